@@ -32,6 +32,7 @@ from nova.api.ec2 import apirequest
 from nova.api.ec2 import ec2utils
 from nova.api.ec2 import faults
 from nova.api import validator
+from nova import cache_utils
 from nova import context
 from nova import exception
 from nova.i18n import _
@@ -40,7 +41,6 @@ from nova.i18n import _LW
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova import utils
 from nova import wsgi
@@ -72,6 +72,11 @@ ec2_opts = [
     cfg.IntOpt('ec2_timestamp_expiry',
                default=300,
                help='Time in seconds before ec2 timestamp expires'),
+    cfg.BoolOpt('ec2_stream_responses',
+                default=False,
+                help='Stream the XML documents of the responses instead of '
+                     'rendering them in memory. Streamed documents are not '
+                     'indented, nor logged'),
     ]
 
 CONF = cfg.CONF
@@ -150,7 +155,7 @@ class Lockout(wsgi.Middleware):
 
     def __init__(self, application):
         """middleware can use fake for testing."""
-        self.mc = memorycache.get_client()
+        self.mc = cache_utils.get_client()
         super(Lockout, self).__init__(application)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
@@ -639,5 +644,8 @@ class Executor(wsgi.Application):
             resp = webob.Response()
             resp.status = 200
             resp.headers['Content-Type'] = 'text/xml'
-            resp.body = str(result)
+            if isinstance(result, six.string_types):
+                resp.body = str(result)
+            else:
+                resp.app_iter = result
             return resp
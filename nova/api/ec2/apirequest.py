@@ -21,8 +21,10 @@ APIRequest class
 import datetime
 # TODO(termie): replace minidom with etree
 from xml.dom import minidom
+from xml.sax import saxutils
 
 from lxml import etree
+from oslo.config import cfg
 import six
 
 from nova.api.ec2 import ec2utils
@@ -32,6 +34,10 @@ from nova.openstack.common import strutils
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+# NOTE: ec2_stream_responses is registered by the nova.api.ec2 package,
+# which imports this module, so it cannot be imported with import_opt.
+
 
 def _underscore_to_camelcase(str):
     return ''.join([x[:1].upper() + x[1:] for x in str.split('_')])
@@ -78,6 +84,8 @@ class APIRequest(object):
                     args[key] = [v for k, v in s]
 
         result = method(context, **args)
+        if CONF.ec2_stream_responses:
+            return self._iter_response(result, context.request_id)
         return self._render_response(result, context.request_id)
 
     def _render_response(self, response_data, request_id):
@@ -140,3 +148,64 @@ class APIRequest(object):
                 strutils.safe_encode(six.text_type(data))))
 
         return data_el
+
+    def _iter_response(self, response_data, request_id):
+        """Yields the XML document of a response in chunks.
+
+        The document is the same as the one of _render_response, without
+        the indentation, but it is never held in memory as a whole, which
+        matters for the responses of large describe calls.
+        """
+        LOG.debug('Streaming the response of %(action)s %(request_id)s',
+                  {'action': self.action, 'request_id': request_id})
+        yield '<%sResponse xmlns="http://ec2.amazonaws.com/doc/%s/">' % (
+            self.action, saxutils.escape(self.version))
+        yield '<requestId>%s</requestId>' % self._escape(request_id)
+        if response_data is True:
+            response_data = {'return': 'true'}
+        for chunk in self._iter_dict(response_data):
+            yield chunk
+        yield '</%sResponse>' % self.action
+
+    @staticmethod
+    def _escape(data):
+        if isinstance(data, six.binary_type):
+            data = strutils.safe_decode(data)
+        else:
+            data = six.text_type(data)
+        return saxutils.escape(data).encode('ascii', 'xmlcharrefreplace')
+
+    def _iter_dict(self, data):
+        for key in data.keys():
+            for chunk in self._iter_data(key, data[key]):
+                yield chunk
+
+    def _iter_data(self, el_name, data):
+        el_name = _underscore_to_xmlcase(el_name)
+
+        if isinstance(data, list):
+            children = (chunk for item in data
+                        for chunk in self._iter_data('item', item))
+        elif isinstance(data, dict):
+            children = self._iter_dict(data)
+        elif hasattr(data, '__dict__'):
+            children = self._iter_dict(data.__dict__)
+        elif isinstance(data, bool):
+            children = [str(data).lower()]
+        elif isinstance(data, datetime.datetime):
+            children = [_database_to_isoformat(data)]
+        elif data is not None:
+            children = [self._escape(data)]
+        else:
+            children = []
+
+        empty = True
+        for chunk in children:
+            if empty:
+                yield '<%s>' % el_name
+                empty = False
+            yield chunk
+        if empty:
+            yield '<%s/>' % el_name
+        else:
+            yield '</%s>' % el_name
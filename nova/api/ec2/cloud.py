@@ -1092,15 +1092,16 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         root_device_short_name = block_device.strip_dev(root_device_name)
         if root_device_name == root_device_short_name:
             root_device_name = block_device.prepend_dev(root_device_name)
         mapping = []
-        bdms = objects.BlockDeviceMappingList.get_by_instance_uuid(
-                context, instance_uuid)
+        if bdms is None:
+            bdms = objects.BlockDeviceMappingList.get_by_instance_uuid(
+                    context, instance_uuid)
         for bdm in bdms:
             volume_id = bdm.volume_id
             if volume_id is None or bdm.no_device:
@@ -1182,18 +1183,40 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
-        for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
+        if not context.is_admin:
+            instances = [inst for inst in instances
+                         if not pipelib.is_vpn_image(inst['image_ref'])]
+
+        # NOTE: The EC2 IDs, block device mappings and availability zones
+        # of all instances are loaded at once, and the EC2 IDs of their
+        # images are only translated once per request.
+        instance_uuids = [inst['uuid'] for inst in instances]
+        ec2_ids = ec2utils.uuids_to_ec2_inst_ids(instance_uuids)
+        bdms_by_uuid = {}
+        if instance_uuids:
+            for bdm in objects.BlockDeviceMappingList.get_by_instance_uuids(
+                    context, instance_uuids):
+                bdms_by_uuid.setdefault(bdm.instance_uuid, []).append(bdm)
+        zones = availability_zones.get_instance_availability_zones(
+                context, instances)
+        ec2_image_ids = {}
+
+        def _ec2_image_id(glance_id, image_type='ami'):
+            key = (glance_id, image_type)
+            if key not in ec2_image_ids:
+                ec2_image_ids[key] = ec2utils.glance_id_to_ec2_id(
+                        context, glance_id, image_type)
+            return ec2_image_ids[key]
+
+        for instance, zone in zip(instances, zones):
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
-            i['instanceId'] = ec2_id
-            image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['instanceId'] = ec2_ids[instance_uuid]
+            i['imageId'] = _ec2_image_id(instance['image_ref'])
+            if instance['kernel_id']:
+                i['kernelId'] = _ec2_image_id(instance['kernel_id'], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = _ec2_image_id(instance['ramdisk_id'], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1219,7 +1242,12 @@ class CloudController(object):
             for k, v in utils.instance_meta(instance).iteritems():
                 i['tagSet'].append({'key': k, 'value': v})
 
-            client_token = self._get_client_token(context, instance_uuid)
+            if (isinstance(instance, obj_base.NovaObject) and
+                    instance.obj_attr_is_set('system_metadata')):
+                client_token = instance.system_metadata.get(
+                        'EC2_client_token')
+            else:
+                client_token = self._get_client_token(context, instance_uuid)
             if client_token:
                 i['clientToken'] = client_token
 
@@ -1234,9 +1262,8 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
-            host = instance['host']
-            zone = availability_zones.get_instance_availability_zone(context, instance)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms_by_uuid.get(instance_uuid, []))
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
                 r = {}
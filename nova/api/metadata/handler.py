@@ -15,6 +15,7 @@
 #    under the License.
 
 """Metadata request handler."""
+import datetime
 import hashlib
 import hmac
 import os
@@ -25,19 +26,38 @@ import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova import cache_utils
 from nova import conductor
+from nova import context
 from nova import exception
 from nova.i18n import _
 from nova.i18n import _LE
 from nova.i18n import _LW
+from nova import objects
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
+from nova.openstack.common import loopingcall
+from nova.openstack.common import timeutils
 from nova import utils
 from nova import wsgi
 
-CACHE_EXPIRATION = 15  # in seconds
+metadata_cache_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Time in seconds to cache metadata; 0 to disable '
+                    'metadata caching entirely (not recommended). The cache '
+                    'is shared by all API workers when memcached_servers '
+                    'is set.'),
+    cfg.IntOpt('metadata_precompute_interval',
+               default=0,
+               help='Interval in seconds between two runs rendering the '
+                    'metadata of the instances created or updated since '
+                    'the last run into the cache, before they are '
+                    'requested. One API worker does it for each interval '
+                    'when the cache is shared. 0 disables it.'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(metadata_cache_opts)
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
 
 metadata_proxy_opts = [
@@ -66,8 +86,17 @@ class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memorycache.get_client()
+        self._cache = cache_utils.get_client()
         self.conductor_api = conductor.API()
+        if CONF.metadata_precompute_interval > 0:
+            self._precompute_timer = loopingcall.FixedIntervalLoopingCall(
+                self.precompute_metadata)
+            self._precompute_timer.start(CONF.metadata_precompute_interval)
+
+    def _cache_metadata(self, cache_key, data):
+        if CONF.metadata_cache_expiration <= 0:
+            return
+        self._cache.set(cache_key, data, CONF.metadata_cache_expiration)
 
     def get_metadata_by_remote_address(self, address):
         if not address:
@@ -83,12 +112,13 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        self._cache_metadata(cache_key, data)
 
         return data
 
     def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
+        # NOTE: The metadata depends on the address it is requested from.
+        cache_key = 'metadata-%s-%s' % (instance_id, address)
         data = self._cache.get(cache_key)
         if data:
             return data
@@ -99,10 +129,71 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        self._cache_metadata(cache_key, data)
 
         return data
 
+    def precompute_metadata(self):
+        """Render the metadata of the instances changed since the last run
+        into the cache.
+        """
+        interval = CONF.metadata_precompute_interval
+        if CONF.metadata_cache_expiration <= 0 or interval <= 0:
+            return
+        # NOTE: Only the worker adding the lock renders the metadata when
+        # the cache is shared, the others wait for the next interval.
+        if not self._cache.add('metadata-precompute-lock', True, interval):
+            return
+
+        now = timeutils.utcnow()
+        changes_since = self._cache.get('metadata-precompute-since')
+        if changes_since is None:
+            changes_since = now - datetime.timedelta(
+                seconds=CONF.metadata_cache_expiration)
+
+        ctxt = context.get_admin_context(read_deleted='yes')
+        instances = objects.InstanceList.get_by_filters(
+            ctxt, {'changes-since': changes_since},
+            expected_attrs=['metadata', 'system_metadata', 'info_cache'])
+        for instance in instances:
+            try:
+                self._precompute_instance_metadata(instance)
+            except Exception:
+                LOG.exception(_('Failed to precompute metadata'),
+                              instance=instance)
+
+        self._cache.set('metadata-precompute-since', now)
+
+    def _precompute_instance_metadata(self, instance):
+        network_info = None
+        if instance.info_cache is not None:
+            network_info = instance.info_cache.network_info
+        fixed_ips = [ip['address'] for ip in
+                     (network_info.fixed_ips() if network_info else [])]
+
+        # The metadata is rendered for each address it can be requested
+        # from.  Fixed IPs may overlap between tenant networks when Neutron
+        # proxies the requests, which are then looked up by instance ID.
+        for address in fixed_ips:
+            if CONF.neutron.service_metadata_proxy:
+                cache_key = 'metadata-%s-%s' % (instance.uuid, address)
+            else:
+                cache_key = 'metadata-%s' % address
+
+            if instance.deleted:
+                self._cache.delete(cache_key)
+                continue
+
+            # The metadata is versioned by the last update of the instance.
+            cached = self._cache.get(cache_key)
+            if (cached and cached.instance.updated_at and
+                    cached.instance.updated_at == instance.updated_at):
+                continue
+
+            data = base.InstanceMetadata(instance, address,
+                                         conductor_api=self.conductor_api)
+            self._cache_metadata(cache_key, data)
+
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         if os.path.normpath(req.path_info) == "/":
@@ -40,6 +40,11 @@ osapi_opts = [
                default=1000,
                help='The maximum number of items returned in a single '
                     'response from a collection resource'),
+    cfg.IntOpt('osapi_instance_list_chunk_size',
+               default=0,
+               help='Number of instances read from the database at a time '
+                    'when listing servers. Each chunk is formatted before '
+                    'the next one is read. 0 reads them all at once.'),
     cfg.StrOpt('osapi_compute_link_prefix',
                help='Base URL that will be presented to users in links '
                     'to the OpenStack Compute API'),
@@ -605,6 +610,34 @@ def get_instance(compute_api, context, instance_id, want_objects=False,
         raise exc.HTTPNotFound(explanation=e.format_message())
 
 
+def get_all_instances(compute_api, context, search_opts, limit, marker,
+                      expected_attrs=None):
+    """Fetch the instances to list from the compute API, as an iterator over
+    InstanceLists of at most CONF.osapi_instance_list_chunk_size instances.
+    """
+    chunk_size = CONF.osapi_instance_list_chunk_size
+    if chunk_size > 0:
+        return compute_api.get_all_chunked(
+            context, search_opts=search_opts, limit=limit, marker=marker,
+            expected_attrs=expected_attrs, chunk_size=chunk_size)
+    return iter([compute_api.get_all(
+        context, search_opts=search_opts, limit=limit, marker=marker,
+        want_objects=True, expected_attrs=expected_attrs)])
+
+
+def iter_instances(req, instance_lists, is_detail):
+    """Return an iterator over the instances of instance_lists. For a
+    detail view, the faults of each list are filled and its instances are
+    cached in req for the extensions.
+    """
+    for instance_list in instance_lists:
+        if is_detail:
+            instance_list.fill_faults()
+            req.cache_db_instances(instance_list)
+        for instance in instance_list:
+            yield instance
+
+
 def check_cells_enabled(function):
     @functools.wraps(function)
     def inner(*args, **kwargs):
@@ -322,10 +322,17 @@ class ServersController(wsgi.Controller):
                 search_opts['user_id'] = context.user_id
 
         limit, marker = common.get_limit_and_marker(req)
+        # NOTE: The index only shows the ID and the name of the servers,
+        # which need no join.
+        if is_detail:
+            expected_attrs = ['metadata', 'system_metadata', 'info_cache',
+                              'security_groups', 'pci_devices']
+        else:
+            expected_attrs = []
         try:
-            instance_list = self.compute_api.get_all(context,
-                    search_opts=search_opts, limit=limit, marker=marker,
-                    want_objects=True, expected_attrs=['pci_devices'])
+            instance_lists = common.get_all_instances(
+                self.compute_api, context, search_opts, limit, marker,
+                expected_attrs=expected_attrs)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
@@ -333,14 +340,15 @@ class ServersController(wsgi.Controller):
             log_msg = _("Flavor '%s' could not be found ")
             LOG.debug(log_msg, search_opts['flavor'])
             # TODO(mriedem): Move to ObjectListBase.__init__ for empty lists.
-            instance_list = objects.InstanceList(objects=[])
+            instance_lists = [objects.InstanceList(objects=[])]
 
+        # NOTE: The instances are formatted list by list, so that the rows
+        # of one chunk can be freed before the next one is read.
+        instances = common.iter_instances(req, instance_lists, is_detail)
         if is_detail:
-            instance_list.fill_faults()
-            response = self._view_builder.detail(req, instance_list)
+            response = self._view_builder.detail(req, instances)
         else:
-            response = self._view_builder.index(req, instance_list)
-        req.cache_db_instances(instance_list)
+            response = self._view_builder.index(req, instances)
         return response
 
     def _get_server(self, context, req, instance_uuid):
@@ -128,14 +128,14 @@ class ViewBuilder(common.ViewBuilder):
 
         :param func: Function used to format the server data
         :param request: API request
-        :param servers: List of servers in dictionary format
+        :param servers: Iterable of servers in dictionary format
         :param coll_name: Name of collection, used to generate the next link
                           for a pagination query
         :returns: Server data in dictionary format
         """
         server_list = [func(request, server)["server"] for server in servers]
         servers_links = self._get_collection_links(request,
-                                                   servers,
+                                                   server_list,
                                                    coll_name)
         servers_dict = dict(servers=server_list)
 
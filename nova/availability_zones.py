@@ -19,12 +19,12 @@ import collections
 
 from oslo.config import cfg
 
+from nova import cache_utils
 from nova import objects
 from nova.cells import opts as cell_opts
 from nova.cells import rpcapi as cell_rpcapi
 from nova import db
 from nova.openstack.common import jsonutils
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 
 from nova import utils
@@ -52,7 +52,7 @@ def _get_cache():
     global MC
 
     if MC is None:
-        MC = memorycache.get_client()
+        MC = cache_utils.get_client()
 
     return MC
 
@@ -236,3 +236,41 @@ def get_instance_availability_zone(context, instance):
             az = get_host_availability_zone(elevated, host)
         cache.set(cache_key, az, AZ_CACHE_SECONDS)
     return az
+
+
+def get_instance_availability_zones(context, instances):
+    """Return the availability zones of a list of instances.
+
+    The zones of the hosts which are not cached are loaded with a single
+    query.
+    """
+    if cell_opts.get_cell_type() == 'api':
+        return [get_instance_availability_zone(context, instance)
+                for instance in instances]
+
+    cache = _get_cache()
+    zones = {}
+    missing = set()
+    for instance in instances:
+        host = str(instance.get('host'))
+        if not host or host in zones or host in missing:
+            continue
+        az = cache.get(_make_cache_key(host))
+        if az:
+            zones[host] = az
+        else:
+            missing.add(host)
+
+    if missing:
+        aggregates = objects.AggregateList.get_by_metadata_key(
+            context.elevated(), 'availability_zone', hosts=missing)
+        metadata = _build_metadata_by_host(aggregates, hosts=missing)
+        for host in missing:
+            if metadata.get(host):
+                az = list(metadata[host])[0]
+            else:
+                az = CONF.default_availability_zone
+            cache.set(_make_cache_key(host), az, AZ_CACHE_SECONDS)
+            zones[host] = az
+
+    return [zones.get(str(instance.get('host'))) for instance in instances]
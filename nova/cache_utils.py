@@ -0,0 +1,132 @@
+#    Copyright 2014 OpenStack Foundation
+#    All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bounded in process cache with the interface of a memcached client."""
+
+import collections
+import heapq
+
+from oslo.config import cfg
+
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+
+cache_opts = [
+    cfg.IntOpt('memorycache_max_items',
+               default=0,
+               help='Maximum number of items kept by the in process cache. '
+                    'The least recently used items are evicted first. '
+                    '0 means no limit.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cache_opts)
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
+
+
+def get_client(memcached_servers=None):
+    """Return a memcached client when memcached servers are configured,
+    or else an in process Client bounded by memorycache_max_items.
+    """
+    if not memcached_servers:
+        memcached_servers = CONF.memcached_servers
+    if memcached_servers:
+        return memorycache.get_client(memcached_servers)
+    return Client(maxsize=CONF.memorycache_max_items)
+
+
+class Client(memorycache.Client):
+    """In process memcached client which does not scan its keys.
+
+    Expired keys are removed when they are read, and swept in the order of
+    their expiry time on each write. With a maxsize, the least recently used
+    keys are evicted once the cache holds maxsize keys.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Ignores the passed in args, but for maxsize."""
+        super(Client, self).__init__(*args, **kwargs)
+        self.maxsize = kwargs.get('maxsize') or 0
+        self.cache = collections.OrderedDict()
+        # Heap of (timeout, key), entries of keys which were set again or
+        # deleted since are ignored when they are popped.
+        self._timeouts = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_stats(self):
+        """Returns the counters of the cache."""
+        return {'items': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations}
+
+    def _sweep(self, now):
+        """Removes the keys expired at now."""
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][0] <= now:
+            timeout, key = heapq.heappop(timeouts)
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] == timeout:
+                del self.cache[key]
+                self.expirations += 1
+
+        # Drop the entries left by keys set again before they expired.
+        if len(timeouts) > 2 * len(self.cache) + 64:
+            self._timeouts = [(item[0], item_key) for item_key, item
+                              in self.cache.iteritems() if item[0]]
+            heapq.heapify(self._timeouts)
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        timeout, value = entry
+        if timeout and timeutils.utcnow_ts() >= timeout:
+            del self.cache[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if self.maxsize:
+            # Move the key to the most recently used end.
+            del self.cache[key]
+            self.cache[key] = entry
+        self.hits += 1
+        return value
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        now = timeutils.utcnow_ts()
+        self._sweep(now)
+
+        timeout = 0
+        if time != 0:
+            timeout = now + time
+            heapq.heappush(self._timeouts, (timeout, key))
+        self.cache.pop(key, None)
+        self.cache[key] = (timeout, value)
+
+        if self.maxsize:
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+        return True
@@ -53,11 +53,19 @@ cell_manager_opts = [
                 default=False,
                 help="If True, enable the periodic task for reservation "
                      "expiry."),
+        cfg.IntOpt("instance_heal_digest_interval",
+                default=600,
+                help="Number of seconds between digest comparisons with "
+                     "the top level cell"),
 ]
 
 
 CONF = cfg.CONF
 CONF.import_opt('name', 'nova.cells.opts', group='cells')
+CONF.import_opt('instance_heal_digest_prefix_length', 'nova.cells.opts',
+                group='cells')
+CONF.import_opt('instance_update_batch_size', 'nova.cells.messaging',
+                group='cells')
 CONF.register_opts(cell_manager_opts, group='cells')
 
 LOG = logging.getLogger(__name__)
@@ -101,6 +109,7 @@ class CellsManager(manager.Manager):
                 CONF.cells.driver)
         self.driver = cells_driver_cls()
         self.instances_to_heal = iter([])
+        self.last_digest_heal_time = 0
         self.consistency_handlers = {
             'security groups': consistency.GroupConsistencyHandler(self.db),
             'rules': consistency.RuleConsistencyHandler(self.db),
@@ -138,7 +147,8 @@ class CellsManager(manager.Manager):
         if we're at the bottom of the tree.
         """
         self.msg_runner.tell_parents_our_capabilities(ctxt)
-        self.msg_runner.tell_parents_our_capacities(ctxt)
+        self.msg_runner.tell_parents_our_capacities(ctxt,
+                                                    only_if_changed=True)
 
     @periodic_task.periodic_task
     def _expire_reservations(self, context):
@@ -161,12 +171,20 @@ class CellsManager(manager.Manager):
         setting defines the maximum number of seconds old the updated_at
         can be.  Ie, a threshold of 3600 means to only update instances
         that have modified in the last hour.
+
+        If CONF.cells.instance_heal_digest_prefix_length is set, the
+        instances are healed by _heal_instance_ranges instead.
         """
 
         if not self.state_manager.get_parent_cells():
             # No need to sync up if we have no parents.
             return
 
+        prefix_length = CONF.cells.instance_heal_digest_prefix_length
+        if prefix_length > 0:
+            self._heal_instance_ranges(ctxt, prefix_length)
+            return
+
         info = {'updated_list': False}
 
         def _next_instance():
@@ -207,6 +225,56 @@ class CellsManager(manager.Manager):
                 self._sync_instance(ctxt, instance)
                 break
 
+    def _heal_instance_ranges(self, ctxt, prefix_length):
+        """Compare the digests of our instances by uuid prefix with the
+        ones known by the top level cell, and sync all of our instances
+        in the ranges which differ, in batches.  The top level cell
+        destroys its instances of ours which are missing from them.
+        """
+        curr_time = time.time()
+        if (self.last_digest_heal_time +
+                CONF.cells.instance_heal_digest_interval > curr_time):
+            return
+        self.last_digest_heal_time = curr_time
+
+        top = self.msg_runner.get_instance_digests(ctxt, prefix_length)
+        if top is None:
+            return
+        top_digests = top['digests']
+        instances = []
+        for chunk in self.db.instance_get_all_by_filters_chunked(
+                ctxt, {'deleted': False}, 'created_at', 'asc',
+                columns_to_join=[]):
+            instances.extend(chunk)
+        digests = cells_utils.get_instance_digests(instances, prefix_length)
+
+        ranges = dict((prefix, [])
+                      for prefix in set(digests) | set(top_digests)
+                      if digests.get(prefix) != top_digests.get(prefix))
+        if not ranges:
+            LOG.debug("Instances are in sync with the top level cell")
+            return
+        for instance in instances:
+            uuids = ranges.get(instance['uuid'][:prefix_length])
+            if uuids is not None:
+                uuids.append(instance['uuid'])
+        uuids = sorted(uuid for range_uuids in ranges.itervalues()
+                       for uuid in range_uuids)
+        LOG.info(_("Healing %(count)d instances in %(ranges)d uuid ranges "
+                   "which differ from the top level cell"),
+                 {'count': len(uuids), 'ranges': len(ranges)})
+
+        batch_size = max(CONF.cells.instance_update_batch_size, 1)
+        for i in xrange(0, len(uuids), batch_size):
+            # Yield to other greenthreads
+            time.sleep(0)
+            updated = self.db.instance_get_all_by_filters(ctxt,
+                    {'uuid': uuids[i:i + batch_size], 'deleted': False},
+                    'created_at', 'asc')
+            self.msg_runner.instance_batch_sync_at_top(ctxt, updated=updated)
+        self.msg_runner.instance_batch_sync_at_top(ctxt, ranges=ranges,
+                digested_at=top['digested_at'])
+
     def _sync_instance(self, ctxt, instance):
         """Broadcast an instance_update or instance_destroy message up to
         parent cells.
@@ -26,9 +26,11 @@ reached.
 
 The interface into this module is the MessageRunner class.
 """
+import collections
 import sys
 import traceback
 
+import eventlet
 from eventlet import queue
 from oslo.config import cfg
 from oslo import messaging
@@ -66,11 +68,30 @@ cell_messaging_opts = [
             help='Maximum number of hops for cells routing.'),
     cfg.StrOpt('scheduler',
             default='nova.cells.scheduler.CellsScheduler',
-            help='Cells scheduler to use')]
+            help='Cells scheduler to use'),
+    cfg.FloatOpt('instance_update_coalesce_window',
+            default=0,
+            help='Number of seconds during which the updates and deletes '
+                 'of instances sent to the top level cell are coalesced '
+                 'and sent in batches. Repeated updates of an instance '
+                 'within the window are merged. 0 sends every update on '
+                 'its own'),
+    cfg.IntOpt('instance_update_batch_size',
+            default=100,
+            help='Maximum number of instances sent to the top level cell '
+                 'in a single message by coalesced updates, instance '
+                 'syncs and instance heals'),
+    cfg.IntOpt('capacity_resend_interval',
+            default=0,
+            help='Number of seconds during which the periodic update of '
+                 'parent cells does not send our capacities again when '
+                 'they did not change. 0 sends them on every update')]
 
 CONF = cfg.CONF
 CONF.import_opt('name', 'nova.cells.opts', group='cells')
 CONF.import_opt('call_timeout', 'nova.cells.opts', group='cells')
+CONF.import_opt('instance_heal_digest_prefix_length', 'nova.cells.opts',
+                group='cells')
 CONF.register_opts(cell_messaging_opts, group='cells')
 
 LOG = logging.getLogger(__name__)
@@ -1123,6 +1144,11 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
         for key in items_to_remove:
             instance.pop(key, None)
         instance['cell_name'] = _reverse_path(message.routing_path)
+        if CONF.cells.instance_heal_digest_prefix_length:
+            # NOTE: The update is timestamped with our own clock, so that
+            # the healing of instance ranges can tell which instances were
+            # updated after it computed their digests.
+            instance['updated_at'] = timeutils.utcnow()
 
         # Fixup info_cache.  We'll have to update this separately if
         # it exists.
@@ -1215,11 +1241,76 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             return
         self.db.bw_usage_update(message.ctxt, **bw_update_info)
 
-    def _sync_instance(self, ctxt, instance):
-        if instance['deleted']:
-            self.msg_runner.instance_destroy_at_top(ctxt, instance)
-        else:
-            self.msg_runner.instance_update_at_top(ctxt, instance)
+    def instance_batch_sync_at_top(self, message, updated=None,
+                                   destroyed=None, ranges=None,
+                                   digested_at=None, **kwargs):
+        """Update and destroy a batch of instances in the DB if we're a
+        top level cell.
+
+        'ranges' maps the uuid prefixes healed by a child cell to the
+        uuids of all of its instances in them, listed after we returned
+        their digests at 'digested_at'.  Instances of the child cell in
+        those ranges which it did not list are destroyed, unless we
+        updated them since.
+        """
+        if not self._at_the_top():
+            return
+        for instance in updated or []:
+            try:
+                self.instance_update_at_top(message, instance)
+            except Exception:
+                LOG.exception(_("Error updating instance in batch"),
+                              instance_uuid=instance['uuid'])
+        for instance in destroyed or []:
+            self.instance_destroy_at_top(message, instance)
+        if ranges:
+            self._destroy_unlisted_instances(message, ranges,
+                    timeutils.parse_strtime(digested_at))
+
+    def _get_cell_instances(self, ctxt, cell_name):
+        """Return a generator of the instances of a child cell which are
+        not deleted, without their joined columns.
+        """
+        for instances in self.db.instance_get_all_by_filters_chunked(
+                ctxt, {'deleted': False, 'cell_name': cell_name},
+                'created_at', 'asc', columns_to_join=[]):
+            for instance in instances:
+                yield instance
+
+    def _destroy_unlisted_instances(self, message, ranges, digested_at):
+        cell_name = _reverse_path(message.routing_path)
+        prefix_length = len(next(iter(ranges)))
+        ranges = dict((prefix, set(uuids))
+                      for prefix, uuids in ranges.iteritems())
+        for instance in self._get_cell_instances(message.ctxt, cell_name):
+            listed = ranges.get(instance['uuid'][:prefix_length])
+            if listed is None or instance['uuid'] in listed:
+                continue
+            # NOTE: An instance updated since the digests may have been
+            # created in the child cell after it listed its instances.
+            updated_at = instance['updated_at'] or instance['created_at']
+            if updated_at >= digested_at:
+                continue
+            LOG.info(_("Destroying instance which is no longer listed by "
+                       "cell %(cell_name)s"), {'cell_name': cell_name},
+                     instance_uuid=instance['uuid'])
+            self.instance_destroy_at_top(message, instance)
+
+    def get_instance_digests(self, message, prefix_length, **kwargs):
+        """Return the digests of the instances of the child cell sending
+        the message by uuid prefix, and when they were computed, if we're
+        a top level cell.
+        """
+        if not self._at_the_top():
+            return
+        cell_name = _reverse_path(message.routing_path)
+        # NOTE: Truncated to the second, like the timestamps of the DB.
+        digested_at = timeutils.utcnow().replace(microsecond=0)
+        digests = cells_utils.get_instance_digests(
+                self._get_cell_instances(message.ctxt, cell_name),
+                prefix_length)
+        return dict(digests=digests,
+                    digested_at=timeutils.strtime(digested_at))
 
     def sync_instances(self, message, project_id, updated_since, deleted,
                        **kwargs):
@@ -1233,8 +1324,19 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
         instances = cells_utils.get_instances_to_sync(message.ctxt,
                 updated_since=updated_since, project_id=project_id,
                 deleted=deleted)
+        batch_size = max(CONF.cells.instance_update_batch_size, 1)
+        batch = {'updated': [], 'destroyed': []}
         for instance in instances:
-            self._sync_instance(message.ctxt, instance)
+            if instance['deleted']:
+                batch['destroyed'].append(instance)
+            else:
+                batch['updated'].append(instance)
+            if len(batch['updated']) + len(batch['destroyed']) >= batch_size:
+                self.msg_runner.instance_batch_sync_at_top(message.ctxt,
+                                                           **batch)
+                batch = {'updated': [], 'destroyed': []}
+        if batch['updated'] or batch['destroyed']:
+            self.msg_runner.instance_batch_sync_at_top(message.ctxt, **batch)
 
     def service_get_all(self, message, filters):
         if filters is None:
@@ -1569,6 +1671,9 @@ class MessageRunner(object):
         for msg_type, cls in _CELL_MESSAGE_TYPE_TO_METHODS_CLS.iteritems():
             self.methods_by_type[msg_type] = cls(self)
         self.serializer = objects_base.NovaObjectSerializer()
+        self._queued_instance_syncs = collections.OrderedDict()
+        self._instance_sync_flusher = None
+        self._last_capacities_sent = None
 
     def _process_message_locally(self, message):
         """Message processing will call this when its determined that
@@ -1698,13 +1803,29 @@ class MessageRunner(object):
                     method_kwargs, 'up', cell, fanout=True)
             message.process()
 
-    def tell_parents_our_capacities(self, ctxt):
-        """Send our capacities to parent cells."""
+    def _capacities_recently_sent(self, capacities):
+        interval = CONF.cells.capacity_resend_interval
+        if interval <= 0 or self._last_capacities_sent is None:
+            return False
+        last_capacities, last_sent_at = self._last_capacities_sent
+        return (last_capacities == capacities and
+                not timeutils.is_older_than(last_sent_at, interval))
+
+    def tell_parents_our_capacities(self, ctxt, only_if_changed=False):
+        """Send our capacities to parent cells.
+
+        If only_if_changed is True, capacities which did not change are
+        only sent again once per CONF.cells.capacity_resend_interval.
+        """
         parent_cells = self.state_manager.get_parent_cells()
         if not parent_cells:
             return
         my_cell_info = self.state_manager.get_my_state()
         capacities = self.state_manager.get_our_capacities()
+        if only_if_changed and self._capacities_recently_sent(capacities):
+            LOG.debug("Not updating parents with unchanged capacities")
+            return
+        self._last_capacities_sent = (capacities, timeutils.utcnow())
         parent_cell_names = ','.join(x.name for x in parent_cells)
         LOG.debug("Updating parents [%(parent_cell_names)s] with "
                                    "our capacities: %(capacities)s",
@@ -1742,6 +1863,9 @@ class MessageRunner(object):
 
     def instance_update_at_top(self, ctxt, instance):
         """Update an instance at the top level cell."""
+        if CONF.cells.instance_update_coalesce_window > 0:
+            self._coalesce_instance_sync(instance, destroy=False)
+            return
         message = _BroadcastMessage(self, ctxt, 'instance_update_at_top',
                                     dict(instance=instance), 'up',
                                     run_locally=False)
@@ -1749,11 +1873,83 @@ class MessageRunner(object):
 
     def instance_destroy_at_top(self, ctxt, instance):
         """Destroy an instance at the top level cell."""
+        if CONF.cells.instance_update_coalesce_window > 0:
+            self._coalesce_instance_sync(instance, destroy=True)
+            return
         message = _BroadcastMessage(self, ctxt, 'instance_destroy_at_top',
                                     dict(instance=instance), 'up',
                                     run_locally=False)
         message.process()
 
+    def instance_batch_sync_at_top(self, ctxt, updated=None, destroyed=None,
+                                   ranges=None, digested_at=None):
+        """Update and destroy a batch of instances at the top level cell.
+        See _BroadcastMessageMethods.instance_batch_sync_at_top for the
+        meaning of 'ranges' and 'digested_at'.
+        """
+        method_kwargs = dict(updated=updated, destroyed=destroyed,
+                             ranges=ranges, digested_at=digested_at)
+        message = _BroadcastMessage(self, ctxt, 'instance_batch_sync_at_top',
+                                    method_kwargs, 'up', run_locally=False)
+        message.process()
+
+    def _coalesce_instance_sync(self, instance, destroy):
+        """Queue an update or destroy of an instance for the next batch.
+
+        The updates of an instance already queued are merged into it,
+        and a destroy replaces them.  The batch is sent when it is full,
+        or when the coalesce window started by its first instance ends.
+        """
+        instance_uuid = instance['uuid']
+        queued = self._queued_instance_syncs.get(instance_uuid)
+        if queued is not None and not destroy and not queued[0]:
+            merged = dict(queued[1])
+            merged.update(instance)
+            instance = merged
+        elif queued is not None and queued[0] and not destroy:
+            # NOTE: An update following a destroy would recreate the
+            # instance at the top, so the destroy is kept.
+            return
+        self._queued_instance_syncs[instance_uuid] = (destroy, instance)
+
+        batch_size = max(CONF.cells.instance_update_batch_size, 1)
+        if len(self._queued_instance_syncs) >= batch_size:
+            self.flush_instance_syncs()
+        elif self._instance_sync_flusher is None:
+            self._instance_sync_flusher = eventlet.spawn_after(
+                    CONF.cells.instance_update_coalesce_window,
+                    self.flush_instance_syncs)
+
+    def flush_instance_syncs(self):
+        """Send the instance updates and destroys queued by coalescing."""
+        if self._instance_sync_flusher is not None:
+            self._instance_sync_flusher.cancel()
+            self._instance_sync_flusher = None
+        queued = self._queued_instance_syncs
+        if not queued:
+            return
+        self._queued_instance_syncs = collections.OrderedDict()
+        updated = [instance for destroy, instance in queued.itervalues()
+                   if not destroy]
+        destroyed = [instance for destroy, instance in queued.itervalues()
+                     if destroy]
+        self.instance_batch_sync_at_top(context.get_admin_context(),
+                                        updated=updated, destroyed=destroyed)
+
+    def get_instance_digests(self, ctxt, prefix_length):
+        """Return the digests of our instances by uuid prefix, as known
+        by the top level cell, or None if there is no response.  They are
+        returned in a dict with the time they were computed at by the top
+        level cell, under 'digests' and 'digested_at'.
+        """
+        message = _BroadcastMessage(self, ctxt, 'get_instance_digests',
+                                    dict(prefix_length=prefix_length), 'up',
+                                    run_locally=False, need_response=True)
+        for response in message.process():
+            digests = response.value_or_raise()
+            if digests is not None:
+                return digests
+
     def instance_delete_everywhere(self, ctxt, instance, delete_type):
         """This is used by API cell when it didn't know what cell
         an instance was in, but the instance was requested to be
@@ -53,6 +53,17 @@ cells_opts = [
     cfg.IntOpt('bandwidth_update_interval',
                 default=600,
                 help='Seconds between bandwidth updates for cells.'),
+    cfg.IntOpt('instance_heal_digest_prefix_length',
+               default=0,
+               help='If greater than 0, instances are healed by comparing '
+                    'the digests of the instances of each range of uuids '
+                    'sharing a prefix of this length with the top level '
+                    'cell, and syncing the ranges which differ, instead '
+                    'of syncing instance_update_num_instances instances '
+                    'per periodic task run. It has to be set in the top '
+                    'level cell as well, which then sets the updated_at '
+                    'of the instances updated by child cells with its own '
+                    'clock'),
 ]
 
 CONF = cfg.CONF
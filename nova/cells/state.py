@@ -39,6 +39,11 @@ from nova.openstack.common import units
 from nova import rpc
 from nova import utils
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 cell_state_manager_opts = [
     cfg.IntOpt('db_check_interval',
                default=60,
@@ -51,6 +56,12 @@ cell_state_manager_opts = [
         cfg.StrOpt('capacity_aggregate_key',
                    help='Aggregate key to limit capacity reporting to '
                    'certain hosts'),
+    cfg.BoolOpt('vectorized_capacity',
+                default=False,
+                help='Compute the capacity of the cell with array '
+                     'operations over the compute nodes. Requires NumPy, '
+                     'the capacity is computed host by host when it is not '
+                     'installed.'),
 ]
 
 
@@ -147,6 +158,90 @@ def sync_after(f):
     return wrapper
 
 
+def _vectorized():
+    return CONF.cells.vectorized_capacity and numpy is not None
+
+
+class CapacityCounter(object):
+    """Counts the number of instances of each size which fit on a set of
+    hosts, given the total and free amount of a resource on each host.
+
+    The counts of every host are kept, so that only the hosts whose
+    resources changed are counted again on updates.
+    """
+
+    def __init__(self, slots, reserve_level):
+        self.slots = sorted(slots)
+        self.reserve_level = reserve_level
+        self.vectorized = _vectorized()
+        self.hosts = {}
+        self.total_free = 0
+        if self.vectorized:
+            self.units = numpy.zeros(len(self.slots), dtype=numpy.int64)
+        else:
+            self.units = [0] * len(self.slots)
+
+    def _count_units(self, resources):
+        """Return the units which fit on every (total, free) resources,
+        one row per host.
+        """
+        if self.vectorized:
+            resources = numpy.array(resources, dtype=numpy.float64)
+            resources = resources.reshape(-1, 2)
+            total, free = resources[:, 0:1], resources[:, 1:2]
+            free = numpy.maximum(0, free - total * self.reserve_level)
+            slots = numpy.array(self.slots, dtype=numpy.float64)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                units = numpy.floor(free / slots)
+            units[:, slots == 0] = 0
+            return units.astype(numpy.int64)
+
+        rows = []
+        for total, free in resources:
+            free = max(0, free - total * self.reserve_level)
+            rows.append([int(free / slot) if slot else 0
+                         for slot in self.slots])
+        return rows
+
+    def _add_units(self, rows, sign):
+        if self.vectorized:
+            if len(rows):
+                self.units += sign * numpy.sum(rows, axis=0)
+            return
+        for row in rows:
+            for i, value in enumerate(row):
+                self.units[i] += sign * value
+
+    def update(self, resources):
+        """Update the counts with a dict of (total, free) resources by
+        host, which replaces the previous one.
+
+        :returns: True if the resources of any host changed
+        """
+        changed = [host for host, host_resources in resources.iteritems()
+                   if host not in self.hosts or
+                   self.hosts[host][0] != host_resources]
+        removed = [host for host in self.hosts if host not in resources]
+        if not changed and not removed:
+            return False
+
+        old_rows = [self.hosts.pop(host)[1] for host in removed]
+        old_rows.extend(self.hosts[host][1] for host in changed
+                        if host in self.hosts)
+        self._add_units(old_rows, -1)
+        new_rows = self._count_units([resources[host] for host in changed])
+        self._add_units(new_rows, 1)
+        for host, row in zip(changed, new_rows):
+            self.hosts[host] = (resources[host], row)
+
+        self.total_free = sum(free for _total, free in resources.values())
+        return True
+
+    def units_by_mb(self):
+        return dict((str(slot), int(units))
+                    for slot, units in zip(self.slots, self.units))
+
+
 _unset = object()
 
 
@@ -172,6 +267,7 @@ class CellStateManager(base.Base):
         self.parent_cells = {}
         self.child_cells = {}
         self.last_cell_db_check = datetime.datetime.min
+        self._capacity_counters = None
 
         attempts = 0
         while True:
@@ -296,22 +392,10 @@ class CellStateManager(base.Base):
 
         _get_compute_hosts()
         if not compute_hosts:
+            self._capacity_counters = None
             self.my_cell_state.update_capacities({})
             return
 
-        ram_mb_free_units = {}
-        disk_mb_free_units = {}
-        total_ram_mb_free = 0
-        total_disk_mb_free = 0
-
-        def _free_units(total, free, per_inst):
-            if per_inst:
-                min_free = total * reserve_level
-                free = max(0, free - min_free)
-                return int(free / per_inst)
-            else:
-                return 0
-
         instance_types = self.db.flavor_get_all(ctxt)
         memory_mb_slots = frozenset(
                 [inst_type['memory_mb'] for inst_type in instance_types])
@@ -319,24 +403,35 @@ class CellStateManager(base.Base):
                 [(inst_type['root_gb'] + inst_type['ephemeral_gb']) * units.Ki
                     for inst_type in instance_types])
 
-        for compute_values in compute_hosts.values():
-            total_ram_mb_free += compute_values['free_ram_mb']
-            total_disk_mb_free += compute_values['free_disk_mb']
-            for memory_mb_slot in memory_mb_slots:
-                ram_mb_free_units.setdefault(str(memory_mb_slot), 0)
-                free_units = _free_units(compute_values['total_ram_mb'],
-                        compute_values['free_ram_mb'], memory_mb_slot)
-                ram_mb_free_units[str(memory_mb_slot)] += free_units
-            for disk_mb_slot in disk_mb_slots:
-                disk_mb_free_units.setdefault(str(disk_mb_slot), 0)
-                free_units = _free_units(compute_values['total_disk_mb'],
-                        compute_values['free_disk_mb'], disk_mb_slot)
-                disk_mb_free_units[str(disk_mb_slot)] += free_units
-
-        capacities = {'ram_free': {'total_mb': total_ram_mb_free,
-                                   'units_by_mb': ram_mb_free_units},
-                      'disk_free': {'total_mb': total_disk_mb_free,
-                                    'units_by_mb': disk_mb_free_units}}
+        # NOTE: The units of the hosts are only counted again when their
+        # resources change, and the capacities are left untouched when
+        # no host changed since the last update.
+        counters_key = (reserve_level, memory_mb_slots, disk_mb_slots,
+                        _vectorized())
+        counters = self._capacity_counters
+        if counters is None or counters[0] != counters_key:
+            counters = self._capacity_counters = (counters_key,
+                    CapacityCounter(memory_mb_slots, reserve_level),
+                    CapacityCounter(disk_mb_slots, reserve_level))
+            changed = True
+        else:
+            changed = False
+        ram_counter, disk_counter = counters[1:]
+
+        changed |= ram_counter.update(dict(
+            (host, (values['total_ram_mb'], values['free_ram_mb']))
+            for host, values in compute_hosts.iteritems()))
+        changed |= disk_counter.update(dict(
+            (host, (values['total_disk_mb'], values['free_disk_mb']))
+            for host, values in compute_hosts.iteritems()))
+        if not changed:
+            return
+
+        capacities = {'ram_free': {'total_mb': ram_counter.total_free,
+                                   'units_by_mb': ram_counter.units_by_mb()},
+                      'disk_free': {'total_mb': disk_counter.total_free,
+                                    'units_by_mb':
+                                        disk_counter.units_by_mb()}}
         self.my_cell_state.update_capacities(capacities)
 
     @sync_before
@@ -16,8 +16,11 @@
 """
 Cells Utility Methods
 """
+import hashlib
 import random
 
+import six
+
 from nova import db
 
 # Separator used between cell names for the 'full cell name' and routing
@@ -25,6 +28,9 @@ from nova import db
 PATH_CELL_SEP = '!'
 # Separator used between cell name and item
 _CELL_ITEM_SEP = '@'
+# Fields of the instances compared by digests between cells
+_INSTANCE_DIGEST_FIELDS = ['uuid', 'vm_state', 'task_state', 'power_state',
+                           'host', 'node']
 
 
 def get_instances_to_sync(context, updated_since=None, project_id=None,
@@ -54,6 +60,24 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
             yield instance
 
 
+def get_instance_digests(instances, prefix_length):
+    """Return a dict of the digests of instances by the prefix of their
+    uuids.  Parent and child cells compare them to find the ranges of
+    uuids in which their instances differ.
+    """
+    hashers = {}
+    for instance in sorted(instances, key=lambda inst: inst['uuid']):
+        prefix = instance['uuid'][:prefix_length]
+        hasher = hashers.get(prefix)
+        if hasher is None:
+            hasher = hashers[prefix] = hashlib.md5()
+        values = [six.text_type(instance[field])
+                  for field in _INSTANCE_DIGEST_FIELDS]
+        hasher.update(u'\0'.join(values).encode('utf-8') + '\n')
+    return dict((prefix, hasher.hexdigest())
+                for prefix, hasher in hashers.iteritems())
+
+
 def cell_with_item(cell_name, item):
     """Turn cell_name and item into <cell_name>@<item>."""
     if cell_name is None:
@@ -114,6 +114,14 @@ compute_opts = [
                      'in a local image being created on the hypervisor node. '
                      'Setting this to 0 means nova will allow only '
                      'boot from volume. A negative number means unlimited.'),
+    cfg.BoolOpt('bulk_provision_instances',
+                default=False,
+                help='Create the database entries of the instances of a '
+                     'multiple create request, and their block device '
+                     'mappings, security group associations and PCI '
+                     'requests, in a single transaction, and check and '
+                     'update their server group membership once per '
+                     'request.'),
 ]
 
 ephemeral_storage_encryption_group = cfg.OptGroup(
@@ -581,7 +589,7 @@ class API(base.Base):
             'auto_disk_config': auto_disk_config
         }
 
-    def _apply_instance_name_template(self, context, instance, index):
+    def _get_instance_name_from_template(self, instance, index):
         params = {
             'uuid': instance['uuid'],
             'name': instance['display_name'],
@@ -594,6 +602,10 @@ class API(base.Base):
             LOG.exception(_LE('Failed to set instance name using '
                               'multi_instance_display_name_template.'))
             new_name = instance['display_name']
+        return new_name
+
+    def _apply_instance_name_template(self, context, instance, index):
+        new_name = self._get_instance_name_from_template(instance, index)
         instance.display_name = new_name
         instance.hostname = utils.sanitize_hostname(new_name)
         instance.save()
@@ -866,7 +878,20 @@ class API(base.Base):
         LOG.debug("Going to run %s instances..." % num_instances)
         instances = []
         try:
-            for i in xrange(num_instances):
+            if CONF.bulk_provision_instances and num_instances > 1:
+                instances.extend(self._create_db_entries_for_new_instances(
+                        context, instance_type, boot_meta, base_options,
+                        security_groups, block_device_mapping,
+                        num_instances, shutdown_terminate))
+                if instance_group:
+                    self._add_instance_group_members(
+                            context, instance_group, instances,
+                            check_server_group_quota)
+                for instance in instances:
+                    notifications.send_update_with_states(context, instance,
+                            None, vm_states.BUILDING, None, None,
+                            service="api")
+            for i in xrange(len(instances), num_instances):
                 instance = objects.Instance()
                 instance.update(base_options)
                 instance = self.create_db_entry_for_new_instance(
@@ -879,22 +904,9 @@ class API(base.Base):
                 instances.append(instance)
 
                 if instance_group:
-                    if check_server_group_quota:
-                        count = QUOTAS.count(context,
-                                             'server_group_members',
-                                             instance_group,
-                                             context.user_id)
-                        try:
-                            QUOTAS.limit_check(context,
-                                               server_group_members=count + 1)
-                        except exception.OverQuota:
-                            msg = _("Quota exceeded, too many servers in "
-                                    "group")
-                            raise exception.QuotaError(msg)
-
-                    objects.InstanceGroup.add_members(context,
-                                                      instance_group.uuid,
-                                                      [instance.uuid])
+                    self._add_instance_group_members(
+                            context, instance_group, [instance],
+                            check_server_group_quota)
 
                 # send a state update notification for the initial create to
                 # show it going from non-existent to BUILDING
@@ -918,6 +930,86 @@ class API(base.Base):
         quotas.commit()
         return instances
 
+    def _add_instance_group_members(self, context, instance_group, instances,
+                                    check_server_group_quota):
+        if check_server_group_quota:
+            count = QUOTAS.count(context,
+                                 'server_group_members',
+                                 instance_group,
+                                 context.user_id)
+            try:
+                QUOTAS.limit_check(context,
+                                   server_group_members=(count +
+                                                         len(instances)))
+            except exception.OverQuota:
+                msg = _("Quota exceeded, too many servers in "
+                        "group")
+                raise exception.QuotaError(msg)
+
+        objects.InstanceGroup.add_members(context,
+                                          instance_group.uuid,
+                                          [instance.uuid
+                                           for instance in instances])
+
+    def _create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options, security_groups, block_device_mapping,
+            num_instances, shutdown_terminate):
+        """Create the DB entries of the instances of a multiple create
+        request, with their block device mappings, security group
+        associations and PCI requests, in a single transaction.
+        """
+        self.security_group_api.ensure_default(context)
+
+        pci_requests = base_options['pci_request_info']
+        numa_topology = base_options.get('numa_topology')
+        extra = {'pci_requests': pci_requests.to_json()}
+        if numa_topology:
+            topology = numa_topology.topology_from_obj()
+            if topology:
+                extra['numa_topology'] = topology.to_json()
+
+        values_list = []
+        for index in xrange(num_instances):
+            instance = objects.Instance()
+            instance.update(base_options)
+            self._populate_instance_for_create(context, instance, image,
+                                               index, security_groups,
+                                               instance_type)
+            self._populate_instance_names(instance, num_instances)
+            instance.shutdown_terminate = shutdown_terminate
+            # NOTE: the uuid of the instance is already known, so the
+            # multi_instance_display_name_template is applied before the
+            # instance is created rather than saved afterwards.
+            instance.display_name = self._get_instance_name_from_template(
+                instance, index)
+            instance.hostname = utils.sanitize_hostname(instance.display_name)
+            self._validate_bdm(context, instance, instance_type,
+                               block_device_mapping)
+
+            values = instance._get_create_updates()
+            values.pop('numa_topology', None)
+            values['extra'] = extra
+            values['block_device_mappings'] = (
+                self._get_block_device_mapping_values(instance_type,
+                                                      block_device_mapping))
+            values_list.append(values)
+
+        LOG.debug("block_device_mapping %s", block_device_mapping)
+        expected_attrs = ['metadata', 'system_metadata', 'info_cache',
+                          'security_groups']
+        instances = []
+        for db_inst in self.db.instance_create_bulk(context, values_list):
+            instance = objects.Instance._from_db_object(
+                context, objects.Instance(), db_inst, expected_attrs)
+            instance.numa_topology = None
+            if numa_topology:
+                instance.numa_topology = numa_topology.obj_clone()
+                instance.numa_topology.instance_uuid = instance.uuid
+            instance.obj_reset_changes(['numa_topology'])
+            instances.append(instance)
+        pci_requests.instance_uuid = instances[-1].uuid
+        return instances
+
     def _get_bdm_image_metadata(self, context, block_device_mapping,
                                 legacy_bdm=True):
         """If we are booting from a volume, we need to get the
@@ -1180,17 +1272,27 @@ class API(base.Base):
         """
         LOG.debug("block_device_mapping %s", block_device_mapping,
                   instance_uuid=instance_uuid)
-        for bdm in block_device_mapping:
-            bdm['volume_size'] = self._volume_size(instance_type, bdm)
-            if bdm.get('volume_size') == 0:
-                continue
-
+        for bdm in self._get_block_device_mapping_values(
+                instance_type, block_device_mapping):
             bdm['instance_uuid'] = instance_uuid
 
             self.db.block_device_mapping_update_or_create(elevated_context,
                                                           bdm,
                                                           legacy=False)
 
+    def _get_block_device_mapping_values(self, instance_type,
+                                         block_device_mapping):
+        """Returns the block device mappings to create, with their
+        volume sizes.
+        """
+        values = []
+        for bdm in block_device_mapping:
+            bdm['volume_size'] = self._volume_size(instance_type, bdm)
+            if bdm.get('volume_size') == 0:
+                continue
+            values.append(bdm)
+        return values
+
     def _validate_bdm(self, context, instance, instance_type, all_mappings):
         def _subsequent_list(l):
             return all(el + 1 == l[i + 1] for i, el in enumerate(l[:-1]))
@@ -1914,8 +2016,58 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        The metadata, system metadata, info cache and security groups of the
+        instances are loaded with them, unless 'expected_attrs' lists the
+        attributes to load instead.
         """
+        filters = self._get_all_filters(context, search_opts)
+        if filters is None:
+            return []
+
+        inst_models = self._get_instances_by_filters(context, filters,
+                sort_key, sort_dir, limit=limit, marker=marker,
+                expected_attrs=expected_attrs)
 
+        if 'ip6' in filters or 'ip' in filters:
+            inst_models = self._ip_filter(inst_models, filters)
+
+        if want_objects:
+            return inst_models
+
+        # Convert the models to dictionaries
+        instances = []
+        for inst_model in inst_models:
+            instances.append(obj_base.obj_to_primitive(inst_model))
+
+        return instances
+
+    def get_all_chunked(self, context, search_opts=None,
+                        sort_key='created_at', sort_dir='desc', limit=None,
+                        marker=None, expected_attrs=None, chunk_size=1000):
+        """Same as get_all() with want_objects, but returns an iterator over
+        InstanceLists of at most chunk_size instances.
+
+        Each list is read from the database by its own query, so that only
+        the rows of one chunk are loaded at a time.
+        """
+        filters = self._get_all_filters(context, search_opts)
+        if filters is None:
+            return iter(())
+
+        inst_lists = self._get_instances_by_filters(context, filters,
+                sort_key, sort_dir, limit=limit, marker=marker,
+                expected_attrs=expected_attrs, chunk_size=chunk_size)
+
+        if 'ip6' in filters or 'ip' in filters:
+            return (self._ip_filter(inst_list, filters)
+                    for inst_list in inst_lists)
+        return inst_lists
+
+    def _get_all_filters(self, context, search_opts):
+        """Return the database filters of the search options of get_all(),
+        or None if they cannot match any instance.
+        """
         # TODO(bcwaldon): determine the best argument for target here
         target = {
             'project_id': context.project_id,
@@ -1977,26 +2129,11 @@ class API(base.Base):
                         remap_object(value)
 
                     # We already know we can't match the filter, so
-                    # return an empty list
+                    # return no filters
                     except ValueError:
-                        return []
+                        return None
 
-        inst_models = self._get_instances_by_filters(context, filters,
-                sort_key, sort_dir, limit=limit, marker=marker,
-                expected_attrs=expected_attrs)
-
-        if 'ip6' in filters or 'ip' in filters:
-            inst_models = self._ip_filter(inst_models, filters)
-
-        if want_objects:
-            return inst_models
-
-        # Convert the models to dictionaries
-        instances = []
-        for inst_model in inst_models:
-            instances.append(obj_base.obj_to_primitive(inst_model))
-
-        return instances
+        return filters
 
     @staticmethod
     def _ip_filter(inst_models, filters):
@@ -2020,11 +2157,22 @@ class API(base.Base):
     def _get_instances_by_filters(self, context, filters,
                                   sort_key, sort_dir,
                                   limit=None,
-                                  marker=None, expected_attrs=None):
-        fields = ['metadata', 'system_metadata', 'info_cache',
-                  'security_groups']
-        if expected_attrs:
-            fields.extend(expected_attrs)
+                                  marker=None, expected_attrs=None,
+                                  chunk_size=None):
+        if expected_attrs is None:
+            fields = ['metadata', 'system_metadata', 'info_cache',
+                      'security_groups']
+        else:
+            fields = list(expected_attrs)
+            if ('ip' in filters or 'ip6' in filters) and (
+                    'info_cache' not in fields):
+                # Needed by _ip_filter()
+                fields.append('info_cache')
+        if chunk_size:
+            return objects.InstanceList.get_by_filters_chunked(
+                context, filters=filters, sort_key=sort_key,
+                sort_dir=sort_dir, limit=limit, marker=marker,
+                expected_attrs=fields, chunk_size=chunk_size)
         return objects.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
             limit=limit, marker=marker, expected_attrs=fields)
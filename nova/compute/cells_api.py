@@ -202,14 +202,23 @@ class ComputeCellsAPI(compute_api.API):
                                   sort_key, sort_dir,
                                   limit=None,
                                   marker=None,
-                                  expected_attrs=None):
+                                  expected_attrs=None,
+                                  chunk_size=None):
         if 'ip' in filters:
             filters['access_ip_v4'] = filters['ip']
         if 'ip6' in filters:
             filters['access_ip_v6'] = filters['ip6']
 
-        fields = ['metadata', 'system_metadata', 'info_cache',
-                  'security_groups']
+        if expected_attrs is None:
+            fields = ['metadata', 'system_metadata', 'info_cache',
+                      'security_groups']
+        else:
+            fields = expected_attrs
+        if chunk_size:
+            return instance_obj.InstanceList.get_by_filters_chunked(
+                context, filters=filters, sort_key=sort_key,
+                sort_dir=sort_dir, limit=limit, marker=marker,
+                expected_attrs=fields, chunk_size=chunk_size)
         return instance_obj.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
             limit=limit, marker=marker, expected_attrs=fields)
@@ -146,6 +146,10 @@ interval_opts = [
                default=60,
                help="Number of seconds between instance info_cache self "
                     "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=1,
+               help="Number of instances whose info_cache is refreshed by "
+                    "each instance info_cache self healing update"),
     cfg.IntOpt('reclaim_instance_interval',
                default=0,
                help='Interval in seconds for reclaiming deleted instances'),
@@ -5326,21 +5330,23 @@ class ComputeManager(manager.Manager):
         spacing=CONF.heal_instance_info_cache_interval)
     def _heal_instance_info_cache(self, context):
         """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
+        info_cache's network information for the next
+        heal_instance_info_cache_batch_size instances by calling to the
+        network manager.
 
         This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors don't fail, as it's possible the instance
-        has been deleted, etc.
+        that live on this host.  On each call, we pop a batch off of a
+        list, pull the DB records in one query, and try the call to the
+        network API.  If anything errors don't fail, as it's possible the
+        instance has been deleted, etc.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
             return
 
         instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
-        instance = None
+        batch_size = max(1, CONF.heal_instance_info_cache_batch_size)
+        instances = []
 
         LOG.debug('Starting heal instance info cache')
 
@@ -5362,27 +5368,22 @@ class ComputeManager(manager.Manager):
                     LOG.debug('Skipping network cache update for instance '
                               'because it is being deleted.', instance=inst)
                     continue
-
-                if not instance:
-                    # Save the first one we find so we don't
-                    # have to get it again
-                    instance = inst
-                else:
-                    instance_uuids.append(inst['uuid'])
+                instance_uuids.append(inst['uuid'])
 
             self._instance_uuids_to_heal = instance_uuids
-        else:
-            # Find the next valid instance on the list
-            while instance_uuids:
-                try:
-                    inst = objects.Instance.get_by_uuid(
-                            context, instance_uuids.pop(0),
-                            expected_attrs=['system_metadata', 'info_cache'],
-                            use_slave=True)
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
 
+        # Find the next valid instances on the list
+        while instance_uuids and len(instances) < batch_size:
+            uuids = instance_uuids[:batch_size - len(instances)]
+            del instance_uuids[:len(uuids)]
+            db_instances = objects.InstanceList.get_by_filters(
+                context, {'uuid': uuids, 'deleted': False},
+                expected_attrs=['system_metadata', 'info_cache'],
+                use_slave=True)
+            # Instances which are gone are simply missing from the list.
+            db_instances = sorted(db_instances,
+                                  key=lambda inst: uuids.index(inst.uuid))
+            for inst in db_instances:
                 # Check the instance hasn't been migrated
                 if inst.host != self.host:
                     LOG.debug('Skipping network cache update for instance '
@@ -5393,25 +5394,32 @@ class ComputeManager(manager.Manager):
                     LOG.debug('Skipping network cache update for instance '
                               'because it is being deleted.', instance=inst)
                 else:
-                    instance = inst
-                    break
+                    instances.append(inst)
 
-        if instance:
-            # We have an instance now to refresh
+        if instances:
+            # We have instances now to refresh
             try:
                 # Call to network API to get instance info.. this will
-                # force an update to the instance's info_cache
-                self._get_instance_nw_info(context, instance, use_slave=True)
-                LOG.debug('Updated the network info_cache for instance',
-                          instance=instance)
-            except exception.InstanceNotFound:
-                # Instance is gone.
-                LOG.debug('Instance no longer exists. Unable to refresh',
-                          instance=instance)
-                return
+                # force an update to the instances' info_cache
+                results = self.network_api.get_instances_nw_info(context,
+                                                                 instances)
             except Exception:
                 LOG.error(_('An error occurred while refreshing the network '
-                            'cache.'), instance=instance, exc_info=True)
+                            'cache.'), exc_info=True)
+                return
+            for instance in instances:
+                result = results.get(instance.uuid)
+                if isinstance(result, exception.InstanceNotFound):
+                    # Instance is gone.
+                    LOG.debug('Instance no longer exists. Unable to refresh',
+                              instance=instance)
+                elif isinstance(result, Exception):
+                    LOG.error(_('An error occurred while refreshing the '
+                                'network cache.'), instance=instance,
+                              exc_info=(type(result), result, None))
+                else:
+                    LOG.debug('Updated the network info_cache for instance',
+                              instance=instance)
         else:
             LOG.debug("Didn't find any instances for network info cache "
                       "update.")
@@ -5764,12 +5772,24 @@ class ComputeManager(manager.Manager):
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
+
+        When the driver can report the power state of all its instances in
+        one call, only the instances whose power state needs syncing are
+        looked at one by one.
         """
         db_instances = objects.InstanceList.get_by_host(context,
                                                              self.host,
                                                              use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
+        try:
+            vm_power_states = self.driver.get_power_states()
+        except NotImplementedError:
+            vm_power_states = None
+
+        if vm_power_states is None:
+            num_vm_instances = self.driver.get_num_instances()
+        else:
+            num_vm_instances = len(vm_power_states)
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -5802,11 +5822,47 @@ class ComputeManager(manager.Manager):
             uuid = db_instance.uuid
             if uuid in self._syncs_in_progress:
                 LOG.debug('Sync already in progress for %s' % uuid)
+            elif (vm_power_states is not None and
+                  self._power_state_in_sync(
+                      db_instance,
+                      vm_power_states.get(uuid, power_state.NOSTATE))):
+                continue
             else:
                 LOG.debug('Triggering sync for uuid %s' % uuid)
                 self._syncs_in_progress[uuid] = True
                 self._sync_power_pool.spawn_n(_sync, db_instance)
 
+    @staticmethod
+    def _power_state_in_sync(db_instance, vm_power_state):
+        """Return True if _sync_instance_power_state has nothing to do for
+        an instance the hypervisor reports in vm_power_state: the database
+        has the same power state and it is the expected one for the
+        vm_state of the instance.
+        """
+        if db_instance.task_state is not None:
+            return False
+        if vm_power_state != db_instance.power_state:
+            return False
+        vm_state = db_instance.vm_state
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state == power_state.RUNNING
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state == vm_states.PAUSED:
+            return vm_power_state not in (power_state.SHUTDOWN,
+                                          power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return vm_state in (vm_states.BUILDING,
+                            vm_states.RESCUED,
+                            vm_states.RESIZED,
+                            vm_states.SUSPENDED,
+                            vm_states.ERROR)
+
     def _query_driver_power_state_and_sync(self, context, db_instance):
         if db_instance.task_state is not None:
             LOG.info(_LI("During sync_power_state the instance has a "
@@ -6252,6 +6308,7 @@ class ComputeManager(manager.Manager):
                       {'event': event.key},
                       instance=instance)
             if event.name == 'network-changed':
+                self.network_api.invalidate_network_cache(context, instance)
                 self.network_api.get_instance_nw_info(context, instance)
             else:
                 self._process_instance_event(instance, event)
@@ -36,7 +36,11 @@ conductor_opts = [
                help='Full class name for the Manager for conductor'),
     cfg.IntOpt('workers',
                help='Number of workers for OpenStack Conductor service. '
-                    'The default will be the number of CPUs available.')
+                    'The default will be the number of CPUs available.'),
+    cfg.IntOpt('build_instances_pool_size',
+               default=1,
+               help='Maximum number of build requests for the instances of '
+                    'a single request sent to compute hosts concurrently.'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -14,9 +14,13 @@
 
 """Handles database requests from other nova services."""
 
+import collections
 import copy
+import functools
 import itertools
 
+import eventlet
+from oslo.config import cfg
 from oslo import messaging
 import six
 
@@ -39,6 +43,7 @@ from nova.network.security_group import openstack_driver
 from nova import notifications
 from nova import objects
 from nova.objects import base as nova_object
+from nova.objects import instance as instance_obj
 from nova.openstack.common import excutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -50,6 +55,8 @@ from nova.scheduler import utils as scheduler_utils
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+
 # Instead of having a huge list of arguments to instance_update(), we just
 # accept a dict of fields to update and use this whitelist to validate it.
 allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
@@ -632,22 +639,35 @@ class ComputeTaskManager(base.Base):
                         instance.uuid, request_spec)
             return
 
-        for (instance, host) in itertools.izip(instances, hosts):
-            try:
-                instance.refresh()
-            except (exception.InstanceNotFound,
-                    exception.InstanceInfoCacheNotFound):
-                LOG.debug('Instance deleted during build', instance=instance)
-                continue
-            local_filter_props = copy.deepcopy(filter_properties)
+        start = timeutils.utcnow()
+        instances = self._refresh_instances(context, instances, hosts)
+        bdms = collections.defaultdict(list)
+        if instances:
+            for bdm in objects.BlockDeviceMappingList.get_by_instance_uuids(
+                    context, [instance.uuid for instance, host in instances]):
+                bdms[bdm.instance_uuid].append(bdm)
+
+        pool = None
+        if CONF.conductor.build_instances_pool_size > 1:
+            pool = eventlet.GreenPool(CONF.conductor.build_instances_pool_size)
+        casts = []
+        for (instance, host) in instances:
+            # NOTE: only the retry entry of the filter properties is changed
+            # for each instance, so the rest of them is shared.
+            local_filter_props = copy.copy(filter_properties)
+            if 'retry' in filter_properties:
+                local_filter_props['retry'] = copy.deepcopy(
+                    filter_properties['retry'])
             scheduler_utils.populate_filter_properties(local_filter_props,
                 host)
             # The block_device_mapping passed from the api doesn't contain
             # instance specific information
-            bdms = objects.BlockDeviceMappingList.get_by_instance_uuid(
-                    context, instance.uuid)
+            instance_bdms = objects.BlockDeviceMappingList(context)
+            instance_bdms.objects = bdms[instance.uuid]
+            instance_bdms.obj_reset_changes()
 
-            self.compute_rpcapi.build_and_run_instance(context,
+            build = functools.partial(
+                    self.compute_rpcapi.build_and_run_instance, context,
                     instance=instance, host=host['host'], image=image,
                     request_spec=request_spec,
                     filter_properties=local_filter_props,
@@ -655,8 +675,57 @@ class ComputeTaskManager(base.Base):
                     injected_files=injected_files,
                     requested_networks=requested_networks,
                     security_groups=security_groups,
-                    block_device_mapping=bdms, node=host['nodename'],
-                    limits=host['limits'])
+                    block_device_mapping=instance_bdms,
+                    node=host['nodename'], limits=host['limits'])
+            if pool:
+                casts.append(pool.spawn(build))
+            else:
+                build()
+        # NOTE: waiting for each cast re-raises the first error any of them
+        # raised, once all of them have been sent.
+        for cast in casts:
+            cast.wait()
+        LOG.debug('Sent build requests for %(count)d instances in '
+                  '%(elapsed).3f seconds',
+                  {'count': len(instances),
+                   'elapsed': timeutils.delta_seconds(start,
+                                                      timeutils.utcnow())})
+
+    def _refresh_instances(self, context, instances, hosts):
+        """Refresh instances like Instance.refresh(), with a single query.
+
+        Returns (instance, host) tuples for the instances which have not
+        been deleted.
+        """
+        expected_attrs = set()
+        for instance in instances:
+            expected_attrs.update(
+                field for field in instance_obj.INSTANCE_OPTIONAL_ATTRS
+                if instance.obj_attr_is_set(field))
+        current = objects.InstanceList.get_by_filters(
+            context, {'uuid': [instance.uuid for instance in instances],
+                      'deleted': False},
+            expected_attrs=sorted(expected_attrs))
+        current = dict((instance.uuid, instance) for instance in current)
+
+        refreshed = []
+        for (instance, host) in itertools.izip(instances, hosts):
+            fresh = current.get(instance.uuid)
+            if fresh is None or (instance.obj_attr_is_set('info_cache') and
+                                 fresh.info_cache is None):
+                LOG.debug('Instance deleted during build', instance=instance)
+                continue
+            for field in instance.fields:
+                if (not instance.obj_attr_is_set(field) or
+                        not fresh.obj_attr_is_set(field)):
+                    continue
+                if field == 'info_cache':
+                    instance.info_cache = fresh.info_cache
+                elif instance[field] != fresh[field]:
+                    instance[field] = fresh[field]
+            instance.obj_reset_changes()
+            refreshed.append((instance, host))
+        return refreshed
 
     def _delete_image(self, context, image_id):
         return self.image_api.delete(context, image_id)
@@ -197,6 +197,24 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    """Get computeNodes created, updated or deleted since a point in time.
+
+    Compute nodes whose service has been created, updated or deleted since
+    then are returned too.
+
+    :param context: The security context
+    :param changed_since: datetime watermark; records whose created_at,
+                          updated_at or deleted_at are at least this value
+                          are returned
+
+    :returns: List of dictionaries each containing compute node properties,
+              including the 'deleted' field and the corresponding service
+              (None if the service has been deleted)
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changed_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get compute nodes by hypervisor hostname.
 
@@ -627,6 +645,15 @@ def instance_create(context, values):
     return instance_ref
 
 
+def instance_create_bulk(context, values_list):
+    """Create instances, and their related rows, in a single transaction.
+
+    Unlike instance_create, the ec2 id mappings are created in the same
+    transaction.
+    """
+    return IMPL.instance_create_bulk(context, values_list)
+
+
 def instance_destroy(context, instance_uuid, constraint=None,
         update_cells=True):
     """Destroy the instance or raise if it does not exist."""
@@ -667,6 +694,20 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             use_slave=use_slave)
 
 
+def instance_get_all_by_filters_chunked(context, filters,
+                                        sort_key='created_at',
+                                        sort_dir='desc', limit=None,
+                                        marker=None, columns_to_join=None,
+                                        use_slave=False, chunk_size=1000):
+    """Get all instances that match all filters, as an iterator over lists
+    of at most chunk_size instances.
+    """
+    return IMPL.instance_get_all_by_filters_chunked(
+        context, filters, sort_key, sort_dir, limit=limit, marker=marker,
+        columns_to_join=columns_to_join, use_slave=use_slave,
+        chunk_size=chunk_size)
+
+
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None,
                                          use_slave=False):
@@ -698,6 +739,11 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
     return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id)
 
 
+def instance_get_hosts_by_not_type(context, type_id=None):
+    """Get the hosts of all instances with a different type_id."""
+    return IMPL.instance_get_hosts_by_not_type(context, type_id)
+
+
 def instance_get_floating_address(context, instance_id):
     """Get the first floating ip address of an instance."""
     return IMPL.instance_get_floating_address(context, instance_id)
@@ -1274,6 +1320,13 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid,
                                                          use_slave)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
+                                                   use_slave=False):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+        context, instance_uuids, use_slave)
+
+
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     """Get block device mapping for a given volume."""
@@ -71,6 +71,17 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('archive_batch_size',
+               default=1000,
+               help='Maximum number of rows moved to a shadow table in one '
+                    'transaction when archiving deleted rows. Tables are '
+                    'archived in repeated batches until they are drained. '
+                    'Set to 0 to move all rows of a table at once.'),
+    cfg.FloatOpt('archive_batch_interval',
+                 default=0.0,
+                 help='Number of seconds to sleep between two archive '
+                      'batches, to limit the write load put on the '
+                      'database and its replicas.'),
 ]
 
 CONF = cfg.CONF
@@ -681,6 +692,59 @@ def compute_node_get_all(context, no_date_fields):
     return compute_nodes
 
 
+@require_admin_context
+def compute_node_get_all_changed_since(context, changed_since):
+    engine = get_engine()
+
+    compute_node = models.ComputeNode.__table__
+    service = models.Service.__table__
+
+    def _changed(table):
+        return or_(table.c.created_at >= changed_since,
+                   table.c.updated_at >= changed_since,
+                   table.c.deleted_at >= changed_since)
+
+    with engine.begin() as conn:
+        # NOTE: Service heartbeats bump services.updated_at, so the compute
+        # nodes of every service which reported since the watermark are
+        # returned as well in order to keep the service data fresh.
+        service_query = sql.select(list(service.c)).\
+                            where((service.c.binary == 'nova-compute') &
+                                  _changed(service))
+        services = dict((proxy['id'], dict(proxy.items()))
+                        for proxy in conn.execute(service_query))
+
+        changed_nodes = _changed(compute_node)
+        if services:
+            changed_nodes = or_(changed_nodes,
+                                compute_node.c.service_id.in_(services.keys()))
+        compute_node_query = sql.select(list(compute_node.c)).\
+                                where(changed_nodes).\
+                                order_by(compute_node.c.service_id)
+        compute_node_rows = conn.execute(compute_node_query).fetchall()
+
+        missing = set(proxy['service_id'] for proxy in compute_node_rows
+                      if proxy['service_id'] not in services)
+        if missing:
+            service_query = sql.select(list(service.c)).\
+                                where((service.c.deleted == 0) &
+                                      service.c.id.in_(missing))
+            for proxy in conn.execute(service_query):
+                services[proxy['id']] = dict(proxy.items())
+
+    compute_nodes = []
+    for proxy in compute_node_rows:
+        node = dict(proxy.items())
+        service_ref = services.get(proxy['service_id'])
+        if service_ref and service_ref['deleted']:
+            service_ref = None
+        node['service'] = service_ref
+
+        compute_nodes.append(node)
+
+    return compute_nodes
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -1724,6 +1788,120 @@ def instance_create(context, values):
     return instance_ref
 
 
+def _insert_rows(session, model, rows):
+    """Insert rows of a model with one multi-row statement per set of
+    columns. Keys which are not columns of the model are ignored.
+    """
+    columns = set(model.__table__.columns.keys())
+    rows_by_keys = collections.defaultdict(list)
+    for row in rows:
+        row = dict((k, v) for k, v in row.iteritems() if k in columns)
+        rows_by_keys[tuple(sorted(row))].append(row)
+    for key_rows in rows_by_keys.values():
+        session.execute(model.__table__.insert(), key_rows)
+
+
+@require_context
+def instance_create_bulk(context, values_list):
+    """Create several Instance records, and their related rows, in a
+    single transaction.
+
+    context - request context object
+    values_list - list of dicts containing column values, as accepted by
+                  instance_create. Each may also contain 'extra', a dict
+                  of instance_extra column values, and
+                  'block_device_mappings', a list of new style block device
+                  mapping dicts.
+
+    Returns the instances in the order of values_list.
+    """
+    security_group_ensure_default(context)
+
+    rows = collections.defaultdict(list)
+    security_group_names = set()
+    uuids = []
+    for values in values_list:
+        values = values.copy()
+        if not values.get('uuid'):
+            values['uuid'] = str(uuid.uuid4())
+        instance_uuid = values['uuid']
+        uuids.append(instance_uuid)
+        _handle_objects_related_type_conversions(values)
+
+        for key, model in (('metadata', models.InstanceMetadata),
+                           ('system_metadata',
+                            models.InstanceSystemMetadata)):
+            for k, v in (values.pop(key, None) or {}).iteritems():
+                rows[model].append({'key': k, 'value': v,
+                                    'instance_uuid': instance_uuid})
+
+        info_cache = dict(values.pop('info_cache', None) or {})
+        info_cache['instance_uuid'] = instance_uuid
+        rows[models.InstanceInfoCache].append(info_cache)
+
+        extra = dict(values.pop('extra', None) or {})
+        extra['instance_uuid'] = instance_uuid
+        rows[models.InstanceExtra].append(extra)
+
+        for bdm in values.pop('block_device_mappings', None) or []:
+            bdm = dict(bdm, instance_uuid=instance_uuid)
+            _scrub_empty_str_values(bdm, ['volume_size'])
+            rows[models.BlockDeviceMapping].append(bdm)
+
+        groups = values.pop('security_groups', None) or []
+        security_group_names.update(groups)
+        for name in groups:
+            rows[models.SecurityGroupInstanceAssociation].append(
+                {'security_group_id': name, 'instance_uuid': instance_uuid})
+
+        rows[models.InstanceIdMapping].append({'uuid': instance_uuid})
+        rows[models.Instance].append(values)
+
+    session = get_session()
+    with session.begin():
+        hostnames = set()
+        for values in rows[models.Instance]:
+            if 'hostname' in values:
+                _validate_unique_server_name(context, session,
+                                             values['hostname'])
+                if (CONF.osapi_compute_unique_server_name_scope and
+                        values['hostname'].lower() in hostnames):
+                    raise exception.InstanceExists(
+                        name=values['hostname'].lower())
+                hostnames.add(values['hostname'].lower())
+
+        security_group_ids = {}
+        if 'default' in security_group_names:
+            default_group = _security_group_ensure_default(context, session)
+            security_group_ids['default'] = default_group['id']
+            security_group_names.discard('default')
+        if security_group_names:
+            for group in _security_group_get_by_names(
+                    context, session, context.project_id,
+                    list(security_group_names)):
+                security_group_ids[group['name']] = group['id']
+        for association in rows[models.SecurityGroupInstanceAssociation]:
+            association['security_group_id'] = security_group_ids[
+                association['security_group_id']]
+
+        # NOTE: the related rows reference the instances by uuid, so all of
+        # them can be inserted with one statement per table.
+        for model in (models.Instance, models.InstanceMetadata,
+                      models.InstanceSystemMetadata, models.InstanceInfoCache,
+                      models.InstanceExtra, models.BlockDeviceMapping,
+                      models.SecurityGroupInstanceAssociation,
+                      models.InstanceIdMapping):
+            if rows[model]:
+                _insert_rows(session, model, rows[model])
+
+        instances = _build_instance_get(context, session=session).\
+                        filter(models.Instance.uuid.in_(uuids)).\
+                        all()
+
+    instances_by_uuid = dict((inst['uuid'], inst) for inst in instances)
+    return [instances_by_uuid[inst_uuid] for inst_uuid in uuids]
+
+
 def _instance_data_get_for_user(context, project_id, user_id, session=None):
     result = model_query(context,
                          func.count(models.Instance.id),
@@ -1952,12 +2130,83 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     if limit == 0:
         return []
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    if CONF.database.slave_connection == '':
+        use_slave = False
+
+    session = get_session(use_slave=use_slave)
+    query_prefix, manual_joins = _instance_get_all_by_filters_query(
+        context, session, filters, sort_key, sort_dir, columns_to_join)
+
+    # paginate query
+    if marker is not None:
+        try:
+            marker = _instance_get_by_uuid(context, marker, session=session)
+        except exception.InstanceNotFound:
+            raise exception.MarkerNotFound(marker)
+    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, limit,
+                           [sort_key, 'created_at', 'id'],
+                           marker=marker,
+                           sort_dir=sort_dir)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+
+
+@require_context
+def instance_get_all_by_filters_chunked(context, filters, sort_key, sort_dir,
+                                        limit=None, marker=None,
+                                        columns_to_join=None, use_slave=False,
+                                        chunk_size=1000):
+    """Same as instance_get_all_by_filters(), but returns an iterator over
+    lists of at most chunk_size instances.
+
+    Each chunk is read by its own query, which starts after the last
+    instance of the previous chunk, and its metadata is joined separately,
+    so that only one chunk of rows is loaded at a time.
+    """
+    if limit == 0:
+        return iter(())
 
     if CONF.database.slave_connection == '':
         use_slave = False
 
     session = get_session(use_slave=use_slave)
+    query_prefix, manual_joins = _instance_get_all_by_filters_query(
+        context, session, filters, sort_key, sort_dir, columns_to_join)
+
+    if marker is not None:
+        try:
+            marker = _instance_get_by_uuid(context, marker, session=session)
+        except exception.InstanceNotFound:
+            raise exception.MarkerNotFound(marker)
+
+    def _chunks(marker, limit):
+        while limit is None or limit > 0:
+            size = chunk_size if limit is None else min(chunk_size, limit)
+            query = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, size,
+                           [sort_key, 'created_at', 'id'],
+                           marker=marker,
+                           sort_dir=sort_dir)
+            instances = query.all()
+            if not instances:
+                return
+            marker = instances[-1]
+            if limit is not None:
+                limit -= len(instances)
+            yield _instances_fill_metadata(context, instances, manual_joins)
+            if len(instances) < size:
+                return
+
+    return _chunks(marker, limit)
+
+
+def _instance_get_all_by_filters_query(context, session, filters, sort_key,
+                                       sort_dir, columns_to_join):
+    """Return the query of instance_get_all_by_filters(), before its
+    pagination, and the columns to join manually.
+    """
+    sort_fn = {'desc': desc, 'asc': asc}
 
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -2025,7 +2274,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     exact_match_filter_names = ['project_id', 'user_id', 'image_ref',
                                 'vm_state', 'instance_type_id', 'uuid',
                                 'metadata', 'host', 'task_state',
-                                'system_metadata']
+                                'system_metadata', 'cell_name']
 
     # Filter the query
     query_prefix = exact_filter(query_prefix, models.Instance,
@@ -2037,19 +2286,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata.instance_uuid,
                               filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix, manual_joins
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2281,6 +2518,17 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
                    filter(models.Instance.instance_type_id != type_id).all())
 
 
+@require_admin_context
+def instance_get_hosts_by_not_type(context, type_id=None):
+    rows = model_query(context, models.Instance.host,
+                       base_model=models.Instance).\
+                filter(models.Instance.host != null()).\
+                filter(models.Instance.instance_type_id != type_id).\
+                distinct().\
+                all()
+    return [row[0] for row in rows]
+
+
 # NOTE(jkoelker) This is only being left here for compat with floating
 #                ips. Currently the network_api doesn't return floaters
 #                in network_info. Once it starts return the model. This
@@ -3793,6 +4041,17 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid,
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
+                                                   use_slave=False):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context, use_slave=use_slave).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
@@ -5928,10 +6187,61 @@ def _get_default_deleted_value(table):
         return None
 
 
-@require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
-    """Move up to max_rows rows from one tables to the corresponding
-    shadow table. The context argument is only used for the decorator.
+# NOTE: Reflecting a table costs a few queries, so the tables reflected
+# by the archiver are kept in one MetaData for the engine they were read
+# from. Their foreign keys also give the order tables are archived in.
+_archive_metadata = {}
+_archive_metadata_lock = threading.Lock()
+
+
+def _get_archive_metadata(engine):
+    """Return the MetaData holding the tables reflected from engine."""
+    metadata = _archive_metadata.get(engine)
+    if metadata is None:
+        _archive_metadata.clear()
+        metadata = MetaData()
+        metadata.bind = engine
+        _archive_metadata[engine] = metadata
+    return metadata
+
+
+def _get_archive_tables(engine, tablename):
+    """Return the reflected table and shadow table for tablename. The
+    shadow table is None if the table has no shadow table.
+    """
+    with _archive_metadata_lock:
+        metadata = _get_archive_metadata(engine)
+        tables = []
+        for name in (tablename, _SHADOW_TABLE_PREFIX + tablename):
+            table = metadata.tables.get(name)
+            if table is None:
+                try:
+                    table = Table(name, metadata, autoload=True)
+                except NoSuchTableError:
+                    table = None
+            tables.append(table)
+        return tables[0], tables[1]
+
+
+def _get_archive_tablenames(engine):
+    """Return the names of the tables to archive, tables holding foreign
+    keys come before the tables they reference.
+    """
+    tablenames = set()
+    for model_class in models.__dict__.itervalues():
+        if hasattr(model_class, "__tablename__"):
+            tablenames.add(model_class.__tablename__)
+    for tablename in tablenames:
+        _get_archive_tables(engine, tablename)
+    with _archive_metadata_lock:
+        sorted_tables = _get_archive_metadata(engine).sorted_tables
+    return [table.name for table in reversed(sorted_tables)
+            if table.name in tablenames]
+
+
+def _archive_deleted_rows_batch(conn, table, shadow_table, max_rows):
+    """Move up to max_rows rows from table to shadow_table in one
+    transaction.
 
     :returns: number of rows archived
     """
@@ -5939,21 +6249,8 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     # imports nova.db.sqlalchemy.api.
     from nova.db.sqlalchemy import utils as db_utils
 
-    engine = get_engine()
-    conn = engine.connect()
-    metadata = MetaData()
-    metadata.bind = engine
-    table = Table(tablename, metadata, autoload=True)
     default_deleted_value = _get_default_deleted_value(table)
-    shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
-    rows_archived = 0
-    try:
-        shadow_table = Table(shadow_tablename, metadata, autoload=True)
-    except NoSuchTableError:
-        # No corresponding shadow table; skip it.
-        return rows_archived
-
-    if tablename == "dns_domains":
+    if table.name == "dns_domains":
         # We have one table (dns_domains) where the key is called
         # "domain" rather than "id"
         column = table.c.domain
@@ -5971,22 +6268,58 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     insert_statement = sqlalchemyutils.InsertFromSelect(
         shadow_table, query_insert)
     delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
-    try:
-        # Group the insert and delete in a transaction.
-        with conn.begin():
-            conn.execute(insert_statement)
-            result_delete = conn.execute(delete_statement)
-    except db_exc.DBError:
-        # TODO(ekudryashova): replace by DBReferenceError when db layer
-        # raise it.
-        # A foreign key constraint keeps us from deleting some of
-        # these rows until we clean up a dependent table.  Just
-        # skip this table for now; we'll come back to it later.
-        msg = _("IntegrityError detected when archiving table %s") % tablename
-        LOG.warn(msg)
+    # Group the insert and delete in a transaction.
+    with conn.begin():
+        conn.execute(insert_statement)
+        result_delete = conn.execute(delete_statement)
+    return result_delete.rowcount
+
+
+@require_admin_context
+def archive_deleted_rows_for_table(context, tablename, max_rows):
+    """Move up to max_rows rows from one tables to the corresponding
+    shadow table. The context argument is only used for the decorator.
+
+    Rows are moved in transactions of at most archive_batch_size rows,
+    until max_rows rows are moved or the table has no deleted rows left.
+
+    :returns: number of rows archived
+    """
+    engine = get_engine()
+    table, shadow_table = _get_archive_tables(engine, tablename)
+    rows_archived = 0
+    if table is None or shadow_table is None:
+        # No corresponding shadow table; skip it.
         return rows_archived
 
-    rows_archived = result_delete.rowcount
+    conn = engine.connect()
+    try:
+        while max_rows is None or rows_archived < max_rows:
+            batch_size = CONF.archive_batch_size or None
+            if max_rows is not None:
+                batch_size = min(batch_size or max_rows,
+                                 max_rows - rows_archived)
+            if rows_archived and CONF.archive_batch_interval > 0:
+                time.sleep(CONF.archive_batch_interval)
+            try:
+                rows = _archive_deleted_rows_batch(conn, table,
+                                                   shadow_table, batch_size)
+            except db_exc.DBError:
+                # TODO(ekudryashova): replace by DBReferenceError when db
+                # layer raise it.
+                # A foreign key constraint keeps us from deleting some of
+                # these rows until we clean up a dependent table.  Just
+                # skip this table for now; we'll come back to it later.
+                msg = _("IntegrityError detected when archiving table "
+                        "%s") % tablename
+                LOG.warn(msg)
+                break
+            rows_archived += rows
+            if batch_size is None or rows < batch_size:
+                # The table has been drained.
+                break
+    finally:
+        conn.close()
 
     return rows_archived
 
@@ -5994,20 +6327,25 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
 @require_admin_context
 def archive_deleted_rows(context, max_rows=None):
     """Move up to max_rows rows from production tables to the corresponding
-    shadow tables.
+    shadow tables. Tables are archived before the tables they reference,
+    so that their foreign keys do not hold back the archiving of rows.
 
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
-    for model_class in models.__dict__.itervalues():
-        if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
     rows_archived = 0
-    for tablename in tablenames:
-        rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
+    for tablename in _get_archive_tablenames(get_engine()):
+        start = time.time()
+        rows = archive_deleted_rows_for_table(context, tablename,
+            max_rows=None if max_rows is None else max_rows - rows_archived)
+        if rows:
+            elapsed = max(time.time() - start, 1e-6)
+            LOG.info(_("Archived %(rows)d rows from table %(table)s in "
+                       "%(elapsed).2fs (%(rate).1f rows/s)"),
+                     {'rows': rows, 'table': tablename, 'elapsed': elapsed,
+                      'rate': rows / elapsed})
+        rows_archived += rows
+        if max_rows is not None and rows_archived >= max_rows:
             break
     return rows_archived
 
@@ -0,0 +1,232 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import httplib
+import time
+
+import eventlet
+from oslo.config import cfg
+import six
+import six.moves.urllib.request as urlrequest
+
+from nova import exception
+from nova.i18n import _, _LI, _LW
+import nova.image.download.base as xfer_base
+from nova.openstack.common import log as logging
+from nova import utils
+
+
+LOG = logging.getLogger(__name__)
+
+http_opts = [
+    cfg.IntOpt('range_workers',
+               default=1,
+               help='Number of byte ranges of an image which are fetched in '
+                    'parallel, when the server accepts range requests'),
+    cfg.IntOpt('chunk_size',
+               default=65536,
+               help='Size in bytes of the chunks read from the server'),
+    cfg.IntOpt('num_retries',
+               default=3,
+               help='Number of times an interrupted transfer is resumed. '
+                    'Transfers from servers which do not accept range '
+                    'requests are restarted instead'),
+    cfg.BoolOpt('preallocate',
+                default=True,
+                help='Whether to preallocate the destination file when the '
+                     'size of the image is known'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(http_opts, group='image_http_download')
+
+#  This module downloads the http:// and https:// locations advertised by
+#  glance, for instance by its http or swift stores.  To use it, add http
+#  and/or https to the allowed_direct_url_schemes option of the [glance]
+#  section.  Images are written while they are hashed, and checked against
+#  the checksum of the image when glance provides it.
+
+
+class HttpTransfer(xfer_base.TransferBase):
+
+    def _open(self, url, start=None, end=None, method=None):
+        request = urlrequest.Request(url)
+        if method:
+            request.get_method = lambda: method
+        if start is not None:
+            request.add_header('Range', 'bytes=%d-%s' % (
+                start, '' if end is None else end - 1))
+        return urlrequest.urlopen(request)
+
+    def _get_info(self, url):
+        """Returns the size of an image, and whether ranges are accepted."""
+        try:
+            response = self._open(url, method='HEAD')
+        except (IOError, httplib.HTTPException) as e:
+            LOG.debug('Unable to get the size of %(url)s: %(e)s',
+                      {'url': url, 'e': e})
+            return None, False
+        try:
+            headers = response.info()
+            size = headers.get('Content-Length')
+            size = int(size) if size else None
+            accepts_ranges = headers.get('Accept-Ranges', '') == 'bytes'
+        finally:
+            response.close()
+        return size, accepts_ranges
+
+    def _preallocate(self, dst_path, size):
+        _out, err = utils.trycmd('fallocate', '-n', '-l', size, dst_path)
+        if err:
+            LOG.debug('Unable to preallocate %(path)s: %(err)s',
+                      {'path': dst_path, 'err': err})
+
+    def _fetch(self, url, dst_path, start, end, accepts_ranges, ranged,
+               hasher=None):
+        """Writes the bytes start to end of an image at the same offsets
+        of dst_path, resuming the transfer after failures.
+
+        A ranged fetch always requests its range; otherwise the whole
+        image is requested, and a range is only used to resume it. If
+        the server does not accept ranges, a failed transfer of the whole
+        image is restarted, and the hasher is reset.
+
+        :returns: a tuple of the position reached and the hasher
+        """
+        position = start
+        failures = 0
+        while True:
+            try:
+                if ranged or position > start:
+                    response = self._open(url, position, end)
+                    if response.getcode() != 206:
+                        response.close()
+                        if ranged:
+                            raise exception.ImageDownloadModuleError(
+                                reason=_('The server did not return the '
+                                         'requested range.'),
+                                module=str(self))
+                        accepts_ranges = False
+                        raise IOError(_('The server did not return the '
+                                        'requested range.'))
+                else:
+                    response = self._open(url)
+                try:
+                    with open(dst_path, 'r+b') as dst:
+                        dst.seek(position)
+                        while end is None or position < end:
+                            size = CONF.image_http_download.chunk_size
+                            if end is not None:
+                                size = min(size, end - position)
+                            chunk = response.read(size)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            if hasher:
+                                hasher.update(chunk)
+                            position += len(chunk)
+                finally:
+                    response.close()
+                if end is not None and position < end:
+                    raise IOError(_('The transfer ended at byte %d.') %
+                                  position)
+                return position, hasher
+            except (IOError, httplib.HTTPException) as e:
+                failures += 1
+                if failures > CONF.image_http_download.num_retries:
+                    raise exception.ImageDownloadModuleError(
+                        reason=six.text_type(e), module=str(self))
+                if not accepts_ranges:
+                    position = start
+                    if hasher:
+                        hasher = hashlib.md5()
+                LOG.warn(_LW('Transfer of %(url)s interrupted (%(e)s), '
+                             'resuming at byte %(position)d'),
+                         {'url': url, 'e': e, 'position': position})
+
+    def _fetch_ranges(self, url, dst_path, size, workers):
+        range_size = (size + workers - 1) // workers
+        pool = eventlet.GreenPool(workers)
+        threads = [pool.spawn(self._fetch, url, dst_path, start,
+                              min(start + range_size, size), True, True)
+                   for start in range(0, size, range_size)]
+        try:
+            for thread in threads:
+                thread.wait()
+        except Exception:
+            for thread in threads:
+                thread.kill()
+            raise
+        return len(threads)
+
+    def _hash_file(self, dst_path):
+        hasher = hashlib.md5()
+        with open(dst_path, 'rb') as dst:
+            for chunk in iter(lambda: dst.read(
+                    CONF.image_http_download.chunk_size), ''):
+                hasher.update(chunk)
+        return hasher
+
+    def download(self, context, url_parts, dst_path, metadata, **kwargs):
+        """Downloads an http(s) location into dst_path.
+
+        :param checksum: (Optional) the md5 checksum of the image
+        :returns: a dict of the size, duration, throughput and number of
+                  ranges of the transfer
+        """
+        url = url_parts.geturl()
+        checksum = kwargs.get('checksum')
+        started = time.time()
+
+        size, accepts_ranges = self._get_info(url)
+        open(dst_path, 'wb').close()
+        if size and CONF.image_http_download.preallocate:
+            self._preallocate(dst_path, size)
+
+        workers = CONF.image_http_download.range_workers
+        if size and accepts_ranges and workers > 1:
+            ranges = self._fetch_ranges(url, dst_path, size, workers)
+            hasher = self._hash_file(dst_path) if checksum else None
+        else:
+            ranges = 1
+            size, hasher = self._fetch(url, dst_path, 0, size,
+                                       accepts_ranges, False,
+                                       hashlib.md5())
+        if checksum and hasher.hexdigest() != checksum:
+            raise exception.ImageDownloadModuleError(
+                reason=_('The checksum %(actual)s of the data does not '
+                         'match the checksum %(expected)s of the '
+                         'image.') % {'actual': hasher.hexdigest(),
+                                      'expected': checksum},
+                module=str(self))
+
+        seconds = time.time() - started
+        stats = {'bytes': size,
+                 'seconds': seconds,
+                 'bytes_per_second': size / seconds if seconds else None,
+                 'ranges': ranges}
+        LOG.info(_LI('Downloaded %(bytes)d bytes of %(url)s in %(seconds).2f '
+                     'seconds using %(ranges)d ranges'),
+                 dict(stats, url=url))
+        return stats
+
+
+def get_download_handler(**kwargs):
+    return HttpTransfer()
+
+
+def get_schemes():
+    return ['http', 'https']
@@ -239,6 +239,28 @@ class NetworkAPI(base.Base):
         """Returns all network info related to an instance."""
         raise NotImplementedError()
 
+    def invalidate_network_cache(self, context, instance):
+        """Drop what is cached about the networks of an instance, called
+        when they are reported to have changed.
+        """
+        pass
+
+    def get_instances_nw_info(self, context, instances, **kwargs):
+        """Returns all network info related to several instances.
+
+        Returns a dict mapping the uuid of each instance to its network
+        info, or to the exception raised while getting it, so that one
+        failing instance does not prevent the refresh of the others.
+        """
+        results = {}
+        for instance in instances:
+            try:
+                results[instance['uuid']] = self.get_instance_nw_info(
+                    context, instance, **kwargs)
+            except Exception as exc:
+                results[instance['uuid']] = exc
+        return results
+
     def create_pci_requests_for_sriov_ports(self, context,
                                             pci_requests,
                                             requested_networks):
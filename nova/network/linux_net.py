@@ -18,6 +18,8 @@
 """Implements vlans, bridges, and iptables rules using linux utilities."""
 
 import calendar
+import collections
+import hashlib
 import inspect
 import os
 import re
@@ -127,6 +129,14 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Once the rules have been applied as a whole, only '
+                     'rewrite the chains owned by this service which '
+                     'changed since, with iptables-restore --noflush. Other '
+                     'changes still rewrite the tables as a whole, and so '
+                     'do all changes when iptables_top_regex or '
+                     'iptables_bottom_regex is set.'),
     cfg.IntOpt('ovs_vsctl_timeout',
                default=120,
                help='Amount of time, in seconds, that ovs_vsctl should wait '
@@ -178,6 +188,9 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.top, self.wrap))
+
     def __str__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -197,6 +210,12 @@ class IptablesTable(object):
         self.unwrapped_chains = set()
         self.remove_chains = set()
         self.dirty = True
+        # Same rules as self.rules, for the duplicate checks.
+        self.rule_set = set()
+        # Digests of the wrapped chains and of the unwrapped part of the
+        # table, as they were last applied.
+        self.applied_chains = None
+        self.applied_unwrapped = None
 
     def has_chain(self, name, wrap=True):
         if wrap:
@@ -260,6 +279,7 @@ class IptablesTable(object):
             self.remove_rules += filter(lambda r: jump_snippet in r.rule,
                                         self.rules)
         self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        self.rule_set = set(self.rules)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -279,12 +299,13 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         rule_obj = IptablesRule(chain, rule, wrap, top)
-        if rule_obj in self.rules:
+        if rule_obj in self.rule_set:
             LOG.debug("Skipping duplicate iptables rule addition. "
-                      "%(rule)r already in %(rules)r",
-                      {'rule': rule_obj, 'rules': self.rules})
+                      "%(rule)r already in %(chain)r",
+                      {'rule': rule_obj.rule, 'chain': chain})
         else:
-            self.rules.append(IptablesRule(chain, rule, wrap, top))
+            self.rules.append(rule_obj)
+            self.rule_set.add(rule_obj)
             self.dirty = True
 
     def _wrap_target_chain(self, s):
@@ -301,7 +322,9 @@ class IptablesTable(object):
 
         """
         try:
-            self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            rule_obj = IptablesRule(chain, rule, wrap, top)
+            self.rules.remove(rule_obj)
+            self.rule_set.discard(rule_obj)
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
             self.dirty = True
@@ -319,17 +342,51 @@ class IptablesTable(object):
         self.rules = filter(lambda r: not regex.match(str(r)), self.rules)
         removed = num_rules - len(self.rules)
         if removed > 0:
+            self.rule_set = set(self.rules)
             self.dirty = True
         return removed
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        if chained_rules:
+        rules = [rule for rule in self.rules
+                 if rule.chain != chain or rule.wrap != wrap]
+        if len(rules) != len(self.rules):
+            self.rules = rules
+            self.rule_set = set(rules)
             self.dirty = True
-        for rule in chained_rules:
-            self.rules.remove(rule)
+
+    def get_chain_rules(self):
+        """Return the lines of the rules of each wrapped chain.
+
+        The rules are in the order they are applied in: top rules first,
+        and only the last of duplicate rules is kept.
+        """
+        chain_rules = dict((name, []) for name in self.chains)
+        for top in (True, False):
+            for rule in self.rules:
+                if rule.wrap and rule.top == top:
+                    chain_rules.setdefault(rule.chain, []).append(str(rule))
+        for name, lines in chain_rules.iteritems():
+            if len(set(lines)) != len(lines):
+                seen_lines = set()
+                unique_lines = []
+                for line in reversed(lines):
+                    if line not in seen_lines:
+                        seen_lines.add(line)
+                        unique_lines.append(line)
+                unique_lines.reverse()
+                chain_rules[name] = unique_lines
+        return chain_rules
+
+    def get_unwrapped_digest(self):
+        """Return a digest of the unwrapped chains and rules."""
+        digest = hashlib.sha1()
+        for name in sorted(self.unwrapped_chains):
+            digest.update(':%s\n' % name)
+        for rule in self.rules:
+            if not rule.wrap:
+                digest.update('%s %s\n' % (rule.top, rule))
+        return digest.hexdigest()
 
 
 class IptablesManager(object):
@@ -452,24 +509,111 @@ class IptablesManager(object):
         rules. This happens atomically, thanks to iptables-restore.
 
         """
+        # NOTE: apply() calls made while the lock is held queue up behind
+        # it. Changes made before the tables were rendered were committed
+        # along with them, so a burst of calls results in a single commit.
+        if not self.dirty():
+            LOG.debug("Skipping apply, rules were applied by a concurrent "
+                      "call")
+            return
+
         s = [('iptables', self.ipv4)]
         if CONF.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
-                                                run_as_root=True,
-                                                attempts=5)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
-                table.dirty = False
-            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+            if CONF.iptables_incremental_apply:
+                try:
+                    if self._apply_changed_chains(cmd, tables):
+                        continue
+                except processutils.ProcessExecutionError as e:
+                    LOG.warn(_('Failed to apply the changed iptables chains, '
+                               'applying all rules: %s'), e)
+            self._apply_all_rules(cmd, tables)
+        LOG.debug("IPTablesManager.apply completed with success")
+
+    def _apply_all_rules(self, cmd, tables):
+        """Rewrites the tables as a whole with iptables-save/restore."""
+        applied = {}
+        for table in tables.itervalues():
+            table.applied_chains = None
+        all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
+                                            run_as_root=True,
+                                            attempts=5)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                    all_lines[start:end], table, table_name)
+            applied[table_name] = (self._get_chain_digests(table),
+                                   table.get_unwrapped_digest())
+            table.dirty = False
+        self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                     process_input='\n'.join(all_lines),
+                     attempts=5)
+        for table_name, table in tables.iteritems():
+            table.applied_chains, table.applied_unwrapped = applied[table_name]
+
+    def _apply_changed_chains(self, cmd, tables):
+        """Rewrites the wrapped chains changed since the last apply.
+
+        Returns False, without applying anything, if the tables have to be
+        rewritten as a whole: before the first apply, if anything but the
+        wrapped chains changed, or to move the rules matching the top and
+        bottom regexes.
+        """
+        if CONF.iptables_top_regex or CONF.iptables_bottom_regex:
+            return False
+        changes = {}
+        for table_name, table in tables.iteritems():
+            if (table.applied_chains is None or table.remove_rules or
+                    table.remove_chains or
+                    table.get_unwrapped_digest() != table.applied_unwrapped):
+                return False
+            if table.dirty:
+                changes[table_name] = self._get_chain_changes(table)
+
+        all_lines = []
+        for table_name, (lines, digests) in sorted(changes.iteritems()):
+            if lines:
+                all_lines += ['*%s' % table_name] + lines + ['COMMIT']
+        for table_name in changes:
+            tables[table_name].dirty = False
+        if all_lines:
+            self.execute('%s-restore' % (cmd,), '-c', '--noflush',
+                         run_as_root=True,
                          process_input='\n'.join(all_lines),
                          attempts=5)
-        LOG.debug("IPTablesManager.apply completed with success")
+        for table_name, (lines, digests) in changes.iteritems():
+            tables[table_name].applied_chains = digests
+        return True
+
+    def _get_chain_digests(self, table, chain_rules=None):
+        if chain_rules is None:
+            chain_rules = table.get_chain_rules()
+        return dict((name, hashlib.sha1('\n'.join(lines)).hexdigest())
+                    for name, lines in chain_rules.iteritems())
+
+    def _get_chain_changes(self, table):
+        """Returns the iptables-restore --noflush lines rewriting the
+        wrapped chains of a table which changed, and the digests of all its
+        wrapped chains.
+        """
+        chain_rules = table.get_chain_rules()
+        digests = self._get_chain_digests(table, chain_rules)
+        applied = table.applied_chains
+        changed = sorted(name for name, digest in digests.iteritems()
+                         if applied.get(name) != digest)
+        removed = sorted(name for name in applied if name not in digests)
+
+        # Declaring a chain which exists flushes it.
+        lines = [':%s-%s - [0:0]' % (binary_name, name) for name in changed]
+        for name in changed:
+            lines += chain_rules[name]
+        for name in removed:
+            lines += ['-F %s-%s' % (binary_name, name),
+                      '-X %s-%s' % (binary_name, name)]
+        return lines, digests
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
@@ -506,17 +650,17 @@ class IptablesManager(object):
         if CONF.iptables_top_regex:
             regex = re.compile(CONF.iptables_top_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
+            temp_lines = set(line.strip() for line in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in temp_lines,
+                                new_filter)
             top_rules = temp_filter
 
         if CONF.iptables_bottom_regex:
             regex = re.compile(CONF.iptables_bottom_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                    new_filter)
+            temp_lines = set(line.strip() for line in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in temp_lines,
+                                new_filter)
             bottom_rules = temp_filter
 
         seen_chains = False
@@ -581,6 +725,10 @@ class IptablesManager(object):
         commit_index = new_filter.index('COMMIT')
         new_filter[commit_index:commit_index] = bottom_rules
         seen_lines = set()
+        # Stripped lines of the rules to remove, each one matching at most
+        # as many lines as there are rules to remove for it.
+        remove_lines = collections.Counter(
+            str(rule).split(' ', 1)[1].strip() for rule in remove_rules)
 
         def _weed_out_duplicates(line):
             # ignore [packet:byte] counts at beginning of lines
@@ -601,23 +749,17 @@ class IptablesManager(object):
                 line = line.split(':')[1]
                 line = line.split('- [')[0]
                 line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                if line in remove_chains:
+                    remove_chains.remove(line)
+                    return False
             elif line.startswith('['):
                 # it's a rule
                 # ignore [packet:byte] counts at beginning of lines
                 line = line.split(']', 1)[1]
                 line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
+                if remove_lines[line] > 0:
+                    remove_lines[line] -= 1
+                    return False
 
             # Leave it alone
             return True
@@ -632,8 +774,7 @@ class IptablesManager(object):
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
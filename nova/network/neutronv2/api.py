@@ -15,6 +15,7 @@
 #    under the License.
 #
 
+import collections
 import time
 import uuid
 
@@ -22,6 +23,7 @@ from neutronclient.common import exceptions as neutron_client_exc
 from oslo.config import cfg
 
 from nova.api.openstack import extensions
+from nova import cache_utils
 from nova.compute import flavors
 from nova.compute import utils as compute_utils
 from nova import conductor
@@ -117,6 +119,13 @@ neutron_opts = [
                 default=False,
                 help='Allow an instance to have multiple vNICs attached to '
                     'the same Neutron network.'),
+    cfg.IntOpt('topology_cache_time',
+               default=0,
+               help='Number of seconds the networks, subnets and DHCP '
+                    'servers read from neutron to build the network info '
+                    'of instances are cached in process. Entries of a '
+                    'network are dropped when neutron reports a change of '
+                    'the network of an instance. 0 disables the cache.'),
    ]
 
 CONF = cfg.CONF
@@ -125,12 +134,66 @@ CONF.register_opts(neutron_opts, 'neutron')
 CONF.import_opt('default_floating_pool', 'nova.network.floating_ips')
 CONF.import_opt('flat_injected', 'nova.network.manager')
 CONF.import_opt('compute_driver', 'nova.virt.driver')
+CONF.import_opt('memorycache_max_items', 'nova.cache_utils')
 LOG = logging.getLogger(__name__)
 
 soft_external_network_attach_authorize = extensions.soft_core_authorizer(
     'network', 'attach_external_network')
 
 
+class _TopologyCache(object):
+    """In process cache of the networks, subnets and DHCP servers read from
+    neutron, keyed by the id of the network or subnet.
+
+    Nothing is cached when the neutron.topology_cache_time option is 0.
+    """
+
+    def __init__(self):
+        self._client = cache_utils.Client(
+            maxsize=CONF.memorycache_max_items)
+
+    def get_many(self, kind, ids):
+        """Return a dict of the cached entries of a kind found for ids."""
+        if CONF.neutron.topology_cache_time <= 0:
+            return {}
+        found = {}
+        for id in ids:
+            value = self._client.get('%s-%s' % (kind, id))
+            if value is not None:
+                found[id] = value
+        return found
+
+    def set_many(self, kind, values, network_ids=None):
+        """Cache a dict of entries of a kind. network_ids maps the id of
+        each entry to the network it belongs to, so that the entry is
+        dropped with that network.
+        """
+        ttl = CONF.neutron.topology_cache_time
+        if ttl <= 0:
+            return
+        for id, value in values.iteritems():
+            key = '%s-%s' % (kind, id)
+            self._client.set(key, value, time=ttl)
+            if network_ids and id in network_ids:
+                index_key = 'keys-%s' % network_ids[id]
+                keys = self._client.get(index_key) or set()
+                keys.add(key)
+                self._client.set(index_key, keys, time=ttl)
+
+    def invalidate_networks(self, network_ids):
+        """Drop the cached entries of networks and of their subnets."""
+        for network_id in network_ids:
+            index_key = 'keys-%s' % network_id
+            for key in self._client.get(index_key) or ():
+                self._client.delete(key)
+            self._client.delete(index_key)
+            self._client.delete('network-%s' % network_id)
+            self._client.delete('dhcp-%s' % network_id)
+
+
+_TOPOLOGY_CACHE = _TopologyCache()
+
+
 class API(base_api.NetworkAPI):
     """API for interacting with the neutron 2.x API."""
 
@@ -176,6 +239,31 @@ class API(base_api.NetworkAPI):
 
         return nets
 
+    def _get_networks_by_ids(self, context, project_id, net_ids):
+        """Return the networks with the requested IDs, the ones found in the
+        topology cache are not read from neutron again.
+        """
+        cached = _TOPOLOGY_CACHE.get_many('network', net_ids)
+        if not cached:
+            nets = self._get_available_networks(context, project_id, net_ids)
+            if net_ids:
+                _TOPOLOGY_CACHE.set_many(
+                    'network', dict((net['id'], net) for net in nets))
+            return nets
+
+        missing = [net_id for net_id in net_ids if net_id not in cached]
+        if missing:
+            nets = self._get_available_networks(context, project_id, missing)
+            fetched = dict((net['id'], net) for net in nets)
+            _TOPOLOGY_CACHE.set_many('network', fetched)
+            cached.update(fetched)
+        nets = []
+        for net_id in net_ids:
+            net = cached.pop(net_id, None)
+            if net is not None:
+                nets.append(net)
+        return nets
+
     def _create_port(self, port_client, instance, network_id, port_req_body,
                      fixed_ip=None, security_group_ids=None,
                      available_macs=None, dhcp_opts=None):
@@ -604,14 +692,69 @@ class API(base_api.NetworkAPI):
                                                         update_cells=False)
         return result
 
+    def get_instances_nw_info(self, context, instances, use_slave=False):
+        """Return network information for several instances and update
+        their caches. The ports of all the instances are listed at once.
+        """
+        results = {}
+        if not instances:
+            return results
+        cached_nw_info = dict(
+            (instance['uuid'],
+             compute_utils.get_nw_info_for_instance(instance))
+            for instance in instances)
+        client = neutronv2.get_client(context, admin=True)
+        data = client.list_ports(
+            device_id=[instance['uuid'] for instance in instances])
+        ports_by_device = collections.defaultdict(list)
+        for port in data.get('ports', []):
+            ports_by_device[port['device_id']].append(port)
+
+        for instance in instances:
+            neutron_ports = [port for port in ports_by_device[instance['uuid']]
+                             if port['tenant_id'] == instance['project_id']]
+            try:
+                with lockutils.lock('refresh_cache-%s' % instance['uuid']):
+                    # NOTE: The ports were listed without the lock held, so
+                    # they are only used if the cache of the instance was not
+                    # updated since, otherwise they are listed again.
+                    if self._info_cache_changed(
+                            context, instance,
+                            cached_nw_info[instance['uuid']]):
+                        neutron_ports = None
+                    result = self._get_instance_nw_info(
+                        context, instance, neutron_ports=neutron_ports)
+                    base_api.update_instance_cache_with_nw_info(
+                        self, context, instance, nw_info=result,
+                        update_cells=False)
+            except Exception as exc:
+                results[instance['uuid']] = exc
+            else:
+                results[instance['uuid']] = result
+        return results
+
+    def _info_cache_changed(self, context, instance, nw_info):
+        """Return whether the info cache of an instance is no longer the
+        given network info, and if so refresh the one of the instance.
+        """
+        try:
+            info_cache = objects.InstanceInfoCache.get_by_instance_uuid(
+                context, instance['uuid'])
+        except exception.InstanceInfoCacheNotFound:
+            return True
+        if info_cache.network_info == nw_info:
+            return False
+        instance['info_cache'] = info_cache
+        return True
+
     def _get_instance_nw_info(self, context, instance, networks=None,
-                              port_ids=None):
+                              port_ids=None, neutron_ports=None):
         # NOTE(danms): This is an inner method intended to be called
         # by other code that updates instance nwinfo. It *must* be
         # called with the refresh_cache-%(instance_uuid) lock held!
         LOG.debug('get_instance_nw_info()', instance=instance)
         nw_info = self._build_network_info_model(context, instance, networks,
-                                                 port_ids)
+                                                 port_ids, neutron_ports)
         return network_model.NetworkInfo.hydrate(nw_info)
 
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
@@ -632,9 +775,9 @@ class API(base_api.NetworkAPI):
             net_ids = [iface['network']['id'] for iface in ifaces]
 
         if networks is None:
-            networks = self._get_available_networks(context,
-                                                    instance['project_id'],
-                                                    net_ids)
+            networks = self._get_networks_by_ids(context,
+                                                 instance['project_id'],
+                                                 net_ids)
         # an interface was added/removed from instance.
         else:
             # Since networks does not contain the existing networks on the
@@ -1185,6 +1328,28 @@ class API(base_api.NetworkAPI):
                               {'fixed_ip': fixed_ip, 'port_id': port})
         return data['floatingips']
 
+    def _get_floating_ips_by_ports(self, client, port_ids):
+        """Get the floatingips of several ports in one call, as a dict
+        mapping (port id, fixed ip) to floatingips.
+        """
+        floating_ips = collections.defaultdict(list)
+        if not port_ids:
+            return floating_ips
+        try:
+            data = client.list_floatingips(port_id=port_ids)
+        # If a neutron plugin does not implement the L3 API a 404 from
+        # list_floatingips will be raised.
+        except neutron_client_exc.NeutronClientException as e:
+            if e.status_code == 404:
+                return floating_ips
+            with excutils.save_and_reraise_exception():
+                LOG.exception(_LE('Unable to access floating IPs for ports '
+                                  '%(port_ids)s'), {'port_ids': port_ids})
+        for fip in data['floatingips']:
+            floating_ips[(fip['port_id'],
+                          fip['fixed_ip_address'])].append(fip)
+        return floating_ips
+
     def release_floating_ip(self, context, address,
                             affect_auto_assigned=False):
         """Remove a floating ip with the given address from a project."""
@@ -1261,12 +1426,16 @@ class API(base_api.NetworkAPI):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, client, port, floating_ips=None):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
+            if floating_ips is not None:
+                floats = floating_ips.get(
+                    (port['id'], fixed_ip['ip_address']), [])
+            else:
+                floats = self._get_floating_ips_by_fixed_and_port(
+                    client, fixed_ip['ip_address'], port['id'])
             for ip in floats:
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
@@ -1274,8 +1443,13 @@ class API(base_api.NetworkAPI):
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, context, port, network_IPs,
+                             neutron_subnets=None, dhcp_servers=None):
+        if neutron_subnets is not None:
+            subnets = self._make_port_subnets(port, neutron_subnets,
+                                              dhcp_servers)
+        else:
+            subnets = self._get_subnets_from_port(context, port)
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -1338,7 +1512,7 @@ class API(base_api.NetworkAPI):
         return network, ovs_interfaceid
 
     def _build_network_info_model(self, context, instance, networks=None,
-                                  port_ids=None):
+                                  port_ids=None, neutron_ports=None):
         """Return list of ordered VIFs attached to instance.
 
         :param context - request context.
@@ -1350,14 +1524,19 @@ class API(base_api.NetworkAPI):
                           instance in order of attachment. If value is None
                           this value will be populated from the existing
                           cached value.
+        :param neutron_ports - List of the ports of the instance, already
+                               listed from neutron. If value is None they
+                               are listed here.
         """
 
-        search_opts = {'tenant_id': instance['project_id'],
-                       'device_id': instance['uuid'], }
         client = neutronv2.get_client(context, admin=True)
-        data = client.list_ports(**search_opts)
+        if neutron_ports is None:
+            search_opts = {'tenant_id': instance['project_id'],
+                           'device_id': instance['uuid'], }
+            data = client.list_ports(**search_opts)
+            neutron_ports = data.get('ports', [])
 
-        current_neutron_ports = data.get('ports', [])
+        current_neutron_ports = neutron_ports
         networks, port_ids = self._gather_port_ids_and_networks(
                 context, instance, networks, port_ids)
         nw_info = network_model.NetworkInfo()
@@ -1377,6 +1556,18 @@ class API(base_api.NetworkAPI):
                     network_id=port['network_id'])['networks'][0]
                 networks.append(neutron_net)
 
+        # Read what is needed about all the ports at once.
+        ports = [current_neutron_port_map[port_id] for port_id in port_ids
+                 if port_id in current_neutron_port_map]
+        floating_ips = self._get_floating_ips_by_ports(
+            client, [port['id'] for port in ports])
+        neutron_subnets = self._get_subnets_by_ids(
+            context, [ip['subnet_id'] for port in ports
+                      for ip in port['fixed_ips']])
+        dhcp_servers = self._get_dhcp_servers(
+            context, [subnet['network_id']
+                      for subnet in neutron_subnets.itervalues()])
+
         for port_id in port_ids:
             current_neutron_port = current_neutron_port_map.get(port_id)
             if current_neutron_port:
@@ -1386,10 +1577,13 @@ class API(base_api.NetworkAPI):
                     vif_active = True
 
                 network_IPs = self._nw_info_get_ips(client,
-                                                    current_neutron_port)
+                                                    current_neutron_port,
+                                                    floating_ips)
                 subnets = self._nw_info_get_subnets(context,
                                                     current_neutron_port,
-                                                    network_IPs)
+                                                    network_IPs,
+                                                    neutron_subnets,
+                                                    dhcp_servers)
 
                 devname = "tap" + current_neutron_port['id']
                 devname = devname[:network_model.NIC_NAME_LEN]
@@ -1413,39 +1607,70 @@ class API(base_api.NetworkAPI):
 
         return nw_info
 
-    def _get_subnets_from_port(self, context, port):
-        """Return the subnets for a given port."""
+    def _get_subnets_by_ids(self, context, subnet_ids):
+        """Return a dict of the neutron subnets with the requested IDs, the
+        ones which are not in the topology cache are read in one call.
+        """
+        subnet_ids = list(set(subnet_ids))
+        subnets = _TOPOLOGY_CACHE.get_many('subnet', subnet_ids)
+        missing = [subnet_id for subnet_id in subnet_ids
+                   if subnet_id not in subnets]
+        if missing:
+            search_opts = {'id': missing}
+            data = neutronv2.get_client(context).list_subnets(**search_opts)
+            fetched = dict((subnet['id'], subnet)
+                           for subnet in data.get('subnets', []))
+            _TOPOLOGY_CACHE.set_many(
+                'subnet', fetched,
+                network_ids=dict((subnet['id'], subnet['network_id'])
+                                 for subnet in fetched.itervalues()))
+            subnets.update(fetched)
+        return subnets
 
-        fixed_ips = port['fixed_ips']
-        # No fixed_ips for the port means there is no subnet associated
-        # with the network the port is created on.
-        # Since list_subnets(id=[]) returns all subnets visible for the
-        # current tenant, returned subnets may contain subnets which is not
-        # related to the port. To avoid this, the method returns here.
-        if not fixed_ips:
-            return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = neutronv2.get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
+    def _get_dhcp_servers(self, context, network_ids):
+        """Return a dict mapping subnet IDs to the address of their DHCP
+        server, for the subnets of the requested networks.
+        """
+        network_ids = list(set(network_ids))
+        cached = _TOPOLOGY_CACHE.get_many('dhcp', network_ids)
+        missing = [network_id for network_id in network_ids
+                   if network_id not in cached]
+        if missing:
+            search_opts = {'network_id': missing,
+                           'device_owner': 'network:dhcp'}
+            data = neutronv2.get_client(context).list_ports(**search_opts)
+            fetched = dict((network_id, {}) for network_id in missing)
+            for p in data.get('ports', []):
+                servers = fetched.setdefault(p['network_id'], {})
+                for ip_pair in p['fixed_ips']:
+                    servers.setdefault(ip_pair['subnet_id'],
+                                       ip_pair['ip_address'])
+            _TOPOLOGY_CACHE.set_many('dhcp', fetched)
+            cached.update(fetched)
+
+        dhcp_servers = {}
+        for servers in cached.itervalues():
+            dhcp_servers.update(servers)
+        return dhcp_servers
+
+    def _make_port_subnets(self, port, neutron_subnets, dhcp_servers):
+        """Return the network model subnets of the fixed ips of a port."""
         subnets = []
-
-        for subnet in ipam_subnets:
+        subnet_ids = []
+        for ip in port['fixed_ips']:
+            if ip['subnet_id'] not in subnet_ids:
+                subnet_ids.append(ip['subnet_id'])
+        for subnet_id in subnet_ids:
+            subnet = neutron_subnets.get(subnet_id)
+            if subnet is None:
+                continue
             subnet_dict = {'cidr': subnet['cidr'],
                            'gateway': network_model.IP(
                                 address=subnet['gateway_ip'],
                                 type='gateway'),
             }
-
-            # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = neutronv2.get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
-            for p in dhcp_ports:
-                for ip_pair in p['fixed_ips']:
-                    if ip_pair['subnet_id'] == subnet['id']:
-                        subnet_dict['dhcp_server'] = ip_pair['ip_address']
-                        break
+            if subnet['id'] in dhcp_servers:
+                subnet_dict['dhcp_server'] = dhcp_servers[subnet['id']]
 
             subnet_object = network_model.Subnet(**subnet_dict)
             for dns in subnet.get('dns_nameservers', []):
@@ -1462,6 +1687,31 @@ class API(base_api.NetworkAPI):
             subnets.append(subnet_object)
         return subnets
 
+    def _get_subnets_from_port(self, context, port):
+        """Return the subnets for a given port."""
+
+        fixed_ips = port['fixed_ips']
+        # No fixed_ips for the port means there is no subnet associated
+        # with the network the port is created on.
+        # Since list_subnets(id=[]) returns all subnets visible for the
+        # current tenant, returned subnets may contain subnets which is not
+        # related to the port. To avoid this, the method returns here.
+        if not fixed_ips:
+            return []
+        neutron_subnets = self._get_subnets_by_ids(
+            context, [ip['subnet_id'] for ip in fixed_ips])
+        # attempt to populate DHCP server field
+        dhcp_servers = self._get_dhcp_servers(
+            context, [subnet['network_id']
+                      for subnet in neutron_subnets.itervalues()])
+        return self._make_port_subnets(port, neutron_subnets, dhcp_servers)
+
+    def invalidate_network_cache(self, context, instance):
+        """Drop what is cached about the networks of an instance."""
+        ifaces = compute_utils.get_nw_info_for_instance(instance)
+        _TOPOLOGY_CACHE.invalidate_networks(
+            set(iface['network']['id'] for iface in ifaces))
+
     def get_dns_domains(self, context):
         """Return a list of available dns domains.
 
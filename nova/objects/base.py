@@ -68,7 +68,11 @@ def make_class_properties(cls):
             attrname = get_attrname(name)
             if not hasattr(self, attrname):
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+            value = getattr(self, attrname)
+            if value.__class__ is _ObjectPrimitive:
+                value = value.hydrate(self._context)
+                setattr(self, attrname, value)
+            return value
 
         def setter(self, value, name=name, field=field):
             attrname = get_attrname(name)
@@ -92,6 +96,32 @@ def make_class_properties(cls):
         setattr(cls, name, property(getter, setter))
 
 
+class _ObjectPrimitive(object):
+    """The primitive of a nested object, which is hydrated on first access.
+
+    Until then, the nested object is unchanged and its primitive is
+    serialized again as it is.
+    """
+
+    __slots__ = ['objclass', 'primitive']
+
+    def __init__(self, objclass, primitive):
+        self.objclass = objclass
+        self.primitive = primitive
+
+    def hydrate(self, context):
+        return self.objclass._obj_from_primitive(
+            context, self.primitive['nova_object.version'], self.primitive)
+
+    def obj_what_changed(self):
+        return set(self.primitive.get('nova_object.changes', []))
+
+    def obj_to_primitive(self):
+        primitive = dict(self.primitive)
+        primitive['nova_object.data'] = dict(primitive['nova_object.data'])
+        return primitive
+
+
 class NovaObjectMetaclass(type):
     """Metaclass that allows tracking of object classes."""
 
@@ -287,6 +317,22 @@ class NovaObject(object):
                                                   objver=objver,
                                                   supported=latest_ver)
 
+    @classmethod
+    def _obj_field_codecs(cls):
+        """Returns a (name, attrname, field, is_object) tuple per field.
+
+        These are computed once per class, that is once per version of an
+        object.
+        """
+        codecs = cls.__dict__.get('_obj_codecs')
+        if codecs is None or codecs[0] is not cls.fields:
+            codecs = (cls.fields,
+                      [(name, get_attrname(name), field,
+                        isinstance(field, fields.ObjectField))
+                       for name, field in cls.fields.items()])
+            cls._obj_codecs = codecs
+        return codecs[1]
+
     @classmethod
     def _obj_from_primitive(cls, context, objver, primitive):
         self = cls()
@@ -294,16 +340,27 @@ class NovaObject(object):
         self.VERSION = objver
         objdata = primitive['nova_object.data']
         changes = primitive.get('nova_object.changes', [])
-        for name, field in self.fields.items():
-            if name in objdata:
-                setattr(self, name, field.from_primitive(self, name,
-                                                         objdata[name]))
+        for name, attrname, field, is_object in cls._obj_field_codecs():
+            if name not in objdata:
+                continue
+            value = objdata[name]
+            if field.is_primitive(value):
+                # NOTE: The value needs no coercion, so it is stored
+                # without going through the field setter.
+                setattr(self, attrname, field.copy_primitive(value))
+            elif is_object and isinstance(value, dict):
+                # NOTE: The class is looked up now so that an incompatible
+                # version is reported while deserializing, as it would be
+                # if the nested object was hydrated at once.
+                objclass = cls._obj_class_from_primitive(value)
+                setattr(self, attrname, _ObjectPrimitive(objclass, value))
+            else:
+                setattr(self, name, field.from_primitive(self, name, value))
         self._changed_fields = set([x for x in changes if x in self.fields])
         return self
 
     @classmethod
-    def obj_from_primitive(cls, primitive, context=None):
-        """Object field-by-field hydration."""
+    def _obj_class_from_primitive(cls, primitive):
         if primitive['nova_object.namespace'] != 'nova':
             # NOTE(danms): We don't do anything with this now, but it's
             # there for "the future"
@@ -312,8 +369,14 @@ class NovaObject(object):
                                    primitive['nova_object.name']))
         objname = primitive['nova_object.name']
         objver = primitive['nova_object.version']
-        objclass = cls.obj_class_from_name(objname, objver)
-        return objclass._obj_from_primitive(context, objver, primitive)
+        return cls.obj_class_from_name(objname, objver)
+
+    @classmethod
+    def obj_from_primitive(cls, primitive, context=None):
+        """Object field-by-field hydration."""
+        objclass = cls._obj_class_from_primitive(primitive)
+        return objclass._obj_from_primitive(
+            context, primitive['nova_object.version'], primitive)
 
     def __deepcopy__(self, memo):
         """Efficiently make a deep copy of this object."""
@@ -368,13 +431,21 @@ class NovaObject(object):
     def obj_to_primitive(self, target_version=None):
         """Simple base-case dehydration.
 
-        This calls to_primitive() for each item in fields.
+        This calls to_primitive() for each item in fields, except for
+        values which need no conversion and for nested objects which have
+        not been hydrated since they were deserialized.
         """
         primitive = dict()
-        for name, field in self.fields.items():
-            if self.obj_attr_is_set(name):
-                primitive[name] = field.to_primitive(self, name,
-                                                     getattr(self, name))
+        for name, attrname, field, is_object in self._obj_field_codecs():
+            if not hasattr(self, attrname):
+                continue
+            value = getattr(self, attrname)
+            if value.__class__ is _ObjectPrimitive:
+                primitive[name] = value.obj_to_primitive()
+            elif field.is_primitive(value):
+                primitive[name] = field.copy_primitive(value)
+            else:
+                primitive[name] = field.to_primitive(self, name, value)
         if target_version:
             self.obj_make_compatible(primitive, target_version)
         obj = {'nova_object.name': self.obj_name(),
@@ -405,11 +476,11 @@ class NovaObject(object):
     def obj_what_changed(self):
         """Returns a set of fields that have been modified."""
         changes = set(self._changed_fields)
-        for field in self.fields:
-            if (self.obj_attr_is_set(field) and
-                    isinstance(self[field], NovaObject) and
-                    self[field].obj_what_changed()):
-                changes.add(field)
+        for name, attrname, field, is_object in self._obj_field_codecs():
+            value = getattr(self, attrname, None)
+            if (isinstance(value, (NovaObject, _ObjectPrimitive)) and
+                    value.obj_what_changed()):
+                changes.add(name)
         return changes
 
     def obj_get_changes(self):
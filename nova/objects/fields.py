@@ -101,6 +101,10 @@ class AbstractFieldType(six.with_metaclass(abc.ABCMeta, object)):
 
 
 class FieldType(AbstractFieldType):
+    # NOTE: Values of exactly these types are left unchanged by coerce(),
+    # to_primitive() and from_primitive(), so they need no conversion.
+    PRIMITIVE_TYPES = ()
+
     @staticmethod
     def coerce(obj, attr, value):
         return value
@@ -119,6 +123,15 @@ class FieldType(AbstractFieldType):
     def stringify(self, value):
         return str(value)
 
+    def is_primitive(self, value):
+        """Returns whether a value needs no conversion by this type."""
+        return type(value) in self.PRIMITIVE_TYPES
+
+    @staticmethod
+    def copy_primitive(value):
+        """Returns a copy of a value for which is_primitive() is True."""
+        return value
+
 
 class UnspecifiedDefault(object):
     pass
@@ -234,8 +247,27 @@ class Field(object):
         else:
             return self._type.stringify(value)
 
+    def is_primitive(self, value):
+        """Returns whether a value needs no coercion nor serialization.
+
+        Such a value can be stored, and serialized, as a copy of itself,
+        which copy_primitive() returns.
+        """
+        if value is None:
+            return self._nullable
+        else:
+            return self._type.is_primitive(value)
+
+    def copy_primitive(self, value):
+        if value is None:
+            return None
+        else:
+            return self._type.copy_primitive(value)
+
 
 class String(FieldType):
+    PRIMITIVE_TYPES = (unicode,)
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should really try to avoid the need to do this
@@ -252,6 +284,8 @@ class String(FieldType):
 
 
 class UUID(FieldType):
+    PRIMITIVE_TYPES = (str,)
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should actually verify the UUIDness here
@@ -259,17 +293,23 @@ class UUID(FieldType):
 
 
 class Integer(FieldType):
+    PRIMITIVE_TYPES = (int,)
+
     @staticmethod
     def coerce(obj, attr, value):
         return int(value)
 
 
 class Float(FieldType):
+    PRIMITIVE_TYPES = (float,)
+
     def coerce(self, obj, attr, value):
         return float(value)
 
 
 class Boolean(FieldType):
+    PRIMITIVE_TYPES = (bool,)
+
     @staticmethod
     def coerce(obj, attr, value):
         return bool(value)
@@ -377,6 +417,10 @@ class IPV6Network(IPNetwork):
 class CompoundFieldType(FieldType):
     def __init__(self, element_type, **field_args):
         self._element_type = Field(element_type, **field_args)
+        # NOTE: Only containers of scalars are primitive, so that a
+        # shallow copy of them is a complete one.
+        self._primitive_elements = not isinstance(element_type,
+                                                  CompoundFieldType)
 
 
 class List(CompoundFieldType):
@@ -398,6 +442,19 @@ class List(CompoundFieldType):
         return '[%s]' % (
             ','.join([self._element_type.stringify(x) for x in value]))
 
+    def is_primitive(self, value):
+        if type(value) is not list or not self._primitive_elements:
+            return False
+        is_primitive = self._element_type.is_primitive
+        for element in value:
+            if not is_primitive(element):
+                return False
+        return True
+
+    @staticmethod
+    def copy_primitive(value):
+        return list(value)
+
 
 class Dict(CompoundFieldType):
     def coerce(self, obj, attr, value):
@@ -433,6 +490,20 @@ class Dict(CompoundFieldType):
             ','.join(['%s=%s' % (key, self._element_type.stringify(val))
                       for key, val in sorted(value.items())]))
 
+    def is_primitive(self, value):
+        if type(value) is not dict or not self._primitive_elements:
+            return False
+        is_primitive = self._element_type.is_primitive
+        for key, element in six.iteritems(value):
+            if (not isinstance(key, six.string_types) or
+                    not is_primitive(element)):
+                return False
+        return True
+
+    @staticmethod
+    def copy_primitive(value):
+        return dict(value)
+
 
 class Set(CompoundFieldType):
     def coerce(self, obj, attr, value):
@@ -337,14 +337,11 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return cls._from_db_object(context, cls(), db_inst,
                                    expected_attrs)
 
-    @base.remotable
-    def create(self, context):
-        if self.obj_attr_is_set('id'):
-            raise exception.ObjectActionError(action='create',
-                                              reason='already created')
+    def _get_create_updates(self):
+        """Returns the changes of a new instance in the form expected by
+        db.instance_create.
+        """
         updates = self.obj_get_changes()
-        expected_attrs = [attr for attr in INSTANCE_DEFAULT_FIELDS
-                          if attr in updates]
         if 'security_groups' in updates:
             updates['security_groups'] = [x.name for x in
                                           updates['security_groups']]
@@ -352,6 +349,16 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             updates['info_cache'] = {
                 'network_info': updates['info_cache'].network_info.json()
                 }
+        return updates
+
+    @base.remotable
+    def create(self, context):
+        if self.obj_attr_is_set('id'):
+            raise exception.ObjectActionError(action='create',
+                                              reason='already created')
+        updates = self._get_create_updates()
+        expected_attrs = [attr for attr in INSTANCE_DEFAULT_FIELDS
+                          if attr in updates]
         numa_topology = updates.pop('numa_topology', None)
         db_inst = db.instance_create(context, updates)
         if numa_topology:
@@ -695,6 +702,32 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @classmethod
+    def get_by_filters_chunked(cls, context, filters,
+                               sort_key='created_at', sort_dir='desc',
+                               limit=None, marker=None, expected_attrs=None,
+                               use_slave=False, chunk_size=1000):
+        """Same as get_by_filters(), but returns an iterator over lists of
+        at most chunk_size instances.
+
+        Each list is built from its own chunk of database rows, so that the
+        caller can be done with one list before the next one is read. Behind
+        an indirection API, all the instances come in a single list.
+        """
+        if base.NovaObject.indirection_api:
+            return iter([cls.get_by_filters(
+                context, filters, sort_key=sort_key, sort_dir=sort_dir,
+                limit=limit, marker=marker, expected_attrs=expected_attrs,
+                use_slave=use_slave)])
+        db_inst_chunks = db.instance_get_all_by_filters_chunked(
+            context, filters, sort_key, sort_dir, limit=limit, marker=marker,
+            columns_to_join=_expected_cols(expected_attrs),
+            use_slave=use_slave, chunk_size=chunk_size)
+        # NOTE: _make_instance_list() removes 'fault' from expected_attrs.
+        return (_make_instance_list(context, cls(), db_inst_chunk,
+                                    list(expected_attrs or []))
+                for db_inst_chunk in db_inst_chunks)
+
     @base.remotable_classmethod
     def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
         db_inst_list = db.instance_get_all_by_host(
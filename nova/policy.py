@@ -15,11 +15,19 @@
 
 """Policy Engine For Nova."""
 
+import ast
+import weakref
+
+import six
+
 from nova import exception
 from nova.openstack.common import policy
 
 
 _ENFORCER = None
+# NOTE: The credentials are kept out of the contexts, which must remain
+# picklable, and are dropped with them.
+_CREDENTIALS = weakref.WeakKeyDictionary()
 
 
 def reset():
@@ -43,10 +51,10 @@ def init(policy_file=None, rules=None, default_rule=None, use_conf=True):
 
     global _ENFORCER
     if not _ENFORCER:
-        _ENFORCER = policy.Enforcer(policy_file=policy_file,
-                                    rules=rules,
-                                    default_rule=default_rule,
-                                    use_conf=use_conf)
+        _ENFORCER = Enforcer(policy_file=policy_file,
+                             rules=rules,
+                             default_rule=default_rule,
+                             use_conf=use_conf)
 
 
 def set_rules(rules, overwrite=True, use_conf=False):
@@ -85,7 +93,7 @@ def enforce(context, action, target, do_raise=True, exc=None):
            do_raise is False.
     """
     init()
-    credentials = context.to_dict()
+    credentials = _get_credentials(context)
     if not exc:
         exc = exception.PolicyNotAuthorized
     return _ENFORCER.enforce(action, target, credentials, do_raise=do_raise,
@@ -99,7 +107,7 @@ def check_is_admin(context):
 
     init()
     # the target is user-self
-    credentials = context.to_dict()
+    credentials = _get_credentials(context)
     target = credentials
     return _ENFORCER.enforce('context_is_admin', target, credentials)
 
@@ -124,3 +132,230 @@ class IsAdminCheck(policy.Check):
 def get_rules():
     if _ENFORCER:
         return _ENFORCER.rules
+
+
+class Credentials(dict):
+    """The credentials of a context, as a dictionary.
+
+    Results of the rules which do not depend on the target are kept in
+    it, so that they are shared by the enforcements made with it.
+    """
+
+    def __init__(self, context):
+        super(Credentials, self).__init__(context.to_dict())
+        self.key = _get_credentials_key(context)
+        self.results = {}
+        self.results_rules = None
+        self._roles = None
+
+    @property
+    def roles(self):
+        if self._roles is None:
+            self._roles = set(role.lower() for role in self['roles'])
+        return self._roles
+
+
+def _get_credentials_key(context):
+    return (context.user_id, context.project_id, context.is_admin,
+            context.read_deleted, tuple(context.roles))
+
+
+def _get_credentials(context):
+    """Returns the credentials of a context, computing them only once
+    unless its user, project, roles or admin flag change.
+    """
+    credentials = _CREDENTIALS.get(context)
+    if (credentials is None or
+            credentials.key != _get_credentials_key(context)):
+        credentials = Credentials(context)
+        _CREDENTIALS[context] = credentials
+    return credentials
+
+
+class _CompiledRules(object):
+    """Flat callables compiled from the parsed rules of an Enforcer.
+
+    Each rule is compiled into a function of the target, the credentials
+    and the results shared for these credentials. The results of the
+    rules which only depend on the credentials are kept in those.
+    """
+
+    def __init__(self, rules, enforcer):
+        self.rules = rules
+        self.enforcer = enforcer
+        self._by_name = {}
+        self._target_independent = {}
+
+    def get(self, name):
+        """Returns the function of a rule, or None if it does not exist."""
+        if name not in self._by_name:
+            try:
+                check = self.rules[name]
+            except KeyError:
+                self._by_name[name] = None
+            else:
+                self._by_name[name] = self._compile_named(name, check)
+        return self._by_name[name]
+
+    def _compile_named(self, name, check):
+        func = self._compile(check)
+        if not self._is_target_independent(check, set([name])):
+            return func
+
+        def shared(target, creds, results):
+            try:
+                return results[name]
+            except KeyError:
+                result = results[name] = func(target, creds, results)
+                return result
+        return shared
+
+    def _is_target_independent(self, check, seen):
+        if isinstance(check, (policy.TrueCheck, policy.FalseCheck,
+                              policy.RoleCheck, IsAdminCheck)):
+            return True
+        if isinstance(check, (policy.AndCheck, policy.OrCheck)):
+            return all(self._is_target_independent(rule, seen)
+                       for rule in check.rules)
+        if isinstance(check, policy.NotCheck):
+            return self._is_target_independent(check.rule, seen)
+        if isinstance(check, policy.RuleCheck):
+            if check.match in seen:
+                return False
+            if check.match not in self._target_independent:
+                try:
+                    rule = self.rules[check.match]
+                except KeyError:
+                    independent = True
+                else:
+                    independent = self._is_target_independent(
+                        rule, seen | set([check.match]))
+                self._target_independent[check.match] = independent
+            return self._target_independent[check.match]
+        if isinstance(check, policy.GenericCheck):
+            return '%' not in check.match
+        return False
+
+    def _compile(self, check):
+        if isinstance(check, policy.TrueCheck):
+            return lambda target, creds, results: True
+        if isinstance(check, policy.FalseCheck):
+            return lambda target, creds, results: False
+        if isinstance(check, (policy.AndCheck, policy.OrCheck)):
+            funcs = [self._compile(rule) for rule in check.rules]
+            if isinstance(check, policy.AndCheck):
+                def and_check(target, creds, results):
+                    for func in funcs:
+                        if not func(target, creds, results):
+                            return False
+                    return True
+                return and_check
+
+            def or_check(target, creds, results):
+                for func in funcs:
+                    if func(target, creds, results):
+                        return True
+                return False
+            return or_check
+        if isinstance(check, policy.NotCheck):
+            func = self._compile(check.rule)
+            return lambda target, creds, results: not func(target, creds,
+                                                           results)
+        if isinstance(check, policy.RuleCheck):
+            name = check.match
+
+            def rule_check(target, creds, results):
+                func = self.get(name)
+                if func is None:
+                    # We don't have any matching rule; fail closed
+                    return False
+                return func(target, creds, results)
+            return rule_check
+        if isinstance(check, policy.RoleCheck):
+            role = check.match.lower()
+
+            def role_check(target, creds, results):
+                if isinstance(creds, Credentials):
+                    return role in creds.roles
+                return role in [x.lower() for x in creds['roles']]
+            return role_check
+        if isinstance(check, IsAdminCheck):
+            expected = check.expected
+            return lambda target, creds, results: (creds['is_admin'] ==
+                                                   expected)
+        if isinstance(check, policy.GenericCheck):
+            return self._compile_generic(check)
+        enforcer = self.enforcer
+        return lambda target, creds, results: check(target, creds, enforcer)
+
+    def _compile_generic(self, check):
+        kind = check.kind
+        match = check.match
+        try:
+            literal = six.text_type(ast.literal_eval(kind))
+        except ValueError:
+            literal = None
+
+        def generic_check(target, creds, results):
+            try:
+                value = match % target
+            except KeyError:
+                # While doing GenericCheck if key not
+                # present in Target return false
+                return False
+            if literal is not None:
+                return value == literal
+            try:
+                return value == six.text_type(creds[kind])
+            except KeyError:
+                return False
+        return generic_check
+
+
+class Enforcer(policy.Enforcer):
+    """An Enforcer which evaluates compiled rules."""
+
+    def __init__(self, *args, **kwargs):
+        self._compiled = None
+        super(Enforcer, self).__init__(*args, **kwargs)
+
+    def set_rules(self, rules, overwrite=True, use_conf=False):
+        super(Enforcer, self).set_rules(rules, overwrite, use_conf)
+        self._compiled = None
+
+    def enforce(self, rule, target, creds, do_raise=False,
+                exc=None, *args, **kwargs):
+        self.load_rules()
+
+        if not isinstance(rule, six.string_types) or not self.rules:
+            return super(Enforcer, self).enforce(rule, target, creds,
+                                                 do_raise, exc,
+                                                 *args, **kwargs)
+
+        compiled = self._compiled
+        if compiled is None or compiled.rules is not self.rules:
+            compiled = self._compiled = _CompiledRules(self.rules, self)
+        if isinstance(creds, Credentials):
+            if creds.results_rules is not compiled:
+                creds.results = {}
+                creds.results_rules = compiled
+            results = creds.results
+        else:
+            results = {}
+
+        func = compiled.get(rule)
+        if func is None:
+            policy.LOG.debug("Rule [%s] doesn't exist" % rule)
+            # If the rule doesn't exist, fail closed
+            result = False
+        else:
+            result = func(target, creds, results)
+
+        # If it is False, raise the exception if requested
+        if do_raise and not result:
+            if exc:
+                raise exc(*args, **kwargs)
+
+            raise policy.PolicyNotAuthorized(rule)
+
+        return result
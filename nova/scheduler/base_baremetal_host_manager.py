@@ -28,6 +28,8 @@ class BaseBaremetalNodeState(host_manager.HostState):
     previously used and lock down access.
     """
 
+    __slots__ = ()
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
         self.vcpus_total = compute['vcpus']
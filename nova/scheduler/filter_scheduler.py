@@ -19,6 +19,8 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
+import itertools
 import random
 
 from oslo.config import cfg
@@ -47,7 +49,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Filter and weigh the hosts once for a request of '
+                     'several instances and pick the host of each instance '
+                     'from a priority queue. Only the hosts whose state '
+                     'changed are filtered and weighed again, against the '
+                     'weights of the first pass.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -102,6 +111,9 @@ class FilterScheduler(driver.Scheduler):
         # NOTE(comstud): Make sure we do not pass this through.  It
         # contains an instance of RpcContext that cannot be serialized.
         filter_properties.pop('context', None)
+        # NOTE: The data precomputed by the filters is only valid for
+        # this request.
+        filter_properties.pop('precomputed', None)
 
         for num, instance_uuid in enumerate(instance_uuids):
             request_spec['instance_properties']['launch_index'] = num
@@ -254,6 +266,7 @@ class FilterScheduler(driver.Scheduler):
 
         self.populate_filter_properties(request_spec,
                                         filter_properties)
+        self.host_manager.precompute_filters(filter_properties)
 
         # Find our local list of acceptable hosts by repeatedly
         # filtering and weighing our options. Each time we choose a
@@ -265,11 +278,18 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self._get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batch(hosts, num_instances,
+                                        instance_properties,
+                                        filter_properties,
+                                        update_group_hosts)
+
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -285,11 +305,8 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
+            scheduler_host_subset_size = self._get_host_subset_size(
+                len(weighed_hosts))
 
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
@@ -297,21 +314,102 @@ class FilterScheduler(driver.Scheduler):
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            # NOTE (baoli) adding and deleting pci_requests is a temporary
-            # fix to avoid DB access in consume_from_instance() while getting
-            # pci_requests. The change can be removed once pci_requests is
-            # part of the instance object that is passed into the scheduler
-            # APIs
-            pci_requests = filter_properties.get('pci_requests')
-            if pci_requests:
-                instance_properties['pci_requests'] = pci_requests
-            chosen_host.obj.consume_from_instance(instance_properties)
-            if pci_requests:
-                del instance_properties['pci_requests']
-            if update_group_hosts is True:
-                filter_properties['group_hosts'].add(chosen_host.obj.host)
+            self._consume_from_instance(chosen_host.obj, instance_properties,
+                                        filter_properties, update_group_hosts)
+        return selected_hosts
+
+    def _schedule_batch(self, hosts, num_instances, instance_properties,
+                        filter_properties, update_group_hosts):
+        """Returns the hosts of a request of several instances, picked from
+        a priority queue of the hosts ordered by their fitness.
+
+        Hosts are filtered and weighed once. Each chosen host is filtered
+        again before being picked another time and weighed against the
+        bounds of the first weighing. When the hosts of a server group are
+        tracked, every host is filtered again before being picked.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        weighers = self.host_manager.get_weighers()
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties, weighers=weighers)
+
+        LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+
+        # NOTE: The counter keeps hosts of equal weight in the order of
+        # the weighed list and avoids comparing the hosts themselves.
+        counter = itertools.count()
+        queue = [(-weighed_host.weight, next(counter), weighed_host)
+                 for weighed_host in weighed_hosts]
+        heapq.heapify(queue)
+        changed_hosts = set()
+
+        selected_hosts = []
+        for num in xrange(num_instances):
+            scheduler_host_subset_size = self._get_host_subset_size(
+                len(queue))
+            candidates = []
+            while queue and len(candidates) < scheduler_host_subset_size:
+                entry = heapq.heappop(queue)
+                host_state = entry[2].obj
+                if ((update_group_hosts or host_state in changed_hosts) and
+                        not self.host_manager.host_passes_filters(
+                            host_state, filter_properties, index=num)):
+                    # Resources only decrease and group hosts only grow
+                    # during a request, so the host is dropped for good.
+                    continue
+                candidates.append(entry)
+            if not candidates:
+                # Can't get any more locally.
+                break
+
+            chosen = random.choice(candidates)
+            for entry in candidates:
+                if entry is not chosen:
+                    heapq.heappush(queue, entry)
+
+            chosen_host = chosen[2]
+            selected_hosts.append(chosen_host)
+
+            self._consume_from_instance(chosen_host.obj, instance_properties,
+                                        filter_properties, update_group_hosts)
+            changed_hosts.add(chosen_host.obj)
+            weighed_host = self.host_manager.get_weighed_hosts(
+                [chosen_host.obj], filter_properties, weighers=weighers)[0]
+            heapq.heappush(queue,
+                           (-weighed_host.weight, next(counter), weighed_host))
         return selected_hosts
 
+    @staticmethod
+    def _get_host_subset_size(num_hosts):
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size > num_hosts:
+            scheduler_host_subset_size = num_hosts
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+        return scheduler_host_subset_size
+
+    def _consume_from_instance(self, host_state, instance_properties,
+                               filter_properties, update_group_hosts):
+        # NOTE (baoli) adding and deleting pci_requests is a temporary
+        # fix to avoid DB access in consume_from_instance() while getting
+        # pci_requests. The change can be removed once pci_requests is
+        # part of the instance object that is passed into the scheduler
+        # APIs
+        pci_requests = filter_properties.get('pci_requests')
+        if pci_requests:
+            instance_properties['pci_requests'] = pci_requests
+        host_state.consume_from_instance(instance_properties)
+        if pci_requests:
+            del instance_properties['pci_requests']
+        if update_group_hosts is True:
+            filter_properties['group_hosts'].add(host_state.host)
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
@@ -18,6 +18,11 @@ Scheduler host filters
 """
 
 from nova import filters
+from nova.i18n import _
+from nova.openstack.common import log as logging
+from nova.scheduler import host_table
+
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -32,11 +37,81 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def filter_table(self, table, filter_properties):
+        """Return a boolean array telling which hosts of a HostTable pass
+        the filter, or None if the filter has to be run host by host.
+
+        Override this in a subclass which can evaluate all hosts at once.
+        """
+        return None
+
+    def precompute(self, filter_properties):
+        """Return the data the filter needs for all hosts of a request, or
+        None if there is nothing to precompute.
+
+        Override this in a subclass which would otherwise query the
+        database for each host. It is run once per request before the
+        hosts are filtered, and its result is returned by get_precomputed().
+        """
+        return None
+
+    def get_precomputed(self, filter_properties):
+        """Return the result of precompute() for the request, or None if
+        it was not run.
+        """
+        precomputed = filter_properties.get('precomputed') or {}
+        return precomputed.get(self.__class__.__name__)
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def precompute(self, filter_classes, filter_properties):
+        """Store the data precomputed by the filters for a request in
+        filter_properties.
+        """
+        precomputed = {}
+        for filter_cls in filter_classes:
+            data = filter_cls().precompute(filter_properties)
+            if data is not None:
+                precomputed[filter_cls.__name__] = data
+        filter_properties['precomputed'] = precomputed
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        if not host_table.enabled():
+            return super(HostFilterHandler, self).get_filtered_objects(
+                    filter_classes, objs, filter_properties, index)
+
+        table = host_table.HostTable(objs)
+        LOG.debug("Starting with %d host(s)", len(table))
+        for filter_cls in filter_classes:
+            cls_name = filter_cls.__name__
+            filter = filter_cls()
+
+            if filter.run_filter_for_index(index):
+                passes = filter.filter_table(table, filter_properties)
+                if passes is not None:
+                    table = table.compress(passes)
+                else:
+                    # NOTE: Fall back to running the filter host by host,
+                    # columns are rebuilt for the remaining hosts on demand.
+                    objs = filter.filter_all(list(table.host_states),
+                                             filter_properties)
+                    if objs is None:
+                        LOG.debug("Filter %(cls_name)s says to stop "
+                                  "filtering", {'cls_name': cls_name})
+                        return
+                    table = host_table.HostTable(objs)
+                if not len(table):
+                    LOG.info(_("Filter %s returned 0 hosts"), cls_name)
+                    break
+                LOG.debug("Filter %(cls_name)s returned "
+                          "%(obj_len)d host(s)",
+                          {'cls_name': cls_name, 'obj_len': len(table)})
+        return list(table.host_states)
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
@@ -30,47 +30,70 @@ class AffinityFilter(filters.BaseHostFilter):
         self.compute_api = compute.API()
 
 
-class DifferentHostFilter(AffinityFilter):
-    '''Schedule the instance on a different host from a set of instances.'''
+class _InstanceHostAffinityFilter(AffinityFilter):
+    """Base class of the filters comparing a host with the hosts of the
+    instances given by a scheduler hint.
+    """
 
     # The hosts the instances are running on doesn't change within a request
     run_filter_once_per_request = True
 
-    def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+    hint_name = None
 
-        affinity_uuids = scheduler_hints.get('different_host', [])
+    def _affinity_uuids(self, filter_properties):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        affinity_uuids = scheduler_hints.get(self.hint_name, [])
         if isinstance(affinity_uuids, six.string_types):
             affinity_uuids = [affinity_uuids]
+        return affinity_uuids
+
+    def precompute(self, filter_properties):
+        """Return the set of hosts the instances of the hint run on."""
+        affinity_uuids = self._affinity_uuids(filter_properties)
+        if not affinity_uuids:
+            return None
+        instances = self.compute_api.get_all(filter_properties['context'],
+                                             {'uuid': affinity_uuids,
+                                              'deleted': False})
+        return set(instance['host'] for instance in instances)
+
+    def _host_has_instances(self, host_state, filter_properties,
+                            affinity_uuids):
+        hosts = self.get_precomputed(filter_properties)
+        if hosts is not None:
+            return host_state.host in hosts
+        return bool(self.compute_api.get_all(filter_properties['context'],
+                                             {'host': host_state.host,
+                                              'uuid': affinity_uuids,
+                                              'deleted': False}))
+
+
+class DifferentHostFilter(_InstanceHostAffinityFilter):
+    '''Schedule the instance on a different host from a set of instances.'''
+
+    hint_name = 'different_host'
+
+    def host_passes(self, host_state, filter_properties):
+        affinity_uuids = self._affinity_uuids(filter_properties)
         if affinity_uuids:
-            return not self.compute_api.get_all(context,
-                                                {'host': host_state.host,
-                                                 'uuid': affinity_uuids,
-                                                 'deleted': False})
+            return not self._host_has_instances(host_state, filter_properties,
+                                                affinity_uuids)
         # With no different_host key
         return True
 
 
-class SameHostFilter(AffinityFilter):
+class SameHostFilter(_InstanceHostAffinityFilter):
     '''Schedule the instance on the same host as another instance in a set of
     instances.
     '''
 
-    # The hosts the instances are running on doesn't change within a request
-    run_filter_once_per_request = True
+    hint_name = 'same_host'
 
     def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-
-        affinity_uuids = scheduler_hints.get('same_host', [])
-        if isinstance(affinity_uuids, six.string_types):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._affinity_uuids(filter_properties)
         if affinity_uuids:
-            return self.compute_api.get_all(context, {'host': host_state.host,
-                                                      'uuid': affinity_uuids,
-                                                      'deleted': False})
+            return self._host_has_instances(host_state, filter_properties,
+                                            affinity_uuids)
         # With no same_host key
         return True
 
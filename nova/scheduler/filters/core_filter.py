@@ -80,6 +80,21 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def filter_table(self, table, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+
+        instance_vcpus = instance_type['vcpus']
+        host_vcpus = table.column('vcpus_total')
+        vcpus_total = host_vcpus * CONF.cpu_allocation_ratio
+        free_vcpus = vcpus_total - table.column('vcpus_used')
+        # Hosts which do not report their VCPUs pass, see host_passes()
+        passes = (host_vcpus == 0) | (free_vcpus >= instance_vcpus)
+
+        table.set_limits('vcpu', vcpus_total, passes & (vcpus_total > 0))
+        return passes
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -88,12 +103,9 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
+        aggregate_vals = utils.aggregate_values_from_key(
             filter_properties['context'],
-            host_state.host,
+            host_state,
             'cpu_allocation_ratio')
         try:
             ratio = utils.validate_num_values(
@@ -26,12 +26,22 @@ class TypeAffinityFilter(filters.BaseHostFilter):
     (spread) set to 1 (default).
     """
 
+    def precompute(self, filter_properties):
+        """Return the set of hosts running instances of other types."""
+        instance_type = filter_properties.get('instance_type')
+        context = filter_properties['context'].elevated()
+        return set(db.instance_get_hosts_by_not_type(context,
+                                                     instance_type['id']))
+
     def host_passes(self, host_state, filter_properties):
         """Dynamically limits hosts to one instance type
 
         Return False if host has any instance types other than the requested
         type. Return True if all instance types match or if host is empty.
         """
+        other_type_hosts = self.get_precomputed(filter_properties)
+        if other_type_hosts is not None:
+            return host_state.host not in other_type_hosts
 
         instance_type = filter_properties.get('instance_type')
         context = filter_properties['context'].elevated()
@@ -53,11 +63,8 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
 
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
-            filter_properties['context'], host_state.host, 'instance_type')
+        aggregate_vals = utils.aggregate_values_from_key(
+            filter_properties['context'], host_state, 'instance_type')
 
         if not aggregate_vals:
             return True
@@ -14,7 +14,9 @@
 
 """Bench of utility methods used by filters."""
 
+import collections
 
+from nova import db
 from nova.i18n import _LI
 from nova.objects import aggregate
 from nova.openstack.common import log as logging
@@ -33,6 +35,33 @@ def aggregate_values_from_db(context, host, key_name):
     return aggregate_vals
 
 
+def aggregate_values_from_key(context, host_state, key_name):
+    """Returns a set of values based on a metadata key for a host state.
+
+    The aggregates indexed by the HostManager are used when the host state
+    carries them, otherwise the database is queried.
+    """
+    if host_state.aggregates is None:
+        return aggregate_values_from_db(context, host_state.host, key_name)
+    return set(aggr.metadata[key_name] for aggr in host_state.aggregates
+               if key_name in aggr.metadata)
+
+
+def aggregate_metadata_get_by_host(context, host_state, key=None):
+    """Returns a dict of the sets of metadata values of a host state,
+    like db.aggregate_metadata_get_by_host().
+    """
+    if host_state.aggregates is None:
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+    metadata = collections.defaultdict(set)
+    for aggr in host_state.aggregates:
+        for k, v in aggr.metadata.iteritems():
+            if key is None or k == key:
+                metadata[k].add(v)
+    return dict(metadata)
+
+
 def validate_num_values(vals, default=None, cast_to=int, based_on=min):
     """Returns a corretly casted value based on a set of values.
 
@@ -18,15 +18,18 @@ Manage hosts in the current zone.
 """
 
 import collections
+import time
 import UserDict
 
 from oslo.config import cfg
+import six
 
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
 from nova import exception
 from nova.i18n import _, _LW
+from nova import objects
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
@@ -58,6 +61,27 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_incremental_host_state',
+                default=False,
+                help='Keep host states in memory between requests and only '
+                     'load the compute nodes which changed since the last '
+                     'refresh, instead of loading every compute node for '
+                     'each request.'),
+    cfg.IntOpt('scheduler_host_state_max_staleness',
+               default=0,
+               help='Number of seconds incrementally maintained host states '
+                    'may be used without checking the database for '
+                    'changes. 0 checks for changes on every request.'),
+    cfg.IntOpt('scheduler_host_state_full_refresh_interval',
+               default=600,
+               help='Maximum number of seconds between two full reloads of '
+                    'the compute nodes when incremental host state refresh '
+                    'is enabled.'),
+    cfg.IntOpt('scheduler_aggregate_index_max_staleness',
+               default=0,
+               help='Number of seconds the host aggregates indexed by the '
+                    'scheduler may be used before they are reloaded from '
+                    'the database. 0 reloads them once for each request.'),
     ]
 
 CONF = cfg.CONF
@@ -107,8 +131,24 @@ class HostState(object):
     """Mutable and immutable information tracked for a host.
     This is an attempt to remove the ad-hoc data structures
     previously used and lock down access.
+
+    The NUMA topology, the metrics and the PCI stats reported by the compute
+    node are kept serialized until a filter or a weigher asks for them.
+
+    The aggregates of the host are set by the HostManager, so that filters
+    do not query the database for each host. None means they are unknown.
     """
 
+    __slots__ = ('host', 'nodename', 'total_usable_ram_mb',
+                 'total_usable_disk_gb', 'disk_mb_used', 'free_ram_mb',
+                 'free_disk_mb', 'vcpus_total', 'vcpus_used', 'num_instances',
+                 'num_io_ops', 'host_ip', 'hypervisor_type',
+                 'hypervisor_version', 'hypervisor_hostname', 'cpu_info',
+                 'supported_instances', 'limits', 'updated', 'service',
+                 'stats', '_numa_topology', '_numa_topology_json',
+                 '_metrics', '_metrics_json', '_pci_stats', '_pci_stats_json',
+                 '_stats_json', '_supported_instances_json', 'aggregates')
+
     def __init__(self, host, node, compute=None):
         self.host = host
         self.nodename = node
@@ -122,11 +162,13 @@ class HostState(object):
         self.free_disk_mb = 0
         self.vcpus_total = 0
         self.vcpus_used = 0
-        self.numa_topology = None
+        self._numa_topology = None
+        self._numa_topology_json = None
 
         # Additional host information from the compute node stats:
         self.num_instances = 0
         self.num_io_ops = 0
+        self._stats_json = None
 
         # Other information
         self.host_ip = None
@@ -135,19 +177,66 @@ class HostState(object):
         self.hypervisor_hostname = None
         self.cpu_info = None
         self.supported_instances = None
+        self._supported_instances_json = None
+        self._pci_stats = None
+        self._pci_stats_json = None
 
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
         # Generic metrics from compute nodes
-        self.metrics = {}
+        self._metrics = {}
+        self._metrics_json = None
+
+        # Aggregates the host belongs to
+        self.aggregates = None
 
         self.updated = None
         if compute:
             self.update_from_compute_node(compute)
 
+    @property
+    def numa_topology(self):
+        if self._numa_topology_json is not None:
+            self._numa_topology = hardware.VirtNUMAHostTopology.from_json(
+                    self._numa_topology_json)
+            self._numa_topology_json = None
+        return self._numa_topology
+
+    @numa_topology.setter
+    def numa_topology(self, numa_topology):
+        self._numa_topology = numa_topology
+        self._numa_topology_json = None
+
+    @property
+    def metrics(self):
+        if self._metrics_json is not None:
+            self._update_metrics_from_json(self._metrics_json)
+            self._metrics_json = None
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        self._metrics_json = None
+
+    @property
+    def pci_stats(self):
+        if self._pci_stats_json is not None:
+            self._pci_stats = pci_stats.PciDeviceStats(self._pci_stats_json)
+            self._pci_stats_json = None
+        return self._pci_stats
+
+    @pci_stats.setter
+    def pci_stats(self, stats):
+        self._pci_stats = stats
+        self._pci_stats_json = None
+
     def update_service(self, service):
-        self.service = ReadOnlyDict(service)
+        if isinstance(getattr(self, 'service', None), ReadOnlyDict):
+            self.service.update(service)
+        else:
+            self.service = ReadOnlyDict(service)
 
     def _update_metrics_from_compute_node(self, compute):
         # NOTE(llu): The 'or []' is to avoid json decode failure of None
@@ -155,8 +244,12 @@ class HostState(object):
         #            NULL in the metrics column
         metrics = compute.get('metrics', []) or []
         if metrics:
-            metrics = jsonutils.loads(metrics)
-        for metric in metrics:
+            # NOTE: Metrics which were not parsed yet are replaced by the
+            # ones of this compute node update.
+            self._metrics_json = metrics
+
+    def _update_metrics_from_json(self, metrics):
+        for metric in jsonutils.loads(metrics):
             # 'name', 'value', 'timestamp' and 'source' are all required
             # to be valid keys, just let KeyError happen if any one of
             # them is missing. But we also require 'name' to be True.
@@ -165,7 +258,7 @@ class HostState(object):
                               timestamp=metric['timestamp'],
                               source=metric['source'])
             if name:
-                self.metrics[name] = item
+                self._metrics[name] = item
             else:
                 LOG.warn(_LW("Metric name unknown of %r"), item)
 
@@ -198,9 +291,19 @@ class HostState(object):
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
-        self.numa_topology = compute['numa_topology']
-        if 'pci_stats' in compute:
-            self.pci_stats = pci_stats.PciDeviceStats(compute['pci_stats'])
+        # NOTE: The NUMA topology is only parsed when it is used, and then
+        # kept as an object which consume_from_instance() updates.
+        numa_topology = compute['numa_topology']
+        if isinstance(numa_topology, six.string_types):
+            self._numa_topology = None
+            self._numa_topology_json = numa_topology
+        else:
+            self.numa_topology = numa_topology
+        if compute.get('pci_stats'):
+            self.pci_stats = None
+            self._pci_stats_json = compute['pci_stats']
+        elif 'pci_stats' in compute:
+            self.pci_stats = pci_stats.PciDeviceStats()
         else:
             self.pci_stats = None
 
@@ -210,15 +313,19 @@ class HostState(object):
         self.hypervisor_version = compute.get('hypervisor_version')
         self.hypervisor_hostname = compute.get('hypervisor_hostname')
         self.cpu_info = compute.get('cpu_info')
-        if compute.get('supported_instances'):
-            self.supported_instances = jsonutils.loads(
-                    compute.get('supported_instances'))
+        supported_instances = compute.get('supported_instances')
+        if (supported_instances and
+                supported_instances != self._supported_instances_json):
+            self.supported_instances = jsonutils.loads(supported_instances)
+            self._supported_instances_json = supported_instances
 
         # Don't store stats directly in host_state to make sure these don't
         # overwrite any values, or get overwritten themselves. Store in self so
         # filters can schedule with them.
         stats = compute.get('stats', None) or '{}'
-        self.stats = jsonutils.loads(stats)
+        if stats != self._stats_json:
+            self.stats = jsonutils.loads(stats)
+            self._stats_json = stats
 
         # Track number of instances on host
         self.num_instances = int(self.stats.get('num_instances', 0))
@@ -280,6 +387,18 @@ class HostManager(object):
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
+        # Incremental host state refresh bookkeeping
+        self._compute_node_keys = {}
+        self._changed_since = None
+        self._last_full_refresh = None
+        self._last_refresh = None
+        self.host_state_stats = dict(hits=0, full_refreshes=0,
+                                     incremental_refreshes=0,
+                                     compute_nodes_loaded=0,
+                                     refresh_seconds=0.0)
+        # Aggregates indexed by host
+        self.host_aggregates_map = {}
+        self._aggregates_loaded_at = None
 
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
@@ -378,43 +497,180 @@ class HostManager(object):
         return self.filter_handler.get_filtered_objects(filter_classes,
                 hosts, filter_properties, index)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
-        return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+    def precompute_filters(self, filter_properties, filter_class_names=None):
+        """Let the filters run the queries they need for all hosts of a
+        request at once, before the hosts are filtered.
+        """
+        filter_classes = self._choose_host_filters(filter_class_names)
+        self.filter_handler.precompute(filter_classes, filter_properties)
+
+    def host_passes_filters(self, host_state, filter_properties,
+            filter_class_names=None, index=0):
+        """Check again whether a host passes the filters, for instance
+        because its state changed since it was filtered.
+        """
+        filter_classes = self._choose_host_filters(filter_class_names)
+        return bool(self.filter_handler.get_filtered_objects(filter_classes,
+                [host_state], filter_properties, index))
+
+    def get_weighers(self):
+        """Return instances of the weigher classes in use."""
+        return [weigher_cls() for weigher_cls in self.weight_classes]
+
+    def get_weighed_hosts(self, hosts, weight_properties, weighers=None):
+        """Weigh the hosts.
+
+        If weighers from get_weighers() are given, the weights are
+        normalized against the bounds recorded by their first call. Weights
+        outside of these bounds are clamped to them, so that hosts weighed
+        by different calls can be compared.
+        """
+        if weighers is None:
+            return self.weight_handler.get_weighed_objects(
+                    self.weight_classes, hosts, weight_properties)
+        bounds = [(weigher.minval, weigher.maxval) for weigher in weighers]
+        weighed_hosts = self.weight_handler.get_weighed_objects_with_weighers(
+                weighers, hosts, weight_properties)
+        for weigher, (minval, maxval) in zip(weighers, bounds):
+            if minval is not None:
+                weigher.minval = minval
+            if maxval is not None:
+                weigher.maxval = maxval
+        return weighed_hosts
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        if not CONF.scheduler_incremental_host_state:
+            self._refresh_all_host_states(context)
+        elif (self._changed_since is None or
+                timeutils.is_older_than(self._last_full_refresh,
+                    CONF.scheduler_host_state_full_refresh_interval)):
+            self._refresh_all_host_states(context)
+        elif (CONF.scheduler_host_state_max_staleness > 0 and
+                not timeutils.is_older_than(self._last_refresh,
+                    CONF.scheduler_host_state_max_staleness)):
+            self.host_state_stats['hits'] += 1
+        else:
+            self._refresh_changed_host_states(context)
+        self._update_host_aggregates(context)
+        return self.host_state_map.itervalues()
+
+    def _load_aggregates(self, context):
+        """Reload the aggregates of every host from the database."""
+        host_aggregates = collections.defaultdict(list)
+        for aggregate in objects.AggregateList.get_all(context):
+            for host in aggregate.hosts:
+                host_aggregates[host].append(aggregate)
+        self.host_aggregates_map = dict(host_aggregates)
+        self._aggregates_loaded_at = timeutils.utcnow()
+
+    def _update_host_aggregates(self, context):
+        """Set the aggregates of the host states, reloading them in bulk
+        when they are older than scheduler_aggregate_index_max_staleness.
+        """
+        if (self._aggregates_loaded_at is None or
+                CONF.scheduler_aggregate_index_max_staleness <= 0 or
+                timeutils.is_older_than(self._aggregates_loaded_at,
+                    CONF.scheduler_aggregate_index_max_staleness)):
+            self._load_aggregates(context)
+        for host_state in self.host_state_map.itervalues():
+            host_state.aggregates = self.host_aggregates_map.get(
+                    host_state.host, [])
+
+    def _update_watermark(self, record):
+        for key in ('created_at', 'updated_at', 'deleted_at'):
+            value = record.get(key)
+            if value and (self._changed_since is None or
+                          value > self._changed_since):
+                self._changed_since = value
+
+    def _record_refresh(self, kind, start, num_nodes):
+        elapsed = time.time() - start
+        self._last_refresh = timeutils.utcnow()
+        self.host_state_stats[kind] += 1
+        self.host_state_stats['compute_nodes_loaded'] += num_nodes
+        self.host_state_stats['refresh_seconds'] += elapsed
+        LOG.debug("Host states refreshed (%(kind)s): %(num)d compute "
+                  "node(s) loaded in %(elapsed).3f seconds",
+                  {'kind': kind, 'num': num_nodes, 'elapsed': elapsed})
+
+    def _update_host_state(self, compute):
+        """Create or update the HostState of a compute node record.
+
+        Returns the key of the HostState, or None if the compute node has
+        no service.
+        """
+        self._update_watermark(compute)
+        service = compute['service']
+        if not service:
+            LOG.warn(_LW("No service for compute ID %s"), compute['id'])
+            return None
+        self._update_watermark(service)
+        host = service['host']
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_from_compute_node(compute)
+        else:
+            host_state = self.host_state_cls(host, node, compute=compute)
+            self.host_state_map[state_key] = host_state
+        host_state.update_service(dict(service.iteritems()))
+        self._compute_node_keys[compute['id']] = state_key
+        return state_key
+
+    def _remove_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % {'host': host, 'node': node})
+        del self.host_state_map[state_key]
+
+    def _refresh_all_host_states(self, context):
+        """Reload every compute node and drop the ones which went away."""
+        start = time.time()
+        self._last_full_refresh = timeutils.utcnow()
+        self._changed_since = None
+        self._compute_node_keys = {}
 
         # Get resource usage across the available compute nodes:
         compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
         for compute in compute_nodes:
-            service = compute['service']
-            if not service:
-                LOG.warn(_LW("No service for compute ID %s"), compute['id'])
-                continue
-            host = service['host']
-            node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_from_compute_node(compute)
-            else:
-                host_state = self.host_state_cls(host, node, compute=compute)
-                self.host_state_map[state_key] = host_state
-            host_state.update_service(dict(service.iteritems()))
-            seen_nodes.add(state_key)
+            state_key = self._update_host_state(compute)
+            if state_key:
+                seen_nodes.add(state_key)
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
         for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+            self._remove_host_state(state_key)
 
-        return self.host_state_map.itervalues()
+        self._record_refresh('full_refreshes', start, len(compute_nodes))
+
+    def _refresh_changed_host_states(self, context):
+        """Apply the compute nodes changed since the last refresh.
+
+        HostStates keep the resources virtually consumed by previous
+        requests until their compute node reports a newer record.
+        """
+        start = time.time()
+        compute_nodes = db.compute_node_get_all_changed_since(
+                context, self._changed_since)
+        for compute in compute_nodes:
+            if compute['deleted'] or not compute['service']:
+                self._update_watermark(compute)
+                state_key = self._compute_node_keys.pop(compute['id'], None)
+                if state_key in self.host_state_map:
+                    self._remove_host_state(state_key)
+                continue
+            old_key = self._compute_node_keys.get(compute['id'])
+            state_key = self._update_host_state(compute)
+            if old_key and old_key != state_key:
+                # The hypervisor hostname of the node changed
+                self.host_state_map.pop(old_key, None)
+
+        self._record_refresh('incremental_refreshes', start,
+                             len(compute_nodes))
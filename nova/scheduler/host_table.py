@@ -0,0 +1,101 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of host states, used to run the filters and weighers which
+support it as NumPy array operations over all hosts at once.
+"""
+
+from oslo.config import cfg
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+host_table_opts = [
+    cfg.BoolOpt('scheduler_vectorized_hosts',
+                default=False,
+                help='Run the filters and weighers which support it as '
+                     'array operations over all hosts at once, instead of '
+                     'calling them for each host. Requires NumPy, hosts '
+                     'are evaluated one by one when it is not installed.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(host_table_opts)
+
+
+def enabled():
+    """Return True if filters and weighers should use a HostTable."""
+    return CONF.scheduler_vectorized_hosts and numpy is not None
+
+
+class HostTable(object):
+    """Columnar view of the numeric attributes of a list of HostStates.
+
+    Columns are built on first use and kept for the lifetime of the table,
+    so that every filter and weigher of a request shares them.
+    """
+
+    def __init__(self, host_states):
+        host_states = list(host_states)
+        self.host_states = numpy.empty(len(host_states), dtype=object)
+        self.host_states[:] = host_states
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def column(self, name):
+        """Return an array of the given HostState attribute."""
+        values = self._columns.get(name)
+        if values is None:
+            values = numpy.fromiter(
+                (getattr(host_state, name) for host_state in self.host_states),
+                dtype=numpy.float64, count=len(self.host_states))
+            self._columns[name] = values
+        return values
+
+    def metric_column(self, name):
+        """Return an array of the values of a metric and a boolean array
+        telling which hosts do not report it. Missing values are 0.
+        """
+        key = ('metrics', name)
+        values = self._columns.get(key)
+        if values is None:
+            nan = float('nan')
+            values = numpy.fromiter(
+                (host_state.metrics[name].value
+                 if name in host_state.metrics else nan
+                 for host_state in self.host_states),
+                dtype=numpy.float64, count=len(self.host_states))
+            self._columns[key] = values
+        missing = numpy.isnan(values)
+        return numpy.where(missing, 0.0, values), missing
+
+    def set_limits(self, key, values, mask):
+        """Record an oversubscription limit on the hosts selected by mask."""
+        for host_state, value in zip(self.host_states[mask],
+                                     values[mask].tolist()):
+            host_state.limits[key] = value
+
+    def compress(self, mask):
+        """Return a new HostTable with the hosts selected by mask."""
+        table = HostTable([])
+        table.host_states = self.host_states[mask]
+        for key, values in self._columns.iteritems():
+            table._columns[key] = values[mask]
+        return table
@@ -62,6 +62,8 @@ class IronicNodeState(bbhm.BaseBaremetalNodeState):
     previously used and lock down access.
     """
 
+    __slots__ = ()
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
         super(IronicNodeState, self).update_from_compute_node(compute)
@@ -19,6 +19,7 @@ Scheduler host weights
 
 from oslo.config import cfg
 
+from nova.scheduler import host_table
 from nova import weights
 
 CONF = cfg.CONF
@@ -37,7 +38,14 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_table(self, table, weight_properties):
+        """Return an array with the weight of each host of a HostTable, or
+        None if the weigher has to be run host by host.
+
+        Override this in a subclass which can weigh all hosts at once.
+        """
+        return None
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -46,6 +54,44 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def get_weighed_objects_with_weighers(self, weighers, obj_list,
+            weighing_properties):
+        if not host_table.enabled() or not obj_list:
+            return super(HostWeightHandler,
+                         self).get_weighed_objects_with_weighers(
+                             weighers, obj_list, weighing_properties)
+
+        table = host_table.HostTable(obj_list)
+        totals = host_table.numpy.zeros(len(table))
+        for weigher in weighers:
+            weights_ = weigher.weigh_table(table, weighing_properties)
+            if weights_ is None:
+                weighed_objs = [self.object_class(obj, weight) for obj, weight
+                                in zip(table.host_states, totals.tolist())]
+                weights_ = host_table.numpy.array(
+                    weigher.weigh_objects(weighed_objs, weighing_properties),
+                    dtype=float)
+            else:
+                # Same bounds as BaseWeigher.weigh_objects() records
+                weigher.minval = min(weights_.min(), weigher.minval
+                                     if weigher.minval is not None
+                                     else weights_.min())
+                weigher.maxval = max(weights_.max(), weigher.maxval
+                                     if weigher.maxval is not None
+                                     else weights_.max())
+
+            # Normalize the weights
+            weights_ = weights.normalize(weights_,
+                                         minval=weigher.minval,
+                                         maxval=weigher.maxval)
+            totals += weigher.weight_multiplier() * weights_
+
+        # NOTE: A stable sort keeps hosts with equal weights in the same
+        # order as sorted(..., reverse=True) does.
+        order = host_table.numpy.argsort(-totals, kind='mergesort')
+        return [self.object_class(obj, weight) for obj, weight
+                in zip(table.host_states[order], totals[order].tolist())]
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
@@ -28,6 +28,11 @@ in the configuration file as the followings:
 
 from oslo.config import cfg
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nova import exception
 from nova.scheduler import utils
 from nova.scheduler import weights
@@ -102,3 +107,23 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def weigh_table(self, table, weight_properties):
+        values = numpy.zeros(len(table))
+        unavailable = numpy.zeros(len(table), dtype=bool)
+
+        for (name, ratio) in self.setting:
+            metric, missing = table.metric_column(name)
+            if missing.any():
+                if CONF.metrics.required:
+                    host_state = table.host_states[missing.argmax()]
+                    raise exception.ComputeHostMetricNotFound(
+                            host=host_state.host,
+                            node=host_state.nodename,
+                            name=name)
+                elif ratio * self.weight_multiplier() != 0:
+                    unavailable |= missing
+            values += metric * ratio
+
+        values[unavailable] = CONF.metrics.weight_of_unavailable
+        return values
@@ -18,6 +18,9 @@
 
 import copy
 
+from lxml import etree
+import mock
+
 from nova.api.ec2 import apirequest
 from nova.openstack.common import timeutils
 from nova import test
@@ -73,6 +76,41 @@ class APIRequestTestCase(test.NoDBTestCase):
         data = self.req._render_response(resp, 'uuid')
         self.assertIn('<utf8>&#40960;abcd&#1972;</utf8>', data)
 
+    def test_iter_response_ascii(self):
+        data = ''.join(self.req._iter_response(self.resp, 'uuid'))
+        self.assertIn('<FakeActionResponse xmlns="http://ec2.amazonaws.com/'
+                      'doc/FakeVersion/', data)
+        self.assertIn('<int>1</int>', data)
+        self.assertIn('<string>foo</string>', data)
+        self.assertIn('<bool>false</bool>', data)
+
+    def test_iter_response_utf8(self):
+        resp = copy.deepcopy(self.resp)
+        resp['utf8'] = unichr(40960) + u'abcd' + unichr(1972)
+        data = ''.join(self.req._iter_response(resp, 'uuid'))
+        self.assertIn('<utf8>&#40960;abcd&#1972;</utf8>', data)
+
+    def test_iter_response_matches_render_response(self):
+        resp = {'list': [{'item_id': 'a<b'}, {'empty': None}],
+                'when': timeutils.parse_strtime('2011-02-21 20:14:10.634276',
+                                                '%Y-%m-%d %H:%M:%S.%f')}
+        streamed = ''.join(self.req._iter_response(resp, 'uuid'))
+        rendered = self.req._render_response(resp, 'uuid')
+        parser = etree.XMLParser(remove_blank_text=True)
+        self.assertEqual(etree.tostring(etree.fromstring(rendered, parser)),
+                         streamed)
+
+    def test_invoke_streams_response(self):
+        self.flags(ec2_stream_responses=True)
+        controller = mock.Mock()
+        controller.fake_action.return_value = True
+        req = apirequest.APIRequest(controller, 'FakeAction', 'FakeVersion',
+                                    {})
+        ctxt = mock.Mock(request_id='uuid')
+        result = req.invoke(ctxt)
+        self.assertNotIsInstance(result, str)
+        self.assertIn('<return>true</return>', ''.join(result))
+
     # Tests for individual data element format functions
 
     def test_return_valid_isoformat(self):
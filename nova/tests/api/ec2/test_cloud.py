@@ -17,6 +17,7 @@
 #    under the License.
 
 import base64
+import contextlib
 import copy
 import datetime
 import functools
@@ -33,6 +34,7 @@ from nova.api.ec2 import cloud
 from nova.api.ec2 import ec2utils
 from nova.api.ec2 import inst_state
 from nova.api.metadata import password
+from nova import availability_zones
 from nova.compute import api as compute_api
 from nova.compute import flavors
 from nova.compute import power_state
@@ -958,6 +960,54 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_describe_instances_batches_lookups(self):
+        # Makes sure describe_instances does not query the client token,
+        # block device mappings and zone of every instance.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        instances = []
+        for i in range(3):
+            sys_meta = flavors.save_flavor_info(
+                {}, flavors.get_flavor(1))
+            sys_meta['EC2_client_token'] = "client-token-%d" % i
+            instances.append(db.instance_create(self.context,
+                    {'reservation_id': 'a',
+                     'image_ref': image_uuid,
+                     'instance_type_id': 1,
+                     'host': 'host1',
+                     'vm_state': 'active',
+                     'system_metadata': sys_meta}))
+        db.service_create(self.context, {'host': 'host1',
+                                         'topic': "compute"})
+        agg = db.aggregate_create(self.context,
+                {'name': 'agg1'}, {'availability_zone': 'zone1'})
+        db.aggregate_host_add(self.context, agg['id'], 'host1')
+
+        with contextlib.nested(
+            mock.patch.object(self.cloud, '_get_client_token'),
+            mock.patch.object(objects.BlockDeviceMappingList,
+                              'get_by_instance_uuid'),
+            mock.patch.object(availability_zones,
+                              'get_instance_availability_zone'),
+        ) as (get_client_token, get_bdms, get_az):
+            result = self.cloud.describe_instances(self.context)
+            self.assertFalse(get_client_token.called)
+            self.assertFalse(get_bdms.called)
+            self.assertFalse(get_az.called)
+
+        result = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(['client-token-0', 'client-token-1',
+                          'client-token-2'],
+                         sorted(inst['clientToken'] for inst in result))
+        self.assertEqual(['zone1'] * 3,
+                         [inst['placement']['availabilityZone']
+                          for inst in result])
+        self.assertEqual(
+            sorted(ec2utils.id_to_ec2_inst_id(inst['uuid'])
+                   for inst in instances),
+            sorted(inst['instanceId'] for inst in result))
+
     def test_describe_instances_all_invalid(self):
         # Makes sure describe_instances works and filters results.
         self.flags(use_ipv6=True)
@@ -12,8 +12,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
 from nova.api.ec2 import ec2utils
 from nova import context
+from nova import db
 from nova import objects
 from nova import test
 
@@ -59,3 +62,30 @@ class EC2UtilsTestCase(test.TestCase):
         s3imap_id = ec2utils.glance_id_to_id(self.ctxt, 'fake-uuid')
         s3imap = objects.S3ImageMapping.get_by_id(self.ctxt, s3imap_id)
         self.assertEqual('fake-uuid', s3imap.uuid)
+
+    def test_uuids_to_ec2_inst_ids(self):
+        imap = objects.EC2InstanceMapping(self.ctxt, uuid='fake-uuid1')
+        imap.create()
+        ec2_ids = ec2utils.uuids_to_ec2_inst_ids(['fake-uuid1', 'fake-uuid2',
+                                                  'fake-uuid1'])
+        imap2 = objects.EC2InstanceMapping.get_by_uuid(self.ctxt,
+                                                       'fake-uuid2')
+        self.assertEqual({'fake-uuid1': ec2utils.id_to_ec2_id(imap.id),
+                          'fake-uuid2': ec2utils.id_to_ec2_id(imap2.id)},
+                         ec2_ids)
+
+    def test_uuids_to_ec2_inst_ids_single_query(self):
+        uuids = ['fake-uuid%d' % i for i in range(5)]
+        for instance_uuid in uuids:
+            objects.EC2InstanceMapping(self.ctxt, uuid=instance_uuid).create()
+        with mock.patch.object(db, 'ec2_instance_get_all_by_filters',
+                wraps=db.ec2_instance_get_all_by_filters) as get_all:
+            ec2_ids = ec2utils.uuids_to_ec2_inst_ids(uuids)
+            self.assertEqual(1, get_all.call_count)
+            self.assertEqual(ec2_ids, ec2utils.uuids_to_ec2_inst_ids(uuids))
+            self.assertEqual(1, get_all.call_count)
+        self.assertEqual(
+            ec2utils.id_to_ec2_inst_id(
+                ec2utils.get_int_id_from_instance_uuid(self.ctxt,
+                                                       'fake-uuid3')),
+            ec2_ids['fake-uuid3'])
@@ -585,6 +585,30 @@ class ServersControllerTest(ControllerTest):
                            'marker': [fakes.get_fake_uuid(2)]}
         self.assertThat(params, matchers.DictMatches(expected_params))
 
+    def test_get_servers_chunked(self):
+        self.flags(osapi_instance_list_chunk_size=2)
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                       fakes.fake_instance_get_all_by_filters(num_servers=0))
+        self.stubs.Set(db, 'instance_get_all_by_filters_chunked',
+                       fakes.fake_instance_get_all_by_filters_chunked())
+
+        req = fakes.HTTPRequestV3.blank('/servers?limit=3')
+        res_dict = self.controller.index(req)
+
+        self.assertEqual([fakes.get_fake_uuid(i) for i in xrange(3)],
+                         [s['id'] for s in res_dict['servers']])
+        href_parts = urlparse.urlparse(res_dict['servers_links'][0]['href'])
+        self.assertEqual('/v3/servers', href_parts.path)
+        params = urlparse.parse_qs(href_parts.query)
+        self.assertEqual([fakes.get_fake_uuid(2)], params['marker'])
+
+        req = fakes.HTTPRequestV3.blank('/servers/detail')
+        res_dict = self.controller.detail(req)
+
+        uuids = [fakes.get_fake_uuid(i) for i in xrange(5)]
+        self.assertEqual(uuids, [s['id'] for s in res_dict['servers']])
+        self.assertEqual(set(uuids), set(req.get_db_instances()))
+
     def test_get_servers_with_limit_bad_value(self):
         req = fakes.HTTPRequestV3.blank('/servers?limit=aaa')
         self.assertRaises(webob.exc.HTTPBadRequest,
@@ -1296,13 +1320,19 @@ class ServersControllerTest(ControllerTest):
                          limit=None, marker=None, want_objects=False,
                          expected_attrs=None):
             self.expected_attrs = expected_attrs
-            return []
+            return objects.InstanceList(objects=[])
 
         self.stubs.Set(compute_api.API, 'get_all', fake_get_all)
 
+        req = fakes.HTTPRequestV3.blank('/servers/detail',
+                                        use_admin_context=True)
+        self.assertIn('servers', self.controller.detail(req))
+        self.assertIn('pci_devices', self.expected_attrs)
+
+        # The index only shows the ID and the name of the servers.
         req = fakes.HTTPRequestV3.blank('/servers', use_admin_context=True)
         self.assertIn('servers', self.controller.index(req))
-        self.assertIn('pci_devices', self.expected_attrs)
+        self.assertEqual([], self.expected_attrs)
 
 
 class ServersControllerDeleteTest(ControllerTest):
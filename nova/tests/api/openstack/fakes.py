@@ -439,6 +439,17 @@ def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
     return _return_servers
 
 
+def fake_instance_get_all_by_filters_chunked(num_servers=5, **kwargs):
+    return_servers = fake_instance_get_all_by_filters(num_servers, **kwargs)
+
+    def _return_chunks(context, *args, **kwargs):
+        chunk_size = kwargs.pop('chunk_size')
+        servers_list = return_servers(context, *args, **kwargs)
+        return iter([servers_list[i:i + chunk_size]
+                     for i in xrange(0, len(servers_list), chunk_size)])
+    return _return_chunks
+
+
 def stub_instance(id, user_id=None, project_id=None, host=None,
                   node=None, vm_state=None, task_state=None,
                   reservation_id="", uuid=FAKE_UUID, image_ref="10",
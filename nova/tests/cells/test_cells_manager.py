@@ -15,6 +15,7 @@
 """
 Tests For CellsManager
 """
+import contextlib
 import copy
 import datetime
 
@@ -109,7 +110,8 @@ class CellsManagerClassTestCase(test.TestCase):
                                  'tell_parents_our_capacities')
 
         self.msg_runner.tell_parents_our_capabilities(self.ctxt)
-        self.msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                    only_if_changed=True)
         self.mox.ReplayAll()
         self.cells_manager._update_our_parents(self.ctxt)
 
@@ -241,6 +243,72 @@ class CellsManagerClassTestCase(test.TestCase):
         self.assertEqual(call_info['sync_instances'],
                 [instances[-1], instances[0]])
 
+    def test_heal_instance_ranges(self):
+        self.flags(instance_heal_digest_prefix_length=1,
+                   instance_update_batch_size=2, group='cells')
+
+        def _instance(uuid, vm_state='active'):
+            return dict(uuid=uuid, vm_state=vm_state, task_state=None,
+                        power_state=1, host='host1', node='node1')
+
+        ours = [_instance('a1'), _instance('a2'), _instance('a3'),
+                _instance('b1'), _instance('c1')]
+        # The top level cell has a stale state in range 'a', an instance
+        # we no longer have in range 'c', and nothing in range 'b'.
+        theirs = [_instance('a1'), _instance('a2', 'building'),
+                  _instance('a3'), _instance('c1'), _instance('c2')]
+        top = dict(digests=cells_utils.get_instance_digests(theirs, 1),
+                   digested_at='fake-digested-at')
+
+        with contextlib.nested(
+            mock.patch.object(self.msg_runner, 'get_instance_digests',
+                              return_value=top),
+            mock.patch.object(self.cells_manager.db,
+                              'instance_get_all_by_filters_chunked',
+                              return_value=iter([ours[:3], ours[3:]])),
+            mock.patch.object(self.cells_manager.db,
+                              'instance_get_all_by_filters',
+                              side_effect=lambda ctxt, filters, *args:
+                                  filters['uuid']),
+            mock.patch.object(self.msg_runner,
+                              'instance_batch_sync_at_top'),
+        ) as (get_digests, get_all_chunked, get_all, batch_sync):
+            self.cells_manager._heal_instances(self.ctxt)
+
+            # The digests are only compared once per interval.
+            self.cells_manager._heal_instances(self.ctxt)
+
+        get_digests.assert_called_once_with(self.ctxt, 1)
+        self.assertEqual(
+            [mock.call(self.ctxt, updated=['a1', 'a2']),
+             mock.call(self.ctxt, updated=['a3', 'b1']),
+             mock.call(self.ctxt, updated=['c1']),
+             mock.call(self.ctxt,
+                       ranges={'a': ['a1', 'a2', 'a3'], 'b': ['b1'],
+                               'c': ['c1']},
+                       digested_at='fake-digested-at')],
+            batch_sync.call_args_list)
+
+    def test_heal_instance_ranges_in_sync(self):
+        self.flags(instance_heal_digest_prefix_length=1, group='cells')
+        instances = [dict(uuid='a1', vm_state='active', task_state=None,
+                          power_state=1, host='host1', node='node1')]
+
+        with contextlib.nested(
+            mock.patch.object(self.msg_runner, 'get_instance_digests',
+                return_value=dict(
+                    digests=cells_utils.get_instance_digests(instances, 1),
+                    digested_at='fake-digested-at')),
+            mock.patch.object(self.cells_manager.db,
+                              'instance_get_all_by_filters_chunked',
+                              return_value=iter([instances])),
+            mock.patch.object(self.msg_runner,
+                              'instance_batch_sync_at_top'),
+        ) as (get_digests, get_all_chunked, batch_sync):
+            self.cells_manager._heal_instances(self.ctxt)
+
+        self.assertFalse(batch_sync.called)
+
     def test_sync_instances(self):
         self.mox.StubOutWithMock(self.msg_runner,
                                  'sync_instances')
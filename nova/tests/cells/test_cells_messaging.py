@@ -18,6 +18,8 @@ Tests For Cells Messaging module
 """
 
 import contextlib
+import copy
+import datetime
 
 import mock
 import mox
@@ -831,6 +833,44 @@ class CellsTargetedMethodsTestCase(test.TestCase):
 
         self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
 
+    def test_update_capacities_only_if_changed(self):
+        self._setup_attrs('child-cell2', 'child-cell2!api-cell')
+        self.flags(capacity_resend_interval=60, group='cells')
+        capacities = {'ram_free': {'total_mb': 1024}}
+
+        with contextlib.nested(
+            mock.patch.object(self.src_state_manager, 'get_our_capacities',
+                              side_effect=lambda: copy.deepcopy(capacities)),
+            mock.patch.object(self.tgt_state_manager,
+                              'update_cell_capacities'),
+            mock.patch.object(self.tgt_msg_runner,
+                              'tell_parents_our_capacities'),
+        ) as (get_capacities, update_capacities, tell_parents):
+            self.src_msg_runner.tell_parents_our_capacities(
+                    self.ctxt, only_if_changed=True)
+            self.assertEqual(1, update_capacities.call_count)
+
+            # Unchanged capacities are not sent again...
+            self.src_msg_runner.tell_parents_our_capacities(
+                    self.ctxt, only_if_changed=True)
+            self.assertEqual(1, update_capacities.call_count)
+
+            # ...unless asked to, or once the interval passed.
+            self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
+            self.assertEqual(2, update_capacities.call_count)
+            timeutils.set_time_override(timeutils.utcnow() +
+                                        datetime.timedelta(seconds=61))
+            self.addCleanup(timeutils.clear_time_override)
+            self.src_msg_runner.tell_parents_our_capacities(
+                    self.ctxt, only_if_changed=True)
+            self.assertEqual(3, update_capacities.call_count)
+
+            capacities['ram_free']['total_mb'] = 512
+            self.src_msg_runner.tell_parents_our_capacities(
+                    self.ctxt, only_if_changed=True)
+            self.assertEqual(4, update_capacities.call_count)
+        update_capacities.assert_called_with('child-cell2', capacities)
+
     def test_announce_capabilities(self):
         self._setup_attrs('api-cell', 'api-cell!child-cell1')
         # To make this easier to test, make us only have 1 child cell.
@@ -1558,7 +1598,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.src_methods_cls._apply_expected_states(instance_info)
         self.assertEqual(expected, instance_info)
 
-    def _test_instance_update_at_top(self, net_info, exists=True):
+    def _test_instance_update_at_top(self, net_info, exists=True,
+                                     digest_heal=False):
         fake_info_cache = {'id': 1,
                            'instance': 'fake_instance',
                            'network_info': net_info}
@@ -1586,6 +1627,11 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
                              'cell_name': expected_cell_name,
                              'other': 'meow',
                              'uuid': 'fake_uuid'}
+        if digest_heal:
+            self.flags(instance_heal_digest_prefix_length=1, group='cells')
+            timeutils.set_time_override()
+            self.addCleanup(timeutils.clear_time_override)
+            expected_instance['updated_at'] = timeutils.utcnow()
 
         # To show these should not be called in src/mid-level cell
         self.mox.StubOutWithMock(self.src_db_inst, 'instance_update')
@@ -1624,6 +1670,10 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
     def test_instance_update_at_top_does_not_already_exist(self):
         self._test_instance_update_at_top([], exists=False)
 
+    def test_instance_update_at_top_healing_by_digest(self):
+        # The child cell's updated_at is replaced by our own clock.
+        self._test_instance_update_at_top([], digest_heal=True)
+
     def test_instance_update_at_top_with_building_state(self):
         fake_info_cache = {'id': 1,
                            'instance': 'fake_instance',
@@ -1785,9 +1835,7 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         fake_instances = [instance1, instance2]
 
         self.mox.StubOutWithMock(self.tgt_msg_runner,
-                                 'instance_update_at_top')
-        self.mox.StubOutWithMock(self.tgt_msg_runner,
-                                 'instance_destroy_at_top')
+                                 'instance_batch_sync_at_top')
 
         self.mox.StubOutWithMock(timeutils, 'parse_isotime')
         self.mox.StubOutWithMock(cells_utils, 'get_instances_to_sync')
@@ -1807,14 +1855,199 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
                 updated_since=updated_since_parsed,
                 project_id=project_id,
                 deleted=deleted).AndReturn(fake_instances)
-        self.tgt_msg_runner.instance_update_at_top(self.ctxt, instance1)
-        self.tgt_msg_runner.instance_destroy_at_top(self.ctxt, instance2)
+        self.tgt_msg_runner.instance_batch_sync_at_top(self.ctxt,
+                updated=[instance1], destroyed=[instance2])
 
         self.mox.ReplayAll()
 
         self.src_msg_runner.sync_instances(self.ctxt,
                 project_id, updated_since_raw, deleted)
 
+    def test_sync_instances_batches(self):
+        # Reset this, as this is a broadcast down.
+        self._setup_attrs(up=False)
+        self.flags(instance_update_batch_size=2, group='cells')
+        fake_instances = [dict(uuid='fake_uuid%d' % i, deleted=False)
+                          for i in range(5)]
+
+        with contextlib.nested(
+            mock.patch.object(cells_utils, 'get_instances_to_sync',
+                              side_effect=[[], fake_instances]),
+            mock.patch.object(self.tgt_msg_runner,
+                              'instance_batch_sync_at_top'),
+        ) as (get_instances_to_sync, batch_sync):
+            self.src_msg_runner.sync_instances(self.ctxt,
+                    None, None, False)
+
+        self.assertEqual(
+            [mock.call(self.ctxt, updated=fake_instances[0:2], destroyed=[]),
+             mock.call(self.ctxt, updated=fake_instances[2:4], destroyed=[]),
+             mock.call(self.ctxt, updated=fake_instances[4:], destroyed=[])],
+            batch_sync.call_args_list)
+
+    def test_instance_batch_sync_at_top(self):
+        instance1 = {'uuid': 'fake_uuid1', 'vm_state': vm_states.ACTIVE}
+        instance2 = {'uuid': 'fake_uuid2'}
+        expected_cell_name = 'api-cell!child-cell2!grandchild-cell1'
+
+        # To show these should not be called in src/mid-level cell
+        self.mox.StubOutWithMock(self.src_db_inst, 'instance_update')
+        self.mox.StubOutWithMock(self.src_db_inst, 'instance_destroy')
+        self.mox.StubOutWithMock(self.mid_db_inst, 'instance_update')
+        self.mox.StubOutWithMock(self.mid_db_inst, 'instance_destroy')
+
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_update')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_destroy')
+        self.tgt_db_inst.instance_update(self.ctxt, 'fake_uuid1',
+                {'uuid': 'fake_uuid1', 'vm_state': vm_states.ACTIVE,
+                 'cell_name': expected_cell_name},
+                update_cells=False)
+        self.tgt_db_inst.instance_destroy(self.ctxt, 'fake_uuid2',
+                                          update_cells=False)
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instance_batch_sync_at_top(self.ctxt,
+                updated=[instance1], destroyed=[instance2])
+
+    def test_instance_batch_sync_at_top_destroys_unlisted(self):
+        cell_name = 'api-cell!child-cell2!grandchild-cell1'
+        digested_at = timeutils.utcnow().replace(microsecond=0)
+        before = digested_at - datetime.timedelta(seconds=1)
+        top_instances = [
+            dict(uuid='a1', cell_name=cell_name, created_at=before,
+                 updated_at=before),
+            dict(uuid='a2', cell_name=cell_name, created_at=before,
+                 updated_at=None),
+            dict(uuid='a3', cell_name=cell_name, created_at=before,
+                 updated_at=digested_at),
+            dict(uuid='b1', cell_name=cell_name, created_at=before,
+                 updated_at=before)]
+
+        with contextlib.nested(
+            mock.patch.object(self.tgt_db_inst,
+                              'instance_get_all_by_filters_chunked',
+                              return_value=iter([top_instances])),
+            mock.patch.object(self.tgt_db_inst, 'instance_destroy'),
+        ) as (get_all, instance_destroy):
+            self.src_msg_runner.instance_batch_sync_at_top(self.ctxt,
+                    ranges={'a': ['a1']},
+                    digested_at=timeutils.strtime(digested_at))
+
+        get_all.assert_called_once_with(self.ctxt,
+                {'deleted': False, 'cell_name': cell_name},
+                'created_at', 'asc', columns_to_join=[])
+        # a3 was updated after the digests and b1 belongs to another range.
+        instance_destroy.assert_called_once_with(self.ctxt, 'a2',
+                                                 update_cells=False)
+
+    def test_get_instance_digests(self):
+        cell_name = 'api-cell!child-cell2!grandchild-cell1'
+        ours = [dict(uuid='a1', vm_state='active', task_state=None,
+                     power_state=1, host='host1', node='node1',
+                     cell_name=cell_name),
+                dict(uuid='b1', vm_state='error', task_state=None,
+                     power_state=0, host=None, node=None,
+                     cell_name=cell_name)]
+
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        with mock.patch.object(self.tgt_db_inst,
+                               'instance_get_all_by_filters_chunked',
+                               return_value=iter([ours])) as get_all:
+            top = self.src_msg_runner.get_instance_digests(self.ctxt, 1)
+
+        get_all.assert_called_once_with(self.ctxt,
+                {'deleted': False, 'cell_name': cell_name},
+                'created_at', 'asc', columns_to_join=[])
+
+        self.assertEqual(cells_utils.get_instance_digests(ours, 1),
+                         top['digests'])
+        self.assertEqual(
+            timeutils.strtime(timeutils.utcnow().replace(microsecond=0)),
+            top['digested_at'])
+
+    def test_heal_keeps_instance_created_after_child_listing(self):
+        # An instance is booted at the API cell, the child cell lists its
+        # instances, then creates the instance and updates it at the top
+        # before the ranges to heal arrive.
+        self.flags(instance_heal_digest_prefix_length=1, group='cells')
+        cell_name = 'api-cell!child-cell2!grandchild-cell1'
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        booted = self.tgt_db_inst.instance_create(self.ctxt,
+                {'uuid': 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                 'project_id': 'fake', 'user_id': 'fake'})
+        existing = self.tgt_db_inst.instance_create(self.ctxt,
+                {'uuid': 'a0000000-0000-0000-0000-000000000000',
+                 'project_id': 'fake', 'user_id': 'fake',
+                 'cell_name': cell_name})
+        other_cell = self.tgt_db_inst.instance_create(self.ctxt,
+                {'uuid': 'a1111111-1111-1111-1111-111111111111',
+                 'project_id': 'fake', 'user_id': 'fake',
+                 'cell_name': 'api-cell!child-cell1'})
+        timeutils.advance_time_seconds(1)
+
+        top = self.src_msg_runner.get_instance_digests(self.ctxt, 1)
+        # The child cell listed no instance in range 'a'.  Its clock is
+        # behind ours.
+        timeutils.advance_time_seconds(1)
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': booted['uuid'], 'vm_state': vm_states.BUILDING,
+                 'created_at': booted['created_at'],
+                 'updated_at': booted['created_at']})
+        self.src_msg_runner.instance_batch_sync_at_top(self.ctxt,
+                ranges={'a': []}, digested_at=top['digested_at'])
+
+        instance = db.instance_get_by_uuid(self.ctxt, booted['uuid'])
+        self.assertEqual(cell_name, instance['cell_name'])
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid,
+                          self.ctxt, existing['uuid'])
+        db.instance_get_by_uuid(self.ctxt, other_cell['uuid'])
+
+    def test_instance_update_at_top_coalesced(self):
+        self.flags(instance_update_coalesce_window=10, group='cells')
+        self.mox.StubOutWithMock(self.src_msg_runner,
+                                 'instance_batch_sync_at_top')
+        self.src_msg_runner.instance_batch_sync_at_top(mox.IgnoreArg(),
+                updated=[{'uuid': 'fake_uuid1', 'vm_state': 'active',
+                          'task_state': None}],
+                destroyed=[{'uuid': 'fake_uuid2'}])
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid1', 'vm_state': 'building',
+                 'task_state': 'spawning'})
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2', 'vm_state': 'building'})
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid1', 'vm_state': 'active',
+                 'task_state': None})
+        self.src_msg_runner.instance_destroy_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2'})
+        self.src_msg_runner.instance_update_at_top(self.ctxt,
+                {'uuid': 'fake_uuid2', 'vm_state': 'deleted'})
+        self.src_msg_runner.flush_instance_syncs()
+        self.assertIsNone(self.src_msg_runner._instance_sync_flusher)
+
+    def test_instance_update_at_top_coalesced_full_batch(self):
+        self.flags(instance_update_coalesce_window=10,
+                   instance_update_batch_size=2, group='cells')
+        instances = [{'uuid': 'fake_uuid%d' % i} for i in range(3)]
+
+        with mock.patch.object(self.src_msg_runner,
+                               'instance_batch_sync_at_top') as batch_sync:
+            for instance in instances:
+                self.src_msg_runner.instance_update_at_top(self.ctxt,
+                                                           instance)
+            batch_sync.assert_called_once_with(mock.ANY,
+                    updated=instances[:2], destroyed=[])
+            self.assertEqual(1, len(
+                self.src_msg_runner._queued_instance_syncs))
+            self.src_msg_runner.flush_instance_syncs()
+
+        self.assertEqual(2, batch_sync.call_count)
+
     def test_service_get_all_with_disabled(self):
         # Reset this, as this is a broadcast down.
         self._setup_attrs(up=False)
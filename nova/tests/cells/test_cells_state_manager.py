@@ -16,12 +16,15 @@
 Tests For CellStateManager
 """
 
+import functools
+import random
 import time
 
 import mock
 from oslo.config import cfg
 from oslo.db import exception as db_exc
 import six
+import testtools
 
 from nova.cells import state
 from nova import db
@@ -48,7 +51,7 @@ FAKE_ITYPES = [
 ]
 
 
-def _fake_compute_node_get_all(context):
+def _fake_compute_node_get_all(context, computes=FAKE_COMPUTES):
     def _node(host, total_mem, total_disk, free_mem, free_disk):
         service = {'host': host, 'disabled': False}
         return {'service': service,
@@ -57,16 +60,16 @@ def _fake_compute_node_get_all(context):
                 'free_ram_mb': free_mem,
                 'free_disk_gb': free_disk}
 
-    return [_node(*fake) for fake in FAKE_COMPUTES]
+    return [_node(*fake) for fake in computes]
 
 
-def _fake_instance_type_all(context):
+def _fake_instance_type_all(context, itypes=FAKE_ITYPES):
     def _type(mem, root, eph):
         return {'root_gb': root,
                 'ephemeral_gb': eph,
                 'memory_mb': mem}
 
-    return [_type(*fake) for fake in FAKE_ITYPES]
+    return [_type(*fake) for fake in itypes]
 
 
 class TestCellsStateManager(test.TestCase):
@@ -193,6 +196,53 @@ class TestCellsStateManager(test.TestCase):
         my_state = state_manager.get_my_state()
         return my_state.capacities
 
+    def test_capacity_unchanged_not_updated(self):
+        state_manager = self._get_state_manager()
+        capacities = state_manager.get_my_state().capacities
+
+        with mock.patch.object(state_manager.my_cell_state,
+                               'update_capacities') as update_capacities:
+            state_manager._update_our_capacity()
+            self.assertFalse(update_capacities.called)
+
+            self.flags(reserve_percent=50.0, group='cells')
+            state_manager._update_our_capacity()
+            self.assertTrue(update_capacities.called)
+        self.assertNotEqual(capacities,
+                            update_capacities.call_args[0][0])
+
+    def test_capacity_updated_incrementally(self):
+        state_manager = self._get_state_manager()
+        computes = [('host1', 1024, 100, 0, 0),
+                    ('host3', 1024, 100, 512, 50),
+                    ('host5', 2048, 200, 2048, 200)]
+        self.stubs.Set(db, 'compute_node_get_all',
+                       functools.partial(_fake_compute_node_get_all,
+                                         computes=computes))
+        counted = []
+        real_count_units = state.CapacityCounter._count_units
+
+        def _count_units(counter, resources):
+            counted.append(len(resources))
+            return real_count_units(counter, resources)
+
+        self.stubs.Set(state.CapacityCounter, '_count_units', _count_units)
+        state_manager._update_our_capacity()
+
+        # Only host3 and host5 are counted again, for ram and disk.
+        self.assertEqual([2, 2], counted)
+        self.assertEqual(self._get_state_manager().get_my_state().capacities,
+                         state_manager.get_my_state().capacities)
+
+
+@testtools.skipIf(state.numpy is None, "NumPy is not installed")
+class TestCellsStateManagerVectorized(TestCellsStateManager):
+    """Run the capacity tests with the vectorized computation."""
+
+    def setUp(self):
+        super(TestCellsStateManagerVectorized, self).setUp()
+        self.flags(vectorized_capacity=True, group='cells')
+
 
 class TestCellStateManagerException(test.TestCase):
     @mock.patch.object(time, 'sleep')
@@ -281,3 +331,41 @@ class TestSyncDecorators(test.TestCase):
 
         self.assertEqual(result, 'result')
         self.assertEqual(manager.called, [('_cell_data_sync', True)])
+
+
+@testtools.skipIf(state.numpy is None, "NumPy is not installed")
+class CellCapacityVectorizedTestCase(test.TestCase):
+    """Check the vectorized capacity matches the host by host one, for a
+    full computation and after one compute node changed.
+    """
+
+    def _capacities(self, vectorized):
+        self.flags(vectorized_capacity=vectorized, group='cells')
+        randint = random.Random(50).randint
+        computes = [('host%d' % i, 65536, 2000, randint(0, 65536),
+                     randint(0, 2000)) for i in xrange(50)]
+        itypes = [(512 * (i % 32 + 1), 10 * (i % 10 + 1), 20 * (i % 7))
+                  for i in xrange(20)]
+        self.stubs.Set(db, 'compute_node_get_all',
+                       functools.partial(_fake_compute_node_get_all,
+                                         computes=computes))
+        self.stubs.Set(db, 'flavor_get_all',
+                       functools.partial(_fake_instance_type_all,
+                                         itypes=itypes))
+        self.flags(reserve_percent=10.0, group='cells')
+        state_manager = state.CellStateManager()
+
+        state_manager._update_our_capacity()
+        full = state_manager.get_my_state().capacities
+        computes[0] = computes[0][:3] + (0, 0)
+        state_manager._update_our_capacity()
+        changed = state_manager.get_my_state().capacities
+        return full, changed
+
+    def test_capacities_match_per_host(self):
+        expected_full, expected_changed = self._capacities(False)
+        full, changed = self._capacities(True)
+
+        self.assertEqual(expected_full, full)
+        self.assertEqual(expected_changed, changed)
+        self.assertNotEqual(expected_full, expected_changed)
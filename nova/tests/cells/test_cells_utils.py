@@ -81,6 +81,31 @@ class CellsUtilsTestCase(test.NoDBTestCase):
                  'project_id': 'fake-project'})
         self.assertEqual(call_info['shuffle'], 2)
 
+    def test_get_instance_digests(self):
+        def _instance(uuid, vm_state='active'):
+            return dict(uuid=uuid, vm_state=vm_state, task_state=None,
+                        power_state=1, host='host1', node='node1',
+                        display_name='ignored')
+
+        instances = [_instance('a2'), _instance('b1'), _instance('a1')]
+        digests = cells_utils.get_instance_digests(instances, 1)
+        self.assertEqual(['a', 'b'], sorted(digests))
+
+        # The order of the instances and fields which are not compared
+        # do not matter.
+        same = [_instance('a1'), _instance('a2'), _instance('b1')]
+        same[0]['display_name'] = 'other'
+        self.assertEqual(digests, cells_utils.get_instance_digests(same, 1))
+
+        changed = [_instance('a1'), _instance('a2', 'error'),
+                   _instance('b1')]
+        changed_digests = cells_utils.get_instance_digests(changed, 1)
+        self.assertNotEqual(digests['a'], changed_digests['a'])
+        self.assertEqual(digests['b'], changed_digests['b'])
+
+        missing = cells_utils.get_instance_digests(instances[:2], 1)
+        self.assertNotEqual(digests['a'], missing['a'])
+
     def test_split_cell_and_item(self):
         path = 'australia', 'queensland', 'gold_coast'
         cell = cells_utils.PATH_CELL_SEP.join(path)
@@ -6176,8 +6176,8 @@ class ComputeTestCase(BaseTestCase):
             # These won't be in our instance since they're not requested
             instances.append(instance_map[inst_uuid])
 
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
+        call_info = {'get_all_by_host': 0, 'get_by_filters': 0,
+                'get_nw_info': 0, 'expected_instances': None}
 
         def fake_instance_get_all_by_host(context, host,
                                           columns_to_join, use_slave=False):
@@ -6185,49 +6185,53 @@ class ComputeTestCase(BaseTestCase):
             self.assertEqual([], columns_to_join)
             return instances[:]
 
-        def fake_instance_get_by_uuid(context, instance_uuid,
-                                      columns_to_join, use_slave=False):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
+        def fake_instance_get_all_by_filters(context, filters, sort_key,
+                                             sort_dir, limit=None,
+                                             marker=None,
+                                             columns_to_join=None,
+                                             use_slave=False):
+            call_info['get_by_filters'] += 1
             self.assertEqual(['system_metadata', 'info_cache'],
                              columns_to_join)
-            return instance_map[instance_uuid]
+            self.assertFalse(filters['deleted'])
+            return [instance_map[inst_uuid] for inst_uuid in filters['uuid']
+                    if inst_uuid in instance_map]
 
         # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance, use_slave=False):
+        def fake_get_instances_nw_info(context, instances):
             # Note that this exception gets caught in compute/manager
-            # and is ignored.  However, the below increment of
-            # 'get_nw_info' won't happen, and you'll get an assert
-            # failure checking it below.
-            self.assertEqual(call_info['expected_instance']['uuid'],
-                             instance['uuid'])
+            # and is ignored.
+            self.assertEqual(
+                [inst['uuid'] for inst in call_info['expected_instances']],
+                [inst['uuid'] for inst in instances])
             call_info['get_nw_info'] += 1
             if _get_instance_nw_info_raise:
-                raise exception.InstanceNotFound(instance_id=instance['uuid'])
+                return dict((inst['uuid'], exception.InstanceNotFound(
+                    instance_id=inst['uuid'])) for inst in instances)
+            return dict((inst['uuid'], None) for inst in instances)
 
         self.stubs.Set(db, 'instance_get_all_by_host',
                 fake_instance_get_all_by_host)
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute, '_get_instance_nw_info',
-                fake_get_instance_nw_info)
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                fake_instance_get_all_by_filters)
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                fake_get_instances_nw_info)
 
         # Make an instance appear to be still Building
         instances[0]['vm_state'] = vm_states.BUILDING
         # Make an instance appear to be Deleting
         instances[1]['task_state'] = task_states.DELETING
         # '0', '1' should be skipped..
-        call_info['expected_instance'] = instances[2]
+        call_info['expected_instances'] = [instances[2]]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
+        self.assertEqual(1, call_info['get_by_filters'])
         self.assertEqual(1, call_info['get_nw_info'])
 
-        call_info['expected_instance'] = instances[3]
+        call_info['expected_instances'] = [instances[3]]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
+        self.assertEqual(2, call_info['get_by_filters'])
         self.assertEqual(2, call_info['get_nw_info'])
 
         # Make an instance switch hosts
@@ -6237,10 +6241,10 @@ class ComputeTestCase(BaseTestCase):
         # Make an instance switch to be Deleting
         instances[6]['task_state'] = task_states.DELETING
         # '4', '5', and '6' should be skipped..
-        call_info['expected_instance'] = instances[7]
+        call_info['expected_instances'] = [instances[7]]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(4, call_info['get_by_uuid'])
+        self.assertEqual(6, call_info['get_by_filters'])
         self.assertEqual(3, call_info['get_nw_info'])
         # Should be no more left.
         self.assertEqual(0, len(self.compute._instance_uuids_to_heal))
@@ -6254,7 +6258,7 @@ class ComputeTestCase(BaseTestCase):
         # Should have called the list once more
         self.assertEqual(2, call_info['get_all_by_host'])
         # Stays the same because we remove invalid entries from the list
-        self.assertEqual(4, call_info['get_by_uuid'])
+        self.assertEqual(6, call_info['get_by_filters'])
         # Stays the same because we didn't find anything to process
         self.assertEqual(3, call_info['get_nw_info'])
 
@@ -6264,6 +6268,48 @@ class ComputeTestCase(BaseTestCase):
     def test_heal_instance_info_cache_with_exception(self):
         self._heal_instance_info_cache(_get_instance_nw_info_raise=True)
 
+    def test_heal_instance_info_cache_batch(self):
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=3)
+        ctxt = context.get_admin_context()
+        instances = [fake_instance.fake_db_instance(
+                         uuid='fake-uuid-%s' % x, host=CONF.host,
+                         created_at=None)
+                     for x in xrange(5)]
+        instances[1]['host'] = 'not-me'
+
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        self.mox.StubOutWithMock(self.compute.network_api,
+                                 'get_instances_nw_info')
+        db.instance_get_all_by_host(ctxt, self.compute.host,
+                                    columns_to_join=[],
+                                    use_slave=True).AndReturn(instances)
+        db.instance_get_all_by_filters(
+            ctxt, {'uuid': ['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2'],
+                   'deleted': False}, 'created_at', 'desc', limit=None,
+            marker=None, columns_to_join=['system_metadata', 'info_cache'],
+            use_slave=True).AndReturn(list(reversed(instances[:3])))
+        db.instance_get_all_by_filters(
+            ctxt, {'uuid': ['fake-uuid-3'], 'deleted': False},
+            'created_at', 'desc', limit=None, marker=None,
+            columns_to_join=['system_metadata', 'info_cache'],
+            use_slave=True).AndReturn([instances[3]])
+
+        def _check_instances(instances):
+            return ([inst.uuid for inst in instances] ==
+                    ['fake-uuid-0', 'fake-uuid-2', 'fake-uuid-3'])
+
+        self.compute.network_api.get_instances_nw_info(
+            ctxt, mox.Func(_check_instances)).AndReturn(
+                {'fake-uuid-0': network_model.NetworkInfo(),
+                 'fake-uuid-2': test.TestingException(),
+                 'fake-uuid-3': network_model.NetworkInfo()})
+        self.mox.ReplayAll()
+
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(['fake-uuid-4'], self.compute._instance_uuids_to_heal)
+
     @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.compute.api.API.unrescue')
     def test_poll_rescued_instances(self, unrescue, get):
@@ -6868,6 +6914,53 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_bulk(self):
+        ctxt = self.context.elevated()
+        params = {'host': self.compute.host, 'vm_state': vm_states.ACTIVE,
+                  'power_state': power_state.RUNNING}
+        in_sync = self._create_fake_instance(params)
+        shutdown = self._create_fake_instance(params)
+        missing = self._create_fake_instance(params)
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_num_instances')
+        self.mox.StubOutWithMock(self.compute,
+                                 '_query_driver_power_state_and_sync')
+
+        self.compute.driver.get_power_states().AndReturn(
+            {in_sync['uuid']: power_state.RUNNING,
+             shutdown['uuid']: power_state.SHUTDOWN})
+        self.compute._query_driver_power_state_and_sync(
+            ctxt, mox.ContainsKeyValue('uuid', shutdown['uuid']))
+        self.compute._query_driver_power_state_and_sync(
+            ctxt, mox.ContainsKeyValue('uuid', missing['uuid']))
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_power_state_in_sync(self):
+        def _in_sync(vm_state, db_power_state, vm_power_state,
+                     task_state=None):
+            db_instance = objects.Instance(vm_state=vm_state,
+                                           power_state=db_power_state,
+                                           task_state=task_state)
+            return self.compute._power_state_in_sync(db_instance,
+                                                     vm_power_state)
+
+        self.assertTrue(_in_sync(vm_states.ACTIVE, power_state.RUNNING,
+                                 power_state.RUNNING))
+        self.assertTrue(_in_sync(vm_states.STOPPED, power_state.SHUTDOWN,
+                                 power_state.SHUTDOWN))
+        self.assertTrue(_in_sync(vm_states.ERROR, power_state.NOSTATE,
+                                 power_state.NOSTATE))
+        self.assertFalse(_in_sync(vm_states.ACTIVE, power_state.RUNNING,
+                                  power_state.SHUTDOWN))
+        self.assertFalse(_in_sync(vm_states.ACTIVE, power_state.SHUTDOWN,
+                                  power_state.SHUTDOWN))
+        self.assertFalse(_in_sync(vm_states.STOPPED, power_state.RUNNING,
+                                  power_state.RUNNING))
+        self.assertFalse(_in_sync(vm_states.ACTIVE, power_state.RUNNING,
+                                  power_state.RUNNING,
+                                  task_state=task_states.REBOOTING))
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -8000,6 +8093,22 @@ class ComputeAPITestCase(BaseTestCase):
         db.instance_destroy(c, instance2['uuid'])
         db.instance_destroy(c, instance3['uuid'])
 
+    def test_get_all_chunked(self):
+        c = context.get_admin_context()
+        instances = [self._create_fake_instance({'display_name': 'woot%d' % i})
+                     for i in range(3)]
+        self._create_fake_instance({'display_name': 'not-woot'})
+
+        inst_lists = list(self.compute_api.get_all_chunked(c,
+                search_opts={'name': '^woot'}, sort_dir='asc', chunk_size=2))
+
+        self.assertEqual([[instances[0]['uuid'], instances[1]['uuid']],
+                          [instances[2]['uuid']]],
+                         [[instance.uuid for instance in inst_list]
+                          for inst_list in inst_lists])
+        self.assertEqual([], list(self.compute_api.get_all_chunked(c,
+                search_opts={'metadata': 'not json'}, chunk_size=2)))
+
     def test_get_all_by_multiple_options_at_once(self):
         # Test searching by multiple options at once.
         c = context.get_admin_context()
@@ -8838,6 +8947,68 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(refs[1]['display_name'], 'x-%s' % refs[1]['uuid'])
         self.assertEqual(refs[1]['hostname'], 'x-%s' % refs[1]['uuid'])
 
+    def test_bulk_provision_instances(self):
+        self.flags(bulk_provision_instances=True,
+                   multi_instance_display_name_template='%(name)s-%(count)s')
+        group = self._create_group()
+        with mock.patch.object(db, 'instance_create') as mock_create:
+            (refs, resv_id) = self.compute_api.create(self.context,
+                    flavors.get_default_flavor(),
+                    image_href='some-fake-image', min_count=3, max_count=3,
+                    display_name='x', metadata={'foo': 'bar'},
+                    security_group=['default', 'testgroup'])
+        self.assertFalse(mock_create.called)
+        self.assertEqual(3, len(refs))
+        for index, instance in enumerate(refs):
+            self.assertEqual(index, instance['launch_index'])
+            self.assertEqual('x-%d' % (index + 1), instance['display_name'])
+            self.assertEqual('x-%d' % (index + 1), instance['hostname'])
+            self.assertEqual(resv_id, instance['reservation_id'])
+            db_inst = db.instance_get_by_uuid(self.context, instance['uuid'])
+            self.assertEqual(instance['id'], db_inst['id'])
+            self.assertEqual({'foo': 'bar'}, utils.instance_meta(db_inst))
+            self.assertEqual(
+                str(flavors.get_default_flavor()['memory_mb']),
+                utils.instance_sys_meta(db_inst)['instance_type_memory_mb'])
+            self.assertEqual(['default', 'testgroup'],
+                             sorted(sg['name']
+                                    for sg in db_inst['security_groups']))
+            self.assertEqual('[]', db_inst['info_cache']['network_info'])
+            self.assertEqual('[]', db.instance_extra_get_by_instance_uuid(
+                self.context, instance['uuid'])['pci_requests'])
+            self.assertIsNotNone(db.get_ec2_instance_id_by_uuid(
+                self.context, instance['uuid']))
+        group = db.security_group_get(self.context, group['id'],
+                                      columns_to_join=['instances'])
+        self.assertEqual(3, len(group['instances']))
+
+    def test_bulk_provision_instances_checks_group_quota_once(self):
+        self.flags(bulk_provision_instances=True)
+        with mock.patch.object(compute_api.QUOTAS, 'limit_check') as mock_lc:
+            (refs, resv_id) = self.compute_api.create(self.context,
+                    flavors.get_default_flavor(),
+                    image_href='some-fake-image', min_count=3, max_count=3,
+                    scheduler_hints={'group': 'bulk-group'},
+                    check_server_group_quota=True)
+        self.assertEqual([mock.call(self.context, server_group_members=3)],
+                         [call for call in mock_lc.call_args_list
+                          if 'server_group_members' in call[1]])
+        group = objects.InstanceGroup.get_by_name(self.context, 'bulk-group')
+        self.assertEqual(sorted(instance['uuid'] for instance in refs),
+                         sorted(group.members))
+
+    def test_bulk_provision_instances_rolls_back(self):
+        self.flags(bulk_provision_instances=True)
+        pre_build_len = len(db.instance_get_all(self.context))
+        self.assertRaises(exception.SecurityGroupNotFoundForProject,
+                          self.compute_api.create,
+                          self.context, flavors.get_default_flavor(),
+                          image_href='some-fake-image',
+                          min_count=3, max_count=3,
+                          security_group=['this_is_a_fake_sec_group'])
+        self.assertEqual(pre_build_len,
+                         len(db.instance_get_all(self.context)))
+
     def test_instance_architecture(self):
         # Test the instance architecture.
         i_ref = self._create_fake_instance()
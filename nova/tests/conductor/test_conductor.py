@@ -17,6 +17,7 @@
 
 import contextlib
 
+from eventlet import greenthread
 import mock
 import mox
 from oslo.config import cfg
@@ -1249,9 +1250,9 @@ class _BaseTaskTestCase(object):
         self.mox.StubOutWithMock(db, 'flavor_extra_specs_get')
         self.mox.StubOutWithMock(self.conductor_manager.scheduler_client,
                                  'select_destinations')
-        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
-        self.mox.StubOutWithMock(db,
-                                 'block_device_mapping_get_all_by_instance')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.mox.StubOutWithMock(
+            db, 'block_device_mapping_get_all_by_instance_uuids')
         self.mox.StubOutWithMock(self.conductor_manager.compute_rpcapi,
                                  'build_and_run_instance')
 
@@ -1268,12 +1269,14 @@ class _BaseTaskTestCase(object):
                 {'retry': {'num_attempts': 1, 'hosts': []}}).AndReturn(
                         [{'host': 'host1', 'nodename': 'node1', 'limits': []},
                          {'host': 'host2', 'nodename': 'node2', 'limits': []}])
-        db.instance_get_by_uuid(self.context, instances[0].uuid,
-                columns_to_join=['system_metadata'],
-                use_slave=False).AndReturn(
-                        jsonutils.to_primitive(instances[0]))
-        db.block_device_mapping_get_all_by_instance(self.context,
-                instances[0].uuid, use_slave=False).AndReturn([])
+        objects.InstanceList.get_by_filters(self.context,
+                {'uuid': [inst.uuid for inst in instances],
+                 'deleted': False},
+                expected_attrs=['system_metadata']).AndReturn(
+                        objects.InstanceList(objects=instances))
+        db.block_device_mapping_get_all_by_instance_uuids(self.context,
+                [inst.uuid for inst in instances],
+                use_slave=False).AndReturn([])
         self.conductor_manager.compute_rpcapi.build_and_run_instance(
                 self.context,
                 instance=mox.IgnoreArg(),
@@ -1294,12 +1297,6 @@ class _BaseTaskTestCase(object):
                 security_groups='security_groups',
                 block_device_mapping=mox.IgnoreArg(),
                 node='node1', limits=[])
-        db.instance_get_by_uuid(self.context, instances[1].uuid,
-                columns_to_join=['system_metadata'],
-                use_slave=False).AndReturn(
-                        jsonutils.to_primitive(instances[1]))
-        db.block_device_mapping_get_all_by_instance(self.context,
-                instances[1].uuid, use_slave=False).AndReturn([])
         self.conductor_manager.compute_rpcapi.build_and_run_instance(
                 self.context,
                 instance=mox.IgnoreArg(),
@@ -2037,8 +2034,7 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
     def test_build_instances_instance_not_found(self):
         instances = [fake_instance.fake_instance_obj(self.context)
                 for i in xrange(2)]
-        self.mox.StubOutWithMock(instances[0], 'refresh')
-        self.mox.StubOutWithMock(instances[1], 'refresh')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         image = {'fake-data': 'should_pass_silently'}
         spec = {'fake': 'specs',
                 'instance_properties': instances[0]}
@@ -2056,9 +2052,11 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                 {'retry': {'num_attempts': 1, 'hosts': []}}).AndReturn(
                         [{'host': 'host1', 'nodename': 'node1', 'limits': []},
                          {'host': 'host2', 'nodename': 'node2', 'limits': []}])
-        instances[0].refresh().AndRaise(
-                exc.InstanceNotFound(instance_id=instances[0].uuid))
-        instances[1].refresh()
+        objects.InstanceList.get_by_filters(self.context,
+                {'uuid': [inst.uuid for inst in instances],
+                 'deleted': False},
+                expected_attrs=[]).AndReturn(
+                        objects.InstanceList(objects=[instances[1]]))
         self.conductor_manager.compute_rpcapi.build_and_run_instance(
                 self.context, instance=instances[1], host='host2',
                 image={'fake-data': 'should_pass_silently'}, request_spec=spec,
@@ -2090,8 +2088,14 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
 
     @mock.patch.object(scheduler_utils, 'build_request_spec')
     def test_build_instances_info_cache_not_found(self, build_request_spec):
-        instances = [fake_instance.fake_instance_obj(self.context)
-                for i in xrange(2)]
+        instances = [fake_instance.fake_instance_obj(self.context,
+                expected_attrs=['info_cache']) for i in xrange(2)]
+        current = []
+        for instance in instances:
+            current.append(instance.obj_clone())
+            instance.info_cache = objects.InstanceInfoCache(
+                instance_uuid=instance.uuid)
+        current[1].info_cache = instances[1].info_cache
         image = {'fake-data': 'should_pass_silently'}
         destinations = [{'host': 'host1', 'nodename': 'node1', 'limits': []},
                 {'host': 'host2', 'nodename': 'node2', 'limits': []}]
@@ -2099,15 +2103,13 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                 'instance_properties': instances[0]}
         build_request_spec.return_value = spec
         with contextlib.nested(
-                mock.patch.object(instances[0], 'refresh',
-                    side_effect=exc.InstanceInfoCacheNotFound(
-                        instance_uuid=instances[0].uuid)),
-                mock.patch.object(instances[1], 'refresh'),
+                mock.patch.object(objects.InstanceList, 'get_by_filters',
+                    return_value=objects.InstanceList(objects=current)),
                 mock.patch.object(self.conductor_manager.scheduler_client,
                     'select_destinations', return_value=destinations),
                 mock.patch.object(self.conductor_manager.compute_rpcapi,
                     'build_and_run_instance')
-                ) as (inst1_refresh, inst2_refresh, select_destinations,
+                ) as (get_by_filters, select_destinations,
                         build_and_run_instance):
 
             # build_instances() is a cast, we need to wait for it to complete
@@ -2138,6 +2140,59 @@ class ConductorTaskTestCase(_BaseTaskTestCase, test_compute.BaseTestCase):
                     block_device_mapping=mock.ANY,
                     node='node2', limits=[])
 
+    @mock.patch.object(scheduler_utils, 'build_request_spec')
+    def test_build_instances_concurrent_casts(self, build_request_spec):
+        self.flags(build_instances_pool_size=2, group='conductor')
+        instances = [fake_instance.fake_instance_obj(self.context)
+                for i in xrange(3)]
+        bdms = block_device_obj.block_device_make_list(self.context, [
+            fake_block_device.FakeDbBlockDeviceDict(
+                {'id': 1, 'instance_uuid': instances[1].uuid,
+                 'source_type': 'volume', 'destination_type': 'volume',
+                 'volume_id': 'fake-volume', 'boot_index': 0})])
+        destinations = [{'host': 'host%d' % i, 'nodename': 'node%d' % i,
+                         'limits': []} for i in xrange(3)]
+        build_request_spec.return_value = {'fake': 'specs'}
+        casts = []
+
+        def fake_build_and_run_instance(context, instance, host, **kwargs):
+            greenthread.sleep(0)
+            casts.append((instance.uuid, host,
+                          kwargs['filter_properties']['retry']['hosts'],
+                          [bdm.id for bdm in kwargs['block_device_mapping']]))
+
+        with contextlib.nested(
+                mock.patch.object(objects.InstanceList, 'get_by_filters',
+                    return_value=objects.InstanceList(objects=instances)),
+                mock.patch.object(objects.BlockDeviceMappingList,
+                    'get_by_instance_uuids', return_value=bdms),
+                mock.patch.object(self.conductor_manager.scheduler_client,
+                    'select_destinations', return_value=destinations),
+                mock.patch.object(self.conductor_manager.compute_rpcapi,
+                    'build_and_run_instance',
+                    side_effect=fake_build_and_run_instance)
+                ) as (get_by_filters, get_by_instance_uuids,
+                      select_destinations, build_and_run_instance):
+            self.conductor_manager.build_instances(self.context,
+                    instances=instances,
+                    image={'fake-data': 'should_pass_silently'},
+                    filter_properties={},
+                    admin_password='admin_password',
+                    injected_files='injected_files',
+                    requested_networks=None,
+                    security_groups='security_groups',
+                    block_device_mapping='block_device_mapping',
+                    legacy_bdm=False)
+
+        self.assertEqual(1, get_by_filters.call_count)
+        get_by_instance_uuids.assert_called_once_with(
+            self.context, [instance.uuid for instance in instances])
+        self.assertEqual(
+            sorted([(instances[0].uuid, 'host0', [['host0', 'node0']], []),
+                    (instances[1].uuid, 'host1', [['host1', 'node1']], [1]),
+                    (instances[2].uuid, 'host2', [['host2', 'node2']], [])]),
+            sorted(casts))
+
 
 class ConductorTaskRPCAPITestCase(_BaseTaskTestCase,
         test_compute.BaseTestCase):
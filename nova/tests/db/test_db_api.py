@@ -18,6 +18,7 @@
 
 """Unit tests for the DB API."""
 
+import contextlib
 import copy
 import datetime
 import types
@@ -251,6 +252,43 @@ class NotDbApiTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def test_instance_get_all_by_filters_chunked(self):
+        instances = [self.create_instance_with_args(display_name='test%d' % i)
+                     for i in range(5)]
+        for instance in instances:
+            self.create_metadata_for_instance(instance['uuid'])
+        expected = db.instance_get_all_by_filters(
+            self.context, {'display_name': '%test%'}, sort_dir='asc')
+
+        chunks = list(db.instance_get_all_by_filters_chunked(
+            self.context, {'display_name': '%test%'}, sort_dir='asc',
+            chunk_size=2))
+
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        result = [instance for chunk in chunks for instance in chunk]
+        self.assertEqual([instance['uuid'] for instance in expected],
+                         [instance['uuid'] for instance in result])
+        self.assertEqual(10, len(result[0]['metadata']))
+        self.assertEqual(10, len(result[4]['system_metadata']))
+
+    def test_instance_get_all_by_filters_chunked_limit_and_marker(self):
+        instances = [self.create_instance_with_args(display_name='test%d' % i)
+                     for i in range(5)]
+
+        chunks = list(db.instance_get_all_by_filters_chunked(
+            self.context, {}, sort_dir='asc', limit=3,
+            marker=instances[0]['uuid'], chunk_size=2))
+
+        self.assertEqual([[instances[1]['uuid'], instances[2]['uuid']],
+                          [instances[3]['uuid']]],
+                         [[instance['uuid'] for instance in chunk]
+                          for chunk in chunks])
+        self.assertEqual([], list(db.instance_get_all_by_filters_chunked(
+            self.context, {}, limit=0)))
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters_chunked,
+                          self.context, {}, marker=str(stdlib_uuid.uuid4()))
+
     def test_convert_objects_related_datetimes(self):
 
         t1 = timeutils.utcnow()
@@ -1551,6 +1589,62 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         for key in dt_keys:
             self.assertEqual(inst[key], dt)
 
+    def test_instance_create_bulk(self):
+        security_group = db.security_group_create(self.ctxt,
+            {'name': 'group1', 'project_id': self.ctxt.project_id})
+        values_list = []
+        for i in range(3):
+            values = self.sample_data.copy()
+            values.update({'hostname': 'host%d' % i,
+                           'security_groups': ['default', 'group1'],
+                           'extra': {'pci_requests': '[]'},
+                           'block_device_mappings': [
+                               {'source_type': 'image',
+                                'destination_type': 'local',
+                                'boot_index': 0, 'device_name': '/dev/vda',
+                                'volume_size': ''}]})
+            values_list.append(values)
+        values_list[1]['uuid'] = 'fake-uuid'
+        instances = db.instance_create_bulk(self.ctxt, values_list)
+
+        self.assertEqual(['host0', 'host1', 'host2'],
+                         [inst['hostname'] for inst in instances])
+        self.assertEqual('fake-uuid', instances[1]['uuid'])
+        for inst in instances:
+            self._assertEqualObjects(
+                inst, db.instance_get_by_uuid(self.ctxt, inst['uuid']),
+                ignored_keys=['metadata', 'system_metadata', 'info_cache',
+                              'security_groups'])
+            self.assertEqual(self.sample_data['metadata'],
+                             utils.metadata_to_dict(inst['metadata']))
+            self.assertEqual(self.sample_data['system_metadata'],
+                             utils.metadata_to_dict(inst['system_metadata']))
+            self.assertIsNotNone(inst['info_cache'])
+            self.assertEqual(['default', 'group1'],
+                             sorted(sg['name']
+                                    for sg in inst['security_groups']))
+            self.assertEqual('[]', db.instance_extra_get_by_instance_uuid(
+                self.ctxt, inst['uuid'])['pci_requests'])
+            bdms = db.block_device_mapping_get_all_by_instance(
+                self.ctxt, inst['uuid'])
+            self.assertEqual(['/dev/vda'], [bdm['device_name']
+                                            for bdm in bdms])
+            self.assertIsNone(bdms[0]['volume_size'])
+            self.assertIsNotNone(db.get_ec2_instance_id_by_uuid(
+                self.ctxt, inst['uuid']))
+        security_group = db.security_group_get(
+            self.ctxt, security_group['id'], columns_to_join=['instances'])
+        self.assertEqual(3, len(security_group['instances']))
+
+    def test_instance_create_bulk_is_atomic(self):
+        self.flags(osapi_compute_unique_server_name_scope='project')
+        values_list = [{'hostname': 'host1', 'project_id': 'project1'},
+                       {'hostname': 'host2', 'project_id': 'project1'},
+                       {'hostname': 'HOST1', 'project_id': 'project1'}]
+        self.assertRaises(exception.InstanceExists,
+                          db.instance_create_bulk, self.ctxt, values_list)
+        self.assertEqual([], db.instance_get_all(self.ctxt))
+
     def test_instance_update_with_object_values(self):
         values = {
             'access_ip_v4': netaddr.IPAddress('1.2.3.4'),
@@ -1729,6 +1823,13 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                                 {'host': 'host1'})
         self._assertEqualListsOfInstances([instance], result)
 
+    def test_instance_get_all_by_filters_cell_name(self):
+        instance = self.create_instance_with_args(cell_name='api!child')
+        self.create_instance_with_args(cell_name='api!child!grandchild')
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'cell_name': 'api!child'})
+        self._assertEqualListsOfInstances([instance], result)
+
     def test_instance_get_all_by_filters_metadata(self):
         instance = self.create_instance_with_args(metadata={'foo': 'bar'})
         self.create_instance_with_args()
@@ -1902,6 +2003,21 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(result[0]['uuid'], instance['uuid'])
         self.assertEqual(result[0]['system_metadata'], [])
 
+    def test_instance_get_hosts_by_not_type(self):
+        self.create_instance_with_args(host='h1', instance_type_id=1)
+        self.create_instance_with_args(host='h2', instance_type_id=2)
+        self.create_instance_with_args(host='h2', instance_type_id=3)
+        self.create_instance_with_args(host='h3', instance_type_id=1)
+        self.create_instance_with_args(host=None, instance_type_id=2)
+        deleted = self.create_instance_with_args(host='h4',
+                                                 instance_type_id=2)
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+
+        result = db.instance_get_hosts_by_not_type(self.ctxt, 1)
+        self.assertEqual(['h2'], result)
+        result = db.instance_get_hosts_by_not_type(self.ctxt, 3)
+        self.assertEqual(['h1', 'h2', 'h3'], sorted(result))
+
     def test_instance_get_all_hung_in_rebooting(self):
         # Ensure no instances are returned.
         results = db.instance_get_all_hung_in_rebooting(self.ctxt, 10)
@@ -4777,6 +4893,28 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        bmds_values = [{'instance_uuid': uuid1,
+                        'device_name': '/dev/vda'},
+                       {'instance_uuid': uuid2,
+                        'device_name': '/dev/vdb'},
+                       {'instance_uuid': uuid3,
+                        'device_name': '/dev/vdc'}]
+
+        for bdm in bmds_values:
+            self._create_bdm(bdm)
+
+        bmd = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid2])
+        self.assertEqual(['/dev/vda', '/dev/vdb'],
+                         sorted(bdm['device_name'] for bdm in bmd))
+        self.assertEqual([], db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -5796,6 +5934,44 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_changed_since(self):
+        past = timeutils.utcnow() - datetime.timedelta(hours=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, past)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(self.item['id'], nodes[0]['id'])
+        self.assertEqual(self.service['id'], nodes[0]['service']['id'])
+
+        future = timeutils.utcnow() + datetime.timedelta(hours=1)
+        self.assertEqual(
+            [], db.compute_node_get_all_changed_since(self.ctxt, future))
+
+    def test_compute_node_get_all_changed_since_updated(self):
+        watermark = timeutils.utcnow()
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'free_ram_mb': 512})
+
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, watermark)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(512, nodes[0]['free_ram_mb'])
+        self.assertFalse(nodes[0]['deleted'])
+
+    def test_compute_node_get_all_changed_since_service_updated(self):
+        watermark = timeutils.utcnow()
+        db.service_update(self.ctxt, self.service['id'], {'report_count': 2})
+
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, watermark)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(2, nodes[0]['service']['report_count'])
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        watermark = timeutils.utcnow()
+        db.service_destroy(self.ctxt, self.service['id'])
+
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, watermark)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+        self.assertIsNone(nodes[0]['service'])
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -6748,6 +6924,103 @@ class ArchiveTestCase(test.TestCase):
         num = db.archive_deleted_rows_for_table(self.context, "console_pools")
         self.assertEqual(num, 1)
 
+    def _create_deleted_instance_id_mappings(self):
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            self.conn.execute(ins_stmt)
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid.in_(self.uuidstrs[:5]))\
+                .values(deleted=1)
+        self.conn.execute(update_statement)
+
+    def test_archive_deleted_rows_for_table_in_batches(self):
+        self.flags(archive_batch_size=2, archive_batch_interval=0.5)
+        self._create_deleted_instance_id_mappings()
+        batch = sqlalchemy_api._archive_deleted_rows_batch
+        with contextlib.nested(
+                mock.patch.object(sqlalchemy_api,
+                                  '_archive_deleted_rows_batch',
+                                  side_effect=batch),
+                mock.patch('time.sleep')) as (batch_mock, sleep_mock):
+            num = db.archive_deleted_rows_for_table(self.context,
+                                                    'instance_id_mappings')
+        self.assertEqual(5, num)
+        self.assertEqual([2, 2, 2],
+                         [call[0][3] for call in batch_mock.call_args_list])
+        self.assertEqual(2, sleep_mock.call_args_list.count(mock.call(0.5)))
+        qsiim = sql.select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                                self.uuidstrs))
+        self.assertEqual(5, len(self.conn.execute(qsiim).fetchall()))
+
+    def test_archive_deleted_rows_for_table_batches_capped_by_max_rows(self):
+        self.flags(archive_batch_size=2)
+        self._create_deleted_instance_id_mappings()
+        batch = sqlalchemy_api._archive_deleted_rows_batch
+        with mock.patch.object(sqlalchemy_api, '_archive_deleted_rows_batch',
+                               side_effect=batch) as batch_mock:
+            num = db.archive_deleted_rows_for_table(
+                self.context, 'instance_id_mappings', max_rows=3)
+        self.assertEqual(3, num)
+        self.assertEqual([2, 1],
+                         [call[0][3] for call in batch_mock.call_args_list])
+
+    def test_archive_deleted_rows_for_table_requires_admin(self):
+        ctxt = context.RequestContext('fake', 'fake', is_admin=False)
+        self.assertRaises(exception.AdminRequired,
+                          db.archive_deleted_rows_for_table,
+                          ctxt, 'instance_id_mappings', max_rows=1)
+
+    def test_archive_deleted_rows_reflects_tables_once(self):
+        self.flags(archive_batch_size=2)
+        self._create_deleted_instance_id_mappings()
+        db.archive_deleted_rows_for_table(self.context,
+                                          'instance_id_mappings', max_rows=1)
+        with mock.patch.object(sqlalchemy_api, 'Table') as table_mock:
+            num = db.archive_deleted_rows_for_table(
+                self.context, 'instance_id_mappings', max_rows=1)
+        self.assertEqual(1, num)
+        self.assertFalse(table_mock.called)
+
+    def test_archive_deleted_rows_archives_dependent_tables_first(self):
+        tablenames = sqlalchemy_api._get_archive_tablenames(self.engine)
+        self.assertTrue(tablenames.index('consoles') <
+                        tablenames.index('console_pools'))
+        # Only the foreign keys reflected from the database order the
+        # tables, sqlite does not reflect all of them.
+        metadata = sqlalchemy_api._get_archive_metadata(self.engine)
+        for tablename in tablenames:
+            for fk in metadata.tables[tablename].foreign_keys:
+                parent = fk.column.table.name
+                if parent != tablename and parent in tablenames:
+                    self.assertTrue(tablenames.index(tablename) <
+                                    tablenames.index(parent),
+                                    '%s before %s' % (tablename, parent))
+        self.assertNotIn('shadow_instances', tablenames)
+
+    def test_archive_deleted_rows_fk_constraint_no_skip(self):
+        # consoles.pool_id depends on console_pools.id
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        result = self.conn.execute(
+            self.console_pools.insert().values(deleted=1))
+        id1 = result.inserted_primary_key[0]
+        self.ids.append(id1)
+        result = self.conn.execute(
+            self.consoles.insert().values(deleted=1, pool_id=id1))
+        self.ids.append(result.inserted_primary_key[0])
+        # A single run archives the console before its pool.
+        self.assertEqual(2, db.archive_deleted_rows(self.context))
+        rows = self.conn.execute(sql.select([self.shadow_console_pools]).
+            where(self.shadow_console_pools.c.id == id1)).fetchall()
+        self.assertEqual(1, len(rows))
+
     def test_archive_deleted_rows_2_tables(self):
         # Add 6 rows to each table
         for uuidstr in self.uuidstrs:
@@ -523,7 +523,8 @@ class TestDownloadNoDirectUri(test.NoDBTestCase):
                     'url': 'file:///files/image',
                     'metadata': mock.sentinel.loc_meta
                 }
-            ]
+            ],
+            'checksum': mock.sentinel.checksum
         }
         tran_mod = mock.MagicMock()
         get_tran_mock.return_value = tran_mod
@@ -539,9 +540,9 @@ class TestDownloadNoDirectUri(test.NoDBTestCase):
                                           mock.sentinel.image_id,
                                           include_locations=True)
         get_tran_mock.assert_called_once_with('file')
-        tran_mod.download.assert_called_once_with(ctx, mock.ANY,
-                                                  mock.sentinel.dst_path,
-                                                  mock.sentinel.loc_meta)
+        tran_mod.download.assert_called_once_with(
+            ctx, mock.ANY, mock.sentinel.dst_path, mock.sentinel.loc_meta,
+            checksum=mock.sentinel.checksum)
 
     @mock.patch('__builtin__.open')
     @mock.patch('nova.image.glance.GlanceImageService._get_transfer_module')
@@ -580,7 +581,8 @@ class TestDownloadNoDirectUri(test.NoDBTestCase):
         get_tran_mock.assert_called_once_with('file')
         tran_mod.download.assert_called_once_with(ctx, mock.ANY,
                                                   mock.sentinel.dst_path,
-                                                  mock.sentinel.loc_meta)
+                                                  mock.sentinel.loc_meta,
+                                                  checksum=None)
         client.call.assert_called_once_with(ctx, 1, 'data',
                                             mock.sentinel.image_id)
         # NOTE(jaypipes): log messages call open() in part of the
@@ -12,13 +12,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import BaseHTTPServer
+import hashlib
+import os
+import re
 import urlparse
 
+import eventlet
 import mock
 
 from nova import exception
 from nova.image.download import file as tm_file
+from nova.image.download import http as tm_http
 from nova import test
+from nova import utils
 
 
 class TestFileTransferModule(test.NoDBTestCase):
@@ -99,3 +106,123 @@ class TestFileTransferModule(test.NoDBTestCase):
                           tm.download, mock.sentinel.ctx, url_parts,
                           dst_file, loc_meta)
         self.assertFalse(copy_mock.called)
+
+
+class _ImageRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the image data of the server, honouring ranges if enabled."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self, code, length, content_range=None):
+        self.send_response(code)
+        self.send_header('Content-Length', str(length))
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers(200, len(self.server.data))
+
+    def do_GET(self):
+        data = self.server.data
+        self.server.ranges.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d*)$',
+                         self.headers.get('Range', ''))
+        if match and self.server.accept_ranges:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(data) - 1) + 1
+            self._send_headers(206, end - start, 'bytes %d-%d/%d' % (
+                start, end - 1, len(data)))
+        else:
+            start, end = 0, len(data)
+            self._send_headers(200, end - start)
+        if self.server.fail_after is not None:
+            # NOTE: Drop the connection once, in the middle of the data
+            end = min(end, start + self.server.fail_after)
+            self.server.fail_after = None
+        self.wfile.write(data[start:end])
+
+
+class TestHttpTransferModule(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestHttpTransferModule, self).setUp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _ImageRequestHandler)
+        self.server.data = os.urandom(100000)
+        self.server.accept_ranges = True
+        self.server.fail_after = None
+        self.server.ranges = []
+        self.checksum = hashlib.md5(self.server.data).hexdigest()
+        eventlet.spawn_n(self.server.serve_forever, 0.01)
+        self.addCleanup(self.server.shutdown)
+        self.url_parts = urlparse.urlparse(
+            'http://127.0.0.1:%d/image' % self.server.server_port)
+        self.flags(chunk_size=4096, preallocate=False,
+                   group='image_http_download')
+
+    def _download(self, **kwargs):
+        with utils.tempdir() as tmpdir:
+            dst_path = os.path.join(tmpdir, 'image')
+            stats = tm_http.HttpTransfer().download(
+                mock.sentinel.ctx, self.url_parts, dst_path, {}, **kwargs)
+            with open(dst_path, 'rb') as f:
+                self.assertEqual(self.server.data, f.read())
+        self.assertEqual(len(self.server.data), stats['bytes'])
+        return stats
+
+    def test_download(self):
+        stats = self._download(checksum=self.checksum)
+        self.assertEqual(1, stats['ranges'])
+        self.assertEqual([None], self.server.ranges)
+
+    def test_download_ranges(self):
+        self.flags(range_workers=4, group='image_http_download')
+        stats = self._download(checksum=self.checksum)
+        self.assertEqual(4, stats['ranges'])
+        self.assertEqual(['bytes=0-24999', 'bytes=25000-49999',
+                          'bytes=50000-74999', 'bytes=75000-99999'],
+                         sorted(self.server.ranges))
+
+    def test_download_ranges_not_accepted(self):
+        self.flags(range_workers=4, group='image_http_download')
+        self.server.accept_ranges = False
+        stats = self._download(checksum=self.checksum)
+        self.assertEqual(1, stats['ranges'])
+
+    def test_download_resumed(self):
+        self.server.fail_after = 30000
+        self._download(checksum=self.checksum)
+        self.assertEqual([None, 'bytes=30000-99999'], self.server.ranges)
+
+    def test_download_restarted(self):
+        self.server.accept_ranges = False
+        self.server.fail_after = 30000
+        self._download(checksum=self.checksum)
+        self.assertEqual([None, None], self.server.ranges)
+
+    def test_download_range_resumed(self):
+        self.flags(range_workers=2, group='image_http_download')
+        self.server.fail_after = 30000
+        self._download(checksum=self.checksum)
+        self.assertEqual(3, len(self.server.ranges))
+
+    def test_download_retries_exhausted(self):
+        self.flags(num_retries=0, group='image_http_download')
+        self.server.fail_after = 30000
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download)
+
+    def test_download_checksum_mismatch(self):
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download, checksum='0' * 32)
+
+    @mock.patch.object(utils, 'trycmd', return_value=('', ''))
+    def test_download_preallocated(self, trycmd_mock):
+        self.flags(preallocate=True, group='image_http_download')
+        self._download()
+        trycmd_mock.assert_called_once_with('fallocate', '-n', '-l',
+                                            len(self.server.data), mock.ANY)
@@ -444,6 +444,19 @@ class ApiTestCase(test.TestCase):
         mock_disassociate.assert_called_once_with(self.context, 123,
                                                   project=True, host=True)
 
+    @mock.patch('nova.network.api.API.get_instance_nw_info')
+    def test_get_instances_nw_info(self, mock_get_nw_info):
+        error = exception.InstanceNotFound(instance_id='uuid2')
+        mock_get_nw_info.side_effect = [mock.sentinel.nw_info1, error]
+        instances = [{'uuid': 'uuid1'}, {'uuid': 'uuid2'}]
+        results = self.network_api.get_instances_nw_info(self.context,
+                                                         instances)
+        self.assertEqual({'uuid1': mock.sentinel.nw_info1, 'uuid2': error},
+                         results)
+        self.assertEqual([mock.call(self.context, instances[0]),
+                          mock.call(self.context, instances[1])],
+                         mock_get_nw_info.call_args_list)
+
     def _test_refresh_cache(self, method, *args, **kwargs):
         # This test verifies that no call to get_instance_nw_info() is made
         # from the @refresh_cache decorator for the tested method.
@@ -19,6 +19,7 @@ import contextlib
 import copy
 import uuid
 
+import fixtures
 import mock
 import mox
 from neutronclient.common import exceptions
@@ -36,6 +37,7 @@ from nova.network.neutronv2 import constants
 from nova import objects
 from nova.openstack.common import jsonutils
 from nova.openstack.common import policy as common_policy
+from nova.openstack.common import timeutils
 from nova.pci import pci_manager
 from nova.pci import pci_whitelist
 from nova import policy
@@ -270,6 +272,7 @@ class TestNeutronv2Base(test.TestCase):
                              'floating_ip_address': '172.0.1.2'}]
         self.dhcp_port_data1 = [{'fixed_ips': [{'ip_address': '10.0.1.9',
                                                'subnet_id': 'my_subid1'}],
+                                 'network_id': 'my_netid1',
                                  'status': 'ACTIVE',
                                  'admin_state_up': True}]
         self.port_address2 = '10.0.2.2'
@@ -572,23 +575,20 @@ class TestNeutronv2Base(test.TestCase):
         nets = number == 1 and self.nets1 or self.nets2
         self.moxed_client.list_networks(
             id=net_ids).AndReturn({'networks': nets})
-        for i in xrange(1, number + 1):
-            float_data = number == 1 and self.float_data1 or self.float_data2
-            for ip in port_data[i - 1]['fixed_ips']:
-                float_data = [x for x in float_data
-                              if x['fixed_ip_address'] == ip['ip_address']]
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=port_data[i - 1]['id']).AndReturn(
-                        {'floatingips': float_data})
-            subnet_data = i == 1 and self.subnet_data1 or self.subnet_data2
-            self.moxed_client.list_subnets(
-                id=mox.SameElementsAs(['my_subid%s' % i])).AndReturn(
-                    {'subnets': subnet_data})
-            self.moxed_client.list_ports(
-                network_id=subnet_data[0]['network_id'],
-                device_owner='network:dhcp').AndReturn(
-                    {'ports': []})
+        float_data = number == 1 and self.float_data1 or self.float_data2
+        self.moxed_client.list_floatingips(
+            port_id=[port['id'] for port in port_data]).AndReturn(
+                {'floatingips': float_data})
+        subnet_data = self.subnet_data1[:]
+        if number == 2:
+            subnet_data += self.subnet_data2
+        self.moxed_client.list_subnets(
+            id=mox.SameElementsAs(['my_subid%s' % i
+                                   for i in xrange(1, number + 1)])
+            ).AndReturn({'subnets': subnet_data})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(net_ids),
+            device_owner='network:dhcp').AndReturn({'ports': []})
         self.mox.ReplayAll()
         nw_inf = api.get_instance_nw_info(self.context, instance)
         for i in xrange(0, number):
@@ -743,23 +743,22 @@ class TestNeutronv2(TestNeutronv2Base):
         for current_neutron_port in current_neutron_ports:
             current_neutron_port_map[current_neutron_port['id']] = (
                 current_neutron_port)
-        for port_id in port_ids:
-            current_neutron_port = current_neutron_port_map.get(port_id)
-            if current_neutron_port:
-                for ip in current_neutron_port['fixed_ips']:
-                    self.moxed_client.list_floatingips(
-                        fixed_ip_address=ip['ip_address'],
-                        port_id=current_neutron_port['id']).AndReturn(
-                            {'floatingips': [self.float_data2[index]]})
-                    self.moxed_client.list_subnets(
-                        id=mox.SameElementsAs([ip['subnet_id']])
-                        ).AndReturn(
-                            {'subnets': [self.subnet_data_n[index]]})
-                    self.moxed_client.list_ports(
-                        network_id=current_neutron_port['network_id'],
-                        device_owner='network:dhcp').AndReturn(
-                        {'ports': self.dhcp_port_data1})
-                    index += 1
+        ports = [current_neutron_port_map[port_id] for port_id in port_ids
+                 if port_id in current_neutron_port_map]
+        if ports:
+            index = len(ports)
+            self.moxed_client.list_floatingips(
+                port_id=[port['id'] for port in ports]).AndReturn(
+                    {'floatingips': self.float_data2[:index]})
+            self.moxed_client.list_subnets(
+                id=mox.SameElementsAs([ip['subnet_id'] for port in ports
+                                       for ip in port['fixed_ips']])
+                ).AndReturn({'subnets': self.subnet_data_n[:index]})
+            self.moxed_client.list_ports(
+                network_id=mox.SameElementsAs(
+                    [port['network_id'] for port in ports]),
+                device_owner='network:dhcp').AndReturn(
+                    {'ports': self.dhcp_port_data1})
         self.mox.ReplayAll()
 
         self.instance['info_cache'] = network_cache
@@ -790,6 +789,9 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_networks(
             id=[self.port_data1[0]['network_id']]).AndReturn(
                 {'networks': self.nets1})
+        self.moxed_client.list_floatingips(
+            port_id=[self.port_data3[0]['id']]).AndReturn(
+                {'floatingips': []})
         neutronv2.get_client(mox.IgnoreArg(),
                              admin=True).MultipleTimes().AndReturn(
             self.moxed_client)
@@ -1296,13 +1298,10 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_networks(id=net_ids).AndReturn(
             {'networks': nets})
         float_data = number == 1 and self.float_data1 or self.float_data2
-        for data in port_data[1:]:
-            for ip in data['fixed_ips']:
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=data['id']).AndReturn(
-                        {'floatingips': float_data[1:]})
-        for port in port_data[1:]:
+        if port_data[1:]:
+            self.moxed_client.list_floatingips(
+                port_id=[data['id'] for data in port_data[1:]]).AndReturn(
+                    {'floatingips': float_data[1:]})
             self.moxed_client.list_subnets(id=['my_subid2']).AndReturn({})
 
         self.mox.ReplayAll()
@@ -2382,7 +2381,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': True,
              'status': 'ACTIVE',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:01',
              'binding:vif_type': model.VIF_TYPE_BRIDGE,
              'binding:vnic_type': model.VNIC_TYPE_NORMAL,
@@ -2393,7 +2393,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': False,
              'status': 'DOWN',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:02',
              'binding:vif_type': model.VIF_TYPE_BRIDGE,
              'binding:vnic_type': model.VNIC_TYPE_NORMAL,
@@ -2404,7 +2405,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': True,
              'status': 'DOWN',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:03',
              'binding:vif_type': model.VIF_TYPE_BRIDGE,
              'binding:vnic_type': model.VNIC_TYPE_NORMAL,
@@ -2415,7 +2417,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': True,
              'status': 'ACTIVE',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:04',
              'binding:vif_type': model.VIF_TYPE_HW_VEB,
              'binding:vnic_type': model.VNIC_TYPE_DIRECT,
@@ -2429,7 +2432,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': True,
              'status': 'ACTIVE',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:05',
              'binding:vif_type': model.VIF_TYPE_802_QBH,
              'binding:vnic_type': model.VNIC_TYPE_MACVTAP,
@@ -2444,7 +2448,8 @@ class TestNeutronv2(TestNeutronv2Base):
              'network_id': 'net-id',
              'admin_state_up': True,
              'status': 'ACTIVE',
-             'fixed_ips': [{'ip_address': '1.1.1.1'}],
+             'fixed_ips': [{'ip_address': '1.1.1.1',
+                            'subnet_id': 'subnet-id'}],
              'mac_address': 'de:ad:be:ef:00:06',
              'binding:vif_type': model.VIF_TYPE_BRIDGE,
              # No binding:vnic_type
@@ -2459,7 +2464,10 @@ class TestNeutronv2(TestNeutronv2Base):
              'binding:vnic_type': model.VNIC_TYPE_NORMAL,
              },
             ]
-        fake_subnets = [model.Subnet(cidr='1.0.0.0/8')]
+        fake_subnet = {'id': 'subnet-id',
+                       'cidr': '1.0.0.0/8',
+                       'gateway_ip': '1.0.0.1',
+                       'network_id': 'net-id'}
         fake_nets = [
             {'id': 'net-id',
              'name': 'foo',
@@ -2472,17 +2480,22 @@ class TestNeutronv2(TestNeutronv2Base):
             tenant_id='fake', device_id='uuid').AndReturn(
                 {'ports': fake_ports})
 
-        self.mox.StubOutWithMock(api, '_get_floating_ips_by_fixed_and_port')
-        self.mox.StubOutWithMock(api, '_get_subnets_from_port')
+        self.mox.StubOutWithMock(api, '_get_floating_ips_by_ports')
+        self.mox.StubOutWithMock(api, '_get_subnets_by_ids')
+        self.mox.StubOutWithMock(api, '_get_dhcp_servers')
         requested_ports = [fake_ports[2], fake_ports[0], fake_ports[1],
                            fake_ports[3], fake_ports[4], fake_ports[5]]
-        for requested_port in requested_ports:
-            api._get_floating_ips_by_fixed_and_port(
-                self.moxed_client, '1.1.1.1', requested_port['id']).AndReturn(
-                    [{'floating_ip_address': '10.0.0.1'}])
-        for requested_port in requested_ports:
-            api._get_subnets_from_port(self.context, requested_port
-                ).AndReturn(fake_subnets)
+        api._get_floating_ips_by_ports(
+            self.moxed_client,
+            [requested_port['id'] for requested_port in requested_ports]
+            ).AndReturn(dict(((requested_port['id'], '1.1.1.1'),
+                              [{'floating_ip_address': '10.0.0.1'}])
+                             for requested_port in requested_ports))
+        api._get_subnets_by_ids(
+            self.context, ['subnet-id'] * len(requested_ports)).AndReturn(
+                {'subnet-id': fake_subnet})
+        api._get_dhcp_servers(self.context, ['net-id']).AndReturn(
+            {'subnet-id': '1.0.0.2'})
 
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
@@ -2512,6 +2525,13 @@ class TestNeutronv2(TestNeutronv2Base):
                              requested_ports[index].get('binding:vif_details'))
             self.assertEqual(nw_info.get('profile'),
                              requested_ports[index].get('binding:profile'))
+            self.assertEqual(['1.1.1.1'],
+                             [ip['address'] for ip in nw_info.fixed_ips()])
+            self.assertEqual(['10.0.0.1'],
+                             [ip['address'] for ip in nw_info.floating_ips()])
+            self.assertEqual(
+                '1.0.0.2',
+                nw_info['network']['subnets'][0]['meta']['dhcp_server'])
             index += 1
 
         self.assertEqual(nw_infos[0]['active'], False)
@@ -2541,7 +2561,7 @@ class TestNeutronv2(TestNeutronv2Base):
             id=[port_data['fixed_ips'][0]['subnet_id']]
         ).AndReturn({'subnets': subnet_data1})
         self.moxed_client.list_ports(
-            network_id=subnet_data1[0]['network_id'],
+            network_id=[subnet_data1[0]['network_id']],
             device_owner='network:dhcp').AndReturn({'ports': []})
         self.mox.ReplayAll()
 
@@ -2677,6 +2697,92 @@ class TestNeutronv2WithMock(test.TestCase):
                           api.get_instance_nw_info, 'context', instance)
         mock_lock.assert_called_once_with('refresh_cache-%s' % instance.uuid)
 
+    def _fake_instance_with_info_cache(self, uuid, nw_info=None):
+        info_cache = objects.InstanceInfoCache(
+            instance_uuid=uuid, network_info=nw_info or model.NetworkInfo())
+        return objects.Instance(uuid=uuid, project_id='fake-project',
+                                info_cache=info_cache)
+
+    @mock.patch.object(objects.InstanceInfoCache, 'get_by_instance_uuid')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch.object(neutronapi.API, '_get_instance_nw_info')
+    @mock.patch.object(neutronv2, 'get_client')
+    def test_get_instances_nw_info(self, mock_get_client, mock_nw_info,
+                                   mock_update_cache, mock_get_cache):
+        inst1 = self._fake_instance_with_info_cache('uuid1')
+        inst2 = self._fake_instance_with_info_cache('uuid2')
+        inst3 = self._fake_instance_with_info_cache('uuid3')
+        mock_get_cache.side_effect = (
+            lambda context, uuid: self._fake_instance_with_info_cache(
+                uuid).info_cache)
+        ports = [{'id': 'port1', 'device_id': 'uuid1',
+                  'tenant_id': 'fake-project'},
+                 {'id': 'port2', 'device_id': 'uuid2',
+                  'tenant_id': 'fake-project'},
+                 {'id': 'port3', 'device_id': 'uuid2',
+                  'tenant_id': 'other-project'}]
+        mock_client = mock_get_client.return_value
+        mock_client.list_ports.return_value = {'ports': ports}
+        nw_info1 = model.NetworkInfo()
+        error = exception.InstanceNotFound(instance_id='uuid2')
+        nw_info3 = model.NetworkInfo()
+        mock_nw_info.side_effect = [nw_info1, error, nw_info3]
+
+        results = self.api.get_instances_nw_info(self.context,
+                                                 [inst1, inst2, inst3])
+
+        self.assertEqual({'uuid1': nw_info1, 'uuid2': error,
+                          'uuid3': nw_info3}, results)
+        mock_get_client.assert_called_once_with(self.context, admin=True)
+        mock_client.list_ports.assert_called_once_with(
+            device_id=['uuid1', 'uuid2', 'uuid3'])
+        self.assertEqual(
+            [mock.call(self.context, inst1, neutron_ports=[ports[0]]),
+             mock.call(self.context, inst2, neutron_ports=[ports[1]]),
+             mock.call(self.context, inst3, neutron_ports=[])],
+            mock_nw_info.call_args_list)
+        self.assertEqual(2, mock_update_cache.call_count)
+
+    @mock.patch.object(objects.InstanceInfoCache, 'get_by_instance_uuid')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch.object(neutronapi.API, '_get_instance_nw_info')
+    @mock.patch.object(neutronv2, 'get_client')
+    def test_get_instances_nw_info_cache_changed(self, mock_get_client,
+                                                 mock_nw_info,
+                                                 mock_update_cache,
+                                                 mock_get_cache):
+        # The cache of the first instance was updated after its ports were
+        # listed, and the cache of the second one is gone.
+        inst1 = self._fake_instance_with_info_cache('uuid1')
+        inst2 = self._fake_instance_with_info_cache('uuid2')
+        inst3 = self._fake_instance_with_info_cache('uuid3')
+        new_nw_info = model.NetworkInfo([model.VIF(id='port2')])
+        new_cache = self._fake_instance_with_info_cache(
+            'uuid1', new_nw_info).info_cache
+        mock_get_cache.side_effect = [
+            new_cache,
+            exception.InstanceInfoCacheNotFound(instance_uuid='uuid2'),
+            self._fake_instance_with_info_cache('uuid3').info_cache]
+        ports = [{'id': 'port1', 'device_id': 'uuid1',
+                  'tenant_id': 'fake-project'},
+                 {'id': 'port3', 'device_id': 'uuid3',
+                  'tenant_id': 'fake-project'}]
+        mock_client = mock_get_client.return_value
+        mock_client.list_ports.return_value = {'ports': ports}
+
+        self.api.get_instances_nw_info(self.context, [inst1, inst2, inst3])
+
+        self.assertEqual(
+            [mock.call(self.context, inst1, neutron_ports=None),
+             mock.call(self.context, inst2, neutron_ports=None),
+             mock.call(self.context, inst3, neutron_ports=[ports[1]])],
+            mock_nw_info.call_args_list)
+        self.assertEqual(new_nw_info, inst1.info_cache.network_info)
+        self.assertEqual(3, mock_update_cache.call_count)
+
+    def test_get_instances_nw_info_no_instances(self):
+        self.assertEqual({}, self.api.get_instances_nw_info(self.context, []))
+
     def _test_validate_networks_fixed_ip_no_dup(self, nets, requested_networks,
                                                 ids, list_port_values):
 
@@ -2912,6 +3018,168 @@ class TestNeutronv2WithMock(test.TestCase):
         self.assertFalse(get_nw_info.called)
 
 
+class FakeNeutronClient(object):
+    """Serves list calls from in memory resources, counting the calls and
+    the time they would take with the given latency per round trip.
+    """
+
+    def __init__(self, latency=0.0, **resources):
+        self.latency = latency
+        self.resources = resources
+        self.calls = collections.defaultdict(int)
+
+    @property
+    def call_count(self):
+        return sum(self.calls.values())
+
+    @property
+    def elapsed(self):
+        return self.call_count * self.latency
+
+    def _list(self, name, filters):
+        self.calls['list_%s' % name] += 1
+        items = []
+        for item in self.resources.get(name, []):
+            for key, value in filters.iteritems():
+                values = value if isinstance(value, list) else [value]
+                if item.get(key) not in values:
+                    break
+            else:
+                items.append(item)
+        return {name: items}
+
+    def list_ports(self, **filters):
+        return self._list('ports', filters)
+
+    def list_networks(self, **filters):
+        return self._list('networks', filters)
+
+    def list_subnets(self, **filters):
+        return self._list('subnets', filters)
+
+    def list_floatingips(self, **filters):
+        return self._list('floatingips', filters)
+
+
+class TestNeutronv2TopologyCache(test.TestCase):
+
+    PORTS = 4
+
+    def setUp(self):
+        super(TestNeutronv2TopologyCache, self).setUp()
+        self.context = context.RequestContext('userid', 'my_tenantid')
+        self.api = neutronapi.API()
+        self.stubs.Set(neutronapi, '_TOPOLOGY_CACHE',
+                       neutronapi._TopologyCache())
+        self.instance = {'uuid': str(uuid.uuid4()),
+                         'project_id': 'my_tenantid',
+                         'info_cache': {'network_info': []}}
+        networks, subnets, ports, fips = [], [], [], []
+        for i in xrange(2):
+            networks.append({'id': 'net%d' % i, 'name': 'net%d' % i,
+                             'tenant_id': 'my_tenantid'})
+            subnets.append({'id': 'subnet%d' % i,
+                            'network_id': 'net%d' % i,
+                            'cidr': '10.0.%d.0/24' % i,
+                            'gateway_ip': '10.0.%d.1' % i,
+                            'dns_nameservers': ['8.8.8.8']})
+            ports.append({'id': 'dhcp%d' % i, 'network_id': 'net%d' % i,
+                          'device_id': 'dhcp', 'tenant_id': 'my_tenantid',
+                          'device_owner': 'network:dhcp',
+                          'fixed_ips': [{'subnet_id': 'subnet%d' % i,
+                                         'ip_address': '10.0.%d.2' % i}]})
+        for i in xrange(self.PORTS):
+            net = i % 2
+            address = '10.0.%d.%d' % (net, 10 + i)
+            ports.append({'id': 'port%d' % i, 'network_id': 'net%d' % net,
+                          'device_id': self.instance['uuid'],
+                          'tenant_id': 'my_tenantid',
+                          'device_owner': 'compute:nova',
+                          'mac_address': 'fa:16:3e:00:00:%02x' % i,
+                          'admin_state_up': True, 'status': 'ACTIVE',
+                          'fixed_ips': [{'subnet_id': 'subnet%d' % net,
+                                         'ip_address': address}]})
+            fips.append({'port_id': 'port%d' % i,
+                         'fixed_ip_address': address,
+                         'floating_ip_address': '172.24.4.%d' % i})
+            self.instance['info_cache']['network_info'].append(
+                {'id': 'port%d' % i, 'network': {'id': 'net%d' % net}})
+        self.client = FakeNeutronClient(latency=0.05, networks=networks,
+                                        subnets=subnets, ports=ports,
+                                        floatingips=fips)
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.network.neutronv2.get_client',
+            lambda *args, **kwargs: self.client))
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.network.base_api.update_instance_cache_with_nw_info',
+            lambda *args, **kwargs: None))
+
+    def _refresh(self):
+        before = self.client.call_count
+        nw_info = self.api.get_instance_nw_info(self.context, self.instance)
+        self.assertEqual(['port%d' % i for i in xrange(self.PORTS)],
+                         [vif['id'] for vif in nw_info])
+        for i, vif in enumerate(nw_info):
+            subnet = vif['network']['subnets'][0]
+            self.assertEqual('10.0.%d.2' % (i % 2),
+                             subnet['meta']['dhcp_server'])
+            self.assertEqual(['172.24.4.%d' % i],
+                             [ip['address'] for ip in vif.floating_ips()])
+        return self.client.call_count - before
+
+    def test_get_instance_nw_info_batches_calls(self):
+        # One call per kind of resource, whatever the number of ports.
+        self.assertEqual(5, self._refresh())
+        self.assertEqual(1, self.client.calls['list_floatingips'])
+        self.assertEqual(1, self.client.calls['list_subnets'])
+        self.assertEqual(1, self.client.calls['list_networks'])
+        self.assertEqual(2, self.client.calls['list_ports'])
+        self.assertEqual(5, self._refresh())
+        self.assertAlmostEqual(0.5, self.client.elapsed)
+
+    def test_get_instance_nw_info_cached_topology(self):
+        self.flags(topology_cache_time=60, group='neutron')
+        self.assertEqual(5, self._refresh())
+        # Only the ports of the instance and their floating ips are read
+        # again.
+        self.assertEqual(2, self._refresh())
+        self.assertEqual(1, self.client.calls['list_networks'])
+        self.assertEqual(1, self.client.calls['list_subnets'])
+        self.assertAlmostEqual(0.35, self.client.elapsed)
+
+    def test_topology_cache_expires(self):
+        self.flags(topology_cache_time=60, group='neutron')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(5, self._refresh())
+        timeutils.advance_time_seconds(59)
+        self.assertEqual(2, self._refresh())
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(5, self._refresh())
+
+    def test_invalidate_network_cache(self):
+        self.flags(topology_cache_time=60, group='neutron')
+        self.assertEqual(5, self._refresh())
+        self.api.invalidate_network_cache(self.context, self.instance)
+        self.assertEqual(5, self._refresh())
+        self.assertEqual(2, self._refresh())
+
+    def test_invalidate_one_network(self):
+        self.flags(topology_cache_time=60, group='neutron')
+        self.assertEqual(5, self._refresh())
+        neutronapi._TOPOLOGY_CACHE.invalidate_networks(['net1'])
+        self.assertEqual(
+            ['subnet0'],
+            list(neutronapi._TOPOLOGY_CACHE.get_many(
+                'subnet', ['subnet0', 'subnet1'])))
+        # Only the resources of the invalidated network are read again.
+        self.assertEqual(5, self._refresh())
+        self.assertEqual(
+            ['subnet0', 'subnet1'],
+            sorted(neutronapi._TOPOLOGY_CACHE.get_many(
+                'subnet', ['subnet0', 'subnet1'])))
+
+
 class TestNeutronv2ModuleMethods(test.TestCase):
 
     def test_gather_port_ids_and_networks_wrong_params(self):
@@ -69,6 +69,13 @@ class TestField(test.NoDBTestCase):
     def test_stringify(self):
         self.assertEqual('123', self.field.stringify(123))
 
+    def test_is_primitive_coerced(self):
+        for in_val, out_val in self.coerce_good_values:
+            if self.field.is_primitive(in_val):
+                self.assertEqual(in_val, out_val)
+                self.assertEqual(in_val, self.field.to_primitive(
+                        'obj', 'attr', self.field.copy_primitive(in_val)))
+
 
 class TestString(TestField):
     def setUp(self):
@@ -83,6 +90,12 @@ class TestString(TestField):
     def test_stringify(self):
         self.assertEqual("'123'", self.field.stringify(123))
 
+    def test_is_primitive(self):
+        self.assertTrue(self.field.is_primitive(u'foo'))
+        self.assertFalse(self.field.is_primitive('foo'))
+        self.assertFalse(self.field.is_primitive(1))
+        self.assertFalse(self.field.is_primitive(None))
+
 
 class TestInteger(TestField):
     def setUp(self):
@@ -221,6 +234,15 @@ class TestDictOfStringsNone(TestField):
                          self.field.stringify({'k2': None,
                                                'key': 'val'}))
 
+    def test_is_primitive(self):
+        value = {u'foo': u'bar', 'baz': None}
+        self.assertTrue(self.field.is_primitive(value))
+        self.assertFalse(self.field.is_primitive({u'foo': 1}))
+        self.assertFalse(self.field.is_primitive({1: u'bar'}))
+        copied = self.field.copy_primitive(value)
+        self.assertEqual(value, copied)
+        self.assertIsNot(value, copied)
+
 
 class TestListOfDictOfNullableStringsField(TestField):
     def setUp(self):
@@ -239,6 +261,9 @@ class TestListOfDictOfNullableStringsField(TestField):
                                        [{'f': 'b'}, {'f1': 'b1'},
                                         {'f2': None}])]
 
+    def test_is_primitive(self):
+        self.assertFalse(self.field.is_primitive([{u'f': u'b'}]))
+
     def test_stringify(self):
         self.assertEqual("[{f=None,f1='b1'},{f2='b2'}]",
                          self.field.stringify(
@@ -30,10 +30,12 @@ from nova.objects import instance_info_cache
 from nova.objects import instance_numa_topology
 from nova.objects import pci_device
 from nova.objects import security_group
+from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests import fake_instance
+from nova.tests import fake_network_cache_model
 from nova.tests.objects import test_instance_fault
 from nova.tests.objects import test_instance_info_cache
 from nova.tests.objects import test_instance_numa_topology
@@ -1182,12 +1184,46 @@ class _TestInstanceListObject(object):
 
 class TestInstanceListObject(test_objects._LocalTest,
                              _TestInstanceListObject):
-    pass
+    def test_get_by_filters_chunked(self):
+        fakes = [self.fake_instance(1), self.fake_instance(2),
+                 self.fake_instance(3)]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters_chunked')
+        db.instance_get_all_by_filters_chunked(
+            self.context, {'foo': 'bar'}, 'uuid', 'asc', limit=None,
+            marker=None, columns_to_join=['metadata'], use_slave=False,
+            chunk_size=2).AndReturn(iter([fakes[:2], fakes[2:]]))
+        self.mox.ReplayAll()
+        inst_lists = list(instance.InstanceList.get_by_filters_chunked(
+            self.context, {'foo': 'bar'}, 'uuid', 'asc',
+            expected_attrs=['metadata', 'fault'], chunk_size=2))
+
+        self.assertEqual([[fake['uuid'] for fake in fakes[:2]],
+                          [fakes[2]['uuid']]],
+                         [[inst.uuid for inst in inst_list]
+                          for inst_list in inst_lists])
+        self.assertIsInstance(inst_lists[0], instance.InstanceList)
 
 
 class TestRemoteInstanceListObject(test_objects._RemoteTest,
                                    _TestInstanceListObject):
-    pass
+    def test_get_by_filters_chunked(self):
+        fakes = [self.fake_instance(1), self.fake_instance(2),
+                 self.fake_instance(3)]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        db.instance_get_all_by_filters(
+            self.context, {'foo': 'bar'}, 'uuid', 'asc', limit=None,
+            marker=None, columns_to_join=['metadata'],
+            use_slave=False).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_lists = list(instance.InstanceList.get_by_filters_chunked(
+            self.context, {'foo': 'bar'}, 'uuid', 'asc',
+            expected_attrs=['metadata'], chunk_size=2))
+
+        # The chunks of the database are not sent over RPC.
+        self.assertEqual([[fake['uuid'] for fake in fakes]],
+                         [[inst.uuid for inst in inst_list]
+                          for inst_list in inst_lists])
+        self.assertRemotes()
 
 
 class TestInstanceObjectMisc(test.NoDBTestCase):
@@ -1195,3 +1231,44 @@ class TestInstanceObjectMisc(test.NoDBTestCase):
         self.stubs.Set(instance, '_INSTANCE_OPTIONAL_JOINED_FIELDS', ['bar'])
         self.assertEqual(['bar'], instance._expected_cols(['foo', 'bar']))
         self.assertIsNone(instance._expected_cols(None))
+
+
+def _make_instance_list(count):
+    nw_info = network_model.NetworkInfo(
+        [fake_network_cache_model.new_vif()])
+    inst_list = instance.InstanceList(objects=[])
+    for i in range(count):
+        inst_uuid = 'fake-uuid-%d' % i
+        inst = instance.Instance(
+            id=i, uuid=inst_uuid, host='fake-host', node='fake-node',
+            display_name='fake-%d' % i, vm_state='active',
+            task_state=None, created_at=timeutils.utcnow(),
+            system_metadata=dict(('key%d' % x, 'value%d' % x)
+                                 for x in range(10)),
+            info_cache=instance_info_cache.InstanceInfoCache(
+                instance_uuid=inst_uuid, network_info=nw_info))
+        inst.info_cache.obj_reset_changes()
+        inst.obj_reset_changes()
+        inst_list.objects.append(inst)
+    inst_list.obj_reset_changes()
+    return inst_list
+
+
+def _round_trip(primitive):
+    """Deserializes an InstanceList as received over RPC and sends it back."""
+    inst_list = instance.InstanceList.obj_from_primitive(
+        jsonutils.loads(jsonutils.dumps(primitive)))
+    return inst_list, inst_list.obj_to_primitive()
+
+
+class TestInstanceListSerialization(test.NoDBTestCase):
+    def test_round_trip(self):
+        primitive = jsonutils.loads(jsonutils.dumps(
+            _make_instance_list(3).obj_to_primitive()))
+        inst_list, result = _round_trip(primitive)
+        self.assertEqual(primitive, result)
+        self.assertEqual(set(), inst_list.obj_what_changed())
+        self.assertEqual('value1', inst_list[0].system_metadata['key1'])
+        self.assertEqual(
+            1, inst_list[0].info_cache.network_info[0]['id'])
+        self.assertEqual(primitive, inst_list.obj_to_primitive())
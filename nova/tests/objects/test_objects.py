@@ -520,6 +520,34 @@ class _TestObject(object):
         obj2.obj_reset_changes()
         self.assertEqual(obj2.obj_what_changed(), set())
 
+    def test_nested_object_hydrated_lazily(self):
+        obj = MyObj(foo=1, rel_object=MyOwnedObject(baz=2))
+        obj.rel_object.obj_reset_changes()
+        obj.obj_reset_changes()
+        primitive = obj.obj_to_primitive()
+        obj2 = MyObj.obj_from_primitive(primitive)
+        self.assertIsInstance(obj2._rel_object, base._ObjectPrimitive)
+        self.assertEqual(set(), obj2.obj_what_changed())
+        self.assertEqual(primitive, obj2.obj_to_primitive())
+        self.assertIsInstance(obj2.rel_object, MyOwnedObject)
+        self.assertEqual(2, obj2.rel_object.baz)
+        self.assertEqual(primitive, obj2.obj_to_primitive())
+
+    def test_nested_object_changes_in_primitive(self):
+        obj = MyObj(foo=1, rel_object=MyOwnedObject(baz=2))
+        obj.obj_reset_changes()
+        obj2 = MyObj.obj_from_primitive(obj.obj_to_primitive())
+        self.assertEqual(set(['rel_object']), obj2.obj_what_changed())
+        self.assertEqual(set(['baz']), obj2.rel_object.obj_what_changed())
+
+    def test_nested_object_unknown_objtype(self):
+        obj = MyObj(foo=1, rel_object=MyOwnedObject(baz=2))
+        primitive = obj.obj_to_primitive()
+        primitive['nova_object.data']['rel_object'][
+            'nova_object.name'] = 'Foo'
+        self.assertRaises(exception.UnsupportedObjectError,
+                          MyObj.obj_from_primitive, primitive)
+
     def test_obj_class_from_name(self):
         obj = base.NovaObject.obj_class_from_name('MyObj', '1.5')
         self.assertEqual('1.5', obj.VERSION)
@@ -936,7 +964,7 @@ object_data = {
     'BandwidthUsage': '1.1-bdab751673947f0ac7de108540a1a8ce',
     'BandwidthUsageList': '1.1-76898106a9db393cd5f42c557389c507',
     'BlockDeviceMapping': '1.3-9968ffe513e7672484b0f528b034cd0f',
-    'BlockDeviceMappingList': '1.4-388b059a9d47ce71d4e8f3cc4f4b760c',
+    'BlockDeviceMappingList': '1.5-5810709bc3311710b4e7957c80603fc6',
     'ComputeNode': '1.5-57ce5a07c727ffab6c51723bb8dccbfe',
     'ComputeNodeList': '1.5-a1641ab314063538470d57daaa5c7831',
     'DNSDomain': '1.0-5bdc288d7c3b723ce86ede998fd5c9ba',
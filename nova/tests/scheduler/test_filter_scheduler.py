@@ -28,6 +28,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import objects
+from nova.openstack.common.fixture import mockpatch
 from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
@@ -47,6 +48,11 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     driver_cls = filter_scheduler.FilterScheduler
 
+    def setUp(self):
+        super(FilterSchedulerTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
+
     def test_run_instance_no_hosts(self):
 
         def _fake_empty_call_zone_method(*args, **kwargs):
@@ -196,6 +202,62 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighed_host in weighed_hosts:
             self.assertIsNotNone(weighed_host.obj)
 
+    @mock.patch('nova.db.instance_get_all_by_host_and_not_type')
+    @mock.patch('nova.db.instance_get_hosts_by_not_type',
+                return_value=['host1', 'host3'])
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_schedule_precomputes_filters(self, mock_get_extra,
+                                          mock_get_hosts, mock_get_all):
+        self.flags(scheduler_default_filters=['TypeAffinityFilter'])
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+        request_spec = {'num_instances': 1,
+                        'instance_type': {'id': 1, 'memory_mb': 512,
+                                          'root_gb': 512, 'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux',
+                                                'uuid': 'fake-uuid'}}
+        self.mox.ReplayAll()
+        filter_properties = {}
+        hosts = sched._schedule(fake_context, request_spec, filter_properties)
+
+        self.assertEqual(1, len(hosts))
+        self.assertIn(hosts[0].obj.host, ('host2', 'host4'))
+        precomputed = filter_properties['precomputed']
+        self.assertEqual(set(['host1', 'host3']),
+                         precomputed['TypeAffinityFilter'])
+        self.assertEqual(1, mock_get_hosts.call_count)
+        self.assertFalse(mock_get_all.called)
+
+    def test_run_instance_does_not_pass_precomputed(self):
+        fake_context = context.RequestContext('user', 'project')
+        request_spec = {'instance_uuids': ['fake-uuid1'],
+                        'instance_properties': {}}
+
+        def _fake_schedule(context, request_spec, filter_properties):
+            filter_properties['precomputed'] = {'FakeFilter': set(['host1'])}
+            return ['host1']
+
+        with contextlib.nested(
+            mock.patch.object(self.driver, '_schedule',
+                              side_effect=_fake_schedule),
+            mock.patch.object(self.driver, '_provision_resource')
+        ) as (_schedule, _provision_resource):
+            self.driver.schedule_run_instance(fake_context, request_spec,
+                    None, None, None, None, {}, False)
+
+        filter_properties = _provision_resource.call_args[0][3]
+        self.assertNotIn('precomputed', filter_properties)
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
         self.assertEqual(4, scheduler_utils._max_attempts())
@@ -675,3 +737,106 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         sched._provision_resource(fake_context, weighted_host,
                                   request_spec, filter_properties,
                                   None, None, None, None)
+
+
+class FilterSchedulerBatchTestCase(test_scheduler.SchedulerTestCase):
+    """Test case for the batch placement of the Filter Scheduler."""
+
+    driver_cls = filter_scheduler.FilterScheduler
+
+    def setUp(self):
+        super(FilterSchedulerBatchTestCase, self).setUp()
+        self.flags(scheduler_default_filters=['RamFilter'],
+                   scheduler_weight_classes=[
+                       'nova.scheduler.weights.ram.RAMWeigher'],
+                   scheduler_host_subset_size=1)
+        patcher = mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                             return_value={'numa_topology': None,
+                                           'pci_requests': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_host_states(self):
+        free_ram = [1100, 3584, 2304, 600, 4096]
+        return [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                    {'total_usable_ram_mb': 4096,
+                                     'free_ram_mb': free_ram_mb})
+                for i, free_ram_mb in enumerate(free_ram)]
+
+    def _get_request_spec(self, num_instances):
+        instance_properties = {'project_id': 1,
+                               'root_gb': 1,
+                               'memory_mb': 1024,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux',
+                               'uuid': 'fake-uuid'}
+        return {'instance_type': {'memory_mb': 1024, 'root_gb': 1,
+                                  'ephemeral_gb': 0, 'vcpus': 1},
+                'instance_properties': instance_properties,
+                'num_instances': num_instances}
+
+    def _schedule(self, num_instances, filter_properties=None):
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(sched, '_get_all_host_states',
+                       lambda context: self._get_host_states())
+        return sched._schedule(self.context,
+                               self._get_request_spec(num_instances),
+                               filter_properties or {})
+
+    def test_schedule_batch_matches_schedule(self):
+        expected = [host.obj.host for host in self._schedule(8)]
+
+        self.flags(scheduler_batch_placement=True)
+        hosts = self._schedule(8)
+
+        self.assertEqual(expected, [host.obj.host for host in hosts])
+        self.assertEqual(['host4', 'host1', 'host4', 'host1', 'host2',
+                          'host4', 'host1', 'host2'], expected)
+
+    def test_schedule_batch_runs_out_of_hosts(self):
+        self.flags(scheduler_batch_placement=True)
+        hosts = self._schedule(25)
+
+        # Each host has room for its free RAM plus 2GB of overcommit.
+        self.assertEqual(20, len(hosts))
+
+    def test_schedule_batch_filters_and_weighs_once(self):
+        self.flags(scheduler_batch_placement=True)
+        sched = fakes.FakeFilterScheduler()
+        self.stubs.Set(sched, '_get_all_host_states',
+                       lambda context: self._get_host_states())
+
+        with contextlib.nested(
+            mock.patch.object(sched.host_manager, 'get_filtered_hosts',
+                              wraps=sched.host_manager.get_filtered_hosts),
+            mock.patch.object(sched.host_manager, 'host_passes_filters',
+                              wraps=sched.host_manager.host_passes_filters),
+            mock.patch.object(sched.host_manager, 'get_weighed_hosts',
+                              wraps=sched.host_manager.get_weighed_hosts)
+        ) as (get_filtered_hosts, host_passes_filters, get_weighed_hosts):
+            hosts = sched._schedule(self.context, self._get_request_spec(3),
+                                    {})
+
+        self.assertEqual(['host4', 'host1', 'host4'],
+                         [host.obj.host for host in hosts])
+        self.assertEqual(1, get_filtered_hosts.call_count)
+        # Only the chosen hosts are weighed again, and only host4 is
+        # filtered again when it is picked a second time.
+        self.assertEqual(4, get_weighed_hosts.call_count)
+        self.assertEqual(1, host_passes_filters.call_count)
+
+    def test_schedule_batch_group_anti_affinity(self):
+        self.flags(scheduler_batch_placement=True,
+                   scheduler_default_filters=['RamFilter',
+                                              'ServerGroupAntiAffinityFilter'])
+        filter_properties = {'group_policies': ['anti-affinity'],
+                             'group_hosts': set()}
+        with mock.patch.object(filter_scheduler.FilterScheduler,
+                               '_setup_instance_group', return_value=True):
+            hosts = self._schedule(8, filter_properties)
+
+        self.assertEqual(['host4', 'host1', 'host2', 'host0', 'host3'],
+                         [host.obj.host for host in hosts])
+        self.assertEqual(set(['host0', 'host1', 'host2', 'host3', 'host4']),
+                         filter_properties['group_hosts'])
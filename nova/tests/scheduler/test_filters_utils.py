@@ -14,8 +14,10 @@
 
 import mock
 
+from nova import objects
 from nova.scheduler.filters import utils
 from nova import test
+from nova.tests.scheduler import fakes
 
 
 class UtilsTestCase(test.NoDBTestCase):
@@ -42,3 +44,58 @@ class UtilsTestCase(test.NoDBTestCase):
 
         self.assertTrue(context.elevated.called)
         self.assertEqual(set([1, 3]), values)
+
+    def _host_state_with_aggregates(self):
+        aggrA = objects.Aggregate(id=1, name='a', hosts=['h1'],
+                                  metadata={'k1': '1', 'k2': '2'})
+        aggrB = objects.Aggregate(id=2, name='b', hosts=['h1'],
+                                  metadata={'k1': '3'})
+        return fakes.FakeHostState('h1', 'n1', {'aggregates': [aggrA, aggrB]})
+
+    @mock.patch("nova.objects.aggregate.AggregateList.get_by_host")
+    def test_aggregate_values_from_key(self, get_by_host):
+        host_state = self._host_state_with_aggregates()
+
+        values = utils.aggregate_values_from_key(
+            mock.sentinel.context, host_state, 'k1')
+
+        self.assertEqual(set(['1', '3']), values)
+        self.assertEqual(set(), utils.aggregate_values_from_key(
+            mock.sentinel.context, host_state, 'k3'))
+        self.assertFalse(get_by_host.called)
+
+    @mock.patch.object(utils, 'aggregate_values_from_db')
+    def test_aggregate_values_from_key_not_indexed(self, values_from_db):
+        host_state = fakes.FakeHostState('h1', 'n1', {})
+
+        values = utils.aggregate_values_from_key(
+            mock.sentinel.context, host_state, 'k1')
+
+        values_from_db.assert_called_once_with(mock.sentinel.context, 'h1',
+                                               'k1')
+        self.assertEqual(values_from_db.return_value, values)
+
+    @mock.patch("nova.db.aggregate_metadata_get_by_host")
+    def test_aggregate_metadata_get_by_host(self, get_metadata):
+        host_state = self._host_state_with_aggregates()
+
+        self.assertEqual({'k1': set(['1', '3']), 'k2': set(['2'])},
+                         utils.aggregate_metadata_get_by_host(
+                             mock.sentinel.context, host_state))
+        self.assertEqual({'k2': set(['2'])},
+                         utils.aggregate_metadata_get_by_host(
+                             mock.sentinel.context, host_state, key='k2'))
+        self.assertEqual({}, utils.aggregate_metadata_get_by_host(
+                             mock.sentinel.context, host_state, key='k3'))
+        self.assertFalse(get_metadata.called)
+
+    @mock.patch("nova.db.aggregate_metadata_get_by_host")
+    def test_aggregate_metadata_get_by_host_not_indexed(self, get_metadata):
+        host_state = fakes.FakeHostState('h1', 'n1', {})
+
+        metadata = utils.aggregate_metadata_get_by_host(
+            mock.sentinel.context, host_state, key='k1')
+
+        get_metadata.assert_called_once_with(mock.sentinel.context, 'h1',
+                                             key='k1')
+        self.assertEqual(get_metadata.return_value, metadata)
@@ -15,12 +15,16 @@
 Tests For Scheduler Host Filters.
 """
 
+import contextlib
+
+import mock
 from oslo.config import cfg
 import six
 
 from nova.compute import arch
 from nova.compute import hvtype
 from nova.compute import vm_mode
+from nova.compute import api as compute_api
 from nova import context
 from nova import db
 from nova import objects
@@ -29,7 +33,9 @@ from nova.openstack.common import jsonutils
 from nova.pci import pci_stats
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import affinity_filter
 from nova.scheduler.filters import ram_filter
+from nova.scheduler.filters import type_filter
 from nova import servicegroup
 from nova import test
 from nova.tests import fake_instance
@@ -395,6 +401,57 @@ class HostFiltersTestCase(test.NoDBTestCase):
 
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def _precompute(self, filter_name, filter_properties):
+        filters.HostFilterHandler().precompute(
+                [self.class_map[filter_name]], filter_properties)
+        return filter_properties['precomputed'].get(filter_name)
+
+    def test_affinity_different_filter_precomputed(self):
+        filt_cls = self.class_map['DifferentHostFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1', {})
+        host2 = fakes.FakeHostState('host2', 'node2', {})
+        instance = fakes.FakeInstance(context=self.context,
+                                         params={'host': 'host1'})
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {
+                                'different_host': [instance.uuid], }}
+
+        self.assertEqual(set(['host1']),
+                         self._precompute('DifferentHostFilter',
+                                          filter_properties))
+        with mock.patch.object(filt_cls.compute_api, 'get_all') as get_all:
+            self.assertFalse(filt_cls.host_passes(host1, filter_properties))
+            self.assertTrue(filt_cls.host_passes(host2, filter_properties))
+        self.assertFalse(get_all.called)
+
+    def test_affinity_different_filter_precompute_no_hint(self):
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': None}
+        self.assertIsNone(self._precompute('DifferentHostFilter',
+                                           filter_properties))
+
+    def test_affinity_same_filter_precomputed(self):
+        filt_cls = self.class_map['SameHostFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1', {})
+        host2 = fakes.FakeHostState('host2', 'node2', {})
+        instance = fakes.FakeInstance(context=self.context,
+                                         params={'host': 'host1'})
+        deleted = fakes.FakeInstance(context=self.context,
+                                     params={'host': 'host2'})
+        db.instance_destroy(self.context, deleted.uuid)
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {
+                                'same_host': [instance.uuid,
+                                              deleted.uuid], }}
+
+        self.assertEqual(set(['host1']),
+                         self._precompute('SameHostFilter',
+                                          filter_properties))
+        with mock.patch.object(filt_cls.compute_api, 'get_all') as get_all:
+            self.assertTrue(filt_cls.host_passes(host1, filter_properties))
+            self.assertFalse(filt_cls.host_passes(host2, filter_properties))
+        self.assertFalse(get_all.called)
+
     def test_affinity_simple_cidr_filter_passes(self):
         filt_cls = self.class_map['SimpleCIDRAffinityFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -470,6 +527,28 @@ class HostFiltersTestCase(test.NoDBTestCase):
                            params={'host': 'fake_host', 'instance_type_id': 2})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_type_filter_precomputed(self):
+        filt_cls = self.class_map['TypeAffinityFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1', {})
+        host2 = fakes.FakeHostState('host2', 'node2', {})
+        host3 = fakes.FakeHostState('host3', 'node3', {})
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host1', 'instance_type_id': 1})
+        fakes.FakeInstance(context=self.context,
+                           params={'host': 'host2', 'instance_type_id': 2})
+        filter_properties = {'context': self.context,
+                             'instance_type': {'id': 1}}
+
+        self.assertEqual(set(['host2']),
+                         self._precompute('TypeAffinityFilter',
+                                          filter_properties))
+        with mock.patch.object(db, 'instance_get_all_by_host_and_not_type'
+                               ) as get_all:
+            self.assertTrue(filt_cls.host_passes(host1, filter_properties))
+            self.assertFalse(filt_cls.host_passes(host2, filter_properties))
+            self.assertTrue(filt_cls.host_passes(host3, filter_properties))
+        self.assertFalse(get_all.called)
+
     def test_aggregate_type_filter(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateTypeAffinityFilter']()
@@ -1416,6 +1495,22 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(4 * 2, host.limits['vcpu'])
 
+    @mock.patch.object(db, 'aggregate_get_by_host')
+    def test_aggregate_core_filter_indexed_aggregates(self, get_by_host):
+        filt_cls = self.class_map['AggregateCoreFilter']()
+        filter_properties = {'context': self.context,
+                             'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=2)
+        aggregate = objects.Aggregate(id=1, name='fake_aggregate',
+                                      hosts=['host1'],
+                                      metadata={'cpu_allocation_ratio': '3'})
+        host = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 8,
+                 'aggregates': [aggregate]})
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+        self.assertEqual(4 * 3, host.limits['vcpu'])
+        self.assertFalse(get_by_host.called)
+
     @staticmethod
     def _make_zone_request(zone, is_admin=False):
         ctxt = context.RequestContext('fake', 'fake', is_admin=is_admin)
@@ -1444,6 +1539,20 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    @mock.patch.object(db, 'aggregate_metadata_get_by_host')
+    def test_availability_zone_filter_indexed_aggregates(self, get_metadata):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        aggregate = objects.Aggregate(id=1, name='fake_aggregate',
+                                      hosts=['host1'],
+                                      metadata={'availability_zone': 'az1'})
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'aggregates': [aggregate]})
+        self.assertTrue(filt_cls.host_passes(host,
+                                             self._make_zone_request('az1')))
+        self.assertFalse(filt_cls.host_passes(host,
+                                              self._make_zone_request('nova')))
+        self.assertFalse(get_metadata.called)
+
     def test_retry_filter_disabled(self):
         # Test case where retry/re-scheduling is disabled.
         filt_cls = self.class_map['RetryFilter']()
@@ -2005,3 +2114,64 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertEqual(limits_topology.cells[1].cpu_limit, 42)
         self.assertEqual(limits_topology.cells[0].memory_limit, 665)
         self.assertEqual(limits_topology.cells[1].memory_limit, 665)
+
+
+class AffinityFiltersPrecomputeTestCase(test.NoDBTestCase):
+    """Compare the instance lookup filters with and without their per
+    request precomputation.
+    """
+
+    def setUp(self):
+        super(AffinityFiltersPrecomputeTestCase, self).setUp()
+        self.queries = 0
+
+    def _query(self, result):
+        self.queries += 1
+        return result
+
+    def _fake_get_all(self, context, search_opts):
+        instance = {'host': 'host0', 'uuid': 'fake-uuid'}
+        if search_opts.get('host', 'host0') != 'host0':
+            return self._query([])
+        return self._query([instance])
+
+    def _fake_get_all_by_host_and_not_type(self, context, host, type_id):
+        return self._query([{'host': host}] if host == 'host1' else [])
+
+    def _fake_get_hosts_by_not_type(self, context, type_id):
+        return self._query(['host1'])
+
+    def _filter_hosts(self, host_count, precompute):
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                       for i in xrange(host_count)]
+        filter_properties = {'context': context.get_admin_context(),
+                             'scheduler_hints': {
+                                 'different_host': ['fake-uuid']},
+                             'instance_type': {'id': 1}}
+        filter_classes = [affinity_filter.DifferentHostFilter,
+                          type_filter.TypeAffinityFilter]
+        handler = filters.HostFilterHandler()
+        self.queries = 0
+
+        with contextlib.nested(
+            mock.patch.object(compute_api.API, 'get_all',
+                              side_effect=self._fake_get_all),
+            mock.patch.object(db, 'instance_get_all_by_host_and_not_type',
+                side_effect=self._fake_get_all_by_host_and_not_type),
+            mock.patch.object(db, 'instance_get_hosts_by_not_type',
+                              side_effect=self._fake_get_hosts_by_not_type)):
+            if precompute:
+                handler.precompute(filter_classes, filter_properties)
+            hosts = handler.get_filtered_objects(filter_classes, host_states,
+                                                 filter_properties)
+
+        return [host.host for host in hosts]
+
+    def test_precomputed_filters_query_once_per_request(self):
+        expected = self._filter_hosts(10, False)
+        # One query per host for each filter, but for the host the first
+        # filter rejected.
+        self.assertEqual(19, self.queries)
+        self.assertEqual(expected, self._filter_hosts(10, True))
+        self.assertEqual(2, self.queries)
+        self.assertEqual(['host%d' % i for i in xrange(2, 10)], expected)
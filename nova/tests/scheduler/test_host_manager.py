@@ -16,6 +16,8 @@
 Tests For HostManager
 """
 
+import datetime
+
 import mock
 import six
 
@@ -24,6 +26,8 @@ from nova.compute import vm_states
 from nova import db
 from nova import exception
 from nova.i18n import _LW
+from nova import objects
+from nova.openstack.common.fixture import mockpatch
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.scheduler import filters
@@ -50,6 +54,8 @@ class HostManagerTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(HostManagerTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = host_manager.HostManager()
         self.fake_hosts = [host_manager.HostState('fake_host%s' % x,
                 'fake-node') for x in xrange(1, 5)]
@@ -273,6 +279,44 @@ class HostManagerTestCase(test.NoDBTestCase):
                 fake_properties)
         self._verify_result(info, result, False)
 
+    def test_host_passes_filters(self):
+        self.host_manager.filter_classes = [FakeFilterClass1]
+        self.flags(scheduler_default_filters=['FakeFilterClass1'])
+        fake_properties = {'moo': 1}
+
+        with mock.patch.object(FakeFilterClass1, '_filter_one',
+                               side_effect=[True, False]) as filter_one:
+            self.assertTrue(self.host_manager.host_passes_filters(
+                self.fake_hosts[0], fake_properties))
+            self.assertFalse(self.host_manager.host_passes_filters(
+                self.fake_hosts[0], fake_properties, index=1))
+        filter_one.assert_called_with(self.fake_hosts[0], fake_properties)
+
+    def test_get_weighed_hosts_with_weighers(self):
+        self.flags(scheduler_weight_classes=[
+            'nova.scheduler.weights.ram.RAMWeigher'])
+        self.host_manager = host_manager.HostManager()
+        for host_state, free_ram_mb in zip(self.fake_hosts[:3],
+                                           [1024, 2048, 4096]):
+            host_state.free_ram_mb = free_ram_mb
+
+        weighers = self.host_manager.get_weighers()
+        weighed_hosts = self.host_manager.get_weighed_hosts(
+            self.fake_hosts[:3], {}, weighers=weighers)
+        self.assertEqual([1.0, 0.5, 0.25],
+                         [host.weight for host in weighed_hosts])
+
+        # Weighing a host again uses the bounds of the first call, and
+        # clamps the weights outside of them.
+        self.fake_hosts[2].free_ram_mb = 2048
+        self.fake_hosts[1].free_ram_mb = -512
+        self.assertEqual(0.5, self.host_manager.get_weighed_hosts(
+            [self.fake_hosts[2]], {}, weighers=weighers)[0].weight)
+        self.assertEqual(0.0, self.host_manager.get_weighed_hosts(
+            [self.fake_hosts[1]], {}, weighers=weighers)[0].weight)
+        self.assertEqual([(0, 4096)],
+                         [(w.minval, w.maxval) for w in weighers])
+
     def test_get_all_host_states(self):
 
         context = 'fake_context'
@@ -318,9 +362,7 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host3', 'node3')].free_disk_mb,
                          3145728)
         self.assertThat(
-                hardware.VirtNUMAHostTopology.from_json(
-                        host_states_map[('host3', 'node3')].numa_topology
-                    )._to_dict(),
+                host_states_map[('host3', 'node3')].numa_topology._to_dict(),
                 matchers.DictMatches(fakes.NUMA_TOPOLOGY._to_dict()))
         self.assertEqual(host_states_map[('host4', 'node4')].free_ram_mb,
                          8192)
@@ -334,6 +376,8 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(HostManagerChangedNodesTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = host_manager.HostManager()
         self.fake_hosts = [
               host_manager.HostState('host1', 'node1'),
@@ -387,6 +431,202 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalTestCase(test.NoDBTestCase):
+    """Test case for the incremental refresh of HostManager host states."""
+
+    def setUp(self):
+        super(HostManagerIncrementalTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
+        self.flags(scheduler_incremental_host_state=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.now = timeutils.utcnow()
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _compute_nodes(self, **kwargs):
+        compute_nodes = []
+        for i in xrange(1, 4):
+            service = dict(id=i, host='host%s' % i, disabled=False,
+                           created_at=self.now, updated_at=None,
+                           deleted_at=None, deleted=0)
+            compute = dict(id=i, local_gb=1024, memory_mb=1024, vcpus=1,
+                           disk_available_least=None, free_ram_mb=512,
+                           vcpus_used=1, free_disk_gb=512, local_gb_used=0,
+                           created_at=self.now, updated_at=None,
+                           deleted_at=None, deleted=0, service=service,
+                           hypervisor_hostname='node%s' % i,
+                           host_ip='127.0.0.1', hypervisor_version=0,
+                           numa_topology=None)
+            compute.update(kwargs)
+            compute_nodes.append(compute)
+        return compute_nodes
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_incremental_refresh(self, get_all, get_changed):
+        compute_nodes = self._compute_nodes()
+        get_all.return_value = compute_nodes
+        updated_at = self.now + datetime.timedelta(seconds=10)
+        changed = dict(compute_nodes[1], free_ram_mb=128,
+                       updated_at=updated_at)
+        get_changed.return_value = [changed]
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        get_all.assert_called_once_with(self.context)
+        get_changed.assert_called_once_with(self.context, self.now)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_states_map))
+        self.assertEqual(128, host_states_map[('host2', 'node2')].free_ram_mb)
+        self.assertEqual(512, host_states_map[('host1', 'node1')].free_ram_mb)
+        self.assertEqual(updated_at, self.host_manager._changed_since)
+        stats = self.host_manager.host_state_stats
+        self.assertEqual(1, stats['full_refreshes'])
+        self.assertEqual(1, stats['incremental_refreshes'])
+        self.assertEqual(4, stats['compute_nodes_loaded'])
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_incremental_refresh_keeps_consumed_resources(self, get_all,
+                                                          get_changed):
+        get_all.return_value = self._compute_nodes()
+        get_changed.return_value = []
+
+        self.host_manager.get_all_host_states(self.context)
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=256, vcpus=1)
+        with mock.patch.object(hardware, 'get_host_numa_usage_from_instance'):
+            host_state.consume_from_instance(instance)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(256, host_state.free_ram_mb)
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_incremental_refresh_deleted_node(self, get_all, get_changed):
+        compute_nodes = self._compute_nodes()
+        get_all.return_value = compute_nodes
+        get_changed.return_value = [
+            dict(compute_nodes[0], deleted=1, deleted_at=self.now),
+            dict(compute_nodes[2], service=None)]
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual([('host2', 'node2')],
+                         self.host_manager.host_state_map.keys())
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_max_staleness(self, get_all, get_changed):
+        self.flags(scheduler_host_state_max_staleness=30)
+        get_all.return_value = self._compute_nodes()
+        get_changed.return_value = []
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertFalse(get_changed.called)
+        self.assertEqual(1, self.host_manager.host_state_stats['hits'])
+
+        timeutils.advance_time_seconds(31)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(1, get_changed.call_count)
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_full_refresh_interval(self, get_all, get_changed):
+        self.flags(scheduler_host_state_full_refresh_interval=60)
+        get_all.return_value = self._compute_nodes()
+        get_changed.return_value = []
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, get_all.call_count)
+        self.assertFalse(get_changed.called)
+
+    @mock.patch.object(db, 'compute_node_get_all_changed_since')
+    @mock.patch.object(db, 'compute_node_get_all')
+    def test_incremental_refresh_disabled(self, get_all, get_changed):
+        self.flags(scheduler_incremental_host_state=False)
+        get_all.return_value = self._compute_nodes()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, get_all.call_count)
+        self.assertFalse(get_changed.called)
+
+
+class HostManagerAggregatesTestCase(test.NoDBTestCase):
+    """Test case for the aggregates indexed by the HostManager."""
+
+    def setUp(self):
+        super(HostManagerAggregatesTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.compute_node_get_all',
+                                        return_value=fakes.COMPUTE_NODES))
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.now = timeutils.utcnow()
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+        self.agg1 = objects.Aggregate(id=1, name='agg1',
+                                      hosts=['host1', 'host2'],
+                                      metadata={'availability_zone': 'az1'})
+        self.agg2 = objects.Aggregate(id=2, name='agg2', hosts=['host2'],
+                                      metadata={'cpu_allocation_ratio': '2'})
+
+    def _host_state(self, host):
+        for host_state in self.host_manager.host_state_map.itervalues():
+            if host_state.host == host:
+                return host_state
+
+    @mock.patch.object(objects.AggregateList, 'get_all')
+    def test_get_all_host_states_sets_aggregates(self, get_all):
+        get_all.return_value = [self.agg1, self.agg2]
+
+        self.host_manager.get_all_host_states(self.context)
+
+        get_all.assert_called_once_with(self.context)
+        self.assertEqual([self.agg1], self._host_state('host1').aggregates)
+        self.assertEqual([self.agg1, self.agg2],
+                         self._host_state('host2').aggregates)
+        self.assertEqual([], self._host_state('host3').aggregates)
+
+    @mock.patch.object(objects.AggregateList, 'get_all')
+    def test_aggregates_reloaded_for_each_request(self, get_all):
+        get_all.return_value = [self.agg1]
+        self.host_manager.get_all_host_states(self.context)
+        get_all.return_value = [self.agg2]
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, get_all.call_count)
+        self.assertEqual([], self._host_state('host1').aggregates)
+        self.assertEqual([self.agg2], self._host_state('host2').aggregates)
+
+    @mock.patch.object(objects.AggregateList, 'get_all')
+    def test_aggregates_max_staleness(self, get_all):
+        self.flags(scheduler_aggregate_index_max_staleness=60)
+        get_all.return_value = [self.agg1]
+        self.host_manager.get_all_host_states(self.context)
+        get_all.return_value = [self.agg2]
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(1, get_all.call_count)
+        self.assertEqual([self.agg1], self._host_state('host1').aggregates)
+
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(2, get_all.call_count)
+        self.assertEqual([], self._host_state('host1').aggregates)
+        self.assertEqual([self.agg2], self._host_state('host2').aggregates)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -535,10 +775,74 @@ class HostStateTestCase(test.NoDBTestCase):
         host = host_manager.HostState("fakehost", "fakenode")
         host.update_from_compute_node(compute)
 
+        # Metrics and NUMA topology are parsed when they are used.
+        self.assertIsInstance(host._metrics_json, six.string_types)
+        self.assertIsInstance(host._numa_topology_json, six.string_types)
+
         self.assertEqual(len(host.metrics), 2)
         self.assertEqual(set(['res1', 'res2']), set(host.metrics.keys()))
         self.assertEqual(1.0, host.metrics['res1'].value)
         self.assertEqual('source1', host.metrics['res1'].source)
         self.assertEqual('string2', host.metrics['res2'].value)
         self.assertEqual('source2', host.metrics['res2'].source)
-        self.assertIsInstance(host.numa_topology, six.string_types)
+        self.assertIsInstance(host.numa_topology,
+                              hardware.VirtNUMAHostTopology)
+        self.assertIsNone(host._metrics_json)
+        self.assertIsNone(host._numa_topology_json)
+
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None, 'pci_requests': None})
+    def test_consume_from_instance_keeps_numa_topology_object(self,
+                                                             mock_get_extra):
+        compute = dict(memory_mb=0, free_disk_gb=0, local_gb=0,
+                       local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
+                       updated_at=None, host_ip='127.0.0.1',
+                       numa_topology=fakes.NUMA_TOPOLOGY.to_json())
+        host = host_manager.HostState("fakehost", "fakenode", compute=compute)
+        instance_topology = hardware.VirtNUMAInstanceTopology(
+            cells=[hardware.VirtNUMATopologyCell(0, set([1]), 256)])
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=256, vcpus=1,
+                        project_id='12345', vm_state=vm_states.BUILDING,
+                        os_type='Linux', uuid='fake-uuid',
+                        numa_topology=instance_topology.to_json())
+
+        host.consume_from_instance(instance)
+        host.consume_from_instance(instance)
+
+        self.assertIsInstance(host.numa_topology,
+                              hardware.VirtNUMAHostTopology)
+        self.assertEqual([512, 0],
+                         [cell.memory_usage
+                          for cell in host.numa_topology.cells])
+        self.assertEqual([2, 0],
+                         [cell.cpu_usage for cell in host.numa_topology.cells])
+
+    def test_update_from_compute_node_in_place(self):
+        compute = dict(memory_mb=0, free_disk_gb=0, local_gb=0,
+                       local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
+                       updated_at=None, host_ip='127.0.0.1',
+                       numa_topology=None,
+                       stats=jsonutils.dumps({'num_instances': '2'}),
+                       supported_instances=jsonutils.dumps(
+                           [['x86_64', 'kvm', 'hvm']]),
+                       pci_stats=jsonutils.dumps([{'count': 1}]))
+        host = host_manager.HostState("fakehost", "fakenode", compute=compute)
+        host.update_service({'disabled': False})
+        stats = host.stats
+        supported_instances = host.supported_instances
+        service = host.service
+
+        compute['free_ram_mb'] = 512
+        host.update_from_compute_node(compute)
+        host.update_service({'disabled': True})
+
+        self.assertFalse(hasattr(host, '__dict__'))
+        self.assertEqual(512, host.free_ram_mb)
+        self.assertEqual(2, host.num_instances)
+        self.assertIs(stats, host.stats)
+        self.assertIs(supported_instances, host.supported_instances)
+        self.assertIs(service, host.service)
+        self.assertTrue(host.service['disabled'])
+        self.assertIsNotNone(host._pci_stats_json)
+        self.assertEqual([{'count': 1}], host.pci_stats.pools)
+        self.assertIsNone(host._pci_stats_json)
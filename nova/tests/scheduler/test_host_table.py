@@ -0,0 +1,273 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the vectorized HostTable filters and weighers.
+"""
+
+import random
+
+import mock
+import testtools
+
+from nova.openstack.common import timeutils
+from nova.scheduler import filter_scheduler
+from nova.scheduler import filters
+from nova.scheduler.filters import core_filter
+from nova.scheduler.filters import disk_filter
+from nova.scheduler.filters import io_ops_filter
+from nova.scheduler.filters import num_instances_filter
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_manager
+from nova.scheduler import host_table
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+from nova.tests.scheduler import test_scheduler
+
+
+def _fake_host_states(count, seed=42):
+    rand = random.Random(seed)
+    host_states = []
+    for i in xrange(count):
+        total_ram = rand.choice([4096, 8192, 16384])
+        total_disk = rand.choice([100, 200, 400])
+        host_state = fakes.FakeHostState('host%s' % i, 'node%s' % i, {
+            'total_usable_ram_mb': total_ram,
+            'free_ram_mb': rand.randint(-1024, total_ram),
+            'total_usable_disk_gb': total_disk,
+            'free_disk_mb': rand.randint(0, total_disk * 1024),
+            'vcpus_total': rand.choice([0, 4, 8]),
+            'vcpus_used': rand.randint(0, 128),
+            'num_io_ops': rand.randint(0, 10),
+            'num_instances': rand.randint(0, 60),
+            'service': {'disabled': False,
+                        'updated_at': timeutils.utcnow(),
+                        'created_at': timeutils.utcnow()}})
+        host_states.append(host_state)
+    return host_states
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class HostTableTestCase(test.NoDBTestCase):
+    """Test case for the HostTable class."""
+
+    def setUp(self):
+        super(HostTableTestCase, self).setUp()
+        self.host_states = _fake_host_states(4)
+        self.table = host_table.HostTable(self.host_states)
+
+    def test_column(self):
+        column = self.table.column('free_ram_mb')
+        self.assertEqual([h.free_ram_mb for h in self.host_states],
+                         column.tolist())
+        self.assertIs(column, self.table.column('free_ram_mb'))
+
+    def test_metric_column(self):
+        self.host_states[1].metrics['foo'] = host_manager.MetricItem(
+            value=5, timestamp=None, source='fake')
+        values, missing = self.table.metric_column('foo')
+        self.assertEqual([0, 5, 0, 0], values.tolist())
+        self.assertEqual([True, False, True, True], missing.tolist())
+
+    def test_compress(self):
+        self.table.column('free_ram_mb')
+        table = self.table.compress([True, False, True, False])
+        self.assertEqual([self.host_states[0], self.host_states[2]],
+                         list(table.host_states))
+        self.assertEqual([self.host_states[0].free_ram_mb,
+                          self.host_states[2].free_ram_mb],
+                         table.column('free_ram_mb').tolist())
+
+    def test_set_limits(self):
+        values = host_table.numpy.array([1.0, 2.0, 3.0, 4.0])
+        self.table.set_limits('foo', values,
+                              host_table.numpy.array([0, 1, 0, 1],
+                                                     dtype=bool))
+        self.assertEqual([None, 2.0, None, 4.0],
+                         [h.limits.get('foo') for h in self.host_states])
+
+    def test_enabled(self):
+        self.assertFalse(host_table.enabled())
+        self.flags(scheduler_vectorized_hosts=True)
+        self.assertTrue(host_table.enabled())
+        with mock.patch.object(host_table, 'numpy', None):
+            self.assertFalse(host_table.enabled())
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class VectorizedFiltersTestCase(test.NoDBTestCase):
+    """Check the vectorized filters against their host_passes()."""
+
+    def setUp(self):
+        super(VectorizedFiltersTestCase, self).setUp()
+        self.filter_properties = {
+            'instance_type': {'memory_mb': 2048, 'vcpus': 4, 'root_gb': 20,
+                              'ephemeral_gb': 10, 'swap': 512}}
+
+    def _test_filter(self, filter_cls, limit=None):
+        host_states = _fake_host_states(500)
+        expected = [filter_cls().host_passes(h, self.filter_properties)
+                    for h in host_states]
+        expected_limits = [h.limits.get(limit) for h in host_states
+                           if filter_cls().host_passes(h,
+                                                       self.filter_properties)]
+        self.assertIn(True, expected)
+        self.assertIn(False, expected)
+
+        for host_state in host_states:
+            host_state.limits = {}
+        passes = filter_cls().filter_table(
+            host_table.HostTable(host_states), self.filter_properties)
+        self.assertEqual(expected, passes.tolist())
+        if limit:
+            self.assertEqual(expected_limits,
+                             [h.limits.get(limit) for h, ok
+                              in zip(host_states, expected) if ok])
+
+    def test_ram_filter(self):
+        self._test_filter(ram_filter.RamFilter, 'memory_mb')
+
+    def test_core_filter(self):
+        self._test_filter(core_filter.CoreFilter, 'vcpu')
+
+    def test_disk_filter(self):
+        self._test_filter(disk_filter.DiskFilter, 'disk_gb')
+
+    def test_io_ops_filter(self):
+        self._test_filter(io_ops_filter.IoOpsFilter)
+
+    def test_num_instances_filter(self):
+        self._test_filter(num_instances_filter.NumInstancesFilter)
+
+    def test_aggregate_filters_not_vectorized(self):
+        table = host_table.HostTable(_fake_host_states(2))
+        for filter_cls in (disk_filter.AggregateDiskFilter,
+                           io_ops_filter.AggregateIoOpsFilter,
+                           num_instances_filter.AggregateNumInstancesFilter):
+            self.assertIsNone(filter_cls().filter_table(
+                table, self.filter_properties))
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class VectorizedHandlersTestCase(test.NoDBTestCase):
+    """Test case for the HostTable paths of the host handlers."""
+
+    def setUp(self):
+        super(VectorizedHandlersTestCase, self).setUp()
+        self.flags(scheduler_vectorized_hosts=True)
+        self.host_states = _fake_host_states(50)
+        self.filter_properties = {
+            'instance_type': {'memory_mb': 2048, 'vcpus': 4, 'root_gb': 20,
+                              'ephemeral_gb': 10, 'swap': 512}}
+        self.filter_handler = filters.HostFilterHandler()
+        self.weight_handler = weights.HostWeightHandler()
+
+    def _filter(self, filter_classes):
+        return self.filter_handler.get_filtered_objects(
+            filter_classes, self.host_states, self.filter_properties)
+
+    def test_filtered_objects_match_per_host(self):
+        filter_classes = [ram_filter.RamFilter, io_ops_filter.IoOpsFilter,
+                          num_instances_filter.NumInstancesFilter]
+        result = self._filter(filter_classes)
+        self.flags(scheduler_vectorized_hosts=False)
+        self.assertEqual(self._filter(filter_classes), result)
+
+    def test_filtered_objects_fallback(self):
+        class OddFilter(filters.BaseHostFilter):
+            def host_passes(self, host_state, filter_properties):
+                return int(host_state.host[4:]) % 2
+
+        with mock.patch.object(ram_filter.RamFilter, 'host_passes') as passes:
+            result = self._filter([OddFilter, ram_filter.RamFilter])
+            self.assertFalse(passes.called)
+        expected = [h for h in self.host_states[1::2]
+                    if ram_filter.RamFilter().host_passes(
+                        h, self.filter_properties)]
+        self.assertEqual(expected, result)
+
+    def test_filtered_objects_stop(self):
+        class StopFilter(filters.BaseHostFilter):
+            def filter_all(self, filter_obj_list, filter_properties):
+                return None
+
+        self.assertIsNone(self._filter([StopFilter]))
+
+    def test_weighed_objects_match_per_host(self):
+        weigher_classes = self.weight_handler.get_matching_classes(
+            ['nova.scheduler.weights.ram.RAMWeigher'])
+        result = self.weight_handler.get_weighed_objects(
+            weigher_classes, self.host_states, {})
+        self.flags(scheduler_vectorized_hosts=False)
+        expected = self.weight_handler.get_weighed_objects(
+            weigher_classes, self.host_states, {})
+        self.assertEqual([(w.obj, w.weight) for w in expected],
+                         [(w.obj, w.weight) for w in result])
+
+    def test_weighed_objects_fallback(self):
+        class HostNumberWeigher(weights.BaseHostWeigher):
+            def _weigh_object(self, host_state, weight_properties):
+                return int(host_state.host[4:])
+
+        result = self.weight_handler.get_weighed_objects(
+            [HostNumberWeigher], self.host_states, {})
+        self.assertEqual(self.host_states[::-1], [w.obj for w in result])
+        self.assertEqual(1.0, result[0].weight)
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class VectorizedSchedulerTestCase(test_scheduler.SchedulerTestCase):
+    """Compare select_destinations with and without a HostTable."""
+
+    driver_cls = filter_scheduler.FilterScheduler
+
+    def setUp(self):
+        super(VectorizedSchedulerTestCase, self).setUp()
+        self.flags(scheduler_default_filters=['RamFilter', 'CoreFilter',
+                                              'DiskFilter', 'IoOpsFilter',
+                                              'NumInstancesFilter'],
+                   scheduler_weight_classes=[
+                       'nova.scheduler.weights.ram.RAMWeigher'])
+        self.driver = self.driver_cls()
+
+    def _get_fake_request_spec(self):
+        flavor = {'flavorid': 'small', 'memory_mb': 512, 'root_gb': 1,
+                  'ephemeral_gb': 1, 'swap': 0, 'vcpus': 1}
+        instance_properties = {'os_type': 'linux', 'project_id': '1234',
+                               'memory_mb': 512, 'root_gb': 1,
+                               'ephemeral_gb': 1, 'vcpus': 1,
+                               'uuid': 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa'}
+        return {'instance_type': flavor,
+                'instance_properties': instance_properties,
+                'num_instances': 1}
+
+    def _select_destinations(self, host_states, vectorized):
+        self.flags(scheduler_vectorized_hosts=vectorized)
+        request_spec = self._get_fake_request_spec()
+        with mock.patch.object(self.driver.host_manager,
+                               'get_all_host_states',
+                               return_value=host_states):
+            return [self.driver.select_destinations(self.context,
+                                                    request_spec, {})
+                    for x in xrange(3)]
+
+    @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                return_value={'numa_topology': None,
+                              'pci_requests': None})
+    def test_select_destinations_vectorized(self, mock_get_extra):
+        expected = self._select_destinations(_fake_host_states(200), False)
+        self.assertEqual(expected,
+                         self._select_destinations(_fake_host_states(200),
+                                                   True))
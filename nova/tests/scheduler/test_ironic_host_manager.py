@@ -21,6 +21,7 @@ import mock
 
 from nova import db
 from nova import exception
+from nova.openstack.common.fixture import mockpatch
 from nova.openstack.common import jsonutils
 from nova.scheduler import filters
 from nova.scheduler import host_manager
@@ -44,6 +45,8 @@ class IronicHostManagerTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(IronicHostManagerTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = ironic_host_manager.IronicHostManager()
 
     def test_manager_public_api_signatures(self):
@@ -90,6 +93,8 @@ class IronicHostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(IronicHostManagerChangedNodesTestCase, self).setUp()
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = ironic_host_manager.IronicHostManager()
         ironic_driver = "nova.virt.ironic.driver.IronicDriver"
         supported_instances = '[["i386", "baremetal", "baremetal"]]'
@@ -16,9 +16,12 @@
 Tests For Scheduler weights.
 """
 
+import testtools
+
 from nova import context
 from nova import exception
 from nova.openstack.common.fixture import mockpatch
+from nova.scheduler import host_table
 from nova.scheduler import weights
 from nova import test
 from nova.tests import matchers
@@ -47,6 +50,8 @@ class RamWeigherTestCase(test.NoDBTestCase):
         self.useFixture(mockpatch.Patch(
             'nova.db.compute_node_get_all',
              return_value=fakes.COMPUTE_NODES))
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = fakes.FakeHostManager()
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
@@ -135,6 +140,8 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.useFixture(mockpatch.Patch(
             'nova.db.compute_node_get_all',
              return_value=fakes.COMPUTE_NODES_METRICS))
+        self.useFixture(mockpatch.Patch('nova.db.aggregate_get_all',
+                                        return_value=[]))
         self.host_manager = fakes.FakeHostManager()
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
@@ -246,3 +253,17 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.flags(required=False, group='metrics')
         setting = ['foo=0.0001', 'zot=-1']
         self._do_test(setting, 1.0, 'host5')
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class VectorizedRamWeigherTestCase(RamWeigherTestCase):
+    def setUp(self):
+        super(VectorizedRamWeigherTestCase, self).setUp()
+        self.flags(scheduler_vectorized_hosts=True)
+
+
+@testtools.skipIf(host_table.numpy is None, "NumPy is not installed")
+class VectorizedMetricsWeigherTestCase(MetricsWeigherTestCase):
+    def setUp(self):
+        super(VectorizedMetricsWeigherTestCase, self).setUp()
+        self.flags(scheduler_vectorized_hosts=True)
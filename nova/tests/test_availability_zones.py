@@ -17,6 +17,7 @@
 Tests for availability zones
 """
 
+import mock
 from oslo.config import cfg
 
 from nova import availability_zones as az
@@ -253,3 +254,35 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEqual(self.availability_zone,
                 az.get_instance_availability_zone(self.context, fake_inst))
+
+    def test_get_instance_availability_zones(self):
+        host = 'host170'
+        service = self._create_service_with_topic('compute', host)
+        self._add_to_aggregate(service, self.agg)
+        instances = [fakes.stub_instance(1, host=host),
+                     fakes.stub_instance(2, host=self.host),
+                     fakes.stub_instance(3, host=host)]
+
+        self.assertEqual([self.availability_zone, self.default_az,
+                          self.availability_zone],
+                         az.get_instance_availability_zones(self.context,
+                                                            instances))
+
+    def test_get_instance_availability_zones_single_query(self):
+        host = 'host170'
+        service = self._create_service_with_topic('compute', host)
+        self._add_to_aggregate(service, self.agg)
+        instances = [fakes.stub_instance(i, host='host%d' % (i % 3 + 169))
+                     for i in range(6)]
+
+        with mock.patch.object(db, 'aggregate_get_by_metadata_key',
+                wraps=db.aggregate_get_by_metadata_key) as get_by_key:
+            zones = az.get_instance_availability_zones(self.context,
+                                                       instances)
+            self.assertEqual(1, get_by_key.call_count)
+            self.assertEqual(zones,
+                             az.get_instance_availability_zones(self.context,
+                                                                instances))
+            self.assertEqual(1, get_by_key.call_count)
+        self.assertEqual([self.default_az, self.availability_zone,
+                          self.default_az] * 2, zones)
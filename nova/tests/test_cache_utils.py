@@ -0,0 +1,124 @@
+#    Copyright 2014 OpenStack Foundation
+#    All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For the in process cache Client.
+"""
+
+import mock
+
+from nova import cache_utils
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class CacheClientTestCase(test.NoDBTestCase):
+    """Test case for the in process cache Client."""
+
+    def setUp(self):
+        super(CacheClientTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.client = cache_utils.get_client()
+
+    def test_get_client(self):
+        self.flags(memorycache_max_items=10)
+        client = cache_utils.get_client()
+        self.assertIsInstance(client, cache_utils.Client)
+        self.assertEqual(10, client.maxsize)
+
+    @mock.patch.object(memorycache, 'get_client')
+    def test_get_client_memcached_servers(self, get_client):
+        self.flags(memcached_servers=['localhost:11211'])
+        self.assertEqual(get_client.return_value, cache_utils.get_client())
+        get_client.assert_called_once_with(['localhost:11211'])
+
+    def test_set_get(self):
+        self.assertTrue(self.client.set('foo', 'bar'))
+        self.assertEqual('bar', self.client.get('foo'))
+        self.assertIsNone(self.client.get('baz'))
+        self.assertEqual({'items': 1, 'hits': 1, 'misses': 1,
+                          'evictions': 0, 'expirations': 0},
+                         self.client.get_stats())
+
+    def test_get_expired(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('baz', 'qux')
+        timeutils.advance_time_seconds(9)
+        self.assertEqual('bar', self.client.get('foo'))
+        timeutils.advance_time_seconds(1)
+        self.assertIsNone(self.client.get('foo'))
+        self.assertEqual('qux', self.client.get('baz'))
+        self.assertNotIn('foo', self.client.cache)
+        self.assertEqual(1, self.client.expirations)
+
+    def test_set_sweeps_expired(self):
+        for i in range(10):
+            self.client.set('key%d' % i, i, time=i + 1)
+        timeutils.advance_time_seconds(5)
+        self.client.set('foo', 'bar')
+        self.assertEqual(['key5', 'key6', 'key7', 'key8', 'key9', 'foo'],
+                         list(self.client.cache))
+        self.assertEqual(5, self.client.expirations)
+
+    def test_set_again_extends_timeout(self):
+        self.client.set('foo', 'bar', time=5)
+        timeutils.advance_time_seconds(4)
+        self.client.set('foo', 'baz', time=5)
+        timeutils.advance_time_seconds(4)
+        self.client.set('spam', 'eggs')
+        self.assertEqual('baz', self.client.get('foo'))
+        self.assertEqual(0, self.client.expirations)
+
+    def test_timeouts_are_compacted(self):
+        for i in range(1000):
+            self.client.set('foo', i, time=60)
+        self.assertTrue(len(self.client._timeouts) < 100)
+        self.assertEqual(999, self.client.get('foo'))
+
+    def test_maxsize_evicts_least_recently_used(self):
+        client = cache_utils.Client(maxsize=3)
+        client.set('a', 1)
+        client.set('b', 2)
+        client.set('c', 3)
+        client.get('a')
+        client.set('d', 4)
+        self.assertIsNone(client.get('b'))
+        self.assertEqual(1, client.get('a'))
+        self.assertEqual(['c', 'd', 'a'], list(client.cache))
+        self.assertEqual(1, client.evictions)
+
+    def test_add(self):
+        self.assertTrue(self.client.add('foo', 'bar'))
+        self.assertFalse(self.client.add('foo', 'baz'))
+        self.assertEqual('bar', self.client.get('foo'))
+
+    def test_incr(self):
+        self.assertIsNone(self.client.incr('foo'))
+        self.client.set('foo', '1', time=10)
+        self.assertEqual(3, self.client.incr('foo', delta=2))
+        self.assertEqual('3', self.client.get('foo'))
+        timeutils.advance_time_seconds(10)
+        self.assertIsNone(self.client.incr('foo'))
+
+    def test_delete(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.delete('foo')
+        self.client.delete('baz')
+        self.assertIsNone(self.client.get('foo'))
+        timeutils.advance_time_seconds(10)
+        self.client.set('foo', 'bar')
+        self.assertEqual('bar', self.client.get('foo'))
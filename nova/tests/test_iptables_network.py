@@ -15,7 +15,12 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import collections
+
+import fixtures
+
 from nova.network import linux_net
+from nova.openstack.common import processutils
 from nova import test
 
 
@@ -275,3 +280,220 @@ class IptablesManagerTestCase(test.NoDBTestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+
+class FakeIptables(object):
+    """Executes iptables-save and iptables-restore against in memory tables.
+
+    Tables map chain names to their rules, without counters.
+    """
+
+    builtin_chains = {'filter': ['INPUT', 'FORWARD', 'OUTPUT'],
+                      'nat': ['PREROUTING', 'INPUT', 'OUTPUT', 'POSTROUTING'],
+                      'mangle': ['PREROUTING', 'INPUT', 'FORWARD', 'OUTPUT',
+                                 'POSTROUTING']}
+
+    def __init__(self):
+        self.tables = {}
+        for table_name in self.builtin_chains:
+            self._flush_table(table_name)
+        self.commands = []
+        self.restored_lines = 0
+        self.restored_input = None
+        self.fail_noflush = False
+
+    def _flush_table(self, table_name):
+        self.tables[table_name] = collections.OrderedDict(
+            (name, []) for name in self.builtin_chains[table_name])
+
+    def save(self):
+        lines = []
+        for table_name, chains in sorted(self.tables.iteritems()):
+            lines.append('*%s' % table_name)
+            for name in chains:
+                if name in self.builtin_chains[table_name]:
+                    lines.append(':%s ACCEPT [0:0]' % name)
+                else:
+                    lines.append(':%s - [0:0]' % name)
+            for name, rules in chains.iteritems():
+                lines += ['[0:0] -A %s %s' % (name, rule) for rule in rules]
+            lines.append('COMMIT')
+        return '\n'.join(lines)
+
+    def restore(self, process_input, noflush=False):
+        self.restored_input = process_input
+        chains = None
+        for line in process_input.split('\n'):
+            self.restored_lines += 1
+            line = line.strip()
+            if not line or line.startswith('#') or line == 'COMMIT':
+                continue
+            if line.startswith('*'):
+                table_name = line[1:]
+                if not noflush:
+                    self._flush_table(table_name)
+                chains = self.tables[table_name]
+            elif line.startswith(':'):
+                name = line[1:].split(' ', 1)[0]
+                chains[name] = []
+            else:
+                if line.startswith('['):
+                    line = line.split('] ', 1)[1]
+                args = line.split(' ', 2)
+                if args[0] == '-A':
+                    chains[args[1]].append(args[2])
+                elif args[0] == '-F':
+                    chains[args[1]] = []
+                elif args[0] == '-X':
+                    del chains[args[1]]
+
+    def execute(self, *cmd, **kwargs):
+        self.commands.append(cmd)
+        if cmd[0] == 'iptables-save':
+            return self.save(), ''
+        if cmd[0] == 'iptables-restore':
+            if '--noflush' in cmd and self.fail_noflush:
+                raise processutils.ProcessExecutionError()
+            self.restore(kwargs['process_input'], '--noflush' in cmd)
+        return '', ''
+
+
+class IptablesManagerApplyTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(IptablesManagerApplyTestCase, self).setUp()
+        self.flags(lock_path=self.useFixture(fixtures.TempDir()).path,
+                   use_ipv6=False)
+        self.iptables = FakeIptables()
+        self.manager = linux_net.IptablesManager(self.iptables.execute)
+        self.table = self.manager.ipv4['filter']
+
+    def _add_instance_chains(self, instances, rules_per_instance):
+        for i in xrange(instances):
+            chain = 'inst-%d' % i
+            self.table.add_chain(chain)
+            self.table.add_rule('local', '-d 10.0.%d.%d -j $%s' %
+                                (i // 250, i % 250, chain))
+            for j in xrange(rules_per_instance):
+                self.table.add_rule(chain, '-p tcp --dport %d -j ACCEPT' %
+                                    (1000 + j))
+
+    def _apply(self):
+        del self.iptables.commands[:]
+        self.manager.apply()
+        return [cmd[0:3] for cmd in self.iptables.commands]
+
+    def _full_apply_tables(self):
+        # The tables a full apply of the same rules results in.
+        iptables = FakeIptables()
+        iptables.restore(self.iptables.save())
+        self.manager.execute = iptables.execute
+        self.flags(iptables_incremental_apply=False)
+        for table in self.manager.ipv4.itervalues():
+            table.dirty = True
+        self.manager.apply()
+        return iptables.tables
+
+    def test_apply_all_rules(self):
+        self._add_instance_chains(2, 2)
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+        self.table.add_rule('inst-0', '-j DROP')
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+        self.assertEqual(['-p tcp --dport 1000 -j ACCEPT',
+                          '-p tcp --dport 1001 -j ACCEPT', '-j DROP'],
+                         self.iptables.tables['filter'][
+                             '%s-inst-0' % linux_net.binary_name])
+
+    def test_apply_skipped_when_applied_concurrently(self):
+        self._add_instance_chains(1, 1)
+        self.manager.apply()
+        del self.iptables.commands[:]
+        self.manager._apply()
+        self.assertEqual([], self.iptables.commands)
+
+    def test_apply_changed_chains(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(3, 2)
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+
+        self.table.add_rule('inst-1', '-j DROP')
+        self.iptables.restored_lines = 0
+        self.assertEqual([('iptables-restore', '-c', '--noflush')],
+                         self._apply())
+        # The declaration of the chain, its three rules and the table.
+        self.assertEqual(6, self.iptables.restored_lines)
+        self.assertEqual(self._full_apply_tables(), self.iptables.tables)
+
+    def test_apply_removed_chain(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(3, 2)
+        self._apply()
+        self.table.remove_chain('inst-2')
+        self.assertEqual([('iptables-restore', '-c', '--noflush')],
+                         self._apply())
+        self.assertNotIn('%s-inst-2' % linux_net.binary_name,
+                         self.iptables.tables['filter'])
+        self.assertEqual(self._full_apply_tables(), self.iptables.tables)
+
+    def test_apply_unchanged_chains(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(1, 2)
+        self._apply()
+        self.table.add_rule('inst-0', '-j DROP')
+        self.table.remove_rule('inst-0', '-j DROP')
+        self.assertEqual([], self._apply())
+        self.assertFalse(self.manager.dirty())
+
+    def test_apply_unwrapped_changes_all_rules(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(1, 1)
+        self._apply()
+        self.table.add_rule('FORWARD', '-j ACCEPT', wrap=False)
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+        self.table.add_rule('inst-0', '-j DROP')
+        self.assertEqual([('iptables-restore', '-c', '--noflush')],
+                         self._apply())
+
+    def test_apply_changed_chains_fails(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(2, 1)
+        self._apply()
+        self.iptables.fail_noflush = True
+        self.table.add_rule('inst-0', '-j DROP')
+        self.assertEqual([('iptables-restore', '-c', '--noflush'),
+                          ('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+        self.assertEqual(self._full_apply_tables(), self.iptables.tables)
+
+    def test_apply_changed_chains_restore_input(self):
+        self.flags(iptables_incremental_apply=True)
+        self._add_instance_chains(100, 10)
+        self._apply()
+        self.table.add_rule('inst-42', '-j DROP')
+        self._apply()
+        chain = '%s-inst-42' % linux_net.binary_name
+        # Only the changed chain is declared, which flushes it, and filled.
+        rules = ['-p tcp --dport %d -j ACCEPT' % port
+                 for port in range(1000, 1010)] + ['-j DROP']
+        self.assertEqual(['*filter', ':%s - [0:0]' % chain] +
+                         ['[0:0] -A %s %s' % (chain, rule) for rule in rules] +
+                         ['COMMIT'],
+                         self.iptables.restored_input.split('\n'))
+
+    def test_apply_top_bottom_regex_all_rules(self):
+        self.flags(iptables_incremental_apply=True,
+                   iptables_top_regex='-j iptables-top-rule')
+        self._add_instance_chains(1, 1)
+        self._apply()
+        self.table.add_rule('inst-0', '-j DROP')
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
+        self.flags(iptables_top_regex='',
+                   iptables_bottom_regex='-j iptables-bottom-rule')
+        self.table.remove_rule('inst-0', '-j DROP')
+        self.assertEqual([('iptables-save', '-c'),
+                          ('iptables-restore', '-c')], self._apply())
@@ -17,6 +17,7 @@
 """Tests for metadata service."""
 
 import base64
+import datetime
 import hashlib
 import hmac
 import re
@@ -43,6 +44,8 @@ from nova import exception
 from nova.network import api as network_api
 from nova import objects
 from nova.openstack.common import jsonutils
+from nova.openstack.common import loopingcall
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import fake_block_device
 from nova.tests import fake_instance
@@ -812,6 +815,154 @@ class MetadataHandlerTestCase(test.TestCase):
         _test_metadata_path('/2009-04-04/meta-data')
 
 
+class MetadataCacheTestCase(test.TestCase):
+    """Test the caching and precomputation of the metadata."""
+
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs)
+        self.context = context.RequestContext('fake', 'fake')
+        self.instance = fake_inst_obj(self.context)
+        self.instance.updated_at = timeutils.utcnow()
+        self.instance.info_cache.network_info = (
+            fake_network.fake_get_instance_nw_info(self.stubs, 1, 1))
+        self.fixed_ip = self.instance.info_cache.network_info.fixed_ips()[0]
+        self.flags(use_local=True, group='conductor')
+        self.handler = handler.MetadataRequestHandler()
+        self.flags(metadata_precompute_interval=60)
+
+    @mock.patch.object(base, 'get_metadata_by_address')
+    def test_get_metadata_caches_by_address(self, get_by_address):
+        get_by_address.side_effect = lambda conductor_api, address: (
+            mock.Mock(uuid=self.instance.uuid, address=address))
+
+        data = self.handler.get_metadata_by_remote_address('10.0.0.2')
+        self.assertEqual(data, self.handler.get_metadata_by_remote_address(
+            '10.0.0.2'))
+        self.assertEqual('10.0.0.3',
+                         self.handler.get_metadata_by_remote_address(
+                             '10.0.0.3').address)
+
+        self.assertEqual(2, get_by_address.call_count)
+
+    @mock.patch.object(base, 'get_metadata_by_instance_id')
+    def test_get_metadata_caches_by_instance_id_and_address(self,
+            get_by_instance_id):
+        get_by_instance_id.side_effect = (
+            lambda conductor_api, instance_id, address: mock.Mock(
+                uuid=instance_id, address=address))
+
+        data = self.handler.get_metadata_by_instance_id(self.instance.uuid,
+                                                        '10.0.0.2')
+        self.assertEqual(data, self.handler.get_metadata_by_instance_id(
+            self.instance.uuid, '10.0.0.2'))
+        self.assertEqual('10.0.0.3',
+                         self.handler.get_metadata_by_instance_id(
+                             self.instance.uuid, '10.0.0.3').address)
+
+        self.assertEqual(2, get_by_instance_id.call_count)
+
+    @mock.patch.object(base, 'get_metadata_by_address')
+    def test_get_metadata_cache_disabled(self, get_by_address):
+        self.flags(metadata_cache_expiration=0)
+        get_by_address.return_value = mock.Mock(uuid=self.instance.uuid)
+
+        self.handler.get_metadata_by_remote_address('10.0.0.2')
+        self.handler.get_metadata_by_remote_address('10.0.0.2')
+
+        self.assertEqual(2, get_by_address.call_count)
+
+    @mock.patch.object(loopingcall, 'FixedIntervalLoopingCall')
+    def test_precompute_timer(self, mock_timer):
+        handler.MetadataRequestHandler()
+        mock_timer.assert_called_once_with(mock.ANY)
+        mock_timer.return_value.start.assert_called_once_with(60)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(base, 'InstanceMetadata')
+    def test_precompute_metadata(self, mock_metadata, get_by_filters):
+        self.flags(metadata_cache_expiration=120)
+        mock_metadata.return_value = mock.Mock(instance=self.instance)
+        get_by_filters.return_value = [self.instance]
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        now = timeutils.utcnow()
+
+        self.handler.precompute_metadata()
+        # The next run is left to the next interval.
+        self.handler.precompute_metadata()
+
+        self.assertEqual(1, get_by_filters.call_count)
+        filters = get_by_filters.call_args[0][1]
+        self.assertEqual(now - datetime.timedelta(seconds=120),
+                         filters['changes-since'])
+        fixed_ips = self.instance.info_cache.network_info.fixed_ips()
+        self.assertEqual(
+            [mock.call(self.instance, ip['address'],
+                       conductor_api=self.handler.conductor_api)
+             for ip in fixed_ips],
+            mock_metadata.call_args_list)
+        data = mock_metadata.return_value
+        self.assertEqual(data, self.handler.get_metadata_by_remote_address(
+            self.fixed_ip['address']))
+        self.assertIsNone(self.handler._cache.get(
+            'metadata-%s-%s' % (self.instance.uuid,
+                                self.fixed_ip['address'])))
+
+        # The metadata of an instance which did not change since is kept.
+        timeutils.advance_time_seconds(60)
+        self.handler.precompute_metadata()
+        self.assertEqual(now, get_by_filters.call_args[0][1]['changes-since'])
+        self.assertEqual(len(fixed_ips), mock_metadata.call_count)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(base, 'InstanceMetadata')
+    def test_precompute_metadata_neutron_proxy(self, mock_metadata,
+                                               get_by_filters):
+        self.flags(service_metadata_proxy=True, group='neutron')
+        get_by_filters.return_value = [self.instance]
+
+        self.handler.precompute_metadata()
+
+        self.assertEqual(mock_metadata.return_value,
+                         self.handler.get_metadata_by_instance_id(
+                             self.instance.uuid, self.fixed_ip['address']))
+        self.assertIsNone(self.handler._cache.get(
+            'metadata-%s' % self.fixed_ip['address']))
+
+    @mock.patch.object(api, 'security_group_get_by_instance',
+                       return_value=[])
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_precompute_metadata_multiple_fixed_ips(self, get_by_filters,
+                                                    sg_get):
+        self.instance.system_metadata = get_default_sys_meta()
+        self.instance.info_cache.network_info = (
+            fake_network.fake_get_instance_nw_info(self.stubs, 2, 1))
+        fixed_ips = [ip['address'] for ip in
+                     self.instance.info_cache.network_info.fixed_ips()
+                     if ip['version'] == 4]
+        self.assertEqual(2, len(fixed_ips))
+        get_by_filters.return_value = [self.instance]
+
+        self.handler.precompute_metadata()
+
+        for address in fixed_ips:
+            data = self.handler.get_metadata_by_remote_address(address)
+            meta_data = data.get_ec2_metadata(version='latest')['meta-data']
+            self.assertEqual(address, meta_data['local-ipv4'])
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_precompute_metadata_deleted_instance(self, get_by_filters):
+        cache_key = 'metadata-%s' % self.fixed_ip['address']
+        self.handler._cache.set(cache_key, 'fake-metadata')
+        self.instance.deleted = True
+        get_by_filters.return_value = [self.instance]
+
+        self.handler.precompute_metadata()
+
+        self.assertIsNone(self.handler._cache.get(cache_key))
+
+
 class MetadataPasswordTestCase(test.TestCase):
     def setUp(self):
         super(MetadataPasswordTestCase, self).setUp()
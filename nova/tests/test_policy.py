@@ -16,6 +16,7 @@
 """Test of Policy Engine For Nova."""
 
 import os.path
+import pickle
 import StringIO
 
 import mock
@@ -229,3 +230,93 @@ class AdminRolePolicyTestCase(test.NoDBTestCase):
         for action in self.actions:
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                           self.context, action, self.target)
+
+
+class CompiledPolicyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        rules = {
+            "example:my_file": "role:compute_admin or "
+                               "project_id:%(project_id)s",
+            "example:lowercase_admin": "role:admin or role:sysadmin",
+            "example:rule_admin": "rule:example:lowercase_admin",
+        }
+        policy.reset()
+        policy.init()
+        policy.set_rules(dict((k, common_policy.parse_rule(v))
+                               for k, v in rules.items()))
+        self.context = context.RequestContext('fake', 'fake', roles=['admin'])
+
+    def test_credentials_computed_once(self):
+        with mock.patch.object(self.context, 'to_dict',
+                               wraps=self.context.to_dict) as to_dict:
+            policy.enforce(self.context, "example:lowercase_admin", {})
+            policy.enforce(self.context, "example:lowercase_admin", {})
+            self.assertEqual(1, to_dict.call_count)
+
+            self.context.roles = ['member']
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, "example:lowercase_admin", {})
+            self.assertEqual(2, to_dict.call_count)
+
+    def test_target_independent_results_shared(self):
+        policy.enforce(self.context, "example:rule_admin", {})
+        policy.enforce(self.context, "example:my_file",
+                       {'project_id': 'fake'})
+        creds = policy._get_credentials(self.context)
+        self.assertEqual({"example:rule_admin": True,
+                          "example:lowercase_admin": True}, creds.results)
+
+    def test_context_picklable_after_enforce(self):
+        policy.enforce(self.context, "example:lowercase_admin", {})
+        ctxt = pickle.loads(pickle.dumps(self.context))
+        self.assertEqual(self.context.to_dict(), ctxt.to_dict())
+        self.assertTrue(policy.enforce(ctxt, "example:lowercase_admin", {}))
+
+    def test_credentials_dropped_with_context(self):
+        count = len(policy._CREDENTIALS)
+        ctxt = context.RequestContext('fake', 'fake', roles=['admin'])
+        policy.enforce(ctxt, "example:lowercase_admin", {})
+        self.assertIn(ctxt, policy._CREDENTIALS)
+        del ctxt
+        self.assertEqual(count, len(policy._CREDENTIALS))
+
+    def test_shared_results_reset_with_rules(self):
+        policy.enforce(self.context, "example:lowercase_admin", {})
+        policy.set_rules({"example:lowercase_admin":
+                          common_policy.parse_rule("!")})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:lowercase_admin", {})
+
+
+def _load_shipped_rules():
+    policy_file = os.path.join(os.path.dirname(__file__), '..', '..',
+                               'etc', 'nova', 'policy.json')
+    with open(policy_file) as f:
+        return common_policy.Rules.load_json(f.read(), 'default')
+
+
+def _sample_credentials():
+    for roles, is_admin in ((['admin'], True), (['member'], False)):
+        ctxt = context.RequestContext('fake', 'fake', roles=roles,
+                                      is_admin=is_admin)
+        yield ctxt.to_dict()
+
+
+def _sample_targets():
+    return [{'project_id': 'fake', 'user_id': 'fake'},
+            {'project_id': 'other', 'user_id': 'other'}]
+
+
+class CompiledPolicyEquivalenceTestCase(test.NoDBTestCase):
+    def test_shipped_policy_equivalent(self):
+        rules = _load_shipped_rules()
+        base = common_policy.Enforcer(rules=rules, use_conf=False)
+        compiled = policy.Enforcer(rules=rules, use_conf=False)
+        for creds in _sample_credentials():
+            for target in _sample_targets():
+                for action in rules:
+                    self.assertEqual(
+                        base.enforce(action, target, creds),
+                        compiled.enforce(action, target, creds),
+                        action)
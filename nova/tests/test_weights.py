@@ -16,6 +16,8 @@
 Tests For weights.
 """
 
+import testtools
+
 from nova import test
 from nova import weights
 
@@ -51,3 +53,22 @@ class TestWeigher(test.NoDBTestCase):
         for seq, result, minval, maxval in map_:
             ret = weights.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(tuple(ret), result)
+
+    @testtools.skipIf(weights.numpy is None, "NumPy is not installed")
+    def test_normalization_array(self):
+        # weight_list, expected_result, minval, maxval
+        map_ = (
+            ((), (), None, None),
+            ((0.0, 0.0), (0.0, 0.0), None, None),
+            ((1.0, 1.0), (0.0, 0.0), None, None),
+
+            ((20.0, 50.0), (0.0, 1.0), None, None),
+            ((20.0, 50.0), (0.0, 0.375), None, 100.0),
+            ((20.0, 50.0), (0.4, 1.0), 0.0, None),
+            ((20.0, 50.0), (0.2, 0.5), 0.0, 100.0),
+        )
+        for seq, result, minval, maxval in map_:
+            ret = weights.normalize(weights.numpy.array(seq, dtype=float),
+                                    minval=minval, maxval=maxval)
+            self.assertIsInstance(ret, weights.numpy.ndarray)
+            self.assertEqual(tuple(ret), result)
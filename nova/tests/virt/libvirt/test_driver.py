@@ -54,6 +54,7 @@ from nova import exception
 from nova.network import model as network_model
 from nova import objects
 from nova.openstack.common import fileutils
+from nova.openstack.common import imageutils
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import lockutils
@@ -3771,6 +3772,55 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEqual(uuids[3], vm4.UUIDString())
         mock_list.assert_called_with(only_running=False)
 
+    def test_get_power_states_fast(self):
+        vm0 = FakeVirtDomain(id=0, name="Domain-0")  # Xen dom-0
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(name="instance00000002")
+        all_stats = [(vm0, {'state.state': libvirt.VIR_DOMAIN_RUNNING}),
+                     (vm1, {'state.state': libvirt.VIR_DOMAIN_RUNNING}),
+                     (vm2, {'state.state': libvirt.VIR_DOMAIN_SHUTOFF})]
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with contextlib.nested(
+                mock.patch.object(libvirt_driver.LibvirtDriver, '_conn'),
+                mock.patch.object(drvr, '_list_instance_domains')) as (
+                    mock_conn, mock_list):
+            mock_conn.getAllDomainStats.return_value = all_stats
+            states = drvr.get_power_states()
+
+        self.assertEqual({vm1.UUIDString(): power_state.RUNNING,
+                          vm2.UUIDString(): power_state.SHUTDOWN}, states)
+        mock_conn.getAllDomainStats.assert_called_once_with(
+            libvirt.VIR_DOMAIN_STATS_STATE)
+        self.assertFalse(mock_list.called)
+
+    @mock.patch.object(libvirt_driver.LibvirtDriver,
+                       "_list_instance_domains")
+    def test_get_power_states_fallback_no_support(self, mock_list):
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(name="instance00000002")
+        vm3 = FakeVirtDomain(name="instance00000003")
+        mock_list.return_value = [vm1, vm2, vm3]
+        ex = fakelibvirt.make_libvirtError(
+            libvirt.libvirtError,
+            "No such domain",
+            error_code=libvirt.VIR_ERR_NO_DOMAIN)
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with contextlib.nested(
+                mock.patch.object(libvirt_driver.LibvirtDriver, '_conn'),
+                mock.patch.object(vm3, 'info', side_effect=ex)) as (
+                    mock_conn, mock_info):
+            mock_conn.getAllDomainStats.side_effect = AttributeError
+            states = drvr.get_power_states()
+            states_again = drvr.get_power_states()
+
+        self.assertEqual({vm1.UUIDString(): power_state.RUNNING,
+                          vm2.UUIDString(): power_state.RUNNING}, states)
+        self.assertEqual(states, states_again)
+        self.assertEqual(1, mock_conn.getAllDomainStats.call_count)
+        mock_list.assert_called_with(only_running=False)
+
     @mock.patch.object(libvirt_driver.LibvirtDriver,
                        "_list_instance_domains")
     def test_get_all_block_devices(self, mock_list):
@@ -6219,10 +6269,6 @@ class LibvirtConnTestCase(test.TestCase):
                 return vdmock
         self.create_fake_libvirt_mock(lookupByName=fake_lookup)
 
-        fake_libvirt_utils.disk_sizes['/test/disk'] = 10 * units.Gi
-        fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * units.Gi
-        fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
-
         self.mox.StubOutWithMock(os.path, "getsize")
         os.path.getsize('/test/disk').AndReturn((10737418240))
         os.path.getsize('/test/disk.local').AndReturn((3328599655))
@@ -6234,12 +6280,9 @@ class LibvirtConnTestCase(test.TestCase):
                "cluster_size: 2097152\n"
                "backing file: /test/dummy (actual path: /backing/file)\n")
 
-        self.mox.StubOutWithMock(os.path, "exists")
-        os.path.exists('/test/disk.local').AndReturn(True)
-
-        self.mox.StubOutWithMock(utils, "execute")
-        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
-                      '/test/disk.local').AndReturn((ret, ''))
+        self.mox.StubOutWithMock(images, "cached_qemu_img_info")
+        images.cached_qemu_img_info('/test/disk.local').AndReturn(
+            imageutils.QemuImgInfo(ret))
 
         self.mox.ReplayAll()
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
@@ -6311,10 +6354,6 @@ class LibvirtConnTestCase(test.TestCase):
                 return vdmock
         self.create_fake_libvirt_mock(lookupByName=fake_lookup)
 
-        fake_libvirt_utils.disk_sizes['/test/disk'] = 10 * units.Gi
-        fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * units.Gi
-        fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
-
         self.mox.StubOutWithMock(os.path, "getsize")
         os.path.getsize('/test/disk').AndReturn((10737418240))
         os.path.getsize('/test/disk.local').AndReturn((3328599655))
@@ -6326,12 +6365,9 @@ class LibvirtConnTestCase(test.TestCase):
                "cluster_size: 2097152\n"
                "backing file: /test/dummy (actual path: /backing/file)\n")
 
-        self.mox.StubOutWithMock(os.path, "exists")
-        os.path.exists('/test/disk.local').AndReturn(True)
-
-        self.mox.StubOutWithMock(utils, "execute")
-        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
-                      '/test/disk.local').AndReturn((ret, ''))
+        self.mox.StubOutWithMock(images, "cached_qemu_img_info")
+        images.cached_qemu_img_info('/test/disk.local').AndReturn(
+            imageutils.QemuImgInfo(ret))
 
         self.mox.ReplayAll()
         conn_info = {'driver_volume_type': 'fake'}
@@ -10701,8 +10737,8 @@ class IptablesFirewallTestCase(test.TestCase):
                                mox.IgnoreArg()).AndReturn((None, None))
         self.fw.add_filters_for_instance(instance_ref, mox.IgnoreArg(),
                                          mox.IgnoreArg(), mox.IgnoreArg())
-        self.fw.instance_rules(instance_ref,
-                               mox.IgnoreArg()).AndReturn((None, None))
+        self.fw.instance_rules(instance_ref, mox.IgnoreArg(),
+                               use_cache=True).AndReturn((None, None))
         self.fw.iptables.ipv4['filter'].has_chain(mox.IgnoreArg()
                                                   ).AndReturn(True)
         self.fw.add_filters_for_instance(instance_ref, mox.IgnoreArg(),
@@ -10735,6 +10771,160 @@ class IptablesFirewallTestCase(test.TestCase):
                                                    any_order=True)
             self.assertEqual(0, mock_filter.add_chain.call_count)
 
+    def _setup_security_group_instances(self):
+        """Creates two instances in a group granting access to the members
+        of another group, and an instance in an unrelated group.
+        """
+        admin_ctxt = context.get_admin_context()
+        self.stubs.Set(self.fw.iptables, 'execute',
+                       lambda *args, **kwargs: ('', ''))
+
+        class FakeNetworkInfo(list):
+            def __init__(self, address):
+                self.address = address
+
+            def fixed_ips(self):
+                return [{'address': self.address, 'version': 4}]
+
+        self.stubs.Set(compute_utils, 'get_nw_info_for_instance',
+                       lambda instance: FakeNetworkInfo(
+                           '10.0.0.%d' % instance['id']))
+
+        groups = {}
+        for name in ('web', 'db', 'other'):
+            groups[name] = db.security_group_create(
+                admin_ctxt, {'user_id': 'fake', 'project_id': 'fake',
+                             'name': name, 'description': name})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': groups['web']['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 80,
+                                       'to_port': 80,
+                                       'cidr': '192.168.10.0/24'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': groups['web']['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'group_id': groups['db']['id']})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id':
+                                           groups['other']['id'],
+                                       'protocol': 'udp',
+                                       'from_port': 53,
+                                       'to_port': 53,
+                                       'cidr': '192.168.20.0/24'})
+
+        instances = []
+        for name in ('web', 'web', 'other', 'db'):
+            instance_ref = self._create_instance_ref()
+            db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                           groups[name]['id'])
+            instances.append(db.instance_get(admin_ctxt, instance_ref['id']))
+        network_info = _fake_network_info(self.stubs, 1)
+        for instance_ref in instances[:3]:
+            self.fw.prepare_instance_filter(instance_ref, network_info)
+        return groups, instances
+
+    def _instance_chain_rules(self, instance_ref):
+        return [rule.rule for rule in self.fw.iptables.ipv4['filter'].rules
+                if rule.chain == 'inst-%s' % instance_ref['id']]
+
+    @mock.patch.object(lockutils, "external_lock")
+    def test_refresh_security_group_members_shares_members(self, mock_lock):
+        mock_lock.return_value = threading.Semaphore()
+        groups, instances = self._setup_security_group_instances()
+        web1, web2, other, member = instances
+        rule = '-j ACCEPT -p tcp --dport 22 -s 10.0.0.%d' % member['id']
+        self.assertIn(rule, self._instance_chain_rules(web1))
+
+        new_member = self._create_instance_ref()
+        db.instance_add_security_group(context.get_admin_context(),
+                                       new_member['uuid'],
+                                       groups['db']['id'])
+        with contextlib.nested(
+            mock.patch.object(objects.InstanceList,
+                              'get_by_security_group_id',
+                              wraps=objects.InstanceList.
+                                  get_by_security_group_id),
+            mock.patch.object(objects.SecurityGroupRuleList,
+                              'get_by_security_group_id'),
+            mock.patch.object(self.fw, 'add_filters_for_instance',
+                              wraps=self.fw.add_filters_for_instance)
+        ) as (mock_members, mock_rules, mock_add):
+            self.fw.refresh_security_group_members(groups['db']['id'])
+            mock_members.assert_called_once_with(mock.ANY,
+                                                 groups['db']['id'])
+            self.assertFalse(mock_rules.called)
+            self.assertEqual([web1['id'], web2['id']],
+                             sorted(call[0][0]['id']
+                                    for call in mock_add.call_args_list))
+
+        rule = '-j ACCEPT -p tcp --dport 22 -s 10.0.0.%d' % new_member['id']
+        self.assertIn(rule, self._instance_chain_rules(web1))
+        self.assertIn(rule, self._instance_chain_rules(web2))
+        self.assertNotIn(rule, self._instance_chain_rules(other))
+
+    @mock.patch.object(lockutils, "external_lock")
+    def test_refresh_security_group_members_unchanged(self, mock_lock):
+        mock_lock.return_value = threading.Semaphore()
+        groups, instances = self._setup_security_group_instances()
+        with mock.patch.object(self.fw, 'add_filters_for_instance') as add:
+            self.fw.refresh_security_group_members(groups['db']['id'])
+            self.assertFalse(add.called)
+
+    @mock.patch.object(lockutils, "external_lock")
+    def test_refresh_security_group_rules_affected_chains(self, mock_lock):
+        mock_lock.return_value = threading.Semaphore()
+        groups, instances = self._setup_security_group_instances()
+        web1, web2, other, member = instances
+        db.security_group_rule_create(context.get_admin_context(),
+                                      {'parent_group_id': groups['web']['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 443,
+                                       'to_port': 443,
+                                       'cidr': '192.168.10.0/24'})
+        with contextlib.nested(
+            mock.patch.object(objects.InstanceList,
+                              'get_by_security_group_id'),
+            mock.patch.object(objects.SecurityGroupRuleList,
+                              'get_by_security_group_id',
+                              wraps=objects.SecurityGroupRuleList.
+                                  get_by_security_group_id),
+            mock.patch.object(self.fw, 'add_filters_for_instance',
+                              wraps=self.fw.add_filters_for_instance)
+        ) as (mock_members, mock_rules, mock_add):
+            self.fw.refresh_security_group_rules(groups['web']['id'])
+            mock_rules.assert_called_once_with(mock.ANY, groups['web']['id'])
+            self.assertFalse(mock_members.called)
+            self.assertEqual(2, mock_add.call_count)
+
+        rule = '-j ACCEPT -p tcp --dport 443 -s 192.168.10.0/24'
+        self.assertIn(rule, self._instance_chain_rules(web1))
+        self.assertIn(rule, self._instance_chain_rules(web2))
+        self.assertNotIn(rule, self._instance_chain_rules(other))
+
+    @mock.patch.object(lockutils, "external_lock")
+    def test_unfilter_instance_purges_security_group_cache(self, mock_lock):
+        mock_lock.return_value = threading.Semaphore()
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda instance, network_info: None)
+        groups, instances = self._setup_security_group_instances()
+        web1, web2, other, member = instances
+        self.assertEqual(
+            set([('rules', groups['web']['id']),
+                 ('members', groups['db']['id']),
+                 ('rules', groups['other']['id'])]),
+            set(self.fw.security_group_cache))
+        self.fw.unfilter_instance(other, None)
+        self.fw.unfilter_instance(web1, None)
+        self.assertEqual(
+            set([('rules', groups['web']['id']),
+                 ('members', groups['db']['id'])]),
+            set(self.fw.security_group_cache))
+        self.fw.unfilter_instance(web2, None)
+        self.assertEqual({}, self.fw.security_group_cache)
+
     @mock.patch.object(lockutils, "external_lock")
     def test_unfilter_instance_undefines_nwfilter(self, mock_lock):
         mock_lock.return_value = threading.Semaphore()
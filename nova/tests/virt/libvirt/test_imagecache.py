@@ -20,6 +20,9 @@ import hashlib
 import os
 import time
 
+import eventlet
+from eventlet import event
+import mock
 from oslo.config import cfg
 
 from nova import conductor
@@ -885,3 +888,111 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             # Checksum requests for a file with no checksum now have the
             # side effect of creating the checksum
             self.assertTrue(os.path.exists(info_fname))
+
+
+class ImageFetchCoordinatorTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ImageFetchCoordinatorTestCase, self).setUp()
+        self.coordinator = imagecache.ImageFetchCoordinator()
+        self.fetches = []
+        self.done = {}
+
+    def _fetch_func(self, target, result=None, error=None):
+        self.fetches.append(target)
+        self.done.setdefault(target, event.Event()).wait()
+        del self.done[target]
+        if error:
+            raise error
+        return result
+
+    def _spawn(self, target, **kwargs):
+        thread = eventlet.spawn(self.coordinator.fetch, target,
+                                self._fetch_func, **kwargs)
+        eventlet.sleep(0)
+        return thread
+
+    def _finish(self, target):
+        self.done.setdefault(target, event.Event()).send()
+        # NOTE: Let the fetch finish, and the next one in line start
+        for i in range(3):
+            eventlet.sleep(0)
+
+    def test_fetches_coalesced(self):
+        threads = [self._spawn('/base/a', result=i) for i in range(3)]
+        self.assertTrue(self.coordinator.is_fetching('/base/a'))
+        self.assertEqual({'/base/a': 0}, self.coordinator.progress())
+        self._finish('/base/a')
+        self.assertEqual([0, 0, 0], [thread.wait() for thread in threads])
+        self.assertEqual(['/base/a'], self.fetches)
+        self.assertFalse(self.coordinator.is_fetching('/base/a'))
+
+        # NOTE: A later fetch is not coalesced with the finished one
+        thread = self._spawn('/base/a', result=3)
+        self._finish('/base/a')
+        self.assertEqual(3, thread.wait())
+        self.assertEqual(['/base/a', '/base/a'], self.fetches)
+
+    def test_fetch_error_shared(self):
+        threads = [self._spawn('/base/a', error=test.TestingException())
+                   for i in range(2)]
+        self._finish('/base/a')
+        for thread in threads:
+            self.assertRaises(test.TestingException, thread.wait)
+        self.assertEqual(['/base/a'], self.fetches)
+        self.assertFalse(self.coordinator.is_fetching('/base/a'))
+
+    def test_concurrent_fetches_limited(self):
+        self.flags(max_concurrent_image_fetches=2, group='libvirt')
+        threads = [self._spawn(target) for target in
+                   ['/base/a', '/base/b', '/base/c', '/base/d']]
+        self.assertEqual(['/base/a', '/base/b'], self.fetches)
+        self._finish('/base/b')
+        self.assertEqual(['/base/a', '/base/b', '/base/c'], self.fetches)
+        self._finish('/base/a')
+        self._finish('/base/c')
+        self._finish('/base/d')
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(['/base/a', '/base/b', '/base/c', '/base/d'],
+                         self.fetches)
+
+
+class PrefetchImagesTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(PrefetchImagesTestCase, self).setUp()
+        self.stubs.Set(utils, 'spawn_n',
+                       lambda func, *args, **kwargs: func(*args, **kwargs))
+
+    def _update(self, tmpdir, image_refs):
+        self.flags(instances_path=tmpdir)
+        self.flags(image_cache_subdirectory_name='_base')
+        os.mkdir(os.path.join(tmpdir, '_base'))
+        all_instances = [fake_instance.fake_instance_obj(
+                             None, name='instance-%d' % i, uuid=str(i),
+                             image_ref=image_ref, kernel_id=None,
+                             ramdisk_id=None, host=CONF.host,
+                             vm_state='active', task_state=None)
+                         for i, image_ref in enumerate(image_refs)]
+        image_cache_manager = imagecache.ImageCacheManager()
+        self.stubs.Set(image_cache_manager, '_age_and_verify_cached_images',
+                       lambda *args: None)
+        image_cache_manager.update(None, all_instances)
+
+    @mock.patch.object(libvirt_utils, 'fetch_image')
+    def test_popular_image_prefetched(self, fetch_mock):
+        self.flags(image_prefetch_popularity=2, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self._update(tmpdir, ['popular', 'popular', 'unpopular'])
+            target = os.path.join(tmpdir, '_base',
+                                  hashlib.sha1('popular').hexdigest())
+        fetch_mock.assert_called_once_with(
+            target=target, context=None, image_id='popular',
+            user_id='fake-user', project_id='fake-project')
+
+    @mock.patch.object(libvirt_utils, 'fetch_image')
+    def test_prefetch_disabled(self, fetch_mock):
+        with utils.tempdir() as tmpdir:
+            self._update(tmpdir, ['popular', 'popular'])
+        self.assertFalse(fetch_mock.called)
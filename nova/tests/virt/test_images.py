@@ -13,10 +13,12 @@
 #    under the License.
 
 import os
+import tempfile
 
 import mock
 
 from nova import exception
+from nova.openstack.common import imageutils
 from nova.openstack.common import processutils
 from nova import test
 from nova import utils
@@ -42,4 +44,90 @@ class QemuTestCase(test.NoDBTestCase):
                                       utils_execute):
         image_info = images.qemu_img_info('/fake/path')
         self.assertTrue(image_info)
-        self.assertTrue(str(image_info))
\ No newline at end of file
+        self.assertTrue(str(image_info))
+
+
+class Qcow2HeaderTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(Qcow2HeaderTestCase, self).setUp()
+        self.stubs.Set(images, '_IMAGE_INFO_CACHE',
+                       images.cache_utils.Client())
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+
+    def _write_qcow2(self, virtual_size, backing_file=None, version=2):
+        backing_file_offset = 0
+        if backing_file:
+            backing_file_offset = images.QCOW2_HEADER.size + 40
+        header = images.QCOW2_HEADER.pack(images.QCOW2_MAGIC, version,
+                                          backing_file_offset,
+                                          len(backing_file or ''),
+                                          16, virtual_size)
+        with open(self.path, 'wb') as f:
+            f.write(header)
+            if backing_file:
+                f.seek(backing_file_offset)
+                f.write(backing_file)
+
+    def test_qcow2_header_info(self):
+        self._write_qcow2(20 * 1024 ** 3, '/base/abcd')
+        info = images.qcow2_header_info(self.path)
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(20 * 1024 ** 3, info.virtual_size)
+        self.assertEqual('/base/abcd', info.backing_file)
+
+    def test_qcow2_header_info_no_backing_file(self):
+        self._write_qcow2(1024, version=3)
+        info = images.qcow2_header_info(self.path)
+        self.assertEqual(1024, info.virtual_size)
+        self.assertIsNone(info.backing_file)
+
+    def test_qcow2_header_info_not_qcow2(self):
+        with open(self.path, 'wb') as f:
+            f.write('\0' * 512)
+        self.assertIsNone(images.qcow2_header_info(self.path))
+
+    def test_qcow2_header_info_unknown_version(self):
+        self._write_qcow2(1024, version=1)
+        self.assertIsNone(images.qcow2_header_info(self.path))
+
+    def test_qcow2_header_info_truncated(self):
+        with open(self.path, 'wb') as f:
+            f.write(images.QCOW2_MAGIC)
+        self.assertIsNone(images.qcow2_header_info(self.path))
+
+    @mock.patch.object(images, 'qemu_img_info')
+    def test_cached_qemu_img_info(self, mock_info):
+        self._write_qcow2(1024, '/base/abcd')
+        info = images.cached_qemu_img_info(self.path)
+        self.assertEqual(1024, info.virtual_size)
+        self.assertEqual('/base/abcd', info.backing_file)
+        with mock.patch.object(images, 'qcow2_header_info') as mock_header:
+            self.assertIs(info, images.cached_qemu_img_info(self.path))
+            self.assertFalse(mock_header.called)
+        self.assertFalse(mock_info.called)
+
+    def test_cached_qemu_img_info_file_changed(self):
+        self._write_qcow2(1024)
+        self.assertEqual(1024,
+                         images.cached_qemu_img_info(self.path).virtual_size)
+        self._write_qcow2(2048, '/base/abcd')
+        self.assertEqual(2048,
+                         images.cached_qemu_img_info(self.path).virtual_size)
+
+    @mock.patch.object(images, 'qemu_img_info')
+    def test_cached_qemu_img_info_other_format(self, mock_info):
+        mock_info.return_value = imageutils.QemuImgInfo(
+            'file format: raw\nvirtual size: 1.0K (1024 bytes)\n')
+        with open(self.path, 'wb') as f:
+            f.write('\0' * 1024)
+        info = images.cached_qemu_img_info(self.path)
+        self.assertEqual('raw', info.file_format)
+        self.assertIs(info, images.cached_qemu_img_info(self.path))
+        mock_info.assert_called_once_with(self.path)
+
+    def test_cached_qemu_img_info_missing_file(self):
+        os.unlink(self.path)
+        self.addCleanup(lambda: open(self.path, 'w').close())
+        self.assertRaises(OSError, images.cached_qemu_img_info, self.path)
@@ -171,6 +171,16 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Return the power state of every instance on the hypervisor.
+
+        Returns a dict mapping instance uuids to power_state codes, built
+        from a single listing of the hypervisor rather than one get_info()
+        call per instance. Drivers which cannot do that raise
+        NotImplementedError, and callers fall back to get_info().
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -161,6 +161,10 @@ class FakeDriver(driver.ComputeDriver):
     def list_instance_uuids(self):
         return [self.instances[name].uuid for name in self.instances.keys()]
 
+    def get_power_states(self):
+        return dict((inst.uuid, inst.state)
+                    for inst in self.instances.itervalues())
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         pass
@@ -15,7 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import itertools
+
 from oslo.config import cfg
+import six
 
 from nova.compute import utils as compute_utils
 from nova import context
@@ -144,6 +147,17 @@ class IptablesFirewallDriver(FirewallDriver):
         self.instance_info = {}
         self.basically_filtered = False
 
+        # Compiled rules of the security groups and fixed ips of the members
+        # of the grantee groups, shared by the instances of the host. Keyed
+        # by ('rules', group id) and ('members', group id), each entry is a
+        # (version, value) tuple whose version changes with its value.
+        self.security_group_cache = {}
+        self._security_group_versions = itertools.count(1)
+        # Versions of the cache entries the rules of each instance were
+        # compiled from, and the rules of each instance chain.
+        self.instance_security_group_versions = {}
+        self.instance_chain_rules = {}
+
         # Flags for DHCP request rule
         self.dhcp_create = False
         self.dhcp_created = False
@@ -169,6 +183,7 @@ class IptablesFirewallDriver(FirewallDriver):
     def unfilter_instance(self, instance, network_info):
         if self.instance_info.pop(instance['id'], None):
             self.remove_filters_for_instance(instance)
+            self.forget_instance_security_groups(instance)
             self.iptables.apply()
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
@@ -247,9 +262,12 @@ class IptablesFirewallDriver(FirewallDriver):
                                                             network_info)
         self._add_filters('local', ipv4_rules, ipv6_rules)
         self._add_filters(chain_name, inst_ipv4_rules, inst_ipv6_rules)
+        self.instance_chain_rules[instance['id']] = (inst_ipv4_rules,
+                                                     inst_ipv6_rules)
 
     def remove_filters_for_instance(self, instance):
         chain_name = self._instance_chain_name(instance)
+        self.instance_chain_rules.pop(instance['id'], None)
 
         self.iptables.ipv4['filter'].remove_chain(chain_name)
         if CONF.use_ipv6:
@@ -329,7 +347,85 @@ class IptablesFirewallDriver(FirewallDriver):
                     '--dports', '%s:%s' % (rule['from_port'],
                                            rule['to_port'])]
 
-    def instance_rules(self, instance, network_info):
+    def _compile_security_group_rules(self, rules):
+        """Compiles security group rules into (ip version, iptables args,
+        cidr, grantee group id) tuples.
+        """
+        compiled = []
+        for rule in rules:
+            if not rule['cidr']:
+                version = 4
+            else:
+                version = netutils.get_ip_version(rule['cidr'])
+
+            protocol = rule['protocol']
+
+            if protocol:
+                protocol = rule['protocol'].lower()
+
+            if version == 6 and protocol == 'icmp':
+                protocol = 'icmpv6'
+
+            args = ['-j ACCEPT']
+            if protocol:
+                args += ['-p', protocol]
+
+            if protocol in ['udp', 'tcp']:
+                args += self._build_tcp_udp_rule(rule, version)
+            elif protocol == 'icmp':
+                args += self._build_icmp_rule(rule, version)
+            if rule['cidr']:
+                compiled.append((version, args, str(rule['cidr']), None))
+            elif rule['grantee_group']:
+                compiled.append((version, args, None,
+                                 rule['grantee_group']['id']))
+        return compiled
+
+    def _get_security_group_members(self, ctxt, security_group_id):
+        """Returns the fixed ips of the members of a security group, by ip
+        version.
+        """
+        ips = {4: [], 6: []}
+        insts = objects.InstanceList.get_by_security_group_id(
+            ctxt, security_group_id)
+        for instance in insts:
+            if instance['info_cache']['deleted']:
+                LOG.debug('ignoring deleted cache')
+                continue
+            nw_info = compute_utils.get_nw_info_for_instance(instance)
+            for ip in nw_info.fixed_ips():
+                ips[ip['version']].append(ip['address'])
+            LOG.debug('ips: %r', ips, instance=instance)
+        return ips
+
+    def _get_security_group_cache_entry(self, key, use_cache, load):
+        """Returns the (version, value) cache entry of key, loading it
+        unless use_cache is set and it is cached.
+        """
+        entry = self.security_group_cache.get(key)
+        if entry is None or not use_cache:
+            value = load()
+            if entry is None or entry[1] != value:
+                entry = (next(self._security_group_versions), value)
+                self.security_group_cache[key] = entry
+        return entry
+
+    def forget_instance_security_groups(self, instance):
+        """Drops the cache entries only an unfiltered instance used."""
+        self.instance_security_group_versions.pop(instance['id'], None)
+        used_keys = set()
+        for versions in self.instance_security_group_versions.values():
+            used_keys.update(versions)
+        for key in self.security_group_cache.keys():
+            if key not in used_keys:
+                del self.security_group_cache[key]
+
+    def instance_rules(self, instance, network_info, use_cache=False):
+        """Returns the ipv4 and ipv6 rules of the chain of an instance.
+
+        The rules and members of its security groups are loaded again
+        unless use_cache is set, in which case the cached ones are used.
+        """
         ctxt = context.get_admin_context()
         if isinstance(instance, dict):
             # NOTE(danms): allow old-world instance objects from
@@ -360,60 +456,36 @@ class IptablesFirewallDriver(FirewallDriver):
             ctxt, instance)
 
         # then, security group chains and rules
+        versions = {}
         for security_group in security_groups:
-            rules = objects.SecurityGroupRuleList.get_by_security_group(
-                    ctxt, security_group)
-
-            for rule in rules:
-                if not rule['cidr']:
-                    version = 4
-                else:
-                    version = netutils.get_ip_version(rule['cidr'])
-
-                if version == 4:
+            key = ('rules', security_group.id)
+            version, rules = self._get_security_group_cache_entry(
+                key, use_cache,
+                lambda: self._compile_security_group_rules(
+                    objects.SecurityGroupRuleList.get_by_security_group(
+                        ctxt, security_group)))
+            versions[key] = version
+
+            for ip_version, args, cidr, grantee_group_id in rules:
+                if ip_version == 4:
                     fw_rules = ipv4_rules
                 else:
                     fw_rules = ipv6_rules
 
-                protocol = rule['protocol']
-
-                if protocol:
-                    protocol = rule['protocol'].lower()
-
-                if version == 6 and protocol == 'icmp':
-                    protocol = 'icmpv6'
-
-                args = ['-j ACCEPT']
-                if protocol:
-                    args += ['-p', protocol]
-
-                if protocol in ['udp', 'tcp']:
-                    args += self._build_tcp_udp_rule(rule, version)
-                elif protocol == 'icmp':
-                    args += self._build_icmp_rule(rule, version)
-                if rule['cidr']:
-                    args += ['-s', str(rule['cidr'])]
-                    fw_rules += [' '.join(args)]
+                if cidr:
+                    fw_rules += [' '.join(args + ['-s', cidr])]
                 else:
-                    if rule['grantee_group']:
-                        insts = (
-                            objects.InstanceList.get_by_security_group(
-                                ctxt, rule['grantee_group']))
-                        for instance in insts:
-                            if instance['info_cache']['deleted']:
-                                LOG.debug('ignoring deleted cache')
-                                continue
-                            nw_info = compute_utils.get_nw_info_for_instance(
-                                    instance)
-
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
-
-                            LOG.debug('ips: %r', ips, instance=instance)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip]
-                                fw_rules += [' '.join(subrule)]
+                    key = ('members', grantee_group_id)
+                    version, ips = self._get_security_group_cache_entry(
+                        key, use_cache,
+                        lambda: self._get_security_group_members(
+                            ctxt, grantee_group_id))
+                    versions[key] = version
+                    for ip in ips[ip_version]:
+                        subrule = args + ['-s %s' % ip]
+                        fw_rules += [' '.join(subrule)]
+
+        self.instance_security_group_versions[instance['id']] = versions
 
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
@@ -425,7 +497,7 @@ class IptablesFirewallDriver(FirewallDriver):
         pass
 
     def refresh_security_group_members(self, security_group):
-        self.do_refresh_security_group_rules(security_group)
+        self.do_refresh_security_group_members(security_group)
         self.iptables.apply()
 
     def refresh_security_group_rules(self, security_group):
@@ -446,13 +518,41 @@ class IptablesFirewallDriver(FirewallDriver):
                     'skipping') % chain_name,
                 instance=instance)
             return
+        if (self.instance_chain_rules.get(instance['id']) ==
+                (ipv4_rules, ipv6_rules)):
+            LOG.debug('Rules of chain %s unchanged', chain_name,
+                      instance=instance)
+            return
         self.remove_filters_for_instance(instance)
         self.add_filters_for_instance(instance, network_info, ipv4_rules,
                                       ipv6_rules)
 
-    def do_refresh_security_group_rules(self, security_group):
+    def _do_refresh_security_group_cache(self, key):
+        """Loads the cache entry of key again, and refreshes the chains of
+        the instances compiled from it if it changed.
+
+        Chains of instances whose rules were not compiled by instance_rules
+        are refreshed as well. The other cache entries are used as cached.
+        """
+        ctxt = context.get_admin_context()
+        kind, security_group_id = key
+        version = None
+        if key in self.security_group_cache:
+            if kind == 'rules':
+                load = lambda: self._compile_security_group_rules(
+                    objects.SecurityGroupRuleList.get_by_security_group_id(
+                        ctxt, security_group_id))
+            else:
+                load = lambda: self._get_security_group_members(
+                    ctxt, security_group_id)
+            version = self._get_security_group_cache_entry(key, False,
+                                                           load)[0]
+
         id_list = self.instance_info.keys()
         for instance_id in id_list:
+            versions = self.instance_security_group_versions.get(instance_id)
+            if versions is not None and versions.get(key, version) == version:
+                continue
             try:
                 instance, network_info = self.instance_info[instance_id]
             except KeyError:
@@ -460,10 +560,24 @@ class IptablesFirewallDriver(FirewallDriver):
                 # ignore this deleted instance and move on
                 continue
             ipv4_rules, ipv6_rules = self.instance_rules(instance,
-                                                         network_info)
+                                                         network_info,
+                                                         use_cache=True)
             self._inner_do_refresh_rules(instance, network_info, ipv4_rules,
                                          ipv6_rules)
 
+    def _security_group_id(self, security_group):
+        if isinstance(security_group, six.integer_types + six.string_types):
+            return security_group
+        return security_group['id']
+
+    def do_refresh_security_group_rules(self, security_group):
+        self._do_refresh_security_group_cache(
+            ('rules', self._security_group_id(security_group)))
+
+    def do_refresh_security_group_members(self, security_group):
+        self._do_refresh_security_group_cache(
+            ('members', self._security_group_id(security_group)))
+
     def do_refresh_instance_rules(self, instance):
         _instance, network_info = self.instance_info[instance['id']]
         ipv4_rules, ipv6_rules = self.instance_rules(instance, network_info)
@@ -20,9 +20,11 @@ Handling of VM disk images.
 """
 
 import os
+import struct
 
 from oslo.config import cfg
 
+from nova import cache_utils
 from nova import exception
 from nova.i18n import _
 from nova import image
@@ -43,6 +45,16 @@ CONF = cfg.CONF
 CONF.register_opts(image_opts)
 IMAGE_API = image.API()
 
+# magic, version, backing_file_offset, backing_file_size, cluster_bits, size
+QCOW2_HEADER = struct.Struct('>4sIQIIQ')
+QCOW2_MAGIC = 'QFI\xfb'
+# NOTE: qemu refuses to open images with longer backing file names.
+QCOW2_MAX_BACKING_FILE_SIZE = 1023
+
+# Image info keyed by path, along with the inode, mtime and size of the file
+# it was read from.
+_IMAGE_INFO_CACHE = cache_utils.Client(maxsize=4096)
+
 
 def qemu_img_info(path):
     """Return an object containing the parsed output from qemu-img info."""
@@ -62,6 +74,62 @@ def qemu_img_info(path):
     return imageutils.QemuImgInfo(out)
 
 
+def qcow2_header_info(path):
+    """Return the image info read from the header of a qcow2 image.
+
+    Only the format, virtual size and backing file are filled in. Returns
+    None if the image is not a qcow2 image this can parse.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(QCOW2_HEADER.size)
+        if len(header) < QCOW2_HEADER.size:
+            return None
+        (magic, version, backing_file_offset, backing_file_size,
+         _cluster_bits, virtual_size) = QCOW2_HEADER.unpack(header)
+        if magic != QCOW2_MAGIC or version not in (2, 3):
+            return None
+
+        backing_file = None
+        if backing_file_offset and backing_file_size:
+            if backing_file_size > QCOW2_MAX_BACKING_FILE_SIZE:
+                return None
+            f.seek(backing_file_offset)
+            backing_file = f.read(backing_file_size)
+            if len(backing_file) < backing_file_size:
+                return None
+
+    info = imageutils.QemuImgInfo()
+    info.image = path
+    info.file_format = 'qcow2'
+    info.virtual_size = virtual_size
+    info.backing_file = backing_file
+    return info
+
+
+def cached_qemu_img_info(path):
+    """Return the image info of a local file, reusing the info read the last
+    time the same file was seen unchanged.
+
+    qcow2 headers are read directly, qemu-img is only run for other formats.
+    """
+    st = os.stat(path)
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    entry = _IMAGE_INFO_CACHE.get(path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    info = None
+    try:
+        info = qcow2_header_info(path)
+    except IOError as e:
+        LOG.debug('Unable to read the header of %(path)s: %(error)s',
+                  {'path': path, 'error': e})
+    if info is None:
+        info = qemu_img_info(path)
+    _IMAGE_INFO_CACHE.set(path, (key, info))
+    return info
+
+
 def convert_image(source, dest, out_format, run_as_root=False):
     """Convert image to other format."""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
@@ -95,6 +95,7 @@ from nova.virt import driver
 from nova.virt import event as virtevent
 from nova.virt import firewall
 from nova.virt import hardware
+from nova.virt import images
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import dmcrypt
@@ -385,6 +386,7 @@ class LibvirtDriver(driver.ComputeDriver):
             libvirt = importutils.import_module('libvirt')
 
         self._skip_list_all_domains = False
+        self._skip_get_all_domain_stats = False
         self._host_state = None
         self._initiator = None
         self._fc_wwnns = None
@@ -779,6 +781,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         self._wrapped_conn = wrapped_conn
         self._skip_list_all_domains = False
+        self._skip_get_all_domain_stats = False
 
         try:
             LOG.debug("Registering for lifecycle events %s", self)
@@ -984,6 +987,43 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return uuids
 
+    def _get_power_states_fast(self):
+        # The modern (>= 1.2.8) fast way - 1 single API call for the state
+        # of all domains
+        states = {}
+        for dom, stats in self._conn.getAllDomainStats(
+                libvirt.VIR_DOMAIN_STATS_STATE):
+            if dom.ID() == 0:
+                continue
+            states[dom.UUIDString()] = LIBVIRT_POWER_STATE[
+                stats['state.state']]
+        return states
+
+    def _get_power_states_slow(self):
+        # The legacy way - 1 API call for the listing, then 1 per domain
+        # but without looking each domain up again
+        states = {}
+        for dom in self._list_instance_domains(only_running=False):
+            try:
+                states[dom.UUIDString()] = LIBVIRT_POWER_STATE[dom.info()[0]]
+            except libvirt.libvirtError as ex:
+                # The domain went away since it was listed
+                if ex.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+        return states
+
+    def get_power_states(self):
+        if not self._skip_get_all_domain_stats:
+            try:
+                return self._get_power_states_fast()
+            except (libvirt.libvirtError, AttributeError) as ex:
+                LOG.info(_LI("Unable to use bulk domain stats APIs, "
+                             "falling back to slow code path: %(ex)s"),
+                         {'ex': ex})
+                self._skip_get_all_domain_stats = True
+
+        return self._get_power_states_slow()
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -5754,8 +5794,11 @@ class LibvirtDriver(driver.ComputeDriver):
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                image_info = images.cached_qemu_img_info(path)
+                backing_file = image_info.backing_file
+                if backing_file:
+                    backing_file = os.path.basename(backing_file)
+                virt_size = image_info.virtual_size
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
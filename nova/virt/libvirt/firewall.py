@@ -321,6 +321,7 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
         # Overriding base class method for applying nwfilter operation
         if self.instance_info.pop(instance['id'], None):
             self.remove_filters_for_instance(instance)
+            self.forget_instance_security_groups(instance)
             self.iptables.apply()
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
@@ -35,6 +35,7 @@ from nova.virt.disk import api as disk
 from nova.virt import images
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import dmcrypt
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import lvm
 from nova.virt.libvirt import rbd_utils
 from nova.virt.libvirt import utils as libvirt_utils
@@ -191,12 +192,19 @@ class Image(object):
         :size: Size of created image in bytes (optional)
         """
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
-        def fetch_func_sync(target, *args, **kwargs):
+        def fetch_func_locked(target, *args, **kwargs):
             # The image may have been fetched while a subsequent
             # call was waiting to obtain the lock.
             if not os.path.exists(target):
                 fetch_func(target=target, *args, **kwargs)
 
+        def fetch_func_sync(target, *args, **kwargs):
+            # NOTE: Concurrent fetches of the same target by this process
+            # share a single fetch, while the lock above keeps serializing
+            # them with other processes.
+            imagecache.FETCH_COORDINATOR.fetch(target, fetch_func_locked,
+                                               *args, **kwargs)
+
         base_dir = os.path.join(CONF.instances_path,
                                 CONF.image_cache_subdirectory_name)
         if not os.path.exists(base_dir):
@@ -20,16 +20,20 @@ http://wiki.openstack.org/nova-image-cache-management.
 
 """
 
+import collections
 import hashlib
 import os
 import re
+import sys
 import time
 
+from eventlet import event
 from oslo.config import cfg
 
 from nova.i18n import _LE
 from nova.i18n import _LI
 from nova.i18n import _LW
+from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -62,6 +66,16 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('max_concurrent_image_fetches',
+               default=0,
+               help='Maximum number of images fetched into the image cache '
+                    'at once. Further fetches wait for their turn in the '
+                    'order they were requested. 0 means unlimited'),
+    cfg.IntOpt('image_prefetch_popularity',
+               default=0,
+               help='Number of instances using an image from which the '
+                    'image cache manager fetches the image into the cache '
+                    'if it is missing. 0 disables prefetching'),
     ]
 
 CONF = cfg.CONF
@@ -94,6 +108,85 @@ def get_cache_fname(images, key):
         return hashlib.sha1(image_id).hexdigest()
 
 
+class ImageFetchCoordinator(object):
+    """Coordinates the fetches of images into the image cache.
+
+    Concurrent fetches of the same target are coalesced into a single
+    fetch, whose result is shared by all of the callers. The number of
+    fetches running at once is limited by max_concurrent_image_fetches.
+    """
+
+    def __init__(self):
+        self._fetches = {}
+        self._running = 0
+        self._waiters = collections.deque()
+
+    def _acquire(self):
+        limit = CONF.libvirt.max_concurrent_image_fetches
+        if limit <= 0 or (self._running < limit and not self._waiters):
+            self._running += 1
+            return
+        waiter = event.Event()
+        self._waiters.append(waiter)
+        # NOTE: The slot of a finished fetch is handed over to us
+        waiter.wait()
+
+    def _release(self):
+        if self._waiters:
+            self._waiters.popleft().send()
+        else:
+            self._running -= 1
+
+    def fetch(self, target, fetch_func, *args, **kwargs):
+        """Calls fetch_func(target=target, ...) once for concurrent callers.
+
+        :returns: the result of fetch_func, or raises its exception
+        """
+        fetch = self._fetches.get(target)
+        if fetch is not None:
+            LOG.debug('Waiting for the fetch of %(target)s in progress, '
+                      '%(fetched)d bytes fetched so far',
+                      {'target': target, 'fetched': _fetched_size(target)})
+            return fetch.wait()
+
+        fetch = self._fetches[target] = event.Event()
+        try:
+            self._acquire()
+            try:
+                result = fetch_func(target=target, *args, **kwargs)
+            finally:
+                self._release()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                del self._fetches[target]
+                fetch.send_exception(*sys.exc_info())
+        del self._fetches[target]
+        fetch.send(result)
+        return result
+
+    def is_fetching(self, target):
+        return target in self._fetches
+
+    def progress(self):
+        """Returns the number of bytes fetched so far per target."""
+        return dict((target, _fetched_size(target))
+                    for target in self._fetches)
+
+
+def _fetched_size(target):
+    # NOTE: Images are downloaded to a .part file before being converted
+    # and renamed to their target.
+    for path in (target + '.part', target):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            pass
+    return 0
+
+
+FETCH_COORDINATOR = ImageFetchCoordinator()
+
+
 def get_info_filename(base_path):
     """Construct a filename for storing additional information about a base
     image.
@@ -583,6 +676,47 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             return
         return base_dir
 
+    def _prefetch_popular_images(self, context, all_instances, base_dir):
+        """Fetch the missing images used by image_prefetch_popularity or
+        more instances into the cache, in the background.
+        """
+        threshold = CONF.libvirt.image_prefetch_popularity
+        if threshold <= 0:
+            return
+        prefetched = set()
+        for instance in all_instances:
+            image_id = instance.image_ref
+            if (not image_id or image_id in prefetched or
+                    self.image_popularity.get(image_id, 0) < threshold):
+                continue
+            prefetched.add(image_id)
+            filename = get_cache_fname({'image_id': image_id}, 'image_id')
+            target = os.path.join(base_dir, filename)
+            if (os.path.exists(target) or
+                    FETCH_COORDINATOR.is_fetching(target)):
+                continue
+            LOG.info(_LI('Prefetching image %(image_id)s used by '
+                         '%(count)d instances'),
+                     {'image_id': image_id,
+                      'count': self.image_popularity[image_id]})
+            utils.spawn_n(self._prefetch_image, context, target, filename,
+                          image_id, instance.user_id, instance.project_id)
+
+    def _prefetch_image(self, context, target, filename, image_id, user_id,
+                        project_id):
+        @utils.synchronized(filename, external=True, lock_path=self.lock_path)
+        def fetch_func_sync(target, *args, **kwargs):
+            if not os.path.exists(target):
+                libvirt_utils.fetch_image(target=target, *args, **kwargs)
+
+        try:
+            FETCH_COORDINATOR.fetch(target, fetch_func_sync, context=context,
+                                    image_id=image_id, user_id=user_id,
+                                    project_id=project_id)
+        except Exception as e:
+            LOG.warn(_LW('Failed to prefetch image %(image_id)s: %(e)s'),
+                     {'image_id': image_id, 'e': e})
+
     def update(self, context, all_instances):
         base_dir = self._get_base()
         if not base_dir:
@@ -596,5 +730,6 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.used_images = running['used_images']
         self.image_popularity = running['image_popularity']
         self.instance_names = running['instance_names']
+        self._prefetch_popular_images(context, all_instances, base_dir)
         # perform the aging and image verification
         self._age_and_verify_cached_images(context, all_instances, base_dir)
@@ -23,6 +23,30 @@ import six
 
 from nova import loadables
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _normalize_array(weights, minval=None, maxval=None):
+    if not len(weights):
+        return weights
+
+    if maxval is None:
+        maxval = weights.max()
+
+    if minval is None:
+        minval = weights.min()
+
+    maxval = float(maxval)
+    minval = float(minval)
+
+    if minval == maxval:
+        return numpy.zeros(len(weights))
+
+    return (weights - minval) / (maxval - minval)
+
 
 def normalize(weight_list, minval=None, maxval=None):
     """Normalize the values in a list between 0 and 1.0.
@@ -32,8 +56,14 @@ def normalize(weight_list, minval=None, maxval=None):
     will be used instead of the minimum and maximum from the list.
 
     If all the values are equal, they are normalized to 0.
+
+    A NumPy array is normalized with array operations and the result is
+    returned as an array.
     """
 
+    if numpy is not None and isinstance(weight_list, numpy.ndarray):
+        return _normalize_array(weight_list, minval=minval, maxval=maxval)
+
     if not weight_list:
         return ()
 
@@ -124,13 +154,24 @@ class BaseWeightHandler(loadables.BaseLoader):
     def get_weighed_objects(self, weigher_classes, obj_list,
             weighing_properties):
         """Return a sorted (descending), normalized list of WeighedObjects."""
+        weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        return self.get_weighed_objects_with_weighers(weighers, obj_list,
+                                                      weighing_properties)
+
+    def get_weighed_objects_with_weighers(self, weighers, obj_list,
+            weighing_properties):
+        """Same as get_weighed_objects(), with weigher instances.
+
+        Weighers record the bounds of the weights they compute, so weighing
+        objects again with the same instances normalizes their weights
+        against the bounds of the previous calls.
+        """
 
         if not obj_list:
             return []
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
-        for weigher_cls in weigher_classes:
-            weigher = weigher_cls()
+        for weigher in weighers:
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
 
             # Normalize the weights
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the cost of the instance lookup filters, DifferentHostFilter and
+TypeAffinityFilter, with and without their per request precomputation, as
+the number of hosts grows. Each database query sleeps to simulate the round
+trip to the database.
+
+Usage: python tools/affinity_filters_benchmark.py [HOSTS ...]
+"""
+
+import contextlib
+import sys
+import time
+
+import mock
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova.compute import api as compute_api
+from nova import context
+from nova import db
+from nova import rpc
+from nova.scheduler import filters
+from nova.scheduler.filters import affinity_filter
+from nova.scheduler.filters import type_filter
+from nova.tests.scheduler import fakes
+
+# Simulated round trip to the database, in seconds
+DB_LATENCY = 0.0002
+
+
+class FakeDatabase(object):
+    """Answers the queries of the filters as if an instance of another
+    flavor ran on host1 and the hinted instance ran on host0.
+    """
+
+    def __init__(self):
+        self.queries = 0
+
+    def _query(self, result):
+        self.queries += 1
+        time.sleep(DB_LATENCY)
+        return result
+
+    def get_all(self, context, search_opts):
+        instance = {'host': 'host0', 'uuid': 'fake-uuid'}
+        if search_opts.get('host', 'host0') != 'host0':
+            return self._query([])
+        return self._query([instance])
+
+    def get_all_by_host_and_not_type(self, context, host, type_id):
+        return self._query([{'host': host}] if host == 'host1' else [])
+
+    def get_hosts_by_not_type(self, context, type_id):
+        return self._query(['host1'])
+
+
+def time_filters(hosts, precompute):
+    """Returns the time in ms filtering hosts takes, the number of queries
+    it made and the hosts which passed.
+    """
+    host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                   for i in xrange(hosts)]
+    filter_properties = {'context': context.get_admin_context(),
+                         'scheduler_hints': {
+                             'different_host': ['fake-uuid']},
+                         'instance_type': {'id': 1}}
+    filter_classes = [affinity_filter.DifferentHostFilter,
+                      type_filter.TypeAffinityFilter]
+    handler = filters.HostFilterHandler()
+    database = FakeDatabase()
+
+    with contextlib.nested(
+        mock.patch.object(rpc, 'get_client'),
+        mock.patch.object(rpc, 'get_notifier'),
+        mock.patch.object(compute_api.API, 'get_all',
+                          side_effect=database.get_all),
+        mock.patch.object(db, 'instance_get_all_by_host_and_not_type',
+                          side_effect=database.get_all_by_host_and_not_type),
+        mock.patch.object(db, 'instance_get_hosts_by_not_type',
+                          side_effect=database.get_hosts_by_not_type)):
+        start = time.time()
+        if precompute:
+            handler.precompute(filter_classes, filter_properties)
+        passed = handler.get_filtered_objects(filter_classes, host_states,
+                                              filter_properties)
+        elapsed = time.time() - start
+    return elapsed * 1000, database.queries, [host.host for host in passed]
+
+
+def main(argv):
+    # Load what the filters import on their first run.
+    time_filters(2, False)
+    for hosts in [int(arg) for arg in argv[1:]] or [100, 1000, 5000]:
+        per_host_ms, per_host_queries, expected = time_filters(hosts, False)
+        precomputed_ms, precomputed_queries, passed = time_filters(hosts,
+                                                                   True)
+        if passed != expected:
+            sys.exit("%d hosts: the precomputed filters pass other hosts"
+                     % hosts)
+        print("%d hosts: per host %.1f ms (%d queries), precomputed %.1f ms "
+              "(%d queries)" % (hosts, per_host_ms, per_host_queries,
+                                precomputed_ms, precomputed_queries))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
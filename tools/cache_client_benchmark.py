@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the cost of set and get of the in process cache client with many
+keys, against the oslo memorycache client it extends.
+
+Usage: python tools/cache_client_benchmark.py [KEYS]
+"""
+
+import sys
+import time
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova import cache_utils
+from nova.openstack.common import memorycache
+
+# The oslo client sweeps all its keys on every get, so only that many gets
+# are timed.
+MEMORYCACHE_GETS = 100
+
+
+def time_client(client, keys, gets):
+    """Returns the time in us a set and a get take on client once it holds
+    keys keys.
+    """
+    start = time.time()
+    for i in xrange(keys):
+        client.set('key%d' % i, i, time=60)
+    set_us = (time.time() - start) * 1e6 / keys
+    got = ['key%d' % i for i in xrange(0, keys, keys // gets)]
+    start = time.time()
+    for key in got:
+        client.get(key)
+    get_us = (time.time() - start) * 1e6 / len(got)
+    return set_us, get_us
+
+
+def main(argv):
+    keys = int(argv[1]) if len(argv) > 1 else 100000
+    client = cache_utils.Client(maxsize=keys // 2)
+    set_us, get_us = time_client(client, keys, keys)
+    print("%d keys: set %.2f us, get %.2f us, %r"
+          % (keys, set_us, get_us, client.get_stats()))
+    set_us, get_us = time_client(memorycache.Client(), keys,
+                                 min(keys, MEMORYCACHE_GETS))
+    print("%d keys, oslo memorycache: set %.2f us, get %.2f us"
+          % (keys, set_us, get_us))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the cost of computing the capacities of a cell host by host and
+vectorized, as the number of compute nodes grows. For the vectorized count,
+also measure a sync after one compute node changed and a sync after none
+did.
+
+Usage: python tools/cell_capacity_benchmark.py [HOSTS ...]
+"""
+
+import contextlib
+import random
+import sys
+import time
+
+import mock
+from oslo.config import cfg
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova.cells import state
+from nova import db
+
+CONF = cfg.CONF
+
+FLAVORS = 100
+
+
+def fake_compute_nodes(computes):
+    return [{'service': {'host': host, 'disabled': False},
+             'memory_mb': total_mem,
+             'local_gb': total_disk,
+             'free_ram_mb': free_mem,
+             'free_disk_gb': free_disk}
+            for host, total_mem, total_disk, free_mem, free_disk in computes]
+
+
+def time_capacity(hosts, vectorized):
+    """Returns the time in ms a full sync, a sync after one host changed
+    and a sync after none did take, and the resulting capacities.
+    """
+    CONF.set_override('vectorized_capacity', vectorized, group='cells')
+    randint = random.Random(hosts).randint
+    computes = [('host%d' % i, 65536, 2000, randint(0, 65536),
+                 randint(0, 2000)) for i in xrange(hosts)]
+    flavors = [{'memory_mb': 512 * (i % 32 + 1),
+                'root_gb': 10 * (i % 10 + 1),
+                'ephemeral_gb': 20 * (i % 7)}
+               for i in xrange(FLAVORS)]
+
+    with contextlib.nested(
+        mock.patch.object(db, 'cell_get_all', return_value=[]),
+        mock.patch.object(db, 'compute_node_get_all',
+                          side_effect=lambda context:
+                              fake_compute_nodes(computes)),
+        mock.patch.object(db, 'flavor_get_all', return_value=flavors)):
+        state_manager = state.CellStateManager()
+        # Count all the hosts again, as the first sync did.
+        state_manager._capacity_counters = None
+        timings = []
+        for change in (False, True, False):
+            if change:
+                computes[0] = computes[0][:3] + (0, 0)
+            start = time.time()
+            state_manager._update_our_capacity()
+            timings.append((time.time() - start) * 1000)
+        return timings, state_manager.get_my_state().capacities
+
+
+def main(argv):
+    CONF.set_override('reserve_percent', 10.0, group='cells')
+    if state.numpy is None:
+        sys.exit("NumPy is not installed")
+    for hosts in [int(arg) for arg in argv[1:]] or [2000, 10000]:
+        per_host_timings, expected = time_capacity(hosts, False)
+        per_host_ms = per_host_timings[0]
+        (vectorized_ms, changed_ms, unchanged_ms), capacities = (
+            time_capacity(hosts, True))
+        if capacities != expected:
+            sys.exit("%d hosts: the vectorized capacities differ" % hosts)
+        print("%d hosts, %d flavors: per host %.1f ms, vectorized %.1f ms, "
+              "one host changed %.1f ms, unchanged %.1f ms"
+              % (hosts, FLAVORS, per_host_ms, vectorized_ms, changed_ms,
+                 unchanged_ms))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the memory and refresh time of the scheduler host states of a
+fleet of fake compute nodes.
+
+Usage: python tools/host_state_benchmark.py [HOSTS]
+"""
+
+import sys
+import time
+import UserDict
+
+import six
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+from nova.scheduler import host_manager
+from nova.virt import hardware
+
+
+def deep_getsizeof(obj, seen=None):
+    """Return the size in bytes of an object and everything it references."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(key, seen) + deep_getsizeof(value, seen)
+                    for key, value in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    elif isinstance(obj, UserDict.UserDict):
+        size += deep_getsizeof(obj.data, seen)
+    elif not isinstance(obj, six.string_types + six.integer_types + (float,)):
+        if hasattr(obj, '__dict__'):
+            size += deep_getsizeof(obj.__dict__, seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += deep_getsizeof(getattr(obj, name), seen)
+    return size
+
+
+def fake_compute_nodes(count):
+    numa_topology = hardware.VirtNUMAHostTopology(
+        cells=[hardware.VirtNUMATopologyCellUsage(
+                   cell, set(range(cell * 8, cell * 8 + 8)), 65536)
+               for cell in range(2)]).to_json()
+    pci_stats = jsonutils.dumps([{'vendor_id': '8086', 'product_id': '1520',
+                                  'extra_info': {}, 'count': 8}])
+    now = timeutils.utcnow()
+    compute_nodes = []
+    for i in xrange(count):
+        metrics = jsonutils.dumps([
+            {'name': name, 'value': i % 100, 'timestamp': None,
+             'source': 'libvirt'}
+            for name in ('cpu.frequency', 'cpu.user.percent',
+                         'cpu.kernel.percent', 'cpu.idle.percent',
+                         'cpu.iowait.percent', 'cpu.percent')])
+        stats = jsonutils.dumps({'num_instances': str(i % 50),
+                                 'io_workload': str(i % 8),
+                                 'num_vm_active': str(i % 50),
+                                 'num_proj_12345': str(i % 50)})
+        compute_nodes.append(dict(
+            id=i, memory_mb=131072, free_ram_mb=65536 + i % 1024,
+            local_gb=2048, local_gb_used=1024, free_disk_gb=1024,
+            disk_available_least=None, vcpus=16, vcpus_used=i % 16,
+            updated_at=now, host_ip='10.0.%d.%d' % (i // 256, i % 256),
+            hypervisor_type='QEMU', hypervisor_version=2000000,
+            hypervisor_hostname='node%d' % i, cpu_info='{}',
+            supported_instances='[["x86_64", "qemu", "hvm"]]',
+            numa_topology=numa_topology, pci_stats=pci_stats,
+            metrics=metrics, stats=stats))
+    return compute_nodes
+
+
+def refresh(compute_nodes, host_states=None, parse=False):
+    """Returns the host states of compute_nodes, created or updated, and the
+    time in ms it took.
+    """
+    start = time.time()
+    if host_states is None:
+        host_states = [
+            host_manager.HostState('host%d' % compute['id'],
+                                   compute['hypervisor_hostname'],
+                                   compute=compute)
+            for compute in compute_nodes]
+    else:
+        for host_state, compute in zip(host_states, compute_nodes):
+            host_state.update_from_compute_node(compute)
+    if parse:
+        # What every refresh used to do for each host.
+        for host_state in host_states:
+            host_state.numa_topology
+            host_state.metrics
+            host_state.pci_stats
+    return host_states, (time.time() - start) * 1000
+
+
+def main(argv):
+    hosts = int(argv[1]) if len(argv) > 1 else 20000
+    compute_nodes = fake_compute_nodes(hosts)
+    empty_size = deep_getsizeof([None] * hosts)
+
+    host_states, create_ms = refresh(compute_nodes)
+    lazy_size = deep_getsizeof(host_states) - empty_size
+    host_states, refresh_ms = refresh(compute_nodes, host_states)
+    host_states, parsed_ms = refresh(compute_nodes, host_states, parse=True)
+    parsed_size = deep_getsizeof(host_states) - empty_size
+
+    print("%d hosts: created in %.1f ms, refreshed in %.1f ms, %.1f ms when "
+          "parsing NUMA topology, metrics and PCI stats"
+          % (hosts, create_ms, refresh_ms, parsed_ms))
+    print("%d bytes per host, %d bytes per host once parsed"
+          % (lazy_size / hosts, parsed_size / hosts))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the cost of serializing an InstanceList as sent over RPC, of
+deserializing it and serializing it back, and of hydrating the info caches
+of its instances afterwards.
+
+Usage: python tools/instance_list_serialization_benchmark.py [INSTANCES]
+"""
+
+import sys
+import time
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova.network import model as network_model
+from nova import objects
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+from nova.tests import fake_network_cache_model
+
+
+def make_instance_list(count):
+    nw_info = network_model.NetworkInfo(
+        [fake_network_cache_model.new_vif()])
+    inst_list = objects.InstanceList(objects=[])
+    for i in xrange(count):
+        inst_uuid = 'fake-uuid-%d' % i
+        inst = objects.Instance(
+            id=i, uuid=inst_uuid, host='fake-host', node='fake-node',
+            display_name='fake-%d' % i, vm_state='active',
+            task_state=None, created_at=timeutils.utcnow(),
+            system_metadata=dict(('key%d' % x, 'value%d' % x)
+                                 for x in range(10)),
+            info_cache=objects.InstanceInfoCache(
+                instance_uuid=inst_uuid, network_info=nw_info))
+        inst.info_cache.obj_reset_changes()
+        inst.obj_reset_changes()
+        inst_list.objects.append(inst)
+    inst_list.obj_reset_changes()
+    return inst_list
+
+
+def time_round_trip(count):
+    """Returns the time in s serializing an InstanceList of count instances,
+    deserializing it from JSON and serializing it back, and hydrating the
+    info caches of its instances take.
+    """
+    inst_list = make_instance_list(count)
+
+    start = time.time()
+    primitive = inst_list.obj_to_primitive()
+    serialize = time.time() - start
+
+    start = time.time()
+    inst_list = objects.InstanceList.obj_from_primitive(
+        jsonutils.loads(jsonutils.dumps(primitive)))
+    inst_list.obj_to_primitive()
+    round_trip = time.time() - start
+
+    start = time.time()
+    for inst in inst_list:
+        inst.info_cache.network_info
+    hydrate = time.time() - start
+    return serialize, round_trip, hydrate
+
+
+def main(argv):
+    objects.register_all()
+    count = int(argv[1]) if len(argv) > 1 else 1000
+    serialize, round_trip, hydrate = time_round_trip(count)
+    print("%d instances: serialize %.3f s, deserialize and serialize back "
+          "%.3f s, hydrate the info caches %.3f s"
+          % (count, serialize, round_trip, hydrate))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the cost of applying iptables rules as a whole and of applying
+only the changed chains, against in memory tables.
+
+Usage: python tools/iptables_apply_benchmark.py [RULES ...]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova.network import linux_net
+from nova.tests import test_iptables_network
+
+CONF = cfg.CONF
+
+
+def time_apply(rules):
+    """Returns the time in ms an apply takes after a rule was added to one
+    of the instance chains, rewriting all the rules and rewriting only the
+    changed chain.
+    """
+    iptables = test_iptables_network.FakeIptables()
+    manager = linux_net.IptablesManager(iptables.execute)
+    table = manager.ipv4['filter']
+    for i in xrange(rules // 10):
+        chain = 'inst-%d' % i
+        table.add_chain(chain)
+        table.add_rule('local', '-d 10.%d.%d.%d -j $%s' %
+                       (i // 62500, i // 250 % 250, i % 250, chain))
+        for j in xrange(10):
+            table.add_rule(chain, '-p tcp --dport %d -j ACCEPT' % (1000 + j))
+
+    results = []
+    for incremental in (False, True):
+        CONF.set_override('iptables_incremental_apply', incremental)
+        manager.apply()
+        table.add_rule('inst-0', '-j DROP')
+        start = time.time()
+        manager.apply()
+        results.append((time.time() - start) * 1000)
+        table.remove_rule('inst-0', '-j DROP')
+    return results
+
+
+def main(argv):
+    lock_path = tempfile.mkdtemp()
+    CONF.set_override('lock_path', lock_path)
+    CONF.set_override('use_ipv6', False)
+    try:
+        for rules in [int(arg) for arg in argv[1:]] or [1000, 10000, 50000]:
+            full_ms, incremental_ms = time_apply(rules)
+            print("%d rules: all rules %.2f ms, changed chains %.2f ms"
+                  % (rules, full_ms, incremental_ms))
+    finally:
+        shutil.rmtree(lock_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
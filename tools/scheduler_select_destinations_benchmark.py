@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the latency of the filter scheduler select_destinations with and
+without the vectorized host table, against fake host states.
+
+Usage: python tools/scheduler_select_destinations_benchmark.py [HOSTS ...]
+"""
+
+import random
+import sys
+import time
+
+import mock
+from oslo.config import cfg
+
+# NOTE: nova.tests has to be imported before the modules importing eventlet.
+import nova.tests  # noqa
+
+from nova import context
+from nova import objects
+from nova.openstack.common import timeutils
+from nova import rpc
+from nova.scheduler import filter_scheduler
+from nova.tests.scheduler import fakes
+
+CONF = cfg.CONF
+
+REQUESTS = 3
+
+
+def fake_host_states(count, seed=42):
+    rand = random.Random(seed)
+    host_states = []
+    for i in xrange(count):
+        total_ram = rand.choice([4096, 8192, 16384])
+        total_disk = rand.choice([100, 200, 400])
+        host_state = fakes.FakeHostState('host%s' % i, 'node%s' % i, {
+            'total_usable_ram_mb': total_ram,
+            'free_ram_mb': rand.randint(-1024, total_ram),
+            'total_usable_disk_gb': total_disk,
+            'free_disk_mb': rand.randint(0, total_disk * 1024),
+            'vcpus_total': rand.choice([0, 4, 8]),
+            'vcpus_used': rand.randint(0, 128),
+            'num_io_ops': rand.randint(0, 10),
+            'num_instances': rand.randint(0, 60),
+            'service': {'disabled': False,
+                        'updated_at': timeutils.utcnow(),
+                        'created_at': timeutils.utcnow()}})
+        host_states.append(host_state)
+    return host_states
+
+
+def fake_request_spec():
+    flavor = {'flavorid': 'small', 'memory_mb': 512, 'root_gb': 1,
+              'ephemeral_gb': 1, 'swap': 0, 'vcpus': 1}
+    instance_properties = {'os_type': 'linux', 'project_id': '1234',
+                           'memory_mb': 512, 'root_gb': 1,
+                           'ephemeral_gb': 1, 'vcpus': 1,
+                           'uuid': 'aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa'}
+    return {'instance_type': flavor,
+            'instance_properties': instance_properties,
+            'num_instances': 1}
+
+
+def time_select_destinations(hosts, vectorized):
+    """Returns the time in ms a select_destinations call takes and its
+    destinations.
+    """
+    CONF.set_override('scheduler_vectorized_hosts', vectorized)
+    with mock.patch.object(rpc, 'get_client'):
+        with mock.patch.object(rpc, 'get_notifier'):
+            driver = filter_scheduler.FilterScheduler()
+    ctxt = context.get_admin_context()
+    request_spec = fake_request_spec()
+    host_states = fake_host_states(hosts)
+
+    with mock.patch.object(driver.host_manager, 'get_all_host_states',
+                           return_value=host_states):
+        start = time.time()
+        for x in xrange(REQUESTS):
+            dests = driver.select_destinations(ctxt, request_spec, {})
+        elapsed = time.time() - start
+    return elapsed * 1000 / REQUESTS, dests
+
+
+def main(argv):
+    objects.register_all()
+    CONF.set_override('scheduler_default_filters',
+                      ['RamFilter', 'CoreFilter', 'DiskFilter',
+                       'IoOpsFilter', 'NumInstancesFilter'])
+    CONF.set_override('scheduler_weight_classes',
+                      ['nova.scheduler.weights.ram.RAMWeigher'])
+    with mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                    return_value={'numa_topology': None,
+                                  'pci_requests': None}):
+        for hosts in [int(arg) for arg in argv[1:]] or [1000, 10000, 50000]:
+            per_host_ms, expected = time_select_destinations(hosts, False)
+            vectorized_ms, dests = time_select_destinations(hosts, True)
+            if dests != expected:
+                sys.exit("%d hosts: the vectorized destinations differ"
+                         % hosts)
+            print("%d hosts: per host %.1f ms, vectorized %.1f ms"
+                  % (hosts, per_host_ms, vectorized_ms))
+
+
+if __name__ == '__main__':
+    main(sys.argv)